@@ -3,10 +3,11 @@
 #=========================================================================
 
 from pymtl3      import *
-from pymtl3.stdlib.ifcs import mk_mem_msg
+from pymtl3.stdlib.ifcs import mk_mem_msg, MemMsgType
 
-from pymtl3.stdlib.rtl import RegisterFile, RegEnRst
-from .DecodeWbenRTL import DecodeWbenRTL
+from pymtl3.stdlib.rtl import RegEnRst
+from .DecodeWbenRTL   import DecodeWbenRTL
+from .RegisterFileRst import RegisterFileRst
 
 size           = 8192             # Cache size in bytes
 p_opaque_nbits = 8
@@ -21,8 +22,18 @@ o              = p_opaque_nbits
 idw            = clog2(nblocks)-1  # Short name for index width
 idw_off        = idw+4
 
+# Coherence requests. A coherent cache asks for a line with GETS (to
+# read it) or GETM (to write it), and writes back a dirty line with PUTM.
+# The same types are used for the snoop requests to the other caches:
+# GETS downgrades a line to S and GETM invalidates it. GETM uses the
+# type of an invalidation since it has no type of its own.
+
+GETS = MemMsgType.READ
+GETM = MemMsgType.INV
+PUTM = MemMsgType.WRITE
+
 class BlockingCacheCtrlPRTL( Component ):
-  def construct( s, idx_shamt = 0 ):
+  def construct( s, idx_shamt = 0, coherent = False ):
 
     #---------------------------------------------------------------------
     # Interface
@@ -48,6 +59,16 @@ class BlockingCacheCtrlPRTL( Component ):
     s.memresp_en         = InPort ()
     s.memresp_rdy        = OutPort()
 
+    # Snoop request
+
+    s.snoop_req_en       = InPort ()
+    s.snoop_req_rdy      = OutPort()
+
+    # Snoop response
+
+    s.snoop_resp_en      = OutPort()
+    s.snoop_resp_rdy     = InPort ()
+
     # control signals (ctrl->dpath)
 
     s.amo_sel            = OutPort( Bits2 )
@@ -73,6 +94,10 @@ class BlockingCacheCtrlPRTL( Component ):
     s.memreq_type        = OutPort( Bits4 )
     s.cacheresp_type     = OutPort( Bits4 )
     s.cacheresp_hit      = OutPort()
+    s.snoop_req_enable   = OutPort()
+    s.snoop_data_reg_en  = OutPort()
+    s.snoop_resp_hit     = OutPort()
+    s.snoop_resp_dirty   = OutPort()
 
     # status signals (dpath->ctrl)
 
@@ -80,6 +105,10 @@ class BlockingCacheCtrlPRTL( Component ):
     s.cachereq_addr      = InPort ( mk_bits(abw) )
     s.tag_match_0        = InPort ()
     s.tag_match_1        = InPort ()
+    s.snoop_type         = InPort ( Bits4 )
+    s.snoop_addr         = InPort ( mk_bits(abw) )
+    s.snoop_tag_match_0  = InPort ()
+    s.snoop_tag_match_1  = InPort ()
 
     #----------------------------------------------------------------------
     # State Definitions
@@ -102,6 +131,29 @@ class BlockingCacheCtrlPRTL( Component ):
     s.STATE_AMO_READ_DATA_ACCESS   = b5( 14 )
     s.STATE_AMO_WRITE_DATA_ACCESS  = b5( 15 )
     s.STATE_INIT_DATA_ACCESS       = b5( 16 )
+    s.STATE_SNOOP_TAG_CHECK        = b5( 17 )
+    s.STATE_SNOOP_RESP             = b5( 18 )
+
+    #----------------------------------------------------------------------
+    # MSI coherence
+    #----------------------------------------------------------------------
+    # With coherent=True the valid and dirty bits of a line are its MSI
+    # state: invalid (I), valid and clean (S), or valid and dirty (M). A
+    # clean line may be shared with other caches, so writes and AMOs only
+    # hit in M. On a write or an AMO to a line in S we refill the same
+    # way with a GETM (an upgrade), and write and AMO misses refill with
+    # GETM instead of GETS. Snoop requests are only accepted in the IDLE,
+    # REFILL_REQUEST, and EVICT_REQUEST states, where we never hold a
+    # transaction half done, and take two cycles: SNOOP_TAG_CHECK reads
+    # the line and updates its state, SNOOP_RESP sends the line back (the
+    # bus writes it back if it was dirty) and returns to where we were.
+    #
+    # If a snoop takes the dirty line we are about to evict, the snoop
+    # already wrote it back, so we skip the eviction. Otherwise the stale
+    # eviction could overwrite the newer data of the next owner.
+
+    s.msi = Wire()
+    s.msi //= b1( coherent )
 
     #----------------------------------------------------------------------
     # State Transitions
@@ -123,6 +175,8 @@ class BlockingCacheCtrlPRTL( Component ):
     s.miss_1    = Wire()
     s.refill    = Wire()
     s.evict     = Wire()
+    s.hit_dirty = Wire()
+    s.upgrade   = Wire()
 
     @s.update
     def comb_state_transition():
@@ -135,9 +189,11 @@ class BlockingCacheCtrlPRTL( Component ):
       s.is_write  = s.cachereq_type == b4(1)
       s.is_init   = s.cachereq_type == b4(2)
       s.is_amo    = s.amo_sel != b2(0)
+      s.hit_dirty = (s.hit_0 & s.is_dirty_0) | (s.hit_1 & s.is_dirty_1)
       s.read_hit  = s.is_read & s.hit
-      s.write_hit = s.is_write & s.hit
-      s.amo_hit   = s.is_amo & s.hit
+      s.write_hit = s.is_write & s.hit & (~s.msi | s.hit_dirty)
+      s.amo_hit   = s.is_amo & s.hit & (~s.msi | s.hit_dirty)
+      s.upgrade   = s.msi & (s.is_write | s.is_amo) & s.hit & ~s.hit_dirty
       s.miss_0    = ~s.hit_0
       s.miss_1    = ~s.hit_1
       s.refill    = (s.miss_0 & ~s.is_dirty_0 & ~s.lru_way) | \
@@ -149,10 +205,28 @@ class BlockingCacheCtrlPRTL( Component ):
 
     @s.update
     def comb_amo_type():
-      if s.cachereq_type == b4(3): s.amo_sel = b2(1)
-      if s.cachereq_type == b4(4): s.amo_sel = b2(2)
-      if s.cachereq_type == b4(5): s.amo_sel = b2(3)
-      else:                        s.amo_sel = b2(0)
+      if   s.cachereq_type == b4(3): s.amo_sel = b2(1)
+      elif s.cachereq_type == b4(4): s.amo_sel = b2(2)
+      elif s.cachereq_type == b4(5): s.amo_sel = b2(3)
+      else:                          s.amo_sel = b2(0)
+
+    # snoop hit and the state of the snooped line
+
+    s.snoop_hit_0 = Wire()
+    s.snoop_hit_1 = Wire()
+    s.snoop_hit   = Wire()
+    s.snoop_way   = Wire()
+    s.snoop_dirty = Wire()
+    s.snoop_inv   = Wire()
+
+    @s.update
+    def comb_snoop_hit():
+      s.snoop_hit_0 = s.is_valid_0 & s.snoop_tag_match_0
+      s.snoop_hit_1 = s.is_valid_1 & s.snoop_tag_match_1
+      s.snoop_hit   = s.snoop_hit_0 | s.snoop_hit_1
+      s.snoop_way   = s.snoop_hit_1
+      s.snoop_dirty = (s.snoop_hit_0 & s.is_dirty_0) | (s.snoop_hit_1 & s.is_dirty_1)
+      s.snoop_inv   = s.snoop_type == b4(GETM)
 
     #----------------------------------------------------------------------
     # State
@@ -173,7 +247,8 @@ class BlockingCacheCtrlPRTL( Component ):
       s.next_state = s.state
 
       if s.state == s.STATE_IDLE:
-        if s.in_go: s.next_state = s.STATE_TAG_CHECK
+        if   s.snoop_req_en: s.next_state = s.STATE_SNOOP_TAG_CHECK
+        elif s.in_go:        s.next_state = s.STATE_TAG_CHECK
 
       elif s.state == s.STATE_TAG_CHECK:
         if   s.is_init                                       : s.next_state = s.STATE_INIT_DATA_ACCESS
@@ -183,6 +258,7 @@ class BlockingCacheCtrlPRTL( Component ):
         elif s.write_hit &  s.cacheresp_rdy                  : s.next_state = s.STATE_WRITE_DATA_ACCESS_HIT
         elif s.write_hit & ~s.cacheresp_rdy                  : s.next_state = s.STATE_WRITE_CACHE_RESP_HIT
         elif s.amo_hit                                       : s.next_state = s.STATE_AMO_READ_DATA_ACCESS
+        elif s.upgrade                                       : s.next_state = s.STATE_REFILL_REQUEST
         elif s.refill                                        : s.next_state = s.STATE_REFILL_REQUEST
         elif s.evict                                         : s.next_state = s.STATE_EVICT_PREPARE
 
@@ -210,7 +286,8 @@ class BlockingCacheCtrlPRTL( Component ):
         s.next_state = s.STATE_WAIT_MISS
 
       elif s.state == s.STATE_REFILL_REQUEST:
-        if   s.memreq_rdy : s.next_state = s.STATE_REFILL_WAIT
+        if   s.snoop_req_en : s.next_state = s.STATE_SNOOP_TAG_CHECK
+        elif s.memreq_rdy   : s.next_state = s.STATE_REFILL_WAIT
 
       elif s.state == s.STATE_REFILL_WAIT:
         if   s.memresp_en : s.next_state = s.STATE_REFILL_UPDATE
@@ -224,7 +301,8 @@ class BlockingCacheCtrlPRTL( Component ):
         s.next_state = s.STATE_EVICT_REQUEST
 
       elif s.state == s.STATE_EVICT_REQUEST:
-        if   s.memreq_rdy : s.next_state = s.STATE_EVICT_WAIT
+        if   s.snoop_req_en : s.next_state = s.STATE_SNOOP_TAG_CHECK
+        elif s.memreq_rdy   : s.next_state = s.STATE_EVICT_WAIT
 
       elif s.state == s.STATE_EVICT_WAIT:
         if   s.memresp_en : s.next_state = s.STATE_REFILL_REQUEST
@@ -235,6 +313,38 @@ class BlockingCacheCtrlPRTL( Component ):
       elif s.state == s.STATE_WAIT_MISS:
         if   s.out_go     : s.next_state = s.STATE_IDLE
 
+      elif s.state == s.STATE_SNOOP_TAG_CHECK:
+        s.next_state = s.STATE_SNOOP_RESP
+
+      elif s.state == s.STATE_SNOOP_RESP:
+        if   s.snoop_resp_rdy : s.next_state = s.ret_state
+
+    # The state to return to after a snoop
+
+    s.ret_state        = Wire( Bits5 )
+    s.ret_state_en     = Wire()
+    s.ret_state_in     = Wire( Bits5 )
+    s.victim_snooped   = Wire()
+
+    @s.update
+    def comb_ret_state():
+      s.victim_snooped = (s.state == s.STATE_SNOOP_TAG_CHECK) & \
+                         (s.ret_state == s.STATE_EVICT_REQUEST) & \
+                         s.snoop_hit & (s.snoop_way == s.way_sel) & \
+                         (s.snoop_idx == s.cachereq_idx)
+
+      s.ret_state_en = s.snoop_req_en | s.victim_snooped
+      if s.victim_snooped:
+        s.ret_state_in = s.STATE_REFILL_REQUEST
+      else:
+        s.ret_state_in = s.state
+
+    s.ret_state_reg = RegEnRst( Bits5, reset_value=0 )(
+      en  = s.ret_state_en,
+      in_ = s.ret_state_in,
+      out = s.ret_state,
+    )
+
     #----------------------------------------------------------------------
     # Valid/Dirty bits record
     #----------------------------------------------------------------------
@@ -249,24 +359,39 @@ class BlockingCacheCtrlPRTL( Component ):
 
     s.cachereq_idx //= s.cachereq_addr[4+idx_shamt:idw_off+idx_shamt]
 
+    # The valid and dirty bits are read and written at the index of the
+    # snooped line while we handle a snoop
+
+    s.snoop_idx    = Wire( mk_bits(idw) )
+    s.state_idx    = Wire( mk_bits(idw) )
+
+    s.snoop_idx //= s.snoop_addr[4+idx_shamt:idw_off+idx_shamt]
+
+    @s.update
+    def comb_state_idx():
+      if s.state == s.STATE_SNOOP_TAG_CHECK:
+        s.state_idx = s.snoop_idx
+      else:
+        s.state_idx = s.cachereq_idx
+
     @s.update
     def comb_valid_bits_en():
       s.valid_bits_write_en_0 = s.valid_bits_write_en & ~s.way_sel_current
       s.valid_bits_write_en_1 = s.valid_bits_write_en &  s.way_sel_current
 
-    s.valid_bits_0 = RegisterFile( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1, const_zero=False )(
-      raddr = { 0: s.cachereq_idx },
+    s.valid_bits_0 = RegisterFileRst( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1 )(
+      raddr = { 0: s.state_idx },
       rdata = { 0: s.is_valid_0 },
       wen   = { 0: s.valid_bits_write_en_0 },
-      waddr = { 0: s.cachereq_idx },
+      waddr = { 0: s.state_idx },
       wdata = { 0: s.valid_bit_in },
     )
 
-    s.valid_bits_1 = RegisterFile( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1, const_zero=False )(
-      raddr = { 0: s.cachereq_idx },
+    s.valid_bits_1 = RegisterFileRst( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1 )(
+      raddr = { 0: s.state_idx },
       rdata = { 0: s.is_valid_1 },
       wen   = { 0: s.valid_bits_write_en_1 },
-      waddr = { 0: s.cachereq_idx },
+      waddr = { 0: s.state_idx },
       wdata = { 0: s.valid_bit_in },
     )
 
@@ -282,19 +407,19 @@ class BlockingCacheCtrlPRTL( Component ):
       s.dirty_bits_write_en_0 = s.dirty_bits_write_en & ~s.way_sel_current
       s.dirty_bits_write_en_1 = s.dirty_bits_write_en &  s.way_sel_current
 
-    s.dirty_bits_0 = RegisterFile( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1, const_zero=False )(
-      raddr = { 0: s.cachereq_idx },
+    s.dirty_bits_0 = RegisterFileRst( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1 )(
+      raddr = { 0: s.state_idx },
       rdata = { 0: s.is_dirty_0 },
       wen   = { 0: s.dirty_bits_write_en_0 },
-      waddr = { 0: s.cachereq_idx },
+      waddr = { 0: s.state_idx },
       wdata = { 0: s.dirty_bit_in },
     )
 
-    s.dirty_bits_1 = RegisterFile( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1, const_zero=False )(
-      raddr = { 0: s.cachereq_idx },
+    s.dirty_bits_1 = RegisterFileRst( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1 )(
+      raddr = { 0: s.state_idx },
       rdata = { 0: s.is_dirty_1 },
       wen   = { 0: s.dirty_bits_write_en_1 },
-      waddr = { 0: s.cachereq_idx },
+      waddr = { 0: s.state_idx },
       wdata = { 0: s.dirty_bit_in },
     )
 
@@ -302,7 +427,7 @@ class BlockingCacheCtrlPRTL( Component ):
     s.lru_bits_write_en     = Wire()
     s.lru_way               = Wire()
 
-    s.lru_bits = RegisterFile( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1, const_zero=False )(
+    s.lru_bits = RegisterFileRst( Bits1, nregs=nblocks//2, rd_ports=1, wr_ports=1 )(
       raddr = { 0: s.cachereq_idx },
       rdata = { 0: s.lru_way },
       wen   = { 0: s.lru_bits_write_en },
@@ -334,6 +459,8 @@ class BlockingCacheCtrlPRTL( Component ):
 
       if s.state == s.STATE_TAG_CHECK:
         s.way_sel_current = s.way_record_in
+      elif s.state == s.STATE_SNOOP_TAG_CHECK:
+        s.way_sel_current = s.snoop_way
       else:
         s.way_sel_current = s.way_sel
 
@@ -404,7 +531,7 @@ class BlockingCacheCtrlPRTL( Component ):
       elif sr == s.STATE_READ_DATA_ACCESS_MISS:  s.cs = concat( n,   n,   n,  n,   n,   n,   r_x,   y,   n,   m_x, x,    n,    x,    n,    y,    n,     n,   n    )
       elif sr == s.STATE_WRITE_DATA_ACCESS_MISS: s.cs = concat( n,   y,   n,  n,   n,   n,   r_c,   n,   n,   m_x, y,    y,    y,    y,    y,    n,     n,   n    )
       elif sr == s.STATE_INIT_DATA_ACCESS:       s.cs = concat( n,   n,   n,  n,   n,   n,   r_c,   n,   n,   m_x, y,    y,    n,    y,    y,    n,     n,   n    )
-      elif sr == s.STATE_AMO_READ_DATA_ACCESS:   s.cs = concat( n,   n,   n,  n,   n,   n,   r_x,   y,   n,   m_x, x,    n,    x,    n,    y,    n,     n,   n    )
+      elif sr == s.STATE_AMO_READ_DATA_ACCESS:   s.cs = concat( n,   n,   n,  n,   n,   n,   r_x,   y,   n,   m_x, x,    n,    x,    n,    y,    n,     n,   y    )
       elif sr == s.STATE_AMO_WRITE_DATA_ACCESS:  s.cs = concat( n,   n,   n,  n,   n,   n,   r_c,   n,   n,   m_x, y,    y,    y,    y,    y,    n,     n,   n    )
       elif sr == s.STATE_REFILL_REQUEST:         s.cs = concat( n,   n,   y,  n,   n,   n,   r_x,   n,   n,   m_r, x,    n,    x,    n,    n,    n,     n,   n    )
       elif sr == s.STATE_REFILL_WAIT:            s.cs = concat( n,   n,   n,  y,   n,   y,   r_m,   n,   n,   m_x, x,    n,    x,    n,    n,    n,     n,   n    )
@@ -414,6 +541,8 @@ class BlockingCacheCtrlPRTL( Component ):
       elif sr == s.STATE_EVICT_WAIT:             s.cs = concat( n,   n,   n,  y,   n,   n,   r_x,   n,   n,   m_x, x,    n,    x,    n,    n,    n,     n,   n    )
       elif sr == s.STATE_WAIT_HIT:               s.cs = concat( n,   y,   n,  n,   n,   n,   r_x,   n,   n,   m_x, x,    n,    x,    n,    n,    n,     y,   n    )
       elif sr == s.STATE_WAIT_MISS:              s.cs = concat( n,   y,   n,  n,   n,   n,   r_x,   n,   n,   m_x, x,    n,    x,    n,    n,    n,     n,   n    )
+      elif sr == s.STATE_SNOOP_TAG_CHECK:        s.cs = concat( n,   n,   n,  n,   n,   n,   r_x,   n,   n,   m_x, n,    n,    n,    n,    n,    n,     n,   n    )
+      elif sr == s.STATE_SNOOP_RESP:             s.cs = concat( n,   n,   n,  n,   n,   n,   r_x,   n,   n,   m_x, x,    n,    x,    n,    n,    n,     n,   n    )
       else :                                     s.cs = concat( n,   n,   n,  n,   n,   n,   r_x,   n,   n,   m_x, x,    n,    x,    n,    n,    n,     n,   n    )
 
       # Unpack signals
@@ -454,7 +583,25 @@ class BlockingCacheCtrlPRTL( Component ):
         s.cachereq_rdy    = b1(1)
         s.cachereq_enable = b1(1)
 
-      s.memreq_en = s.memreq_val & s.memreq_rdy
+      # snoops take priority over cache requests and our own memory
+      # requests
+
+      if s.snoop_req_en:
+        s.cachereq_rdy    = b1(0)
+        s.cachereq_enable = b1(0)
+
+      s.memreq_en = s.memreq_val & s.memreq_rdy & ~s.snoop_req_en
+
+      # refill with GETM for writes and AMOs
+
+      if s.msi & (s.state == s.STATE_REFILL_REQUEST) & (s.is_write | s.is_amo):
+        s.memreq_type = b4(GETM)
+
+      # a snoop downgrades (GETS) or invalidates (GETM) the snooped line
+
+      if s.state == s.STATE_SNOOP_TAG_CHECK:
+        s.valid_bits_write_en = s.snoop_hit & s.snoop_inv
+        s.dirty_bits_write_en = s.snoop_hit
 
     # Control bits based on next state
 
@@ -490,6 +637,8 @@ class BlockingCacheCtrlPRTL( Component ):
       elif sn == s.STATE_EVICT_WAIT:             s.ns = concat( n,    n,    n,    n,   )
       elif sn == s.STATE_WAIT_HIT:               s.ns = concat( n,    n,    n,    n,   )
       elif sn == s.STATE_WAIT_MISS:              s.ns = concat( n,    n,    n,    n,   )
+      elif sn == s.STATE_SNOOP_TAG_CHECK:        s.ns = concat( n,    y,    n,    y,   )
+      elif sn == s.STATE_SNOOP_RESP:             s.ns = concat( n,    n,    n,    n,   )
       else :                                     s.ns = concat( n,    n,    n,    n,   )
 
       # Unpack signals
@@ -536,3 +685,28 @@ class BlockingCacheCtrlPRTL( Component ):
 
     s.cacheresp_type //= s.cachereq_type
 
+    #----------------------------------------------------------------------
+    # Snoop handshake
+    #----------------------------------------------------------------------
+
+    s.snoop_hit_reg = RegEnRst( Bits1, reset_value=0 )(
+      en  = s.snoop_data_reg_en,
+      in_ = s.snoop_hit,
+      out = s.snoop_resp_hit,
+    )
+
+    s.snoop_dirty_reg = RegEnRst( Bits1, reset_value=0 )(
+      en  = s.snoop_data_reg_en,
+      in_ = s.snoop_dirty,
+      out = s.snoop_resp_dirty,
+    )
+
+    @s.update
+    def comb_snoop_handshake():
+      s.snoop_req_rdy     = (s.state == s.STATE_IDLE) | \
+                            (s.state == s.STATE_REFILL_REQUEST) | \
+                            (s.state == s.STATE_EVICT_REQUEST)
+      s.snoop_req_enable  = s.snoop_req_en
+      s.snoop_data_reg_en = s.state == s.STATE_SNOOP_TAG_CHECK
+      s.snoop_resp_en     = (s.state == s.STATE_SNOOP_RESP) & s.snoop_resp_rdy
+
@@ -50,6 +50,14 @@ class BlockingCacheDpathPRTL( Component ):
 
     s.memresp_msg        = InPort ( MemRespType )
 
+    # Snoop request
+
+    s.snoop_req_msg      = InPort ( MemReqType  )
+
+    # Snoop response
+
+    s.snoop_resp_msg     = OutPort( MemRespType )
+
     # control signals (ctrl->dpath)
 
     s.amo_sel            = InPort( Bits2 )
@@ -75,6 +83,10 @@ class BlockingCacheDpathPRTL( Component ):
     s.memreq_type        = InPort( Bits4 )
     s.cacheresp_type     = InPort( Bits4 )
     s.cacheresp_hit      = InPort()
+    s.snoop_req_enable   = InPort()
+    s.snoop_data_reg_en  = InPort()
+    s.snoop_resp_hit     = InPort()
+    s.snoop_resp_dirty   = InPort()
 
     # status signals (dpath->ctrl)
 
@@ -82,6 +94,10 @@ class BlockingCacheDpathPRTL( Component ):
     s.cachereq_addr      = OutPort ( mk_bits(abw) )
     s.tag_match_0        = OutPort ()
     s.tag_match_1        = OutPort ()
+    s.snoop_type         = OutPort ( Bits4 )
+    s.snoop_addr         = OutPort ( mk_bits(abw) )
+    s.snoop_tag_match_0  = OutPort ()
+    s.snoop_tag_match_1  = OutPort ()
 
     # Register the unpacked cachereq_msg
 
@@ -108,6 +124,20 @@ class BlockingCacheDpathPRTL( Component ):
       in_ = s.cachereq_msg.data,
     )
 
+    # Register the unpacked snoop_req_msg
+
+    s.snoop_type_reg = RegEnRst( Bits4, reset_value=0 )(
+      en  = s.snoop_req_enable,
+      in_ = s.snoop_req_msg.type_,
+      out = s.snoop_type,
+    )
+
+    s.snoop_addr_reg = RegEnRst( mk_bits(abw), reset_value=0 )(
+      en  = s.snoop_req_enable,
+      in_ = s.snoop_req_msg.addr,
+      out = s.snoop_addr,
+    )
+
     # Register the unpacked data from memresp_msg
 
     s.memresp_data_reg = RegEnRst( mk_bits(clw), reset_value=0 )(
@@ -162,7 +192,10 @@ class BlockingCacheDpathPRTL( Component ):
     s.cachereq_idx = Wire( mk_bits(idw) )
 
     s.cachereq_tag //= s.cachereq_addr_reg.out[4:abw]
-    s.cachereq_idx //= s.cachereq_addr_reg.out[4:idw_off]
+    s.cachereq_idx //= s.cachereq_addr_reg.out[4+idx_shamt:idw_off+idx_shamt]
+
+    s.snoop_tag    = Wire( mk_bits(abw-4) )
+    s.snoop_tag //= s.snoop_addr_reg.out[4:abw]
 
     # Concat
 
@@ -181,8 +214,10 @@ class BlockingCacheDpathPRTL( Component ):
     def comb_tag():
       s.cachereq_msg_addr = s.cachereq_msg.addr
       s.temp_cachereq_tag = concat( b4(0), s.cachereq_tag )
-      if s.cachereq_enable:
-        s.cur_cachereq_idx = s.cachereq_msg_addr[4:idw_off]
+      if s.snoop_req_enable:
+        s.cur_cachereq_idx = s.snoop_req_msg.addr[4+idx_shamt:idw_off+idx_shamt]
+      elif s.cachereq_enable:
+        s.cur_cachereq_idx = s.cachereq_msg_addr[4+idx_shamt:idw_off+idx_shamt]
       else:
         s.cur_cachereq_idx  = s.cachereq_idx
 
@@ -267,6 +302,20 @@ class BlockingCacheDpathPRTL( Component ):
       out = s.tag_match_1,
     )
 
+    # Eq comparators to check the snooped line against both ways
+
+    s.snoop_tag_compare_0 = EqComparator( mk_bits(abw - 4) )(
+      in0 = s.snoop_tag,
+      in1 = s.tag_array_0_read_out[0:abw-4],
+      out = s.snoop_tag_match_0,
+    )
+
+    s.snoop_tag_compare_1 = EqComparator( mk_bits(abw - 4) )(
+      in0 = s.snoop_tag,
+      in1 = s.tag_array_1_read_out[0:abw-4],
+      out = s.snoop_tag_match_1,
+    )
+
     # Mux that selects between the ways for requesting from memory
 
     s.way_sel_mux = Mux( mk_bits(abw - 4), ninputs = 2 )(
@@ -330,9 +379,11 @@ class BlockingCacheDpathPRTL( Component ):
       sel = s.read_byte_sel,
     )
 
+    # Reads and AMOs return the (old) data of the word
+
     @s.update
     def comb_addr_refill():
-      if s.cacheresp_type == b4(0):
+      if (s.cacheresp_type == b4(0)) | (s.cacheresp_type >= b4(3)):
         s.cacheresp_msg.data = s.read_byte_sel_mux.out
       else :
         s.cacheresp_msg.data = b32(0)
@@ -350,3 +401,17 @@ class BlockingCacheDpathPRTL( Component ):
       s.memreq_msg.addr   = s.memreq_addr
       s.memreq_msg.len    = b4(0)
 
+    # Snoop data register, holds the snooped line for the snoop response
+
+    s.snoop_data_reg = RegEnRst( mk_bits(clw), reset_value=0 )(
+      en  = s.snoop_data_reg_en,
+      in_ = s.data_read_mux.out,
+      out = s.snoop_resp_msg.data,
+    )
+
+    @s.update
+    def comb_snooprespmsgpack():
+      s.snoop_resp_msg.type_  = s.snoop_type
+      s.snoop_resp_msg.opaque = b8(0)
+      s.snoop_resp_msg.test   = concat( s.snoop_resp_dirty, s.snoop_resp_hit )
+      s.snoop_resp_msg.len    = b4(0)
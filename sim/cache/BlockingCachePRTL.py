@@ -24,10 +24,17 @@ from .BlockingCacheDpathPRTL import BlockingCacheDpathPRTL
 # will compose four-banked cache in lab5 multi-core lab. You can modify
 # your cache to multi-banked by slightly modifying the address structure.
 # For now you can simply assume num_banks == 0.
+#
+# Note on coherent:
+# With coherent=True the cache keeps its lines in the MSI states (see
+# BlockingCacheCtrlPRTL) and has a snoop interface, on which the
+# SnoopBus sends GETS and GETM snoop requests. The memory interface then
+# carries GETS/GETM refills and PUTM writebacks, and must be connected
+# to a SnoopBus, which turns them into plain memory requests.
 
 class BlockingCachePRTL( Component ):
 
-  def construct( s, num_banks = 0 ):
+  def construct( s, num_banks = 0, coherent = False ):
 
     CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
     MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
@@ -45,7 +52,12 @@ class BlockingCachePRTL( Component ):
 
     s.mem = MemMasterIfcRTL( MemReqType, MemRespType )
 
-    s.ctrl  = BlockingCacheCtrlPRTL ( idx_shamt )(
+    # Bus -> Cache snoops
+
+    if coherent:
+      s.snoop = MemMinionIfcRTL( MemReqType, MemRespType )
+
+    s.ctrl  = BlockingCacheCtrlPRTL ( idx_shamt, coherent )(
       # Cache request
       cachereq_en  = s.cache.req.en,
       cachereq_rdy = s.cache.req.rdy,
@@ -104,6 +116,11 @@ class BlockingCachePRTL( Component ):
     s.dpath.cacheresp_type   //= s.ctrl.cacheresp_type
     s.dpath.cacheresp_hit    //= s.ctrl.cacheresp_hit
 
+    s.dpath.snoop_req_enable  //= s.ctrl.snoop_req_enable
+    s.dpath.snoop_data_reg_en //= s.ctrl.snoop_data_reg_en
+    s.dpath.snoop_resp_hit    //= s.ctrl.snoop_resp_hit
+    s.dpath.snoop_resp_dirty  //= s.ctrl.snoop_resp_dirty
+
     # status signals (dpath->ctrl)
 
     s.ctrl.cachereq_type //= s.dpath.cachereq_type
@@ -111,6 +128,25 @@ class BlockingCachePRTL( Component ):
     s.ctrl.tag_match_0   //= s.dpath.tag_match_0
     s.ctrl.tag_match_1   //= s.dpath.tag_match_1
 
+    s.ctrl.snoop_type        //= s.dpath.snoop_type
+    s.ctrl.snoop_addr        //= s.dpath.snoop_addr
+    s.ctrl.snoop_tag_match_0 //= s.dpath.snoop_tag_match_0
+    s.ctrl.snoop_tag_match_1 //= s.dpath.snoop_tag_match_1
+
+    # snoops
+
+    if coherent:
+      s.ctrl.snoop_req_en    //= s.snoop.req.en
+      s.ctrl.snoop_req_rdy   //= s.snoop.req.rdy
+      s.ctrl.snoop_resp_en   //= s.snoop.resp.en
+      s.ctrl.snoop_resp_rdy  //= s.snoop.resp.rdy
+      s.dpath.snoop_req_msg  //= s.snoop.req.msg
+      s.dpath.snoop_resp_msg //= s.snoop.resp.msg
+    else:
+      s.ctrl.snoop_req_en    //= 0
+      s.ctrl.snoop_resp_rdy  //= 0
+      s.dpath.snoop_req_msg  //= MemReqType()
+
     #'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''/\
 
   def line_trace( s ):
@@ -140,6 +176,8 @@ class BlockingCachePRTL( Component ):
     elif state == s.ctrl.STATE_EVICT_WAIT:             state_str = "(EW)"
     elif state == s.ctrl.STATE_WAIT_HIT:               state_str = "(W )"
     elif state == s.ctrl.STATE_WAIT_MISS:              state_str = "(W )"
+    elif state == s.ctrl.STATE_SNOOP_TAG_CHECK:        state_str = "(ST)"
+    elif state == s.ctrl.STATE_SNOOP_RESP:             state_str = "(SR)"
     else :                                             state_str = "(? )"
 
     return state_str
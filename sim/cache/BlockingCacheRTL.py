@@ -5,11 +5,12 @@ from pymtl3.passes.backends.verilog import TranslationConfigs
 from .BlockingCachePRTL import BlockingCachePRTL
 
 class BlockingCacheRTL( BlockingCachePRTL ):
-  def construct( s, num_banks=0 ):
-    super().construct( num_banks )
+  def construct( s, num_banks=0, coherent=False ):
+    super().construct( num_banks, coherent )
 
     # The translated Verilog must be xRTL.v instead of xPRTL.v
     s.config_verilog_translate = TranslationConfigs(
       translate=False,
-      explicit_module_name = f'cache_BlockingCacheRTL_{num_banks}bank',
+      explicit_module_name = f'cache_BlockingCacheRTL_{num_banks}bank' +
+                             ( '_msi' if coherent else '' ),
     )
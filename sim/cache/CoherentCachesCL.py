@@ -0,0 +1,246 @@
+#=========================================================================
+# CoherentCachesCL.py
+#=========================================================================
+# CL model of N coherent caches on a snooping bus, i.e., of N
+# BlockingCacheRTL( coherent=True ) connected to one memory port through
+# a SnoopBus, for fast exploration of cached multicore designs. Every
+# cache has the same organization as the RTL cache (8KB, two ways with
+# LRU replacement, 16B lines, write back and write allocate) and keeps
+# its lines in the same MSI states:
+#
+#  - reads hit in S and M, writes and AMOs only hit in M
+#  - misses (and upgrades of lines in S) are served by the bus one at a
+#    time, in round robin order. The bus evicts the victim line if it is
+#    dirty (PUTM), snoops the other caches (GETS downgrades the line to
+#    S, GETM invalidates it), writes back the line if another cache had
+#    it in M and then uses that line, or else reads it from memory.
+#
+# So the model sends the same writebacks and refills to memory as the
+# RTL, but it snoops all caches in the cycle the bus takes the miss.
+# Hits take one cycle like in the RTL. Unlike the RTL, init requests
+# are handled like writes. The model counts hits, misses (including
+# upgrades), upgrades, invalidations, and writebacks over all caches.
+
+from collections import deque
+
+from pymtl3 import *
+from pymtl3.stdlib.cl   import PipeQueueCL
+from pymtl3.stdlib.ifcs import MemMsgType
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcCL, MemMinionIfcCL, mk_mem_msg
+
+# Cache organization, same as BlockingCacheCtrlPRTL
+
+nsets = 256
+nways = 2
+
+# Line states
+
+I, S, M = 0, 1, 2
+
+amo_funcs = {
+  MemMsgType.AMO_ADD : lambda m,a : m+a,
+  MemMsgType.AMO_AND : lambda m,a : m&a,
+  MemMsgType.AMO_OR  : lambda m,a : m|a,
+}
+
+class CoherentCachesCL( Component ):
+
+  def construct( s, ncaches ):
+
+    CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
+    MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
+
+    s.ncaches = ncaches
+
+    # Interface
+
+    s.cache = [ MemMinionIfcCL( CacheReqType, CacheRespType ) for _ in range(ncaches) ]
+    s.mem   = MemMasterIfcCL( MemReqType, MemRespType )
+
+    # Queues
+
+    s.req_qs    = [ PipeQueueCL( num_entries=1 )( enq = s.cache[i].req )
+                    for i in range(ncaches) ]
+    s.memresp_q = PipeQueueCL( num_entries=1 )( enq = s.mem.resp )
+
+    # Cache state: line address, MSI state, and data (an int) of every
+    # line, and the way to replace next in every set
+
+    s.addrs  = [ [ [ 0 ] * nways for _ in range(nsets) ] for _ in range(ncaches) ]
+    s.states = [ [ [ I ] * nways for _ in range(nsets) ] for _ in range(ncaches) ]
+    s.lines  = [ [ [ 0 ] * nways for _ in range(nsets) ] for _ in range(ncaches) ]
+    s.lru    = [ [ 0 ] * nsets for _ in range(ncaches) ]
+
+    # Bus state: the caches waiting for the bus, the next cache to
+    # consider, and the transaction on the bus
+
+    s.waiting = [ False ] * ncaches
+    s.ptr     = 0
+    s.txn     = None
+
+    # Stats
+
+    s.num_hits          = 0
+    s.num_misses        = 0
+    s.num_upgrades      = 0
+    s.num_invalidations = 0
+    s.num_writebacks    = 0
+
+    #---------------------------------------------------------------------
+    # Helpers
+    #---------------------------------------------------------------------
+
+    def find( i, addr ):
+      idx = ( addr >> 4 ) % nsets
+      for way in range( nways ):
+        if s.states[i][idx][way] != I and s.addrs[i][idx][way] == addr & ~0xf:
+          return idx, way
+      return idx, None
+
+    def needs_m( req ):
+      return req.type_ != MemMsgType.READ
+
+    # Performs a request on a line which is in the cache in the right
+    # state and returns the response.
+
+    def access( i, idx, way, req, hit ):
+
+      shamt = ( int( req.addr ) & 0xc ) * 8
+      line  = s.lines[i][idx][way]
+      word  = Bits32( ( line >> shamt ) & 0xffffffff )
+      data  = Bits32( 0 )
+
+      if req.type_ == MemMsgType.READ:
+        data = word
+
+      elif req.type_ == MemMsgType.WRITE or req.type_ == MemMsgType.WRITE_INIT:
+        word = req.data
+        hit  = hit and req.type_ == MemMsgType.WRITE
+
+      else:
+        data = word
+        word = amo_funcs[ int( req.type_ ) ]( word, req.data )
+        hit  = False
+
+      if needs_m( req ):
+        s.lines[i][idx][way] = line & ~( 0xffffffff << shamt ) | ( int( word ) << shamt )
+      s.lru[i][idx] = 1 - way
+
+      return CacheRespType( req.type_, req.opaque, int( hit ), 0, data )
+
+    # Starts the bus transaction for the miss of cache i
+
+    def start_txn( i, req ):
+
+      addr     = int( req.addr ) & ~0xf
+      idx, way = find( i, addr )
+
+      txn = { "cache": i, "req": req, "ops": deque(), "inflight": 0,
+              "line": None, "idx": idx }
+
+      # Upgrade the line in S in place, or evict the LRU line
+
+      if way is not None:
+        s.num_upgrades += 1
+      else:
+        way = s.lru[i][idx]
+        if s.states[i][idx][way] == M:
+          s.num_writebacks += 1
+          txn["ops"].append( MemReqType( MemMsgType.WRITE, 0, s.addrs[i][idx][way],
+                                         0, s.lines[i][idx][way] ) )
+
+      s.states[i][idx][way] = I
+      txn["way"] = way
+
+      # Snoop the other caches
+
+      for j in range( s.ncaches ):
+        jidx, jway = find( j, addr )
+        if j == i or jway is None:
+          continue
+
+        if s.states[j][jidx][jway] == M:
+          s.num_writebacks += 1
+          txn["line"] = s.lines[j][jidx][jway]
+          txn["ops"].append( MemReqType( MemMsgType.WRITE, 0, addr, 0, txn["line"] ) )
+
+        if needs_m( req ):
+          s.num_invalidations += 1
+          s.states[j][jidx][jway] = I
+        else:
+          s.states[j][jidx][jway] = S
+
+      if txn["line"] is None:
+        txn["ops"].append( MemReqType( MemMsgType.READ, 0, addr, 0, 0 ) )
+
+      s.txn = txn
+
+    #---------------------------------------------------------------------
+    # Concurrent block
+    #---------------------------------------------------------------------
+
+    @s.update
+    def up_caches():
+
+      # Bus transaction: send the memory requests one by one, and once
+      # all of them are done fill the line and perform the request
+
+      txn = s.txn
+      if txn is not None:
+
+        if txn["ops"] and s.mem.req.rdy():
+          s.mem.req( txn["ops"].popleft() )
+          txn["inflight"] += 1
+
+        if s.memresp_q.deq.rdy():
+          resp = s.memresp_q.deq()
+          txn["inflight"] -= 1
+          if resp.type_ == MemMsgType.READ:
+            txn["line"] = int( resp.data )
+
+        i = txn["cache"]
+        if not txn["ops"] and txn["inflight"] == 0 and s.cache[i].resp.rdy():
+          req, idx, way = txn["req"], txn["idx"], txn["way"]
+          s.addrs [i][idx][way] = int( req.addr ) & ~0xf
+          s.states[i][idx][way] = M if needs_m( req ) else S
+          s.lines [i][idx][way] = int( txn["line"] )
+          s.req_qs[i].deq()
+          s.cache[i].resp( access( i, idx, way, req, False ) )
+          s.waiting[i] = False
+          s.txn = None
+
+      # Hits
+
+      for i in range( s.ncaches ):
+        if s.waiting[i] or not s.req_qs[i].deq.rdy():
+          continue
+
+        req      = s.req_qs[i].peek()
+        idx, way = find( i, int( req.addr ) )
+
+        if way is not None and ( not needs_m( req ) or s.states[i][idx][way] == M ):
+          if s.cache[i].resp.rdy():
+            s.num_hits += 1
+            s.req_qs[i].deq()
+            s.cache[i].resp( access( i, idx, way, req, True ) )
+        else:
+          s.num_misses += 1
+          s.waiting[i] = True
+
+      # Give the bus to the next waiting cache
+
+      if s.txn is None:
+        for k in range( s.ncaches ):
+          i = ( s.ptr + k ) % s.ncaches
+          if s.waiting[i]:
+            start_txn( i, s.req_qs[i].peek() )
+            s.ptr = ( i + 1 ) % s.ncaches
+            break
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    bus = s.txn["cache"] if s.txn is not None else " "
+    return "({}|{})".format( "".join( "*" if x else " " for x in s.waiting ), bus )
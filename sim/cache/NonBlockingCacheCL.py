@@ -0,0 +1,277 @@
+#=========================================================================
+# NonBlockingCacheCL.py
+#=========================================================================
+# CL model of the non-blocking cache (NonBlockingCacheRTL), for fast
+# exploration of the number of MSHRs. It has the same organization as
+# the RTL (8KB, two ways with LRU replacement, 16B lines, write back and
+# write allocate) and follows the same rules:
+#
+#  - a miss allocates an MSHR, evicts the victim line (writing it back
+#    if it is dirty) and sends a refill request tagged with the MSHR id
+#  - misses to a line which already has an MSHR are merged into it, up
+#    to num_targets requests per MSHR
+#  - once the refill comes back we perform the requests of the MSHR in
+#    order and write the line into the cache
+#  - hits are served while misses are in flight, so responses can come
+#    back out of order, but responses to requests with the same opaque
+#    field come back in the order of the requests. A request waits if
+#    its opaque field has requests in flight in another MSHR.
+#  - a request waits if all MSHRs are in use, its MSHR is full, or both
+#    ways of its set wait for a refill
+#
+# Init requests which miss fill the line without a refill, like in the
+# blocking cache. Hits take one cycle like in the RTL, but we perform all
+# requests of an MSHR in the cycle the refill comes back. The model
+# counts hits, misses, merged misses, writebacks, and the cycles a
+# request waited.
+
+from collections import deque
+
+from pymtl3 import *
+from pymtl3.stdlib.cl   import PipeQueueCL
+from pymtl3.stdlib.ifcs import MemMsgType
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcCL, MemMinionIfcCL, mk_mem_msg
+
+# Cache organization, same as NonBlockingCachePRTL
+
+nsets = 256
+nways = 2
+
+amo_funcs = {
+  MemMsgType.AMO_ADD : lambda m,a : m+a,
+  MemMsgType.AMO_AND : lambda m,a : m&a,
+  MemMsgType.AMO_OR  : lambda m,a : m|a,
+}
+
+class NonBlockingCacheCL( Component ):
+
+  def construct( s, num_mshrs=4, num_targets=4 ):
+
+    CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
+    MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
+
+    s.num_mshrs   = num_mshrs
+    s.num_targets = num_targets
+
+    # Interface
+
+    s.cache = MemMinionIfcCL( CacheReqType, CacheRespType )
+    s.mem   = MemMasterIfcCL( MemReqType, MemRespType )
+
+    # Queues
+
+    s.req_q     = PipeQueueCL( num_entries=1 )( enq = s.cache.req )
+    s.memresp_q = PipeQueueCL( num_entries=1 )( enq = s.mem.resp )
+
+    s.resps   = deque()
+    s.memreqs = deque()
+
+    # Cache state: line address, valid and dirty bits, and data (an int)
+    # of every line, and the way to replace next in every set
+
+    s.addrs  = [ [ 0 ]     * nways for _ in range(nsets) ]
+    s.valid  = [ [ False ] * nways for _ in range(nsets) ]
+    s.dirty  = [ [ False ] * nways for _ in range(nsets) ]
+    s.lines  = [ [ 0 ]     * nways for _ in range(nsets) ]
+    s.lru    = [ 0 ] * nsets
+
+    # MSHRs: None if free, else a dict with the line address, its set and
+    # way, and the requests waiting for the line
+
+    s.mshrs = [ None ] * num_mshrs
+
+    # Stats
+
+    s.num_hits       = 0
+    s.num_misses     = 0
+    s.num_merges     = 0
+    s.num_writebacks = 0
+    s.num_stalls     = 0
+
+    #---------------------------------------------------------------------
+    # Helpers
+    #---------------------------------------------------------------------
+
+    def find( addr ):
+      idx = ( addr >> 4 ) % nsets
+      for way in range( nways ):
+        if s.valid[idx][way] and s.addrs[idx][way] == addr & ~0xf:
+          return idx, way
+      return idx, None
+
+    # Performs a request on a line (an int) and returns the response and
+    # the new line.
+
+    def access( line, req, hit ):
+
+      shamt = ( int( req.addr ) & 0xc ) * 8
+      word  = Bits32( ( line >> shamt ) & 0xffffffff )
+      data  = Bits32( 0 )
+
+      if req.type_ == MemMsgType.READ:
+        data = word
+
+      elif req.type_ == MemMsgType.WRITE or req.type_ == MemMsgType.WRITE_INIT:
+        word = req.data
+        hit  = hit and req.type_ == MemMsgType.WRITE
+
+      else:
+        data = word
+        word = amo_funcs[ int( req.type_ ) ]( word, req.data )
+        hit  = False
+
+      line = line & ~( 0xffffffff << shamt ) | ( int( word ) << shamt )
+      return CacheRespType( req.type_, req.opaque, int( hit ), 0, data ), line
+
+    # Picks the way to replace in a set, None if both ways wait for a
+    # refill
+
+    def victim( idx ):
+
+      pending = [ False ] * nways
+      for mshr in s.mshrs:
+        if mshr is not None and mshr["idx"] == idx:
+          pending[ mshr["way"] ] = True
+
+      for way in range( nways ):
+        if not s.valid[idx][way] and not pending[way]:
+          return way
+
+      for way in ( s.lru[idx], 1 - s.lru[idx] ):
+        if not pending[way]:
+          return way
+
+      return None
+
+    # Evicts the line in a way, writing it back if it is dirty
+
+    def evict( idx, way ):
+      if s.valid[idx][way] and s.dirty[idx][way]:
+        s.num_writebacks += 1
+        s.memreqs.append( MemReqType( MemMsgType.WRITE, 0, s.addrs[idx][way],
+                                      0, s.lines[idx][way] ) )
+      s.valid[idx][way] = False
+      s.dirty[idx][way] = False
+      s.lru[idx]        = 1 - way
+
+    # Handles a request, returns False if it has to wait
+
+    def handle( req ):
+
+      addr     = int( req.addr )
+      idx, way = find( addr )
+
+      # Wait for requests in flight with the same opaque field
+
+      mshr_id = None
+      for i, mshr in enumerate( s.mshrs ):
+        if mshr is None:
+          continue
+        if mshr["addr"] == addr & ~0xf:
+          mshr_id = i
+        elif any( target.opaque == req.opaque for target in mshr["targets"] ):
+          return False
+
+      # Secondary miss
+
+      if mshr_id is not None:
+        targets = s.mshrs[ mshr_id ]["targets"]
+        if len( targets ) == s.num_targets:
+          return False
+        s.num_merges += 1
+        targets.append( req )
+        return True
+
+      # Hit
+
+      if way is not None:
+        s.num_hits += 1
+        resp, s.lines[idx][way] = access( s.lines[idx][way], req, True )
+        if req.type_ != MemMsgType.READ:
+          s.dirty[idx][way] = True
+        s.lru[idx] = 1 - way
+        s.resps.append( resp )
+        return True
+
+      # Miss: init requests fill the line right away, others allocate an
+      # MSHR and wait for the refill
+
+      way = victim( idx )
+      if way is None or s.memreqs:
+        return False
+
+      if req.type_ == MemMsgType.WRITE_INIT:
+        evict( idx, way )
+        resp, s.lines[idx][way] = access( s.lines[idx][way], req, False )
+        s.addrs[idx][way] = addr & ~0xf
+        s.valid[idx][way] = True
+        s.resps.append( resp )
+        return True
+
+      if None not in s.mshrs:
+        return False
+
+      s.num_misses += 1
+      mshr_id = s.mshrs.index( None )
+      evict( idx, way )
+      s.mshrs[ mshr_id ] = { "addr": addr & ~0xf, "idx": idx, "way": way,
+                             "targets": [ req ] }
+      s.memreqs.append( MemReqType( MemMsgType.READ, mshr_id, addr & ~0xf, 0, 0 ) )
+      return True
+
+    # Performs the requests of an MSHR on its line and fills the line
+
+    def refill( mshr_id, line ):
+
+      mshr = s.mshrs[ mshr_id ]
+      idx, way = mshr["idx"], mshr["way"]
+      dirty = False
+
+      for req in mshr["targets"]:
+        resp, line = access( line, req, False )
+        dirty = dirty or req.type_ != MemMsgType.READ
+        s.resps.append( resp )
+
+      s.addrs[idx][way] = mshr["addr"]
+      s.valid[idx][way] = True
+      s.dirty[idx][way] = dirty
+      s.lines[idx][way] = line
+      s.mshrs[ mshr_id ] = None
+
+    #---------------------------------------------------------------------
+    # Concurrent block
+    #---------------------------------------------------------------------
+
+    @s.update
+    def up_cache():
+
+      # Send a response and a memory request
+
+      if s.resps and s.cache.resp.rdy():
+        s.cache.resp( s.resps.popleft() )
+
+      if s.memreqs and s.mem.req.rdy():
+        s.mem.req( s.memreqs.popleft() )
+
+      # Refills come first, we drop the responses to writebacks
+
+      if s.memresp_q.deq.rdy():
+        resp = s.memresp_q.deq()
+        if resp.type_ == MemMsgType.READ:
+          refill( int( resp.opaque ), int( resp.data ) )
+
+      # Handle the next request unless we still have responses to send
+
+      elif s.req_q.deq.rdy() and not s.resps:
+        if handle( s.req_q.peek() ):
+          s.req_q.deq()
+        else:
+          s.num_stalls += 1
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    return "({})".format( "".join( " " if mshr is None else str( len( mshr["targets"] ) )
+                                   for mshr in s.mshrs ) )
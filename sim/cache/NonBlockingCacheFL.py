@@ -0,0 +1,68 @@
+#=========================================================================
+# NonBlockingCacheFL.py
+#=========================================================================
+# A function level model of the non-blocking cache which only passes
+# cache requests and responses to the memory, like the old FL model of
+# the blocking cache. It does not hold any lines, so every response is a
+# miss, but it never stalls on a miss: it sends requests to memory as
+# fast as the memory takes them. The memory answers in order, so we
+# remember the types of the requests in flight to turn the responses to
+# init requests back into init responses.
+
+from collections import deque
+
+from pymtl3 import *
+from pymtl3.stdlib.cl   import PipeQueueCL
+from pymtl3.stdlib.ifcs import MemMsgType
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcCL, MemMinionIfcCL, mk_mem_msg
+
+class NonBlockingCacheFL( Component ):
+
+  def construct( s ):
+
+    CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
+    MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
+
+    # Interface
+
+    s.cache = MemMinionIfcCL( CacheReqType, CacheRespType )
+    s.mem   = MemMasterIfcCL( MemReqType, MemRespType )
+
+    # Queues
+
+    s.req_q     = PipeQueueCL( num_entries=1 )( enq = s.cache.req )
+    s.memresp_q = PipeQueueCL( num_entries=1 )( enq = s.mem.resp )
+
+    # Types of the requests in flight
+
+    s.types = deque()
+
+    @s.update
+    def up_cache():
+
+      # Pass through responses, truncating the data
+
+      if s.memresp_q.deq.rdy() and s.cache.resp.rdy():
+        resp = s.memresp_q.deq()
+        s.cache.resp( CacheRespType( s.types.popleft(), resp.opaque, 0,
+                                     0, resp.data[0:32] ) )
+
+      # Pass through requests, writing init data like any other data and
+      # zero extending the data
+
+      if s.req_q.deq.rdy() and s.mem.req.rdy():
+        req   = s.req_q.deq()
+        type_ = req.type_
+        if type_ == MemMsgType.WRITE_INIT:
+          type_ = MemMsgType.WRITE
+
+        s.types.append( req.type_ )
+        s.mem.req( MemReqType( type_, req.opaque, req.addr,
+                               int( req.len ) or 4, zext( req.data, 128 ) ) )
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    return "(forw {})".format( len( s.types ) )
@@ -0,0 +1,692 @@
+#=========================================================================
+# NonBlockingCachePRTL.py
+#=========================================================================
+# Non-blocking cache with the same organization as the blocking cache
+# (8KB, two ways with LRU replacement, 16B lines, write back and write
+# allocate) and num_mshrs miss status holding registers (MSHRs).
+#
+# A miss allocates an MSHR, which holds the address of the line, the way
+# it goes to, and up to num_targets requests waiting for the line. We
+# invalidate the victim line (sending it to memory if it is dirty) and
+# send a refill request with the MSHR id in the opaque field, and then
+# go on with the next request. A later miss to the same line is merged
+# into its MSHR (a secondary miss). When a refill comes back we perform
+# the requests of its MSHR in order on the line, sending their
+# responses, and then write the line into the cache and free the MSHR.
+#
+# Since hits are served while misses are in flight, responses can come
+# back out of order. But responses to requests with the same opaque
+# field come back in the order of the requests, so a requester which
+# expects its responses in order (e.g., the processor and the
+# accelerator behind the Funnel in ProcMemXcel) can share the cache with
+# another one. A request waits (and so do all requests behind it) if
+# requests with the same opaque field wait for another line, if all
+# MSHRs are in use, if its MSHR is full, or if both ways of its set wait
+# for a refill.
+#
+# The cache handles one request at a time:
+#
+#  - IDLE: takes a refill if there is one and goes to REPLAY, otherwise
+#    reads the tags and data of the next request
+#  - TAG_CHECK: hits send their response (writes and AMOs also write the
+#    data array), misses are merged or allocate an MSHR, and requests
+#    which have to wait go back to IDLE and try again. After a read hit
+#    or a merged miss we can take the next request right away.
+#  - REFILL_REQUEST: sends the refill request of the new MSHR
+#  - REPLAY: performs the requests of the refilled MSHR, one per cycle
+#  - REFILL_UPDATE: writes the line into the cache and frees the MSHR
+#
+# Read hits take one cycle and write hits two, like in the blocking
+# cache. Init requests which miss fill the line without a refill, like in
+# the blocking cache, and they always respond with a miss. Responses to
+# writebacks are dropped.
+
+from pymtl3 import *
+from pymtl3.stdlib.ifcs import mk_mem_msg, MemMsgType
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcRTL, MemMinionIfcRTL
+from pymtl3.stdlib.rtl import NormalQueueRTL
+
+from sram.SramRTL import SramRTL
+
+from .RegisterFileRst import RegisterFileRst
+
+# local parameters not meant to be set from outside
+
+abw     = 32          # Short name for addr bitwidth
+clw     = 128         # Short name for cacheline bitwidth
+nsets   = 256         # Number of sets
+nways   = 2           # Number of ways
+idw     = 8           # Short name for index width
+tgw     = abw - 4     # Short name for tag width, the whole line address
+
+class NonBlockingCachePRTL( Component ):
+
+  def construct( s, num_mshrs=4, num_targets=4 ):
+
+    assert num_mshrs   >= 2 and num_mshrs   & ( num_mshrs   - 1 ) == 0, \
+      "num_mshrs must be a power of two"
+    assert num_targets >= 2 and num_targets & ( num_targets - 1 ) == 0, \
+      "num_targets must be a power of two"
+
+    CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
+    MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
+
+    MshrIdType = mk_bits( clog2( num_mshrs ) )
+    TgtIdType  = mk_bits( clog2( num_targets ) )
+    CountType  = mk_bits( clog2( num_targets + 1 ) )
+    IdxType    = mk_bits( idw )
+    LineType   = mk_bits( tgw )
+
+    s.num_mshrs   = num_mshrs
+    s.num_targets = num_targets
+
+    #---------------------------------------------------------------------
+    # Interface
+    #---------------------------------------------------------------------
+
+    s.cache = MemMinionIfcRTL( CacheReqType, CacheRespType )
+    s.mem   = MemMasterIfcRTL( MemReqType, MemRespType )
+
+    # Memory queues. A miss needs two entries (writeback and refill), and
+    # we only allocate an MSHR if the memory request queue is empty.
+
+    s.memreq_q  = NormalQueueRTL( MemReqType, 2 )
+    s.memresp_q = NormalQueueRTL( MemRespType, 2 )( enq = s.mem.resp )
+
+    s.memreq_q.deq.ret //= s.mem.req.msg
+
+    @s.update
+    def up_memreq_deq():
+      both_rdy = s.mem.req.rdy & s.memreq_q.deq.rdy
+      s.memreq_q.deq.en = both_rdy
+      s.mem.req.en      = both_rdy
+
+    #---------------------------------------------------------------------
+    # State Definitions
+    #---------------------------------------------------------------------
+
+    s.STATE_IDLE           = b3( 0 )
+    s.STATE_TAG_CHECK      = b3( 1 )
+    s.STATE_REFILL_REQUEST = b3( 2 )
+    s.STATE_REPLAY         = b3( 3 )
+    s.STATE_REFILL_UPDATE  = b3( 4 )
+
+    s.state      = Wire( Bits3 )
+    s.next_state = Wire( Bits3 )
+
+    @s.update_ff
+    def reg_state():
+      if s.reset:
+        s.state <<= s.STATE_IDLE
+      else:
+        s.state <<= s.next_state
+
+    #---------------------------------------------------------------------
+    # Request register
+    #---------------------------------------------------------------------
+    # Holds the request from IDLE or TAG_CHECK until it is done. req_held
+    # is set if the request has to try again.
+
+    s.req      = Wire( CacheReqType )
+    s.req_held = Wire()
+    s.accept   = Wire()
+    s.stall    = Wire()
+
+    @s.update_ff
+    def reg_req():
+      if s.accept:
+        s.req <<= CacheReqType( s.cache.req.msg.type_, s.cache.req.msg.opaque,
+                                s.cache.req.msg.addr,  s.cache.req.msg.len,
+                                s.cache.req.msg.data )
+
+      if s.reset:
+        s.req_held <<= b1(0)
+      elif s.state == s.STATE_TAG_CHECK:
+        s.req_held <<= s.stall
+
+    s.req_line   = Wire( LineType )
+    s.req_idx    = Wire( IdxType )
+    s.req_offset = Wire( Bits2 )
+
+    s.req_line   //= s.req.addr[4:abw]
+    s.req_idx    //= s.req.addr[4:4+idw]
+    s.req_offset //= s.req.addr[2:4]
+
+    #---------------------------------------------------------------------
+    # MSHRs
+    #---------------------------------------------------------------------
+    # The targets of MSHR m are entries m*num_targets to
+    # (m+1)*num_targets-1 of the target arrays.
+
+    s.mshr_valid = [ Wire()            for _ in range(num_mshrs) ]
+    s.mshr_line  = [ Wire( LineType )  for _ in range(num_mshrs) ]
+    s.mshr_way   = [ Wire()            for _ in range(num_mshrs) ]
+    s.mshr_count = [ Wire( CountType ) for _ in range(num_mshrs) ]
+
+    s.tgt_type   = [ Wire( Bits4 )  for _ in range(num_mshrs*num_targets) ]
+    s.tgt_opaque = [ Wire( Bits8 )  for _ in range(num_mshrs*num_targets) ]
+    s.tgt_offset = [ Wire( Bits2 )  for _ in range(num_mshrs*num_targets) ]
+    s.tgt_data   = [ Wire( Bits32 ) for _ in range(num_mshrs*num_targets) ]
+
+    s.mshr_alloc = Wire()
+    s.mshr_merge = Wire()
+    s.mshr_free  = Wire()
+    s.free_id    = Wire( MshrIdType )
+    s.match_id   = Wire( MshrIdType )
+    s.alloc_id   = Wire( MshrIdType )
+    s.refill_id  = Wire( MshrIdType )
+    s.victim     = Wire()
+
+    @s.update_ff
+    def reg_mshrs():
+
+      if s.reset:
+        for m in range( num_mshrs ):
+          s.mshr_valid[m] <<= b1(0)
+
+      else:
+        if s.mshr_alloc:
+          s.mshr_valid[ s.free_id ] <<= b1(1)
+          s.mshr_line [ s.free_id ] <<= s.req_line
+          s.mshr_way  [ s.free_id ] <<= s.victim
+          s.mshr_count[ s.free_id ] <<= CountType(1)
+          s.tgt_type  [ concat( s.free_id, TgtIdType(0) ) ] <<= s.req.type_
+          s.tgt_opaque[ concat( s.free_id, TgtIdType(0) ) ] <<= s.req.opaque
+          s.tgt_offset[ concat( s.free_id, TgtIdType(0) ) ] <<= s.req_offset
+          s.tgt_data  [ concat( s.free_id, TgtIdType(0) ) ] <<= s.req.data
+
+        if s.mshr_merge:
+          s.mshr_count[ s.match_id ] <<= s.mshr_count[ s.match_id ] + CountType(1)
+          s.tgt_type  [ concat( s.match_id, s.mshr_count[ s.match_id ][0:clog2(num_targets)] ) ] <<= s.req.type_
+          s.tgt_opaque[ concat( s.match_id, s.mshr_count[ s.match_id ][0:clog2(num_targets)] ) ] <<= s.req.opaque
+          s.tgt_offset[ concat( s.match_id, s.mshr_count[ s.match_id ][0:clog2(num_targets)] ) ] <<= s.req_offset
+          s.tgt_data  [ concat( s.match_id, s.mshr_count[ s.match_id ][0:clog2(num_targets)] ) ] <<= s.req.data
+
+        if s.mshr_free:
+          s.mshr_valid[ s.refill_id ] <<= b1(0)
+
+      if s.mshr_alloc:
+        s.alloc_id <<= s.free_id
+
+    # Look up the request in the MSHRs: the MSHR of its line, whether a
+    # request with the same opaque field waits for another line, which
+    # ways of its set wait for a refill, and the first free MSHR
+
+    s.mshr_match = Wire()
+    s.mshr_full  = Wire()
+    s.opq_block  = Wire()
+    s.pending_0  = Wire()
+    s.pending_1  = Wire()
+
+    @s.update
+    def comb_mshr_lookup():
+      s.mshr_match = b1(0)
+      s.match_id   = MshrIdType(0)
+      s.opq_block  = b1(0)
+      s.pending_0  = b1(0)
+      s.pending_1  = b1(0)
+
+      for m in range( num_mshrs ):
+        if s.mshr_valid[m]:
+
+          if s.mshr_line[m] == s.req_line:
+            s.mshr_match = b1(1)
+            s.match_id   = MshrIdType(m)
+          else:
+            for t in range( num_targets ):
+              if ( CountType(t) < s.mshr_count[m] ) & \
+                 ( s.tgt_opaque[ m*num_targets + t ] == s.req.opaque ):
+                s.opq_block = b1(1)
+
+          if s.mshr_line[m][0:idw] == s.req_idx:
+            if s.mshr_way[m]: s.pending_1 = b1(1)
+            else:             s.pending_0 = b1(1)
+
+      s.mshr_full = b1(1)
+      s.free_id   = MshrIdType(0)
+
+      for m in range( num_mshrs-1, -1, -1 ):
+        if ~s.mshr_valid[m]:
+          s.mshr_full = b1(0)
+          s.free_id   = MshrIdType(m)
+
+    # The refilled MSHR and the target we perform next
+
+    s.refill_line  = Wire( LineType )
+    s.refill_way   = Wire()
+    s.refill_count = Wire( CountType )
+    s.replay_ptr   = Wire( TgtIdType )
+    s.replay_last  = Wire()
+
+    @s.update
+    def comb_refill_mshr():
+      s.refill_line  = s.mshr_line [ s.refill_id ]
+      s.refill_way   = s.mshr_way  [ s.refill_id ]
+      s.refill_count = s.mshr_count[ s.refill_id ]
+      s.replay_last  = zext( s.replay_ptr, clog2(num_targets+1) ) + CountType(1) == s.refill_count
+
+    #---------------------------------------------------------------------
+    # Tag and data arrays
+    #---------------------------------------------------------------------
+
+    s.sram_idx   = Wire( IdxType )
+    s.array_ren  = Wire()
+    s.tag_wen    = [ Wire() for _ in range(nways) ]
+    s.data_wen   = [ Wire() for _ in range(nways) ]
+    s.tag_val    = [ Wire() for _ in range(nways) ]
+    s.data_val   = [ Wire() for _ in range(nways) ]
+    s.tag_wdata  = Wire( Bits32 )
+    s.data_wdata = Wire( mk_bits(clw) )
+    s.data_wben  = Wire( Bits4 )
+    s.tag_rdata  = [ Wire( Bits32 )       for _ in range(nways) ]
+    s.data_rdata = [ Wire( mk_bits(clw) ) for _ in range(nways) ]
+
+    @s.update
+    def comb_array_en():
+      for w in range( nways ):
+        s.tag_val [w] = s.array_ren | s.tag_wen [w]
+        s.data_val[w] = s.array_ren | s.data_wen[w]
+
+    s.tag_arrays = [ SramRTL( 32, nsets )(
+      port0_val   = s.tag_val[w],
+      port0_type  = s.tag_wen[w],
+      port0_idx   = s.sram_idx,
+      port0_rdata = s.tag_rdata[w],
+      port0_wdata = s.tag_wdata,
+    ) for w in range(nways) ]
+
+    s.data_arrays = [ SramRTL( clw, nsets, mask_size=4 )(
+      port0_val   = s.data_val[w],
+      port0_type  = s.data_wen[w],
+      port0_idx   = s.sram_idx,
+      port0_rdata = s.data_rdata[w],
+      port0_wben  = s.data_wben,
+      port0_wdata = s.data_wdata,
+    ) for w in range(nways) ]
+
+    # Valid, dirty, and LRU bits, read and written at the index of the
+    # request, or of the refilled line in REFILL_UPDATE
+
+    s.bits_idx  = Wire( IdxType )
+    s.valid     = [ Wire() for _ in range(nways) ]
+    s.dirty     = [ Wire() for _ in range(nways) ]
+    s.valid_wen = [ Wire() for _ in range(nways) ]
+    s.dirty_wen = [ Wire() for _ in range(nways) ]
+    s.valid_in  = Wire()
+    s.dirty_in  = Wire()
+    s.lru_wen   = Wire()
+    s.lru_in    = Wire()
+    s.lru_way   = Wire()
+
+    s.valid_bits = [ RegisterFileRst( Bits1, nregs=nsets, rd_ports=1, wr_ports=1 )(
+      raddr = { 0: s.bits_idx },
+      rdata = { 0: s.valid[w] },
+      wen   = { 0: s.valid_wen[w] },
+      waddr = { 0: s.bits_idx },
+      wdata = { 0: s.valid_in },
+    ) for w in range(nways) ]
+
+    s.dirty_bits = [ RegisterFileRst( Bits1, nregs=nsets, rd_ports=1, wr_ports=1 )(
+      raddr = { 0: s.bits_idx },
+      rdata = { 0: s.dirty[w] },
+      wen   = { 0: s.dirty_wen[w] },
+      waddr = { 0: s.bits_idx },
+      wdata = { 0: s.dirty_in },
+    ) for w in range(nways) ]
+
+    s.lru_bits = RegisterFileRst( Bits1, nregs=nsets, rd_ports=1, wr_ports=1 )(
+      raddr = { 0: s.bits_idx },
+      rdata = { 0: s.lru_way },
+      wen   = { 0: s.lru_wen },
+      waddr = { 0: s.bits_idx },
+      wdata = { 0: s.lru_in },
+    )
+
+    @s.update
+    def comb_bits_idx():
+      if s.state == s.STATE_REFILL_UPDATE:
+        s.bits_idx = s.refill_line[0:idw]
+      else:
+        s.bits_idx = s.req_idx
+
+    #---------------------------------------------------------------------
+    # Tag check
+    #---------------------------------------------------------------------
+
+    s.hit_0        = Wire()
+    s.hit_1        = Wire()
+    s.hit          = Wire()
+    s.victim_ok    = Wire()
+    s.victim_dirty = Wire()
+
+    @s.update
+    def comb_tag_check():
+      s.hit_0 = s.valid[0] & ( s.tag_rdata[0][0:tgw] == s.req_line )
+      s.hit_1 = s.valid[1] & ( s.tag_rdata[1][0:tgw] == s.req_line )
+      s.hit   = s.hit_0 | s.hit_1
+
+      # Replace an empty way, else the LRU way, but never a way which
+      # waits for a refill
+
+      s.victim_ok = ~( s.pending_0 & s.pending_1 )
+
+      if   ~s.valid[0] & ~s.pending_0: s.victim = b1(0)
+      elif ~s.valid[1] & ~s.pending_1: s.victim = b1(1)
+      elif s.pending_0:                s.victim = b1(1)
+      elif s.pending_1:                s.victim = b1(0)
+      else:                            s.victim = s.lru_way
+
+      if s.victim: s.victim_dirty = s.valid[1] & s.dirty[1]
+      else:        s.victim_dirty = s.valid[0] & s.dirty[0]
+
+    #---------------------------------------------------------------------
+    # Word access
+    #---------------------------------------------------------------------
+    # The request we perform, either the request register on its line in
+    # the data array (in TAG_CHECK), or a target on the refilled line (in
+    # REPLAY). We compute the word it reads and the word it writes.
+
+    s.op_type     = Wire( Bits4 )
+    s.op_opaque   = Wire( Bits8 )
+    s.op_offset   = Wire( Bits2 )
+    s.op_data     = Wire( Bits32 )
+    s.op_line     = Wire( mk_bits(clw) )
+    s.op_word     = Wire( Bits32 )
+    s.op_new_word = Wire( Bits32 )
+    s.op_new_line = Wire( mk_bits(clw) )
+    s.op_is_read  = Wire()
+    s.line_reg    = Wire( mk_bits(clw) )
+
+    @s.update
+    def comb_op():
+
+      if s.state == s.STATE_REPLAY:
+        s.op_type   = s.tgt_type  [ concat( s.refill_id, s.replay_ptr ) ]
+        s.op_opaque = s.tgt_opaque[ concat( s.refill_id, s.replay_ptr ) ]
+        s.op_offset = s.tgt_offset[ concat( s.refill_id, s.replay_ptr ) ]
+        s.op_data   = s.tgt_data  [ concat( s.refill_id, s.replay_ptr ) ]
+        s.op_line   = s.line_reg
+      else:
+        s.op_type   = s.req.type_
+        s.op_opaque = s.req.opaque
+        s.op_offset = s.req_offset
+        s.op_data   = s.req.data
+        if s.hit_1 | ( ~s.hit & s.victim ):
+          s.op_line = s.data_rdata[1]
+        else:
+          s.op_line = s.data_rdata[0]
+
+      s.op_is_read = s.op_type == b4( MemMsgType.READ )
+
+      if   s.op_offset == b2(0): s.op_word = s.op_line[ 0: 32]
+      elif s.op_offset == b2(1): s.op_word = s.op_line[32: 64]
+      elif s.op_offset == b2(2): s.op_word = s.op_line[64: 96]
+      else:                      s.op_word = s.op_line[96:128]
+
+      if   s.op_type == b4( MemMsgType.AMO_ADD ): s.op_new_word = s.op_word + s.op_data
+      elif s.op_type == b4( MemMsgType.AMO_AND ): s.op_new_word = s.op_word & s.op_data
+      elif s.op_type == b4( MemMsgType.AMO_OR  ): s.op_new_word = s.op_word | s.op_data
+      elif s.op_is_read:                          s.op_new_word = s.op_word
+      else:                                       s.op_new_word = s.op_data
+
+      if   s.op_offset == b2(0): s.op_new_line = concat( s.op_line[32:128], s.op_new_word )
+      elif s.op_offset == b2(1): s.op_new_line = concat( s.op_line[64:128], s.op_new_word, s.op_line[0:32] )
+      elif s.op_offset == b2(2): s.op_new_line = concat( s.op_line[96:128], s.op_new_word, s.op_line[0:64] )
+      else:                      s.op_new_line = concat( s.op_new_word, s.op_line[0:96] )
+
+    # Reads and AMOs return the (old) data of the word
+
+    s.resp_val = Wire()
+    s.resp_hit = Wire()
+
+    @s.update
+    def comb_cacheresp():
+      if s.op_is_read | ( s.op_type >= b4( MemMsgType.AMO_ADD ) ):
+        resp_data = s.op_word
+      else:
+        resp_data = b32(0)
+
+      s.cache.resp.msg = CacheRespType( s.op_type, s.op_opaque,
+                                        concat( b1(0), s.resp_hit ), b2(0), resp_data )
+      s.cache.resp.en  = s.resp_val & s.cache.resp.rdy
+
+    #---------------------------------------------------------------------
+    # Refill
+    #---------------------------------------------------------------------
+    # We take a refill into line_reg, perform the targets on it, and then
+    # write it into the data array. Responses to writebacks are dropped.
+
+    s.refill_avail = Wire()
+    s.wback_resp   = Wire()
+    s.refill_take  = Wire()
+    s.replay_next  = Wire()
+    s.line_dirty   = Wire()
+
+    @s.update
+    def comb_memresp():
+      s.refill_avail = s.memresp_q.deq.rdy & ( s.memresp_q.deq.ret.type_ == b4( MemMsgType.READ ) )
+      s.wback_resp   = s.memresp_q.deq.rdy & ( s.memresp_q.deq.ret.type_ != b4( MemMsgType.READ ) )
+
+    @s.update_ff
+    def reg_refill():
+      if s.refill_take:
+        s.line_reg   <<= s.memresp_q.deq.ret.data
+        s.refill_id  <<= s.memresp_q.deq.ret.opaque[0:clog2(num_mshrs)]
+        s.replay_ptr <<= TgtIdType(0)
+        s.line_dirty <<= b1(0)
+      elif s.replay_next:
+        s.line_reg   <<= s.op_new_line
+        s.replay_ptr <<= s.replay_ptr + TgtIdType(1)
+        s.line_dirty <<= s.line_dirty | ~s.op_is_read
+
+    #---------------------------------------------------------------------
+    # Control
+    #---------------------------------------------------------------------
+
+    s.free_sram      = Wire()
+    s.ctrl_ren       = Wire()
+    s.ctrl_state     = Wire( Bits3 )
+
+    @s.update
+    def comb_ctrl():
+
+      s.ctrl_state = s.state
+
+      s.stall         = b1(0)
+      s.resp_val      = b1(0)
+      s.resp_hit      = b1(0)
+      s.refill_take   = b1(0)
+      s.replay_next   = b1(0)
+      s.mshr_alloc    = b1(0)
+      s.mshr_merge    = b1(0)
+      s.mshr_free     = b1(0)
+      s.free_sram     = b1(0)
+      s.ctrl_ren      = b1(0)
+      s.lru_wen       = b1(0)
+      s.lru_in        = b1(0)
+      s.valid_in      = b1(0)
+      s.dirty_in      = b1(0)
+      s.data_wben     = b4(0)
+
+      for w in range( nways ):
+        s.tag_wen  [w] = b1(0)
+        s.data_wen [w] = b1(0)
+        s.valid_wen[w] = b1(0)
+        s.dirty_wen[w] = b1(0)
+
+      s.memreq_q.enq.en  = b1(0)
+      s.memreq_q.enq.msg = MemReqType()
+
+      # Tag and data written by TAG_CHECK (and the same way but the whole
+      # line in REFILL_UPDATE)
+
+      s.tag_wdata  = concat( b4(0), s.req_line )
+      s.data_wdata = concat( s.op_new_word, s.op_new_word, s.op_new_word, s.op_new_word )
+
+      s.memresp_q.deq.en = s.wback_resp
+
+      is_read = s.req.type_ == b4( MemMsgType.READ  )
+      is_init = s.req.type_ == b4( MemMsgType.WRITE_INIT )
+
+      if s.state == s.STATE_IDLE:
+        if s.refill_avail:
+          s.memresp_q.deq.en = b1(1)
+          s.refill_take      = b1(1)
+          s.ctrl_state       = s.STATE_REPLAY
+        elif s.req_held:
+          s.ctrl_ren   = b1(1)
+          s.ctrl_state = s.STATE_TAG_CHECK
+        else:
+          s.free_sram = b1(1)
+
+      elif s.state == s.STATE_TAG_CHECK:
+        s.ctrl_state = s.STATE_IDLE
+
+        if s.opq_block:
+          s.stall = b1(1)
+
+        # Secondary miss
+
+        elif s.mshr_match:
+          if s.mshr_count[ s.match_id ] < CountType( num_targets ):
+            s.mshr_merge = b1(1)
+            s.free_sram  = b1(1)
+          else:
+            s.stall = b1(1)
+
+        # Hit
+
+        elif s.hit:
+          if s.cache.resp.rdy:
+            s.resp_val = b1(1)
+            s.resp_hit = ( is_read | ( s.req.type_ == b4( MemMsgType.WRITE ) ) )
+            s.lru_wen  = b1(1)
+            s.lru_in   = ~s.hit_1
+            if is_read:
+              s.free_sram = b1(1)
+            else:
+              s.data_wen [ s.hit_1 ] = b1(1)
+              s.data_wben            = b4(1) << zext( s.req_offset, 4 )
+              s.dirty_wen[ s.hit_1 ] = b1(1)
+              s.dirty_in             = b1(1)
+          else:
+            s.stall = b1(1)
+
+        elif ~s.victim_ok:
+          s.stall = b1(1)
+
+        # Init miss, fill the victim way with the word
+
+        elif is_init:
+          if s.cache.resp.rdy & ( ~s.victim_dirty | s.memreq_q.enq.rdy ):
+            s.resp_val = b1(1)
+            s.memreq_q.enq.en = s.victim_dirty
+            s.tag_wen  [ s.victim ] = b1(1)
+            s.data_wen [ s.victim ] = b1(1)
+            s.data_wben             = b4(1) << zext( s.req_offset, 4 )
+            s.valid_wen[ s.victim ] = b1(1)
+            s.valid_in              = b1(1)
+            s.dirty_wen[ s.victim ] = b1(1)
+            s.dirty_in              = b1(0)
+            s.lru_wen               = b1(1)
+            s.lru_in                = ~s.victim
+          else:
+            s.stall = b1(1)
+
+        # Primary miss, allocate an MSHR and evict the victim
+
+        elif ~s.mshr_full & ( s.memreq_q.count == 0 ):
+          s.mshr_alloc = b1(1)
+          s.memreq_q.enq.en = s.victim_dirty
+          s.valid_wen[ s.victim ] = b1(1)
+          s.valid_in              = b1(0)
+          s.lru_wen               = b1(1)
+          s.lru_in                = ~s.victim
+          s.ctrl_state            = s.STATE_REFILL_REQUEST
+
+        else:
+          s.stall = b1(1)
+
+        # Writeback of the victim
+
+        if s.victim:
+          s.memreq_q.enq.msg = MemReqType( b4( MemMsgType.WRITE ), b8(0),
+                                           concat( s.tag_rdata[1][0:tgw], b4(0) ),
+                                           b4(0), s.data_rdata[1] )
+        else:
+          s.memreq_q.enq.msg = MemReqType( b4( MemMsgType.WRITE ), b8(0),
+                                           concat( s.tag_rdata[0][0:tgw], b4(0) ),
+                                           b4(0), s.data_rdata[0] )
+
+      elif s.state == s.STATE_REFILL_REQUEST:
+        s.memreq_q.enq.msg = MemReqType( b4( MemMsgType.READ ), zext( s.alloc_id, 8 ),
+                                         concat( s.mshr_line[ s.alloc_id ], b4(0) ),
+                                         b4(0), mk_bits(clw)(0) )
+        if s.memreq_q.enq.rdy:
+          s.memreq_q.enq.en = b1(1)
+          s.ctrl_state      = s.STATE_IDLE
+
+      elif s.state == s.STATE_REPLAY:
+        if s.cache.resp.rdy:
+          s.resp_val    = b1(1)
+          s.replay_next = b1(1)
+          if s.replay_last:
+            s.ctrl_state = s.STATE_REFILL_UPDATE
+
+      elif s.state == s.STATE_REFILL_UPDATE:
+        s.tag_wdata  = concat( b4(0), s.refill_line )
+        s.data_wdata = s.line_reg
+        s.data_wben  = b4(0xf)
+        s.tag_wen  [ s.refill_way ] = b1(1)
+        s.data_wen [ s.refill_way ] = b1(1)
+        s.valid_wen[ s.refill_way ] = b1(1)
+        s.valid_in                  = b1(1)
+        s.dirty_wen[ s.refill_way ] = b1(1)
+        s.dirty_in                  = s.line_dirty
+        s.mshr_free                 = b1(1)
+        s.ctrl_state                = s.STATE_IDLE
+
+    # Take the next request if the arrays are free this cycle, unless a
+    # refill is waiting
+
+    @s.update
+    def comb_cachereq_rdy():
+      s.cache.req.rdy = s.free_sram & ~s.refill_avail
+
+    @s.update
+    def comb_accept():
+      s.accept    = s.cache.req.en
+      s.array_ren = s.ctrl_ren | s.cache.req.en
+      if s.cache.req.en:
+        s.next_state = s.STATE_TAG_CHECK
+      else:
+        s.next_state = s.ctrl_state
+
+    @s.update
+    def comb_sram_idx():
+      if s.state == s.STATE_REFILL_UPDATE:
+        s.sram_idx = s.refill_line[0:idw]
+      elif s.accept:
+        s.sram_idx = s.cache.req.msg.addr[4:4+idw]
+      else:
+        s.sram_idx = s.req_idx
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+
+    state = s.state
+
+    if   state == s.STATE_IDLE:           state_str = "(I "
+    elif state == s.STATE_TAG_CHECK:      state_str = "(TC"
+    elif state == s.STATE_REFILL_REQUEST: state_str = "(RR"
+    elif state == s.STATE_REPLAY:         state_str = "(RP"
+    elif state == s.STATE_REFILL_UPDATE:  state_str = "(RU"
+    else :                                state_str = "(? "
+
+    mshrs = "".join( str( int( s.mshr_count[m] ) ) if s.mshr_valid[m] else " "
+                     for m in range( s.num_mshrs ) )
+
+    return "{} {})".format( state_str, mshrs )
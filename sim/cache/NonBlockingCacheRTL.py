@@ -0,0 +1,14 @@
+from pymtl3.passes.backends.verilog import TranslationConfigs
+
+# Only using PyMTL version
+from .NonBlockingCachePRTL import NonBlockingCachePRTL
+
+class NonBlockingCacheRTL( NonBlockingCachePRTL ):
+  def construct( s, num_mshrs=4, num_targets=4 ):
+    super().construct( num_mshrs, num_targets )
+
+    # The translated Verilog must be xRTL.v instead of xPRTL.v
+    s.config_verilog_translate = TranslationConfigs(
+      translate=False,
+      explicit_module_name = f'cache_NonBlockingCacheRTL_{num_mshrs}x{num_targets}',
+    )
@@ -0,0 +1,39 @@
+#=========================================================================
+# RegisterFileRst
+#=========================================================================
+# Register file like RegisterFile in the stdlib, but all registers are
+# cleared on reset. The caches keep their valid, dirty, and LRU bits in
+# it, so that resetting a model (e.g., to run the next program in
+# pmx-sim --batch) also empties its caches.
+
+from pymtl3 import *
+
+class RegisterFileRst( Component ):
+
+  def construct( s, Type, nregs=32, rd_ports=1, wr_ports=1 ):
+
+    addr_type = mk_bits( clog2( nregs ) )
+
+    s.raddr = [ InPort( addr_type ) for i in range( rd_ports ) ]
+    s.rdata = [ OutPort( Type ) for i in range( rd_ports ) ]
+
+    s.waddr = [ InPort( addr_type ) for i in range( wr_ports ) ]
+    s.wdata = [ InPort( Type ) for i in range( wr_ports ) ]
+    s.wen   = [ InPort( Bits1 ) for i in range( wr_ports ) ]
+
+    s.regs = [ Wire( Type ) for i in range(nregs) ]
+
+    @s.update
+    def up_rf_read():
+      for i in range( rd_ports ):
+        s.rdata[i] = s.regs[ s.raddr[i] ]
+
+    @s.update_ff
+    def up_rf_write():
+      if s.reset:
+        for i in range( nregs ):
+          s.regs[i] <<= Type( 0 )
+      else:
+        for i in range( wr_ports ):
+          if s.wen[i]:
+            s.regs[ s.waddr[i] ] <<= s.wdata[i]
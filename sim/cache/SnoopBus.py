@@ -0,0 +1,229 @@
+#=========================================================================
+# SnoopBus.py
+#=========================================================================
+# Snooping bus for coherent caches (BlockingCacheRTL with coherent=True).
+# The bus connects the memory interfaces and the snoop interfaces of N
+# caches to one memory port, and serves one coherence request at a time:
+#
+#  - GETS/GETM : snoop all the other caches with the same request, so
+#                that they downgrade (GETS) or invalidate (GETM) the
+#                line. If one of them had the line in M, its snoop
+#                response carries the dirty line, which we write back
+#                and then send to the requester. Otherwise we read the
+#                line from memory.
+#  - PUTM      : write the line back to memory.
+#
+# We do not queue requests: a cache keeps its request until we take it,
+# so that it can still handle snoops while it waits (see
+# BlockingCacheCtrlPRTL). Since the en/rdy interface does not tell us
+# whether a cache has a request, we poll the caches round robin and are
+# only ready for one of them per cycle.
+
+from pymtl3 import *
+from pymtl3.stdlib.ifcs import MemMsgType
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcRTL, MemMinionIfcRTL, mk_mem_msg
+
+from .BlockingCacheCtrlPRTL import PUTM
+
+class SnoopBus( Component ):
+
+  def construct( s, ncaches ):
+
+    MemReqType, MemRespType = mk_mem_msg( 8, 32, 128 )
+
+    IdType   = mk_bits( max( 1, clog2( ncaches ) ) )
+    MaskType = mk_bits( ncaches )
+
+    #---------------------------------------------------------------------
+    # Interface
+    #---------------------------------------------------------------------
+
+    s.cache = [ MemMinionIfcRTL( MemReqType, MemRespType ) for _ in range(ncaches) ]
+    s.snoop = [ MemMasterIfcRTL( MemReqType, MemRespType ) for _ in range(ncaches) ]
+    s.mem   = MemMasterIfcRTL( MemReqType, MemRespType )
+
+    #---------------------------------------------------------------------
+    # State Definitions
+    #---------------------------------------------------------------------
+
+    s.STATE_IDLE     = b3( 0 )
+    s.STATE_SNOOP    = b3( 1 )
+    s.STATE_WB_REQ   = b3( 2 )
+    s.STATE_WB_WAIT  = b3( 3 )
+    s.STATE_MEM_REQ  = b3( 4 )
+    s.STATE_MEM_WAIT = b3( 5 )
+    s.STATE_RESP     = b3( 6 )
+
+    # Registers
+
+    s.state     = Wire( Bits3 )
+    s.ptr       = Wire( IdType )
+    s.req_id    = Wire( IdType )
+    s.req_msg   = Wire( MemReqType )
+    s.sent      = Wire( MaskType )
+    s.done      = Wire( MaskType )
+    s.wb        = Wire()
+    s.line      = Wire( mk_bits(128) )
+
+    # Next values
+
+    s.next_state   = Wire( Bits3 )
+    s.next_ptr     = Wire( IdType )
+    s.next_sent    = Wire( MaskType )
+    s.next_done    = Wire( MaskType )
+    s.next_wb      = Wire()
+    s.next_line    = Wire( mk_bits(128) )
+    s.accept       = Wire()
+    s.others       = Wire( MaskType )
+
+    @s.update_ff
+    def up_bus_regs():
+      if s.reset:
+        s.state <<= s.STATE_IDLE
+        s.ptr   <<= IdType(0)
+        s.sent  <<= MaskType(0)
+        s.done  <<= MaskType(0)
+        s.wb    <<= b1(0)
+      else:
+        s.state <<= s.next_state
+        s.ptr   <<= s.next_ptr
+        s.sent  <<= s.next_sent
+        s.done  <<= s.next_done
+        s.wb    <<= s.next_wb
+
+      s.line <<= s.next_line
+
+      if s.accept:
+        s.req_id  <<= s.ptr
+        s.req_msg <<= s.cache[ s.ptr ].req.msg
+
+    #---------------------------------------------------------------------
+    # Control
+    #---------------------------------------------------------------------
+
+    @s.update
+    def comb_bus():
+
+      s.next_state = s.state
+      s.next_ptr   = s.ptr
+      s.next_sent  = s.sent
+      s.next_done  = s.done
+      s.next_wb    = s.wb
+      s.next_line  = s.line
+      s.accept     = b1(0)
+
+      for i in range( ncaches ):
+        s.cache[i].req.rdy  = b1(0)
+        s.cache[i].resp.en  = b1(0)
+        s.cache[i].resp.msg = MemRespType()
+        s.snoop[i].req.en   = b1(0)
+        s.snoop[i].req.msg  = MemReqType()
+        s.snoop[i].resp.rdy = b1(0)
+
+      s.mem.req.en   = b1(0)
+      s.mem.req.msg  = MemReqType()
+      s.mem.resp.rdy = b1(0)
+
+      s.others = MaskType(0)
+      for i in range( ncaches ):
+        if s.req_id != IdType(i):
+          s.others[i] = b1(1)
+
+      # Poll the caches round robin
+
+      if s.state == s.STATE_IDLE:
+        s.cache[ s.ptr ].req.rdy = b1(1)
+
+        if s.cache[ s.ptr ].req.en:
+          s.accept    = b1(1)
+          s.next_sent = MaskType(0)
+          s.next_done = MaskType(0)
+          s.next_wb   = b1(0)
+          if s.cache[ s.ptr ].req.msg.type_ == b4(PUTM):
+            s.next_state = s.STATE_MEM_REQ
+          else:
+            s.next_state = s.STATE_SNOOP
+        elif s.ptr == IdType(ncaches-1):
+          s.next_ptr = IdType(0)
+        else:
+          s.next_ptr = s.ptr + IdType(1)
+
+      # Snoop all other caches and wait for all their responses
+
+      elif s.state == s.STATE_SNOOP:
+        for i in range( ncaches ):
+          if s.others[i]:
+            s.snoop[i].req.msg.type_ = s.req_msg.type_
+            s.snoop[i].req.msg.addr  = s.req_msg.addr
+            s.snoop[i].req.en        = ~s.sent[i] & s.snoop[i].req.rdy
+            if s.snoop[i].req.en:
+              s.next_sent = s.next_sent | ( MaskType(1) << i )
+
+            s.snoop[i].resp.rdy = b1(1)
+            if s.snoop[i].resp.en:
+              s.next_done = s.next_done | ( MaskType(1) << i )
+              if s.snoop[i].resp.msg.test[1]:
+                s.next_wb   = b1(1)
+                s.next_line = s.snoop[i].resp.msg.data
+
+        if s.next_done == s.others:
+          if s.next_wb: s.next_state = s.STATE_WB_REQ
+          else:         s.next_state = s.STATE_MEM_REQ
+
+      # Write back the dirty line of a snooped cache
+
+      elif s.state == s.STATE_WB_REQ:
+        s.mem.req.msg.type_ = b4(MemMsgType.WRITE)
+        s.mem.req.msg.addr  = s.req_msg.addr
+        s.mem.req.msg.data  = s.line
+        s.mem.req.en        = s.mem.req.rdy
+        if s.mem.req.rdy:
+          s.next_state = s.STATE_WB_WAIT
+
+      elif s.state == s.STATE_WB_WAIT:
+        s.mem.resp.rdy = b1(1)
+        if s.mem.resp.en:
+          s.next_state = s.STATE_RESP
+
+      # Read the line (GETS/GETM) or write it back (PUTM)
+
+      elif s.state == s.STATE_MEM_REQ:
+        if s.req_msg.type_ == b4(PUTM):
+          s.mem.req.msg.type_ = b4(MemMsgType.WRITE)
+        else:
+          s.mem.req.msg.type_ = b4(MemMsgType.READ)
+        s.mem.req.msg.addr = s.req_msg.addr
+        s.mem.req.msg.data = s.req_msg.data
+        s.mem.req.en       = s.mem.req.rdy
+        if s.mem.req.rdy:
+          s.next_state = s.STATE_MEM_WAIT
+
+      elif s.state == s.STATE_MEM_WAIT:
+        s.mem.resp.rdy = b1(1)
+        if s.mem.resp.en:
+          s.next_line  = s.mem.resp.msg.data
+          s.next_state = s.STATE_RESP
+
+      # Respond to the requester and move on to the next cache
+
+      elif s.state == s.STATE_RESP:
+        s.cache[ s.req_id ].resp.msg.type_  = s.req_msg.type_
+        s.cache[ s.req_id ].resp.msg.opaque = s.req_msg.opaque
+        s.cache[ s.req_id ].resp.msg.data   = s.line
+        s.cache[ s.req_id ].resp.en         = s.cache[ s.req_id ].resp.rdy
+        if s.cache[ s.req_id ].resp.rdy:
+          s.next_state = s.STATE_IDLE
+          if s.req_id == IdType(ncaches-1):
+            s.next_ptr = IdType(0)
+          else:
+            s.next_ptr = s.req_id + IdType(1)
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    state_str = "ISwWmMR"[ int( s.state ) ]
+    if s.state == s.STATE_IDLE:
+      return f"({state_str} )"
+    return f"({state_str}{int( s.req_id )})"
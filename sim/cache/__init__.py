@@ -4,4 +4,8 @@
 
 # from BlockingCacheFL  import BlockingCacheFL
 from .BlockingCacheRTL import BlockingCacheRTL
-
+from .SnoopBus         import SnoopBus
+from .CoherentCachesCL import CoherentCachesCL
+from .NonBlockingCacheFL  import NonBlockingCacheFL
+from .NonBlockingCacheCL  import NonBlockingCacheCL
+from .NonBlockingCacheRTL import NonBlockingCacheRTL
@@ -0,0 +1,349 @@
+#=========================================================================
+# CoherentCache_test.py
+#=========================================================================
+# Tests for N coherent caches, either the RTL caches (BlockingCacheRTL
+# with coherent=True) on a SnoopBus, or the CL model of both. Every test
+# is a list of phases, and every phase gives the requests (and the
+# expected responses) of some of the caches. The caches run their
+# requests of one phase concurrently, and the next phase starts once all
+# responses of the current phase came back, so that we can order the
+# accesses of different caches.
+
+import random
+import struct
+from collections import deque
+
+import pytest
+
+from pymtl3 import *
+from pymtl3.stdlib.test import run_sim
+from pymtl3.stdlib.cl.MemoryCL import MemoryCL
+from pymtl3.stdlib.ifcs import mk_mem_msg, MemMsgType
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcRTL, MemMinionIfcRTL
+
+from cache import BlockingCacheRTL, SnoopBus, CoherentCachesCL
+
+CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
+MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
+
+#-------------------------------------------------------------------------
+# CoherentCachesRTL
+#-------------------------------------------------------------------------
+# The RTL caches on a snoop bus, with the same interface as the CL model.
+
+class CoherentCachesRTL( Component ):
+
+  def construct( s, ncaches ):
+
+    s.cache = [ MemMinionIfcRTL( CacheReqType, CacheRespType ) for _ in range(ncaches) ]
+    s.mem   = MemMasterIfcRTL( MemReqType, MemRespType )
+
+    s.caches = [ BlockingCacheRTL( coherent=True ) for _ in range(ncaches) ]
+    s.bus    = SnoopBus( ncaches )
+
+    for i in range( ncaches ):
+      s.cache[i]     //= s.caches[i].cache
+      s.bus.cache[i] //= s.caches[i].mem
+      s.bus.snoop[i] //= s.caches[i].snoop
+
+    s.mem //= s.bus.mem
+
+  def line_trace( s ):
+    return "|".join( c.line_trace() for c in s.caches ) + s.bus.line_trace()
+
+#-------------------------------------------------------------------------
+# CacheClient
+#-------------------------------------------------------------------------
+# Sends the requests of one cache and checks its responses. Every phase
+# is a list of ( request, expected response, check data ).
+
+class CacheClient( Component ):
+
+  def construct( s, phases ):
+
+    s.send = CallerIfcCL( Type=CacheReqType )
+    s.recv.Type = CacheRespType
+
+    s.phases    = [ deque( ops ) for ops in phases ]
+    s.expected  = deque()
+    s.phase     = 0
+    s.error_msg = ''
+
+    @s.update
+    def up_client():
+
+      if s.error_msg:
+        raise Exception( s.error_msg )
+
+      if not s.reset and s.phase < len( s.phases ) and s.phases[ s.phase ] \
+          and s.send.rdy():
+        req, resp, check_data = s.phases[ s.phase ].popleft()
+        s.send( req )
+        s.expected.append( ( resp, check_data ) )
+
+  @non_blocking( lambda s: True )
+  def recv( s, msg ):
+
+    if not s.expected:
+      s.error_msg = f'Cache client received an unexpected response {msg}'
+      return
+
+    ref, check_data = s.expected.popleft()
+
+    if    msg.type_ != ref.type_ or msg.opaque != ref.opaque \
+       or ( check_data and msg.data != ref.data ) \
+       or ( ref.test != 2 and msg.test != ref.test ):
+      s.error_msg = ( f'Cache client received WRONG response!\n'
+                      f'Expected : {ref}\n'
+                      f'Received : {msg}' )
+
+  def phase_done( s, phase ):
+    return not s.phases[ phase ] and not s.expected
+
+  def line_trace( s ):
+    return "{}".format( s.send )
+
+#-------------------------------------------------------------------------
+# TestHarness
+#-------------------------------------------------------------------------
+
+class TestHarness( Component ):
+
+  def construct( s, dut, ncaches, phases ):
+
+    s.clients = [ CacheClient( [ phase.get( i, [] ) for phase in phases ] )
+                  for i in range(ncaches) ]
+    s.dut     = dut
+    s.mem     = MemoryCL( 1, [ (MemReqType, MemRespType) ] )
+
+    for i in range( ncaches ):
+      s.clients[i].send //= s.dut.cache[i].req
+      s.dut.cache[i].resp //= s.clients[i].recv
+
+    s.dut.mem //= s.mem.ifc[0]
+
+    s.nphases = len( phases )
+    s.phase   = 0
+
+    @s.update
+    def up_phase():
+      if s.phase < s.nphases:
+        done = True
+        for client in s.clients:
+          done = done and client.phase_done( s.phase )
+        if done:
+          s.phase += 1
+          for client in s.clients:
+            client.phase = s.phase
+
+  def load( s, addrs, data_ints ):
+    for addr, data_int in zip( addrs, data_ints ):
+      s.mem.write_mem( addr, struct.pack( "<I", data_int ) )
+
+  def done( s ):
+    return s.phase == s.nphases
+
+  def line_trace( s ):
+    return " ".join( c.line_trace() for c in s.clients ) + " > " + \
+           s.dut.line_trace()
+
+#-------------------------------------------------------------------------
+# make messages
+#-------------------------------------------------------------------------
+# The test field of the response is 0 for a miss, 1 for a hit, and 2 if
+# we do not care. A response data of None means we do not check it.
+
+types = {
+  'rd': MemMsgType.READ,
+  'wr': MemMsgType.WRITE,
+  'in': MemMsgType.WRITE_INIT,
+  'ad': MemMsgType.AMO_ADD,
+  'an': MemMsgType.AMO_AND,
+  'or': MemMsgType.AMO_OR,
+}
+
+def op( type_, opaque, addr, data, test, resp_data ):
+  check_data = resp_data is not None
+  return ( CacheReqType ( types[type_], opaque, addr, 0, data ),
+           CacheRespType( types[type_], opaque, test, 0, resp_data if check_data else 0 ),
+           check_data )
+
+def rd( addr, data, test=2, opaque=0 ):
+  return op( 'rd', opaque, addr, 0, test, data )
+
+def wr( addr, data, test=2, opaque=0 ):
+  return op( 'wr', opaque, addr, data, test, 0 )
+
+def amo( type_, addr, data, old, opaque=0 ):
+  return op( type_, opaque, addr, data, 0, old )
+
+#-------------------------------------------------------------------------
+# run_test
+#-------------------------------------------------------------------------
+
+def mk_dut( impl, ncaches ):
+  return { "rtl": CoherentCachesRTL, "cl": CoherentCachesCL }[ impl ]( ncaches )
+
+def run_test( impl, ncaches, phases, mem=None, max_cycles=20000 ):
+
+  model = TestHarness( mk_dut( impl, ncaches ), ncaches, phases )
+  model.elaborate()
+
+  if mem:
+    model.load( *zip( *sorted( mem.items() ) ) )
+
+  run_sim( model, max_cycles=max_cycles )
+
+  return model
+
+impls = [ "rtl", "cl" ]
+
+# Addresses 4KB apart map to the same set
+
+X = 0x1000
+Y = 0x1100
+Z = 0x2000
+
+#-------------------------------------------------------------------------
+# test_read_sharing
+#-------------------------------------------------------------------------
+# Both caches get the line in S and then hit.
+
+@pytest.mark.parametrize( "impl", impls )
+def test_read_sharing( impl ):
+  run_test( impl, 2, [
+    { 0: [ rd( X, 0x11, 0 ) ] },
+    { 1: [ rd( X, 0x11, 0 ), rd( X+4, 0x22, 1 ) ] },
+    { 0: [ rd( X+4, 0x22, 1 ) ] },
+  ], mem={ X: 0x11, X+4: 0x22 } )
+
+#-------------------------------------------------------------------------
+# test_write_invalidate
+#-------------------------------------------------------------------------
+# A write to a shared line upgrades it (a miss) and invalidates the
+# other copy, the other cache then misses and gets the new data from the
+# writer, which keeps the line in S.
+
+@pytest.mark.parametrize( "impl", impls )
+def test_write_invalidate( impl ):
+  run_test( impl, 2, [
+    { 0: [ rd( X, 0x11, 0 ) ], 1: [ rd( X, 0x11, 2 ) ] },
+    { 0: [ wr( X, 0xaa, 0 ), wr( X+8, 0xbb, 1 ) ] },
+    { 1: [ rd( X, 0xaa, 0 ), rd( X+8, 0xbb, 1 ) ] },
+    { 0: [ rd( X, 0xaa, 1 ) ] },
+    { 1: [ wr( X+8, 0xcc, 0 ) ] },
+    { 0: [ rd( X+8, 0xcc, 0 ) ] },
+  ], mem={ X: 0x11 } )
+
+#-------------------------------------------------------------------------
+# test_migratory
+#-------------------------------------------------------------------------
+# A counter which moves between all caches, every cache reads it and
+# writes it back incremented.
+
+@pytest.mark.parametrize( "impl", impls )
+@pytest.mark.parametrize( "ncaches", [ 2, 4 ] )
+def test_migratory( impl, ncaches ):
+  phases = []
+  for n in range( 3*ncaches ):
+    phases.append( { n % ncaches: [ rd( X, n ), wr( X, n+1 ) ] } )
+  phases.append( { 0: [ rd( X, 3*ncaches ) ] } )
+  run_test( impl, ncaches, phases )
+
+#-------------------------------------------------------------------------
+# test_dirty_eviction
+#-------------------------------------------------------------------------
+# Cache 0 writes three lines of the same set, so the first one is
+# evicted and written back, and then the other two move to cache 1
+# through snoops.
+
+@pytest.mark.parametrize( "impl", impls )
+def test_dirty_eviction( impl ):
+  run_test( impl, 2, [
+    { 0: [ wr( X, 1, 0 ), wr( X+0x1000, 2, 0 ), wr( X+0x2000, 3, 0 ) ] },
+    { 1: [ rd( X, 1, 0 ), rd( X+0x1000, 2, 0 ), rd( X+0x2000, 3, 0 ) ] },
+    { 0: [ rd( X+0x2000, 3, 1 ), rd( X, 1, 0 ) ] },
+  ] )
+
+#-------------------------------------------------------------------------
+# test_false_sharing
+#-------------------------------------------------------------------------
+# All caches write and read their own word of the same lines at the
+# same time, so the lines keep moving between the caches.
+
+@pytest.mark.parametrize( "impl", impls )
+@pytest.mark.parametrize( "ncaches", [ 2, 4 ] )
+def test_false_sharing( impl, ncaches ):
+  ops = { i: [] for i in range( ncaches ) }
+  for n in range( 8 ):
+    for i in range( ncaches ):
+      addr = X + 16*( n % 2 ) + 4*i
+      ops[i] += [ wr( addr, 0x100*n + i ), rd( addr, 0x100*n + i ) ]
+  phases = [ ops, { 0: [ rd( X + 16 + 4*i, 0x700 + i ) for i in range( ncaches ) ] } ]
+  run_test( impl, ncaches, phases )
+
+#-------------------------------------------------------------------------
+# test_amo
+#-------------------------------------------------------------------------
+# AMOs return the old value and take the line in M, then all caches add
+# to the same counter at the same time.
+
+@pytest.mark.parametrize( "impl", impls )
+@pytest.mark.parametrize( "ncaches", [ 1, 2, 4 ] )
+def test_amo( impl, ncaches ):
+  phases = [
+    { 0: [ amo( 'ad', X, 0x10, 0x01 ), amo( 'ad', X, 0x10, 0x11 ) ] },
+    { ncaches-1: [ amo( 'or', X, 0x100, 0x21 ), rd( X, 0x121 ) ] },
+    { 0: [ amo( 'an', X, 0x0f0, 0x121 ), rd( X, 0x020, 2 ) ] },
+    { i: [ amo( 'ad', Y, 1, None ) for _ in range( 10 ) ] for i in range( ncaches ) },
+    { ncaches-1: [ rd( Y, 10*ncaches ) ] },
+  ]
+  run_test( impl, ncaches, phases, mem={ X: 0x01 } )
+
+#-------------------------------------------------------------------------
+# test_random
+#-------------------------------------------------------------------------
+# Random reads and writes of all caches at the same time. Every cache
+# only writes its own words, but the words share lines and sets, so
+# every read must see the last write of its cache.
+
+@pytest.mark.parametrize( "impl", impls )
+@pytest.mark.parametrize( "ncaches, seed", [ (2, 0), (2, 1), (4, 2), (4, 3) ] )
+def test_random( impl, ncaches, seed ):
+
+  rgen = random.Random( seed )
+
+  words = [ Z + 0x1000*( n // 8 ) + 0x10*( n % 2 ) + 4*( n % 4 )
+            for n in range( 3*8 ) ]
+  words = sorted( set( words ) )
+  mem   = { addr: rgen.randint( 0, 0xffff ) for addr in words }
+  owner = { addr: n % ncaches for n, addr in enumerate( words ) }
+  value = dict( mem )
+
+  ops = { i: [] for i in range( ncaches ) }
+  for i in range( ncaches ):
+    mine = [ addr for addr in words if owner[addr] == i ]
+    for n in range( 40 ):
+      addr = rgen.choice( mine )
+      if rgen.randint( 0, 1 ):
+        value[addr] = rgen.randint( 0, 0xffffffff )
+        ops[i].append( wr( addr, value[addr], opaque=n ) )
+      else:
+        ops[i].append( rd( addr, value[addr], opaque=n ) )
+
+  phases = [ ops, { 0: [ rd( addr, value[addr] ) for addr in words ] } ]
+  run_test( impl, ncaches, phases, mem=mem )
+
+#-------------------------------------------------------------------------
+# test_cl_stats
+#-------------------------------------------------------------------------
+
+def test_cl_stats():
+  model = run_test( "cl", 2, [
+    { 0: [ rd( X, 0 ), rd( X, 0 ) ] },
+    { 1: [ rd( X, 0 ), wr( X, 1 ) ] },
+    { 0: [ rd( X, 1 ) ] },
+  ] )
+  cl = model.dut
+  assert ( cl.num_hits, cl.num_misses, cl.num_upgrades ) == ( 1, 4, 1 )
+  assert ( cl.num_invalidations, cl.num_writebacks ) == ( 1, 1 )
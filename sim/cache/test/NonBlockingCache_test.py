@@ -0,0 +1,256 @@
+#=========================================================================
+# NonBlockingCache_test.py
+#=========================================================================
+# Tests for the FL, CL, and RTL models of the non-blocking cache. The
+# cache only keeps responses with the same opaque field in order, so most
+# tests only check that order. Secondary misses respond with a miss where
+# the blocking cache hits, so the generic cache tests do not check hits
+# and misses.
+
+import random
+import struct
+
+import pytest
+
+from pymtl3 import *
+from pymtl3.stdlib.test import TestSrcCL, run_sim
+from pymtl3.stdlib.cl.MemoryCL import MemoryCL
+from pymtl3.stdlib.ifcs import MemMsgType
+
+from cache import BlockingCacheRTL, NonBlockingCacheFL, NonBlockingCacheCL, \
+                  NonBlockingCacheRTL
+
+from .TestCacheSink        import TestCacheSink
+from .BlockingCacheFL_test import ( CacheReqType, CacheRespType,
+  MemReqType, MemRespType, req, resp, test_case_table_generic )
+
+#-------------------------------------------------------------------------
+# TestHarness
+#-------------------------------------------------------------------------
+
+class TestHarness( Component ):
+
+  def construct( s, cache, msgs, stall_prob=0, latency=1, src_delay=0,
+                 sink_delay=0, check_test=False, ordered=True ):
+
+    s.src   = TestSrcCL( CacheReqType, msgs[::2],
+                         initial_delay=src_delay+3, interval_delay=src_delay )
+    s.cache = cache
+    s.mem   = MemoryCL( 1, [ (MemReqType, MemRespType) ],
+                        stall_prob=stall_prob, latency=latency )
+    s.sink  = TestCacheSink( CacheRespType, msgs[1::2],
+                             initial_delay=sink_delay+3,
+                             interval_delay=sink_delay,
+                             check_test=check_test, ordered=ordered )
+
+    s.src.send  //= s.cache.cache.req
+    s.sink.recv //= s.cache.cache.resp
+    s.cache.mem //= s.mem.ifc[0]
+
+  def load( s, addrs, data_ints ):
+    for addr, data_int in zip( addrs, data_ints ):
+      s.mem.write_mem( addr, struct.pack( "<I", data_int ) )
+
+  def done( s ):
+    return s.src.done() and s.sink.done()
+
+  def line_trace( s ):
+    return s.src.line_trace() + " > " + s.cache.line_trace() + " > " + \
+           s.mem.line_trace() + " > " + s.sink.line_trace()
+
+# Runs the harness until it is done, returns the number of cycles
+
+def run_cycles( th, max_cycles=10000 ):
+
+  th.elaborate()
+  th.apply( SimulationPass() )
+  th.sim_reset()
+
+  while not th.done() and th.simulated_cycles < max_cycles:
+    th.tick()
+
+  assert th.done()
+  return th.simulated_cycles
+
+impls = {
+  "fl"  : NonBlockingCacheFL,
+  "cl"  : NonBlockingCacheCL,
+  "rtl" : NonBlockingCacheRTL,
+}
+
+#-------------------------------------------------------------------------
+# Generic cache tests
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "impl", [ "fl", "cl", "rtl" ] )
+@pytest.mark.parametrize( **test_case_table_generic )
+def test_generic( test_params, impl ):
+
+  msgs = test_params.msg_func( 0 )
+
+  th = TestHarness( impls[ impl ](), msgs, test_params.stall,
+                    test_params.lat+1, test_params.src, test_params.sink,
+                    ordered=False )
+  th.elaborate()
+
+  if test_params.mem_data_func != None:
+    mem = test_params.mem_data_func( 0 )
+    th.load( mem[::2], mem[1::2] )
+
+  run_sim( th )
+
+#-------------------------------------------------------------------------
+# Hit under miss
+#-------------------------------------------------------------------------
+# A read hit behind a read miss with another opaque field comes back
+# first. The sink checks the exact order.
+
+@pytest.mark.parametrize( "impl", [ "cl", "rtl" ] )
+def test_hit_under_miss( impl ):
+
+  src_msgs = [
+    #    type  opq  addr    len data
+    req( 'in', 0x0, 0x1000, 0,  0xdeadbeef ),
+    req( 'rd', 0x1, 0x2000, 0,  0          ),
+    req( 'rd', 0x2, 0x1000, 0,  0          ),
+    req( 'wr', 0x2, 0x1004, 0,  0x00c0ffee ),
+    req( 'rd', 0x2, 0x1004, 0,  0          ),
+  ]
+
+  sink_msgs = [
+    #     type  opq  test len data
+    resp( 'in', 0x0, 0,   0,  0          ),
+    resp( 'rd', 0x2, 1,   0,  0xdeadbeef ),
+    resp( 'wr', 0x2, 1,   0,  0          ),
+    resp( 'rd', 0x2, 1,   0,  0x00c0ffee ),
+    resp( 'rd', 0x1, 0,   0,  0x0a0b0c0d ),
+  ]
+
+  msgs = [ msg for pair in zip( src_msgs, sink_msgs ) for msg in pair ]
+
+  th = TestHarness( impls[ impl ](), msgs, latency=20, check_test=True )
+  th.elaborate()
+  th.load( [ 0x2000 ], [ 0x0a0b0c0d ] )
+  run_sim( th )
+
+#-------------------------------------------------------------------------
+# Secondary misses
+#-------------------------------------------------------------------------
+# Requests to a line with a refill in flight wait for it in its MSHR and
+# come back in order, and a full MSHR stalls the next request.
+
+@pytest.mark.parametrize( "impl", [ "cl", "rtl" ] )
+@pytest.mark.parametrize( "num_targets", [ 2, 4 ] )
+def test_secondary_miss( impl, num_targets ):
+
+  # The first num_targets requests wait for the refill, the others hit
+
+  hit = lambda i: int( i >= num_targets )
+
+  msgs = [
+    #    type  opq  addr    len data                 type  opq  test    len data
+    req( 'rd', 0x1, 0x2000, 0,  0          ), resp( 'rd', 0x1, hit(0), 0,  0x00000001 ),
+    req( 'wr', 0x1, 0x2004, 0,  0x00c0ffee ), resp( 'wr', 0x1, hit(1), 0,  0          ),
+    req( 'rd', 0x1, 0x2004, 0,  0          ), resp( 'rd', 0x1, hit(2), 0,  0x00c0ffee ),
+    req( 'rd', 0x1, 0x2008, 0,  0          ), resp( 'rd', 0x1, hit(3), 0,  0x00000003 ),
+    req( 'rd', 0x1, 0x2000, 0,  0          ), resp( 'rd', 0x1, hit(4), 0,  0x00000001 ),
+  ]
+
+  th = TestHarness( impls[ impl ]( num_targets=num_targets ), msgs,
+                    latency=10, check_test=True )
+  th.elaborate()
+  th.load( [ 0x2000, 0x2004, 0x2008 ], [ 1, 2, 3 ] )
+  run_sim( th )
+
+  if impl == "cl":
+    assert th.cache.num_misses == 1
+    assert th.cache.num_merges == num_targets - 1
+
+#-------------------------------------------------------------------------
+# Memory-level parallelism
+#-------------------------------------------------------------------------
+# Misses to different lines with different opaque fields overlap, so
+# with four MSHRs they take less than half the cycles of the blocking
+# cache. Misses with the same opaque field do not overlap.
+
+def mk_stream( nlines, opaque ):
+  msgs = []
+  for i in range( nlines ):
+    msgs += [ req(  'rd', opaque(i), 0x4000 + 16*i, 0, 0 ),
+              resp( 'rd', opaque(i), 0, 0, 0 ) ]
+  return msgs
+
+def test_mlp():
+
+  msgs = mk_stream( 16, lambda i: i % 4 )
+
+  blocking    = run_cycles( TestHarness( BlockingCacheRTL(), msgs, latency=20 ) )
+  nonblocking = run_cycles( TestHarness( NonBlockingCacheRTL(), msgs,
+                                         latency=20, ordered=False ) )
+  cl          = run_cycles( TestHarness( NonBlockingCacheCL(), msgs,
+                                         latency=20, ordered=False ) )
+
+  assert nonblocking * 2 < blocking
+  assert cl * 2 < blocking
+
+  same_opaque = run_cycles( TestHarness( NonBlockingCacheRTL(),
+                                         mk_stream( 16, lambda i: 0 ), latency=20 ) )
+
+  assert same_opaque * 3 > blocking * 2
+
+#-------------------------------------------------------------------------
+# Random requests with several opaque fields
+#-------------------------------------------------------------------------
+# Reads, writes, and AMOs to a few words of lines which map to a few
+# sets, so that misses evict dirty lines and wait for ways and MSHRs. The
+# cache performs the requests in order, so we compute the responses with
+# a flat memory.
+
+amo_funcs = {
+  'ad' : ( MemMsgType.AMO_ADD, lambda m,a : ( m + a ) & 0xffffffff ),
+  'an' : ( MemMsgType.AMO_AND, lambda m,a : m & a ),
+  'or' : ( MemMsgType.AMO_OR,  lambda m,a : m | a ),
+}
+
+def random_opaque_msgs( seed, nreqs=200, nopaques=4 ):
+
+  rng   = random.Random( seed )
+  addrs = [ 0x1000*k + 16*idx + 4*word for k in range(4)
+            for idx in range(2) for word in range(2) ]
+  mem   = {}
+  msgs  = []
+
+  for _ in range( nreqs ):
+    addr   = rng.choice( addrs )
+    opaque = rng.randrange( nopaques )
+    data   = rng.randrange( 1 << 32 )
+    old    = mem.get( addr, 0 )
+    op     = rng.choice( [ 'rd', 'rd', 'wr', 'wr', 'ad', 'an', 'or' ] )
+
+    if op == 'rd':
+      msgs += [ req( 'rd', opaque, addr, 0, 0 ), resp( 'rd', opaque, 0, 0, old ) ]
+    elif op == 'wr':
+      mem[ addr ] = data
+      msgs += [ req( 'wr', opaque, addr, 0, data ), resp( 'wr', opaque, 0, 0, 0 ) ]
+    else:
+      type_, func = amo_funcs[ op ]
+      mem[ addr ] = func( old, data )
+      msgs += [ CacheReqType( type_, opaque, addr, 0, data ),
+                CacheRespType( type_, opaque, 0, 0, old ) ]
+
+  return msgs
+
+@pytest.mark.parametrize( "impl", [ "fl", "cl", "rtl" ] )
+@pytest.mark.parametrize( "num_mshrs,num_targets", [ ( 2, 2 ), ( 4, 4 ) ] )
+@pytest.mark.parametrize( "lat,src,sink", [ ( 1, 0, 0 ), ( 10, 0, 3 ), ( 4, 2, 1 ) ] )
+def test_random( impl, num_mshrs, num_targets, lat, src, sink ):
+
+  if impl == "fl":
+    cache = NonBlockingCacheFL()
+  else:
+    cache = impls[ impl ]( num_mshrs, num_targets )
+
+  msgs = random_opaque_msgs( num_mshrs * 100 + lat * 10 + src )
+  th   = TestHarness( cache, msgs, latency=lat, src_delay=src,
+                      sink_delay=sink, ordered=False )
+  run_sim( th )
@@ -8,15 +8,20 @@ from pymtl3.stdlib.ifcs import MemMsgType
 class TestCacheSink( Component ):
 
   def construct( s, Type, msgs, initial_delay=0, interval_delay=0,
-                 arrival_time=None, check_test=False ):
+                 arrival_time=None, check_test=False, ordered=True ):
 
     s.recv.Type = Type
     s.check_test = check_test
+    s.ordered    = ordered
 
     # [msgs] and [arrival_time] must have the same length.
     if arrival_time is not None:
       assert len( msgs ) == len( arrival_time )
 
+    # With ordered=False only the responses with the same opaque field
+    # have to arrive in order (e.g., from a non-blocking cache).
+    assert ordered or arrival_time is None
+
     s.idx          = 0
     s.cycle_count  = 0
     s.msgs         = list( msgs )
@@ -67,7 +72,7 @@ class TestCacheSink( Component ):
     )
 
   def compare_cacheresp( s, msg, ref ):
-    if msg.type_  != ref.type_ or msg.len != ref.len or msg.opaque != msg.opaque:
+    if msg.type_  != ref.type_ or msg.len != ref.len or msg.opaque != ref.opaque:
       return False
 
     # if memresp is a write, ignore the data
@@ -93,6 +98,14 @@ class TestCacheSink( Component ):
   def recv( s, msg ):
     assert s.count == 0
 
+    # Bring the next expected message with the same opaque field to the
+    # front
+    if not s.ordered:
+      for i in range( s.idx, len( s.msgs ) ):
+        if s.msgs[i].opaque == msg.opaque:
+          s.msgs.insert( s.idx, s.msgs.pop( i ) )
+          break
+
     # Sanity check
     if s.idx >= len( s.msgs ):
       s.error_msg = ( 'Test Sink received more msgs than expected!\n'
@@ -20,6 +20,13 @@ def pytest_addoption(parser):
   parser.addoption( "--dump-bin", action="store_true",
                     help="dump binary file for each test" )
 
+  parser.addoption( "--asm-cache", action="store", default=None,
+                    help="directory to cache assembled test programs in "
+                         "(default: in the pytest cache directory)" )
+
+  parser.addoption( "--no-asm-cache", action="store_true",
+                    help="do not cache assembled test programs on disk" )
+
   parser.addoption( "--test-verilog", action="store",
                     default='', nargs='?', const='zeros',
                     choices=[ '', 'zeros', 'ones', 'rand' ],
@@ -73,10 +80,26 @@ def pytest_configure(config):
   elif config.option.vrtl:
     sys._pymtl_rtl_override = 'verilog'
 
+  # Keep assembled test programs around across test sessions. We must
+  # not import the proc package here (any error in it would break every
+  # test session), so proc/tinyrv2_encoding.py picks up the directory
+  # when it is first imported.
+
+  sys._tinyrv2_asm_cache_dir = None
+  if not config.option.no_asm_cache:
+    sys._tinyrv2_asm_cache_dir = config.option.asm_cache
+    if sys._tinyrv2_asm_cache_dir is None and hasattr( config, "cache" ):
+      sys._tinyrv2_asm_cache_dir = str( config.cache.makedir( "tinyrv2_asm" ) )
+
 def pytest_unconfigure(config):
   import sys
   del sys._called_from_test
   del sys._pymtl_rtl_override
+  del sys._tinyrv2_asm_cache_dir
+
+  tinyrv2_encoding = sys.modules.get( "proc.tinyrv2_encoding" )
+  if tinyrv2_encoding is not None:
+    tinyrv2_encoding.assemble_cache.set_dir( None )
 
 #-------------------------------------------------------------------------
 # fix_randseed
@@ -0,0 +1,155 @@
+#=========================================================================
+# BankedCache
+#=========================================================================
+# N-bank data cache with one port per requester (the processor and the
+# accelerator in ProcMemXcel). Every bank is a BlockingCacheRTL with
+# num_banks=N, and consecutive cache lines go to consecutive banks (see
+# the note on num_banks in cache/BlockingCachePRTL.py), i.e., address
+# bits [4:4+log2(N)] select the bank. Every bank has a Funnel which
+# arbitrates between the ports and a Router which sends the responses
+# back to the port the Funnel put in the opaque field, so the banks
+# serve the requests of different ports in parallel. The memory ports of
+# the banks are merged with another Funnel and Router.
+#
+# A bank serves the requests of one port in order, but two banks do not
+# know about each other. So a port only has requests in flight to one
+# bank at a time, and a request to another bank waits until all of them
+# are done. We keep the opaque fields of the requests in flight in a
+# queue per port and put them back into the responses, so unlike with a
+# plain Funnel/Router in front of a cache the opaque fields survive.
+
+from pymtl3             import *
+from pymtl3.stdlib.ifcs import mk_mem_msg
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcRTL, MemMinionIfcRTL
+from pymtl3.stdlib.rtl  import NormalQueueRTL
+
+from cache    import BlockingCacheRTL
+
+from .Router  import Router
+from .Funnel  import Funnel
+
+# Max number of requests in flight per port
+
+max_reqs = 4
+
+class BankedCache( Component ):
+
+  #-----------------------------------------------------------------------
+  # constructor
+  #-----------------------------------------------------------------------
+
+  def construct( s, nbanks, nports=2 ):
+
+    assert nbanks >= 2 and nbanks & ( nbanks - 1 ) == 0, \
+      "nbanks must be a power of two, use BlockingCacheRTL for one bank"
+    assert nports >= 2, "the Funnels need at least two ports"
+
+    CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
+    MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
+
+    OpaqueType = CacheReqType.get_field_type( 'opaque' )
+    BankType   = mk_bits( clog2( nbanks ) )
+
+    s.nbanks = nbanks
+    s.nports = nports
+
+    # Interface
+
+    s.cache = [ MemMinionIfcRTL( CacheReqType, CacheRespType ) for _ in range(nports) ]
+    s.mem   = MemMasterIfcRTL( MemReqType, MemRespType )
+
+    # Banks with a Funnel and a Router each
+
+    s.banks = [ BlockingCacheRTL( num_banks=nbanks ) for _ in range(nbanks) ]
+
+    s.bank_funnels = [ Funnel( CacheReqType, nports )( out = s.banks[b].cache.req )
+                       for b in range(nbanks) ]
+    s.bank_routers = [ Router( CacheRespType, nports )( in_ = s.banks[b].cache.resp )
+                       for b in range(nbanks) ]
+
+    # Merge the memory ports of the banks
+
+    s.mem_funnel = Funnel( MemReqType, nbanks )(
+      in_ = { b: s.banks[b].mem.req for b in range(nbanks) },
+      out = s.mem.req,
+    )
+
+    s.mem_router = Router( MemRespType, nbanks )(
+      in_ = s.mem.resp,
+      out = { b: s.banks[b].mem.resp for b in range(nbanks) },
+    )
+
+    # Opaque fields of the requests in flight, the bank of the request of
+    # every port, and the bank the requests in flight went to
+
+    s.opaque_qs = [ NormalQueueRTL( OpaqueType, max_reqs ) for _ in range(nports) ]
+
+    s.req_bank = [ Wire( BankType ) for _ in range(nports) ]
+    s.cur_bank = [ Wire( BankType ) for _ in range(nports) ]
+
+    for i in range( nports ):
+      s.req_bank[i] //= s.cache[i].req.msg.addr[4:4+clog2(nbanks)]
+
+    @s.update_ff
+    def up_cur_bank():
+      for i in range( nports ):
+        if s.cache[i].req.en:
+          s.cur_bank[i] <<= s.req_bank[i]
+
+    #---------------------------------------------------------------------
+    # Requests
+    #---------------------------------------------------------------------
+
+    @s.update
+    def up_req_rdy():
+      for i in range( nports ):
+        s.cache[i].req.rdy = s.opaque_qs[i].enq.rdy \
+          & ( ( s.opaque_qs[i].count == 0 ) | ( s.req_bank[i] == s.cur_bank[i] ) ) \
+          & s.bank_funnels[ s.req_bank[i] ].in_[i].rdy
+
+    @s.update
+    def up_req():
+      for i in range( nports ):
+        for b in range( nbanks ):
+          s.bank_funnels[b].in_[i].msg = s.cache[i].req.msg
+          s.bank_funnels[b].in_[i].en  = s.cache[i].req.en & ( s.req_bank[i] == BankType(b) )
+
+        s.opaque_qs[i].enq.en  = s.cache[i].req.en
+        s.opaque_qs[i].enq.msg = s.cache[i].req.msg.opaque
+
+    #---------------------------------------------------------------------
+    # Responses
+    #---------------------------------------------------------------------
+    # Only the current bank of a port can have a response for it.
+
+    @s.update
+    def up_resp_rdy():
+      for b in range( nbanks ):
+        for i in range( nports ):
+          s.bank_routers[b].out[i].rdy = s.cache[i].resp.rdy
+
+    @s.update
+    def up_resp():
+      for i in range( nports ):
+        s.cache[i].resp.en  = b1(0)
+        s.cache[i].resp.msg = CacheRespType()
+
+        for b in range( nbanks ):
+          if s.bank_routers[b].out[i].en:
+            s.cache[i].resp.en  = b1(1)
+            s.cache[i].resp.msg = CacheRespType(
+              s.bank_routers[b].out[i].msg.type_,
+              s.opaque_qs[i].deq.ret,
+              s.bank_routers[b].out[i].msg.test,
+              s.bank_routers[b].out[i].msg.len,
+              s.bank_routers[b].out[i].msg.data,
+            )
+
+        s.opaque_qs[i].deq.en = s.cache[i].resp.en
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    return "|".join( bank.line_trace() for bank in s.banks )
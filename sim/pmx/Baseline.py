@@ -0,0 +1,26 @@
+#=========================================================================
+# Baseline
+#=========================================================================
+# Versioned JSON baselines of our benchmark suites (see SimBench and
+# UbmarkPerf). A baseline is a JSON object with a "version" field for the
+# format of the suite, so that an old baseline is rejected instead of
+# being compared field by field. The files are written with sorted keys
+# so that checked-in baselines give readable diffs.
+
+import json
+
+def load_baseline( path, version ):
+
+  with open( path ) as fd:
+    baseline = json.load( fd )
+
+  if baseline.get( "version" ) != version:
+    raise ValueError( "{}: unsupported baseline version {} (expected {})"
+                      .format( path, baseline.get( "version" ), version ) )
+
+  return baseline
+
+def save_baseline( path, baseline ):
+  with open( path, "w" ) as fd:
+    json.dump( baseline, fd, indent=2, sort_keys=True )
+    fd.write( "\n" )
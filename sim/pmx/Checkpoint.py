@@ -0,0 +1,159 @@
+#=========================================================================
+# Checkpoint
+#=========================================================================
+# Architectural state of a TinyRV2 program at some point in its
+# execution: the PC, the register file, stats_en, and the contents of
+# memory. We capture a checkpoint from the instruction set simulator in
+# proc/tinyrv2_semantics.py, and can then restore it either into another
+# instruction set simulator or into a freshly reset RTL processor and
+# test memory to continue simulating in detail from there.
+#
+# The RTL processor always starts fetching at its reset vector, so the
+# processor has to be constructed with reset_vector=checkpoint.pc. The
+# remaining state is restored one cycle after reset: the reset signal is
+# still high for the registers during the first tick after sim_reset,
+# while no instruction can have read the register file yet. Restoring
+# pokes the register file and the stats_en register of the PyMTL
+# processor directly, so this does not work with the Verilog processor.
+#
+# Memory is kept as a dictionary of the pages which are not all zero, so
+# that checkpoints stay small enough to keep a few of them around (or
+# send them to other processes). Most of the memory of the instruction
+# set simulator is zero, so we first skip all-zero spans of many pages
+# and only look at the pages of the other spans. bytearray.startswith
+# compares in place, so the zero memory is never copied.
+
+from pymtl3 import *
+
+#-------------------------------------------------------------------------
+# poke
+#-------------------------------------------------------------------------
+# Overwrite the value of a register. Registers are double buffered, so we
+# set both the current and the next value.
+
+def poke( signal, value ):
+  signal <<= value
+  signal._flip()
+
+#=========================================================================
+# Checkpoint
+#=========================================================================
+
+class Checkpoint:
+
+  page_nbytes = 4096
+  span_nbytes = 1 << 20
+
+  def __init__( s, pc, regs, stats_en, num_insts, pages ):
+    s.pc        = pc
+    s.regs      = regs
+    s.stats_en  = stats_en
+    s.num_insts = num_insts
+    s.pages     = pages
+
+  #-----------------------------------------------------------------------
+  # capture
+  #-----------------------------------------------------------------------
+  # Capture the current state of the given instruction set simulator.
+
+  @staticmethod
+  def capture( iss ):
+
+    M           = iss.M
+    page_nbytes = Checkpoint.page_nbytes
+    span_nbytes = Checkpoint.span_nbytes
+    zero_page   = bytes( page_nbytes )
+    zero_span   = bytes( span_nbytes )
+
+    pages = {}
+    for span_addr in range( 0, len(M), span_nbytes ):
+      if M.startswith( zero_span, span_addr ):
+        continue
+      for addr in range( span_addr, min( span_addr+span_nbytes, len(M) ),
+                         page_nbytes ):
+        if not M.startswith( zero_page, addr ):
+          pages[addr] = bytes( M[addr:addr+page_nbytes] )
+
+    return Checkpoint( iss.PC, list( iss.R ), iss.stats_en, iss.num_insts,
+                       pages )
+
+  #-----------------------------------------------------------------------
+  # load_mem
+  #-----------------------------------------------------------------------
+  # Copy the checkpointed memory into the given bytearray, which is
+  # assumed to be all zero.
+
+  def load_mem( s, mem ):
+    for addr, page in s.pages.items():
+      mem[addr:addr+len(page)] = page
+
+  #-----------------------------------------------------------------------
+  # restore_iss
+  #-----------------------------------------------------------------------
+  # Restore the checkpoint into a freshly constructed instruction set
+  # simulator.
+
+  def restore_iss( s, iss ):
+
+    s.load_mem( iss.M )
+
+    iss.PC        = s.pc
+    iss.R[:]      = s.regs
+    iss.stats_en  = s.stats_en
+    iss.num_insts = s.num_insts
+
+  #-----------------------------------------------------------------------
+  # restore
+  #-----------------------------------------------------------------------
+  # Restore the checkpoint into an RTL processor that was constructed with
+  # reset_vector=s.pc and the test memory it is connected to (anything
+  # with a write_mem method, like MemoryCL or SparseMemoryCL). This has
+  # to be called after sim_reset and exactly one more tick.
+
+  def restore( s, proc, mem ):
+
+    if not hasattr( proc, "dpath" ):
+      raise TypeError( "Restoring a checkpoint needs the PyMTL processor" )
+
+    for addr, page in s.pages.items():
+      mem.write_mem( addr, page )
+
+    rf = proc.dpath.rf
+    for i in range( 1, 32 ):
+      poke( rf.regs[i], b32( s.regs[i] ) )
+
+    poke( proc.dpath.stats_en_reg_W.out, b32( s.stats_en ) )
+
+#-------------------------------------------------------------------------
+# run_functional
+#-------------------------------------------------------------------------
+# Run the instruction set simulator until it has executed max_insts
+# instructions in total (if max_insts is not None), until stats_en rises
+# (if until_stats_en is set), until the PC reaches until_pc (if it is not
+# None), or until the program is done. Messages sent to the manager are
+# handled by the given Proc2MngrDecoder, and we return its status (None
+# if the program is still running).
+
+def run_functional( iss, proc2mngr_decoder, max_insts=None,
+                    until_stats_en=False, until_pc=None ):
+
+  status = None
+  while status is None:
+
+    if until_stats_en and iss.stats_en:
+      break
+
+    if until_pc is not None and iss.PC == until_pc:
+      break
+
+    if max_insts is None:
+      iss.run( 1 << 32, until_pc )
+    elif iss.num_insts < max_insts:
+      iss.run( max_insts - iss.num_insts, until_pc )
+    else:
+      break
+
+    while status is None and iss.proc2mngr_queue:
+      status = proc2mngr_decoder( iss.proc2mngr_queue.popleft() )
+
+  return status
@@ -0,0 +1,174 @@
+#=========================================================================
+# IntervalSim
+#=========================================================================
+# Helpers for simulating a long program as a set of independent
+# intervals. We run the program once on the instruction set simulator and
+# take a checkpoint at the start of every interval of interval_insts
+# instructions (minus a warm-up prefix of warmup_insts instructions, so
+# that the caches and the pipeline are warm by the time the interval
+# starts). Every interval can then be simulated in detail from its
+# checkpoint in a separate process, and the per-interval results are
+# stitched together into an estimate for the whole program.
+#
+# Intervals are delimited by committed instructions, so the intervals of
+# a program add up exactly to the whole program. The only error comes
+# from the state we do not checkpoint (caches, pipeline, memory system),
+# which the warm-up is meant to hide, and from sampling if we only
+# simulate every sample_period-th interval. The error bound we report is
+# a 95% confidence interval for the sampling error.
+
+import math
+
+from .Checkpoint import Checkpoint, run_functional
+
+#-------------------------------------------------------------------------
+# take_checkpoints
+#-------------------------------------------------------------------------
+# Run the program to completion on the given instruction set simulator.
+# Returns the list of intervals to simulate in detail as tuples of
+# ( index, checkpoint, warmup_insts, num_insts ), the total number of
+# instructions, the number of instructions in the stats region, and the
+# status from the proc2mngr decoder.
+
+def take_checkpoints( iss, proc2mngr_decoder, interval_insts,
+                      warmup_insts=0, sample_period=1 ):
+
+  checkpoints = []
+
+  status = None
+  index  = 0
+  while status is None:
+
+    if index % sample_period == 0:
+      status = run_functional( iss, proc2mngr_decoder,
+                               max( 0, index*interval_insts - warmup_insts ) )
+      if status is None:
+        checkpoints.append( ( index, Checkpoint.capture( iss ) ) )
+
+    index += 1
+
+  # The last interval might be shorter (or even empty)
+
+  num_insts = iss.num_insts
+
+  intervals = []
+  for index, checkpoint in checkpoints:
+    start_insts = index*interval_insts
+    if start_insts < num_insts:
+      intervals.append( ( index, checkpoint,
+                          start_insts - checkpoint.num_insts,
+                          min( interval_insts, num_insts - start_insts ) ) )
+
+  return intervals, num_insts, iss.num_stats_insts, status
+
+#-------------------------------------------------------------------------
+# sim_interval
+#-------------------------------------------------------------------------
+# Simulate one interval in detail. The model has to be ready to simulate
+# and just reset, its processor must have been constructed with
+# reset_vector=checkpoint.pc, and mem is the test memory the processor is
+# connected to. We simulate the warm-up instructions, then count the
+# cycles until another num_insts instructions have committed. Returns a
+# dictionary with the results for the interval, or None if we ran out of
+# cycles.
+
+def sim_interval( model, proc, mem, checkpoint, warmup_insts, num_insts,
+                  max_cycles=1000000 ):
+
+  model.tick()
+  checkpoint.restore( proc, mem )
+
+  num_commits      = 0
+  num_cycles       = 0
+  num_stats_insts  = 0
+  num_stats_cycles = 0
+  measure          = warmup_insts == 0
+
+  while num_commits < warmup_insts + num_insts:
+
+    if model.simulated_cycles >= max_cycles:
+      return None
+
+    model.tick()
+
+    if measure:
+      num_cycles += 1
+      if proc.stats_en:
+        num_stats_cycles += 1
+
+    if proc.commit_inst:
+      num_commits += 1
+      if measure and proc.stats_en:
+        num_stats_insts += 1
+      if num_commits == warmup_insts:
+        measure = True
+
+  return {
+    "num_insts"        : num_insts,
+    "num_cycles"       : num_cycles,
+    "num_stats_insts"  : num_stats_insts,
+    "num_stats_cycles" : num_stats_cycles,
+  }
+
+#-------------------------------------------------------------------------
+# estimate_total
+#-------------------------------------------------------------------------
+# Ratio estimate of the total of ys given the xs of the sampled intervals
+# and the total of xs over the whole program. Returns the estimate and
+# the 95% confidence bound. All intervals are the same size (except the
+# last one), so we treat them as a simple random sample of num_intervals
+# intervals.
+
+def estimate_total( xs, ys, x_total, num_intervals ):
+
+  n = len(xs)
+  if n == 0 or sum(xs) == 0:
+    return 0, 0.0
+
+  ratio = sum(ys) / sum(xs)
+  total = ratio * x_total
+
+  if n >= num_intervals:
+    return total, 0.0
+
+  if n == 1:
+    return total, math.inf
+
+  var = sum( ( y - ratio*x )**2 for x, y in zip( xs, ys ) ) / ( n - 1 )
+  err = 1.96 * num_intervals * math.sqrt( ( 1 - n/num_intervals ) * var / n )
+
+  return total, err
+
+#-------------------------------------------------------------------------
+# stitch
+#-------------------------------------------------------------------------
+# Combine the per-interval results into an estimate for the whole
+# program.
+
+def stitch( results, num_insts, num_stats_insts, interval_insts ):
+
+  num_intervals = math.ceil( num_insts / interval_insts )
+
+  num_cycles, num_cycles_err = estimate_total(
+    [ r["num_insts"]  for r in results ],
+    [ r["num_cycles"] for r in results ],
+    num_insts, num_intervals )
+
+  stats_results = [ r for r in results if r["num_stats_insts"] ]
+  num_stats_intervals = math.ceil( num_stats_insts / interval_insts )
+
+  num_stats_cycles, num_stats_cycles_err = estimate_total(
+    [ r["num_stats_insts"]  for r in stats_results ],
+    [ r["num_stats_cycles"] for r in stats_results ],
+    num_stats_insts, max( num_stats_intervals, len(stats_results) ) )
+
+  return {
+    "num_intervals"        : num_intervals,
+    "num_sim_intervals"    : len(results),
+    "num_insts"            : num_insts,
+    "num_cycles"           : num_cycles,
+    "num_cycles_err"       : num_cycles_err,
+    "num_stats_insts"      : num_stats_insts,
+    "num_stats_cycles"     : num_stats_cycles,
+    "num_stats_cycles_err" : num_stats_cycles_err,
+  }
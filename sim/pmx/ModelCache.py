@@ -0,0 +1,238 @@
+#=========================================================================
+# ModelCache
+#=========================================================================
+# Persistent cache for the code the simulation passes generate. Setting
+# up a simulator for a pmx model generates and compiles Python source
+# for every net (GenDAGPass), the posedge flip, the meta blocks, and the
+# tick function (Mamba2020). Turning all of that source into code objects
+# is about a third of the setup time, mostly because py.code.Source
+# re-indents every generated source with the tokenizer.
+#
+# We keep one file of marshalled code objects per configuration. The key
+# covers the implementation choices, the contents of every source file
+# in the sim directory which is loaded, the PyMTL version, and the
+# interpreter. Inside the file the code objects are looked up by their
+# source, so an entry can never be used for a different block.
+#
+#  cache = ModelCache( cache_dir, [ opts.proc_impl, opts.cache_impl, ... ] )
+#  with cache.setup():
+#    model = ...
+#    model.apply( Mamba2020() )
+#
+# PyMTL iterates over sets of signals and blocks, so some of the source
+# it generates comes out in a different order in every process. We keep
+# all the variants we have seen, and drop the ones we have not used in
+# the last max_age runs, so the hit rate goes up over the first few runs.
+# On a miss we still avoid the tokenizer, since the generated source has
+# no multi-line strings and can be de-indented line by line.
+#
+# Elaborated components themselves cannot be saved since their update
+# blocks are closures over the component, so a warm start still
+# constructs and elaborates the model and only skips the compilation.
+
+import hashlib
+import linecache
+import marshal
+import os
+import sys
+import timeit
+
+from contextlib import contextmanager
+
+import py
+import pymtl3
+
+from pymtl3.passes.sim import GenDAGPass as gen_dag_pass_module
+
+from proc.DiskCache import user_cache_dir, sources_hash, imported_sources, \
+                       write_entry
+
+default_cache_dir = user_cache_dir()
+
+#-------------------------------------------------------------------------
+# deindent
+#-------------------------------------------------------------------------
+# Same as the deindent in py.code.Source for source without multi-line
+# strings: strip trailing blank lines and remove the indentation of the
+# first non-blank line from every line.
+
+def deindent( source ):
+
+  lines = source.split( "\n" )
+  while lines and not lines[-1].strip():
+    lines.pop()
+
+  offset = 0
+  for line in lines:
+    stripped = line.expandtabs().lstrip()
+    if stripped:
+      offset = len( line.expandtabs() ) - len( stripped )
+      break
+
+  if offset == 0:
+    return [ line.rstrip() for line in lines ]
+
+  new_lines = []
+  for line in lines:
+    line = line.expandtabs().rstrip()
+    if line[:offset].isspace():
+      line = line[offset:]
+    new_lines.append( line )
+
+  return new_lines
+
+#=========================================================================
+# ModelCache
+#=========================================================================
+
+class ModelCache (object):
+
+  def __init__( s, cache_dir, config, max_age=16 ):
+
+    s.cache_dir = cache_dir
+    s.max_age   = max_age
+
+    h = hashlib.sha1()
+    for x in list( config ) + [ sources_hash( imported_sources() ),
+                                pymtl3.__version__,
+                                sys.implementation.cache_tag ]:
+      h.update( str(x).encode() )
+      h.update( b"\0" )
+    s.key = h.hexdigest()
+
+    # Entries are ( code, lines, last run which used them ) keyed by
+    # source. cold_setup_time is the setup time of the run which created
+    # the cache.
+
+    s.entries         = {}
+    s.run             = 0
+    s.cold_setup_time = None
+
+    s.loaded          = False
+    s.num_code_hits   = 0
+    s.num_code_misses = 0
+    s.setup_time      = 0.0
+
+    s.load()
+
+  #-----------------------------------------------------------------------
+  # load/store
+  #-----------------------------------------------------------------------
+  # We ignore any problems with the cache directory and just compile
+  # everything again. The file is written with write_entry (see
+  # proc/DiskCache.py), so simulators running in parallel never see a
+  # partially written cache.
+
+  def path( s ):
+    return os.path.join( s.cache_dir, s.key + ".marshal" )
+
+  def load( s ):
+
+    try:
+      with open( s.path(), "rb" ) as fd:
+        s.run, s.cold_setup_time, s.entries = marshal.load( fd )
+      s.loaded = True
+    except Exception:
+      s.run, s.cold_setup_time, s.entries = 0, None, {}
+
+    s.run += 1
+
+  def store( s ):
+
+    if s.cold_setup_time is None:
+      s.cold_setup_time = s.setup_time
+
+    entries = { k: v for k, v in s.entries.items()
+                if v[2] > s.run - s.max_age }
+
+    write_entry( s.path(),
+                 lambda f: marshal.dump( ( s.run, s.cold_setup_time, entries ), f ) )
+
+  #-----------------------------------------------------------------------
+  # compile
+  #-----------------------------------------------------------------------
+  # Returns the code object for the given source, compiling it with
+  # compile_func on a miss. We also put the source into the linecache
+  # like py.code.Source.compile does, so that tracebacks into generated
+  # code still show the source.
+
+  def compile( s, key, compile_func ):
+
+    entry = s.entries.get( key )
+    if entry is None:
+      s.num_code_misses += 1
+      code, lines = compile_func()
+    else:
+      s.num_code_hits += 1
+      code, lines, _ = entry
+
+    s.entries[ key ] = ( code, lines, s.run )
+
+    if lines:
+      linecache.cache[ code.co_filename ] = \
+        ( 1, None, [ x + "\n" for x in lines ], code.co_filename )
+    return code
+
+  #-----------------------------------------------------------------------
+  # setup
+  #-----------------------------------------------------------------------
+  # Context manager for building the simulator. While it is active,
+  # py.code.Source and the compile used by GenDAGPass go through the
+  # cache. On exit we write the cache back.
+
+  @contextmanager
+  def setup( s ):
+
+    cache = s
+
+    class CachedSource (object):
+
+      def __init__( self, source ):
+        self.source = source
+
+      def compile( self, filename=None, mode="exec" ):
+
+        def compile_source():
+          lines = deindent( self.source )
+          name  = filename or "<codegen {}:{}>".format(
+                    caller.f_code.co_filename, caller.f_lineno )
+          return compile( "\n".join( lines ) + "\n", name, mode ), lines
+
+        caller = sys._getframe(1)
+        return cache.compile( "src:" + self.source, compile_source )
+
+      def __getattr__( self, attr ):
+        return getattr( real_source( self.source ), attr )
+
+    def cached_compile( source, filename, mode, *args, **kwargs ):
+
+      def compile_net():
+        return compile( source, filename, mode, *args, **kwargs ), []
+
+      return cache.compile( "net:" + filename + "\0" + source, compile_net )
+
+    real_source = py.code.Source
+
+    py.code.Source = CachedSource
+    gen_dag_pass_module.compile = cached_compile
+
+    start_time = timeit.default_timer()
+
+    try:
+      yield s
+    finally:
+      py.code.Source = real_source
+      del gen_dag_pass_module.compile
+
+    s.setup_time = timeit.default_timer() - start_time
+    s.store()
+
+  #-----------------------------------------------------------------------
+  # time_saved
+  #-----------------------------------------------------------------------
+  # Setup time saved compared to the run which created the cache
+
+  def time_saved( s ):
+    if not s.loaded or s.cold_setup_time is None:
+      return 0.0
+    return max( 0.0, s.cold_setup_time - s.setup_time )
@@ -0,0 +1,123 @@
+#=========================================================================
+# MultiProcMemXcel
+#=========================================================================
+# N-core composition for bthread applications. Every core is a complete
+# single-core composition, either a ProcMemXcel (with its own icache,
+# dcache, and accelerator) or a ProcXcel (no caches), whose processor
+# was constructed with num_cores=N and which was given its core_id. We
+# merge the memory ports of all cores with a Funnel per port, and route
+# the responses back with a Router per port, so that the composition has
+# exactly the same interface as a single core and drops into the same
+# TestHarness:
+#
+#  - with caches : imem and dmem (the refills of the icaches/dcaches)
+#  - no caches   : imem, dmem, and xmem
+#
+# The Funnel tags every request with the index of the core in the opaque
+# field and the Router uses it to steer the response. The caches, the
+# processors, and the accelerators do not use the opaque field of these
+# messages, so we do not have to keep the original one.
+#
+# With coherent=True the cores must be ProcMemXcels with coherent=True
+# and coherent data caches (BlockingCacheRTL with coherent=True). Their
+# refills and writebacks then go through a SnoopBus instead, which also
+# snoops the other data caches.
+# The instruction caches are never coherent, so programs must not write
+# their own code.
+#
+# Only core 0 talks to the manager, just like in the bthread runtime
+# where the other cores only run the functions spawned onto them. The
+# other cores never get a mngr2proc message and whatever they send to
+# proc2mngr is dropped. stats_en is the one of core 0.
+
+from pymtl3             import *
+from pymtl3.stdlib.ifcs import RecvIfcRTL, SendIfcRTL
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcRTL, mk_mem_msg
+
+from cache    import SnoopBus
+
+from .Router  import Router
+from .Funnel  import Funnel
+
+class MultiProcMemXcel ( Component ):
+
+  #-----------------------------------------------------------------------
+  # constructor
+  #-----------------------------------------------------------------------
+
+  def construct( s, cores, caches, coherent=False ):
+
+    s.ncores = ncores = len( cores )
+
+    if caches:
+      ReqType, RespType = mk_mem_msg( 8, 32, 128 )
+      mem_ports = [ "imem", "dmem" ]
+    else:
+      ReqType, RespType = mk_mem_msg( 8, 32, 32 )
+      mem_ports = [ "imem", "dmem", "xmem" ]
+      assert not coherent, "coherence needs caches"
+
+    # interface to outside MultiProcMemXcel
+
+    s.go        = InPort ()
+    s.stats_en  = OutPort()
+    s.mngr2proc = RecvIfcRTL( Bits32 )
+    s.proc2mngr = SendIfcRTL( Bits32 )
+
+    s.imem = MemMasterIfcRTL( ReqType, RespType )
+    s.dmem = MemMasterIfcRTL( ReqType, RespType )
+    if not caches:
+      s.xmem = MemMasterIfcRTL( ReqType, RespType )
+
+    s.cores = cores
+
+    # Core 0 talks to the manager
+
+    s.stats_en  //= s.cores[0].stats_en
+    s.mngr2proc //= s.cores[0].mngr2proc
+    s.proc2mngr //= s.cores[0].proc2mngr
+
+    for i in range( 1, ncores ):
+      s.cores[i].mngr2proc.en  //= 0
+      s.cores[i].mngr2proc.msg //= 0
+      s.cores[i].proc2mngr.rdy //= 1
+
+    # Coherent data caches share a snoop bus
+
+    if coherent:
+      mem_ports.remove( "dmem" )
+
+      s.bus = SnoopBus( ncores )
+      s.dmem //= s.bus.mem
+      for i in range( ncores ):
+        s.bus.cache[i] //= s.cores[i].dmem
+        s.bus.snoop[i] //= s.cores[i].snoop
+
+    # Merge the memory ports of all cores
+
+    for name in mem_ports:
+
+      port = getattr( s, name )
+
+      if ncores == 1:
+        port //= getattr( s.cores[0], name )
+        continue
+
+      funnel = Funnel( ReqType, ncores )(
+        in_ = { i: getattr( s.cores[i], name ).req for i in range( ncores ) },
+        out = port.req,
+      )
+      setattr( s, name + "_funnel", funnel )
+
+      router = Router( RespType, ncores )(
+        in_ = port.resp,
+        out = { i: getattr( s.cores[i], name ).resp for i in range( ncores ) },
+      )
+      setattr( s, name + "_router", router )
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    return " || ".join( core.line_trace() for core in s.cores )
@@ -0,0 +1,118 @@
+#=========================================================================
+# Proc2MngrDecoder.py
+#=========================================================================
+# Decodes the proc2mngr messages sent by assembly tests and benchmarks.
+# The upper 16 bits of a message are the type and the lower 16 bits are
+# extra information:
+#
+#  - type 0 : assembly test, xtra is 0 if passed or the failing line
+#  - type 1 : benchmark exit, xtra is the exit status
+#  - type 2 : benchmark verification, xtra is 0 if passed, otherwise the
+#             next three messages are the index, dest, and ref values
+#  - type 3 : print, xtra is 0 for an int, 1 for a char, 2 for a string,
+#             followed by the value (or one message per char for strings,
+#             terminated by a zero)
+#
+# Calling the decoder with a message returns None if the program is
+# still running, 0 if the program is done and passed, and a nonzero exit
+# status if the program failed.
+
+class Proc2MngrDecoder (object):
+
+  def __init__( s ):
+
+    # Storage for extra three messages on failure
+
+    s.app_fail_xtra       = False
+    s.app_fail_xtra_count = 0
+    s.app_fail_xtra_msgs  = [ None, None, None ]
+
+    # Storage for print
+
+    s.app_print           = False
+    s.app_print_type      = None  # 0: int, 1: char, 2: string
+
+  def __call__( s, msg ):
+
+    msg      = int(msg)
+    msg_type = msg >> 16
+    msg_xtra = msg & 0xFFFF
+
+    # First we check if we are gathering app_fail_xtra_msgs
+
+    if s.app_fail_xtra:
+      s.app_fail_xtra_msgs[ s.app_fail_xtra_count ] = msg
+      s.app_fail_xtra_count += 1
+      if s.app_fail_xtra_count == 3:
+        print( "" )
+        print( "  [ FAILED ] dest[{0}] != ref[{0}] ({1} != {2})" \
+                .format( s.app_fail_xtra_msgs[0],
+                         s.app_fail_xtra_msgs[1],
+                         s.app_fail_xtra_msgs[2] ) )
+        print( "" )
+        return 1
+
+    # Then we check if we are doing a print
+
+    elif s.app_print:
+
+      # Print int
+
+      if s.app_print_type == 0:
+        print( msg, end='' )
+        s.app_print = False
+
+      if s.app_print_type == 1:
+        print( chr(msg), end='' )
+        s.app_print = False
+
+      if s.app_print_type == 2:
+        if msg > 0:
+          print( chr(msg), end='' )
+        else:
+          s.app_print = False
+
+    # Message is from an assembly test
+
+    elif msg_type == 0:
+
+      if msg_xtra == 0:
+        print( "" )
+        print( "  [ passed ]" )
+        print( "" )
+        return 0
+
+      else:
+        print( "" )
+        print( "  [ FAILED ] error on line {}".format(msg_xtra) )
+        print( "" )
+        return 1
+
+    # Message is from a bmark
+
+    elif msg_type == 1:
+      return msg_xtra
+
+    # Message is from a bmark
+
+    elif msg_type == 2:
+
+      if msg_xtra == 0:
+        print( "" )
+        print( "  [ passed ]" )
+        print( "" )
+        return 0
+
+      else:
+        s.app_fail_xtra = True
+
+    # Message is from print
+
+    elif msg_type == 3:
+      s.app_print = True
+      s.app_print_type = msg_xtra
+      if s.app_print_type not in [0,1,2]:
+        print("ERROR: received unrecognized app print type!")
+        return 1
+
+    return None
@@ -6,8 +6,9 @@ from pymtl3             import *
 from pymtl3.stdlib.ifcs import RecvIfcRTL, SendIfcRTL
 from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcRTL, MemMinionIfcRTL, mk_mem_msg
 
-from .Router  import Router
-from .Funnel  import Funnel
+from .Router      import Router
+from .Funnel      import Funnel
+from .BankedCache import BankedCache
 
 class ProcMemXcel ( Component ):
 
@@ -15,7 +16,7 @@ class ProcMemXcel ( Component ):
   # constructor
   #-----------------------------------------------------------------------
 
-  def construct( s, proc, imem, dmem, xcel ):
+  def construct( s, proc, imem, dmem, xcel, core_id=0, coherent=False ):
 
     CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
     MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
@@ -30,22 +31,36 @@ class ProcMemXcel ( Component ):
     s.imem = MemMasterIfcRTL( MemReqType, MemRespType )
     s.dmem = MemMasterIfcRTL( MemReqType, MemRespType )
 
+    # snoops for a coherent data cache, i.e., BlockingCacheRTL with
+    # coherent=True
+
+    if coherent:
+      s.snoop = MemMinionIfcRTL( MemReqType, MemRespType )
+
     s.proc      = proc
     s.xcel      = xcel
     s.icache    = imem
     s.dcache    = dmem
 
-    s.funnel = Funnel( CacheReqType,  2 )(
-      in_ = { 0: s.proc.dmem.req,
-              1: s.xcel.mem.req  },
-      out = s.dcache.cache.req,
-    )
+    # A banked dcache has a port for the processor and one for the
+    # accelerator, otherwise they share the dcache through a Funnel
+
+    if isinstance( dmem, BankedCache ):
+      s.dcache.cache[0] //= s.proc.dmem
+      s.dcache.cache[1] //= s.xcel.mem
 
-    s.router = Router( CacheRespType, 2 )(
-      in_ = s.dcache.cache.resp,
-      out = { 0: s.proc.dmem.resp,
-              1: s.xcel.mem.resp }
-    )
+    else:
+      s.funnel = Funnel( CacheReqType,  2 )(
+        in_ = { 0: s.proc.dmem.req,
+                1: s.xcel.mem.req  },
+        out = s.dcache.cache.req,
+      )
+
+      s.router = Router( CacheRespType, 2 )(
+        in_ = s.dcache.cache.resp,
+        out = { 0: s.proc.dmem.resp,
+                1: s.xcel.mem.resp }
+      )
 
     # connect signals
 
@@ -55,7 +70,7 @@ class ProcMemXcel ( Component ):
 
     # proc
 
-    s.proc.core_id //= 0
+    s.proc.core_id //= core_id
     s.xcel.xcel  //= s.proc.xcel
     s.icache.cache //= s.proc.imem
 
@@ -64,6 +79,9 @@ class ProcMemXcel ( Component ):
     s.imem //= s.icache.mem
     s.dmem //= s.dcache.mem
 
+    if coherent:
+      s.snoop //= s.dcache.snoop
+
   def line_trace( s ):
 
     return s.proc.line_trace() \
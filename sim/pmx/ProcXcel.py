@@ -13,7 +13,7 @@ class ProcXcel( Component ):
   # constructor
   #-----------------------------------------------------------------------
 
-  def construct( s, proc, xcel ):
+  def construct( s, proc, xcel, core_id=0 ):
 
     CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32 )
     MemReqType,   MemRespType   = mk_mem_msg( 8, 32, 128 )
@@ -44,7 +44,7 @@ class ProcXcel( Component ):
 
     # connect signals
 
-    s.proc.core_id //= 0
+    s.proc.core_id //= core_id
 
     s.stats_en  //= s.proc.stats_en
 
@@ -0,0 +1,332 @@
+#=========================================================================
+# SimBench
+#=========================================================================
+# Simulator throughput benchmarks. Every benchmark builds one of our test
+# harnesses the same way its simulator script does, and then runs one
+# workload to completion:
+#
+#  - proc/<impl>/<ubmark>  : assembly ubmarks on the processor test
+#                            harness, simulated with Mamba like pmx-sim
+#  - imul/<impl>/<input>   : the imul-sim inputs on the multipliers
+#  - accum/<impl>/<input>  : the accum-xcel-sim inputs on the accumulator
+#
+# For each benchmark we measure the elaboration time (from constructing
+# the harness to having a simulator), the simulation throughput in
+# cycles per second, and the peak RSS. Each benchmark runs in its own
+# process, so neither the peak RSS nor the elaboration time depend on the
+# benchmarks which ran before.
+#
+# Results are kept in a JSON baseline, and compare() flags benchmarks
+# whose throughput dropped by more than a threshold. Baselines are only
+# meaningful on the machine where they were recorded.
+
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import timeit
+
+import pymtl3
+
+from pymtl3 import *
+
+from . import Baseline
+
+# The sim directory (marked by .pymtl_sim_root)
+
+sim_dir = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+# Version of the baseline format
+
+baseline_version = 1
+
+# The imul and accum workloads are only a few hundred cycles long, so we
+# repeat their messages to get a stable throughput
+
+imul_repeat  = 10
+accum_repeat = 10
+
+#-------------------------------------------------------------------------
+# proc
+#-------------------------------------------------------------------------
+
+def build_proc( impl, ubmark ):
+
+  from proc                import ProcFL, ProcRTL
+  from proc.test.harness   import TestHarness
+  from pymtl3.passes.mamba import Mamba2020
+  from pymtl3.passes.backends.verilog import VerilogPlaceholderPass
+
+  proc_impls = {
+    "fl-bits"  : ( ProcFL,  { "mode" : "bits"  } ),
+    "fl-int"   : ( ProcFL,  { "mode" : "int"   } ),
+    "fl-block" : ( ProcFL,  { "mode" : "block" } ),
+    "rtl"      : ( ProcRTL, {} ),
+  }
+
+  ProcModel, params = proc_impls[ impl ]
+
+  model = TestHarness( ProcModel )
+  if params:
+    model.set_param( "top.proc.construct", **params )
+
+  model.elaborate()
+  model.load( ubmarks[ ubmark ]().gen_mem_image() )
+
+  model.apply( VerilogPlaceholderPass() )
+  model.apply( TranslationImportPass() )
+  model.apply( Mamba2020() )
+
+  def check():
+    return bool( ubmarks[ ubmark ]().verify( model.mem.mem.mem ) )
+
+  return model, check
+
+def ubmark_vvadd():
+  from proc.ubmark.proc_ubmark_vvadd_unopt import ubmark_vvadd_unopt
+  return ubmark_vvadd_unopt
+
+def ubmark_cmult():
+  from proc.ubmark.proc_ubmark_cmult import ubmark_cmult
+  return ubmark_cmult
+
+def ubmark_mfilt():
+  from proc.ubmark.proc_ubmark_mfilt import ubmark_mfilt
+  return ubmark_mfilt
+
+def ubmark_bsearch():
+  from proc.ubmark.proc_ubmark_bsearch import ubmark_bsearch
+  return ubmark_bsearch
+
+ubmarks = {
+  "vvadd"   : ubmark_vvadd,
+  "cmult"   : ubmark_cmult,
+  "mfilt"   : ubmark_mfilt,
+  "bsearch" : ubmark_bsearch,
+}
+
+#-------------------------------------------------------------------------
+# imul
+#-------------------------------------------------------------------------
+
+imul_inputs = [ "small", "large", "lomask", "himask", "lohimask", "sparse" ]
+
+def build_imul( impl, input_ ):
+
+  from lab1_imul.IntMulScycleRTL   import IntMulScycleRTL
+  from lab1_imul.IntMulFixedLatRTL import IntMulFixedLatRTL
+  from lab1_imul.IntMulVarLatRTL   import IntMulVarLatRTL
+  from lab1_imul.IntMulNstageRTL   import IntMulNstageRTL
+  from lab1_imul.test              import IntMulFixedLatRTL_test as imul_test
+  from pymtl3.passes.backends.verilog import VerilogPlaceholderPass
+
+  imul_impls = {
+    "rtl-scycle" : IntMulScycleRTL,
+    "rtl-fixed"  : IntMulFixedLatRTL,
+    "rtl-var"    : IntMulVarLatRTL,
+    "rtl-nstage" : IntMulNstageRTL,
+  }
+
+  msgs = getattr( imul_test, "random_{}_msgs".format( input_ ) ) * imul_repeat
+
+  model = imul_test.TestHarness( imul_impls[ impl ]() )
+  model.set_param( "top.tm.src.construct",  msgs=msgs[::2]  )
+  model.set_param( "top.tm.sink.construct", msgs=msgs[1::2] )
+
+  model.elaborate()
+
+  model.apply( VerilogPlaceholderPass() )
+  model.apply( TranslationImportPass() )
+  model.apply( SimulationPass() )
+
+  return model, None
+
+#-------------------------------------------------------------------------
+# accum
+#-------------------------------------------------------------------------
+
+accum_inputs = [ "small", "large", "multiple" ]
+
+def build_accum( impl, input_ ):
+
+  import struct
+
+  from tut9_xcel import AccumXcelFL, AccumXcelCL, AccumXcelRTL
+  from tut9_xcel.test import AccumXcelFL_test as accum_test
+  from pymtl3.passes.backends.verilog import VerilogPlaceholderPass
+
+  accum_impls = {
+    "fl"  : AccumXcelFL,
+    "cl"  : AccumXcelCL,
+    "rtl" : AccumXcelRTL,
+  }
+
+  data = { "small"    : accum_test.small_data,
+           "large"    : accum_test.large_data,
+           "multiple" : accum_test.multiple }[ input_ ]
+
+  msgs = []
+  for i in range( len(data) ):
+    msgs += accum_test.gen_xcel_protocol_msgs( len(data[i]), i, sum(data[i]) )
+  msgs = msgs * accum_repeat
+
+  model = accum_test.TestHarness( accum_impls[ impl ]() )
+  model.set_param( "top.tm.src.construct",  msgs=msgs[::2]  )
+  model.set_param( "top.tm.sink.construct", msgs=msgs[1::2] )
+
+  model.elaborate()
+
+  for i in range( len(data) ):
+    model.mem.write_mem( 0x1000 + 0x3000*i,
+                         struct.pack( "<{}I".format( len(data[i]) ), *data[i] ) )
+
+  model.apply( VerilogPlaceholderPass() )
+  model.apply( TranslationImportPass() )
+  model.apply( SimulationPass() )
+
+  return model, None
+
+#-------------------------------------------------------------------------
+# benchmarks
+#-------------------------------------------------------------------------
+# All benchmarks by name, in the order we run them
+
+benchmarks = {}
+
+for impl in [ "fl-bits", "fl-int", "fl-block", "rtl" ]:
+  for ubmark in ubmarks:
+    benchmarks[ "proc/{}/{}".format( impl, ubmark ) ] = \
+      ( build_proc, impl, ubmark )
+
+for impl in [ "rtl-scycle", "rtl-fixed", "rtl-var", "rtl-nstage" ]:
+  for input_ in imul_inputs:
+    benchmarks[ "imul/{}/{}".format( impl, input_ ) ] = \
+      ( build_imul, impl, input_ )
+
+for impl in [ "fl", "cl", "rtl" ]:
+  for input_ in accum_inputs:
+    benchmarks[ "accum/{}/{}".format( impl, input_ ) ] = \
+      ( build_accum, impl, input_ )
+
+def select( patterns ):
+  if not patterns:
+    return list( benchmarks )
+  return [ name for name in benchmarks
+           if any( fnmatch.fnmatchcase( name, p ) for p in patterns ) ]
+
+#-------------------------------------------------------------------------
+# run_benchmark
+#-------------------------------------------------------------------------
+# Builds and runs one benchmark in this process and returns its result.
+
+def run_benchmark( name, max_cycles=1000000 ):
+
+  build, impl, input_ = benchmarks[ name ]
+
+  start_time = timeit.default_timer()
+  model, check = build( impl, input_ )
+  elab_time = timeit.default_timer() - start_time
+
+  model.sim_reset()
+
+  num_cycles = 0
+
+  start_time = timeit.default_timer()
+  while not model.done() and num_cycles < max_cycles:
+    model.tick()
+    num_cycles += 1
+  sim_time = timeit.default_timer() - start_time
+
+  passed = model.done() and ( check is None or check() )
+
+  return {
+    "elab_time"      : elab_time,
+    "num_cycles"     : num_cycles,
+    "sim_time"       : sim_time,
+    "cycles_per_sec" : num_cycles / sim_time if sim_time > 0 else 0.0,
+    "peak_rss_kb"    : resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss,
+    "passed"         : passed,
+  }
+
+#-------------------------------------------------------------------------
+# run_isolated
+#-------------------------------------------------------------------------
+# Runs one benchmark in a fresh interpreter. The result is the last line
+# of its output, anything before is what the models printed.
+
+def run_isolated( name, max_cycles=1000000 ):
+
+  code = "\n".join([
+    "import json, sys",
+    "sys.path.insert( 0, {!r} )".format( sim_dir ),
+    "from pmx.SimBench import run_benchmark",
+    "print( json.dumps( run_benchmark( {!r}, {!r} ) ) )".format( name, max_cycles ),
+  ])
+
+  proc = subprocess.run( [ sys.executable, "-c", code ],
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         universal_newlines=True )
+
+  lines = proc.stdout.strip().splitlines()
+  if proc.returncode != 0 or not lines:
+    return { "error": proc.stdout }
+
+  return json.loads( lines[-1] )
+
+#-------------------------------------------------------------------------
+# Baselines
+#-------------------------------------------------------------------------
+
+def mk_baseline( results ):
+
+  try:
+    git_rev = subprocess.check_output( [ "git", "rev-parse", "HEAD" ],
+                cwd=sim_dir, stderr=subprocess.DEVNULL,
+                universal_newlines=True ).strip()
+  except ( OSError, subprocess.CalledProcessError ):
+    git_rev = None
+
+  return {
+    "version"    : baseline_version,
+    "date"       : time.strftime( "%Y-%m-%d %H:%M:%S" ),
+    "host"       : platform.node(),
+    "python"     : "{} {}".format( platform.python_implementation(),
+                                   platform.python_version() ),
+    "pymtl3"     : pymtl3.__version__,
+    "git_rev"    : git_rev,
+    "benchmarks" : results,
+  }
+
+def load_baseline( path ):
+  return Baseline.load_baseline( path, baseline_version )
+
+save_baseline = Baseline.save_baseline
+
+#-------------------------------------------------------------------------
+# compare
+#-------------------------------------------------------------------------
+# Returns the throughput of every benchmark relative to the baseline,
+# and the names of the benchmarks which regressed by more than the
+# threshold (as a fraction). Benchmarks which are not in the baseline or
+# failed are skipped.
+
+def compare( results, baseline, threshold ):
+
+  ratios      = {}
+  regressions = []
+
+  for name, result in results.items():
+    base = baseline["benchmarks"].get( name )
+    if not base or "error" in result or "error" in base \
+        or not base["cycles_per_sec"]:
+      continue
+
+    ratios[ name ] = result["cycles_per_sec"] / base["cycles_per_sec"]
+    if ratios[ name ] < 1.0 - threshold:
+      regressions.append( name )
+
+  return ratios, regressions
@@ -0,0 +1,382 @@
+#=========================================================================
+# SparseMemoryCL
+#=========================================================================
+# Test memory with the same interface and behavior as MemoryCL, but
+# backed by a sparse paged memory instead of one flat bytearray. Pages
+# are only allocated when they are first written, so a 256MB memory for
+# a program which touches a few KB takes a few KB. Reading memory which
+# was never written returns zeros just like MemoryCL.
+#
+# write_mem takes any bytes-like object, so the sections of an ELF file
+# go straight from the mapped file into the pages, and zeroing a
+# ZeroData section (e.g., .bss) only drops the pages it covers.
+
+from collections import deque
+from copy        import deepcopy
+
+from pymtl3 import *
+from pymtl3.stdlib.ifcs import MemMsgType
+from pymtl3.stdlib.ifcs.mem_ifcs import MemMinionIfcCL
+
+from proc.SparseMemoryImage import SparseMemoryImage
+
+#-------------------------------------------------------------------------
+# PagedMemory
+#-------------------------------------------------------------------------
+# Byte addressable memory made of 4KB pages. Supports integer indexing
+# and slicing (without steps) like a bytearray, so it can be used in
+# place of the bytearray of a flat memory.
+
+class PagedMemory (object):
+
+  page_nbits  = 12
+  page_nbytes = 1 << page_nbits
+
+  def __init__( s, mem_nbytes ):
+    s.mem_nbytes = mem_nbytes
+    s.pages      = {}
+
+  def __len__( s ):
+    return s.mem_nbytes
+
+  def num_resident_pages( s ):
+    return len( s.pages )
+
+  def resident_nbytes( s ):
+    return len( s.pages ) * s.page_nbytes
+
+  def clear( s ):
+    s.pages.clear()
+
+  def check( s, addr, nbytes ):
+    if addr < 0 or addr + nbytes > s.mem_nbytes:
+      raise IndexError( "Memory access [{:#x},{:#x}) out of bounds" \
+                          .format( addr, addr + nbytes ) )
+
+  #-----------------------------------------------------------------------
+  # read/write
+  #-----------------------------------------------------------------------
+  # Read nbytes bytes starting at addr as bytes, and write the given
+  # bytes-like object starting at addr. Accesses can cross page
+  # boundaries. Whole pages are copied straight into new pages.
+
+  def read( s, addr, nbytes ):
+
+    s.check( addr, nbytes )
+
+    data = bytearray()
+    while nbytes > 0:
+      offset = addr & ( s.page_nbytes - 1 )
+      n      = min( nbytes, s.page_nbytes - offset )
+      page   = s.pages.get( addr >> s.page_nbits )
+      data  += page[offset:offset+n] if page is not None else bytes( n )
+      addr  += n
+      nbytes -= n
+
+    return bytes( data )
+
+  def write( s, addr, data ):
+
+    s.check( addr, len(data) )
+
+    i = 0
+    while i < len(data):
+      offset = addr & ( s.page_nbytes - 1 )
+      n      = min( len(data) - i, s.page_nbytes - offset )
+      page   = s.pages.get( addr >> s.page_nbits )
+      if page is None and n == s.page_nbytes:
+        s.pages[ addr >> s.page_nbits ] = bytearray( data[i:i+n] )
+      else:
+        if page is None:
+          page = s.pages[ addr >> s.page_nbits ] = bytearray( s.page_nbytes )
+        page[offset:offset+n] = data[i:i+n]
+      addr += n
+      i    += n
+
+  #-----------------------------------------------------------------------
+  # zero
+  #-----------------------------------------------------------------------
+  # Zero nbytes bytes starting at addr. Pages which are entirely zeroed
+  # are dropped (reading them returns zeros), and we only touch resident
+  # pages, so zeroing a large range of fresh memory is free.
+
+  def zero( s, addr, nbytes ):
+
+    s.check( addr, nbytes )
+
+    if nbytes == 0:
+      return
+
+    first = addr >> s.page_nbits
+    last  = ( addr + nbytes - 1 ) >> s.page_nbits
+
+    if last - first + 1 > len( s.pages ):
+      page_nums = sorted( x for x in s.pages if first <= x <= last )
+    else:
+      page_nums = [ x for x in range( first, last+1 ) if x in s.pages ]
+
+    for page_num in page_nums:
+      page_addr = page_num << s.page_nbits
+      start     = max( addr, page_addr )
+      stop      = min( addr + nbytes, page_addr + s.page_nbytes )
+      if stop - start == s.page_nbytes:
+        del s.pages[ page_num ]
+      else:
+        offset = start - page_addr
+        s.pages[ page_num ][offset:offset+stop-start] = bytes( stop - start )
+
+  #-----------------------------------------------------------------------
+  # read_int/write_int
+  #-----------------------------------------------------------------------
+  # Little endian integer accesses, with a fast path for accesses within
+  # a single page.
+
+  def read_int( s, addr, nbytes ):
+
+    offset = addr & ( s.page_nbytes - 1 )
+    if offset + nbytes <= s.page_nbytes and 0 <= addr <= s.mem_nbytes - nbytes:
+      page = s.pages.get( addr >> s.page_nbits )
+      if page is None:
+        return 0
+      return int.from_bytes( page[offset:offset+nbytes], "little" )
+
+    return int.from_bytes( s.read( addr, nbytes ), "little" )
+
+  def write_int( s, addr, nbytes, value ):
+    mask = ( 1 << ( nbytes*8 ) ) - 1
+    s.write( addr, ( value & mask ).to_bytes( nbytes, "little" ) )
+
+  #-----------------------------------------------------------------------
+  # bytearray-like interface
+  #-----------------------------------------------------------------------
+
+  def _slice( s, key ):
+    start, stop, step = key.indices( s.mem_nbytes )
+    assert step == 1, "PagedMemory does not support extended slices"
+    return start, max( 0, stop - start )
+
+  def __getitem__( s, key ):
+    if isinstance( key, slice ):
+      return s.read( *s._slice( key ) )
+    return s.read_int( key, 1 )
+
+  def __setitem__( s, key, value ):
+    if isinstance( key, slice ):
+      start, nbytes = s._slice( key )
+      assert len(value) == nbytes, "PagedMemory cannot be resized"
+      s.write( start, value )
+    else:
+      s.write_int( key, 1, value )
+
+#-------------------------------------------------------------------------
+# AMO functions
+#-------------------------------------------------------------------------
+# Same as in MemoryFL: the AMOs operate on Bits of the access size.
+
+amo_funcs = {
+  MemMsgType.AMO_ADD  : lambda m,a : m+a,
+  MemMsgType.AMO_AND  : lambda m,a : m&a,
+  MemMsgType.AMO_OR   : lambda m,a : m|a,
+  MemMsgType.AMO_SWAP : lambda m,a : a,
+  MemMsgType.AMO_MIN  : lambda m,a : m if m.int() < a.int() else a,
+  MemMsgType.AMO_MINU : min,
+  MemMsgType.AMO_MAX  : lambda m,a : m if m.int() > a.int() else a,
+  MemMsgType.AMO_MAXU : max,
+  MemMsgType.AMO_XOR  : lambda m,a : m^a,
+}
+
+#-------------------------------------------------------------------------
+# Delay pipes
+#-------------------------------------------------------------------------
+# Same timing as DelayPipeDeqCL and DelayPipeSendCL in the stdlib, but
+# the pipes drop the messages they hold on reset, so that a model can be
+# reset and run again with a new program without seeing responses to the
+# requests of the old one.
+
+class ResetDelayPipeDeqCL( Component ):
+
+  @non_blocking( lambda s: s.pipeline[0] is None )
+  def enq( s, msg ):
+    assert s.pipeline[0] is None
+    s.pipeline[0] = deepcopy(msg)
+
+  @non_blocking( lambda s: s.pipeline[-1] is not None )
+  def deq( s ):
+    ret = s.pipeline[-1]
+    s.pipeline[-1] = None
+    return ret
+
+  def construct( s, delay ):
+
+    s.pipeline = deque( [None]*(delay+1), maxlen=(delay+1) )
+
+    @s.update
+    def up_delay():
+      if s.reset:
+        s.pipeline.extend( [None]*(delay+1) )
+      elif delay > 0 and s.pipeline[-1] is None:
+        s.pipeline.rotate()
+
+    if delay == 0: # bypass behavior
+      s.add_constraints(
+        U(up_delay) < M(s.enq),
+        M(s.enq) < M(s.deq),
+      )
+
+    else: # pipe behavior
+      s.add_constraints(
+        U(up_delay) < M(s.deq),
+        U(up_delay) < M(s.deq.rdy),
+        U(up_delay) < M(s.enq),
+        U(up_delay) < M(s.enq.rdy),
+      )
+
+class ResetDelayPipeSendCL( Component ):
+
+  def enq_pipe( s, msg ):
+    assert s.pipeline[0] is None
+    s.pipeline[0] = deepcopy(msg)
+
+  def enq_rdy_pipe( s ):
+    return s.pipeline[0] is None
+
+  def construct( s, delay ):
+
+    s.send = CallerIfcCL()
+
+    if delay == 0: # combinational behavior
+      s.enq = CalleeIfcCL()
+      connect( s.enq, s.send )
+
+    else: # pipe behavior
+      s.enq = CalleeIfcCL( Type=None, method=s.enq_pipe, rdy=s.enq_rdy_pipe )
+      s.pipeline = deque( [None]*delay, maxlen=delay )
+
+      @s.update
+      def up_delay():
+        if s.reset:
+          s.pipeline.extend( [None]*delay )
+        elif s.pipeline[-1] is not None:
+          if s.send.rdy():
+            s.send( s.pipeline[-1] )
+            s.pipeline[-1] = None
+            s.pipeline.rotate()
+        else:
+          s.pipeline.rotate()
+
+      s.add_constraints(
+        M(s.enq) > U(up_delay),
+        M(s.enq.rdy) > U(up_delay),
+      )
+
+#=========================================================================
+# SparseMemoryCL
+#=========================================================================
+
+class SparseMemoryCL( Component ):
+
+  # Magical methods, same as MemoryCL
+
+  def read_mem( s, addr, size ):
+    return bytearray( s.mem.read( addr, size ) )
+
+  def write_mem( s, addr, data ):
+    if isinstance( data, SparseMemoryImage.ZeroData ):
+      return s.mem.zero( addr, len(data) )
+    return s.mem.write( addr, data )
+
+  def clear_mem( s ):
+    s.mem.clear()
+
+  #-----------------------------------------------------------------------
+  # read/write/amo
+  #-----------------------------------------------------------------------
+
+  def read( s, addr, nbytes ):
+    return Bits( nbytes*8, s.mem.read_int( int(addr), nbytes ) )
+
+  def write( s, addr, nbytes, data ):
+    s.mem.write_int( int(addr), nbytes, int(data) )
+
+  def amo( s, amo, addr, nbytes, data ):
+    ret = s.read( addr, nbytes )
+    s.write( addr, nbytes, amo_funcs[ int(amo) ]( ret, Bits( nbytes*8, int(data) ) ) )
+    return ret
+
+  #-----------------------------------------------------------------------
+  # constructor
+  #-----------------------------------------------------------------------
+
+  def construct( s, nports, mem_ifc_dtypes, latency=1, mem_nbytes=1<<28 ):
+
+    # Local constants
+
+    s.nports = nports
+    req_classes  = [ x for (x,y) in mem_ifc_dtypes ]
+    resp_classes = [ y for (x,y) in mem_ifc_dtypes ]
+
+    s.mem = PagedMemory( mem_nbytes )
+
+    # Interface
+
+    s.ifc = [ MemMinionIfcCL( req_classes[i], resp_classes[i] ) for i in range(nports) ]
+
+    # Queues
+
+    req_latency  = min(1, latency)
+    resp_latency = latency - req_latency
+
+    s.req_qs  = [ ResetDelayPipeDeqCL( req_latency )( enq = s.ifc[i].req ) for i in range(nports) ]
+    s.resp_qs = [ ResetDelayPipeSendCL( resp_latency )( send = s.ifc[i].resp ) for i in range(nports) ]
+
+    amo_types = set( amo_funcs )
+
+    @s.update
+    def up_mem():
+
+      # Unlike MemoryCL we drop all requests in flight on reset (see the
+      # delay pipes above), so that a model can be reset and run again
+      # with a new program
+
+      if s.reset:
+        return
+
+      for i in range(s.nports):
+
+        if s.req_qs[i].deq.rdy() and s.resp_qs[i].enq.rdy():
+
+          # Dequeue memory request message
+
+          req = s.req_qs[i].deq()
+          len_ = int(req.len)
+          if len_ == 0: len_ = req_classes[i].data_nbits >> 3
+
+          if req.type_ == MemMsgType.READ:
+            resp = resp_classes[i]( req.type_, req.opaque, 0, req.len,
+                                    s.read( req.addr, len_ ) )
+
+          elif req.type_ == MemMsgType.WRITE:
+            s.write( req.addr, len_, req.data )
+            resp = resp_classes[i]( req.type_, req.opaque, 0, 0, 0 )
+
+          elif int(req.type_) in amo_types:
+            resp = resp_classes[i]( req.type_, req.opaque, 0, req.len,
+                                    s.amo( req.type_, req.addr, len_, req.data ) )
+
+          elif req.type_ == MemMsgType.INV or req.type_ == MemMsgType.FLUSH:
+            resp = resp_classes[i]( req.type_, req.opaque, 0, 0, 0 )
+
+          else:
+            assert False, "Invalid memory request type {}".format( req.type_ )
+
+          s.resp_qs[i].enq( resp )
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    msg = ""
+    for i in range( s.nports ):
+      msg += f"[{i}] {str(s.ifc[i].req)} {str(s.ifc[i].resp)} "
+    return msg
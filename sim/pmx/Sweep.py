@@ -0,0 +1,283 @@
+#=========================================================================
+# Sweep
+#=========================================================================
+# Design space sweeps over our simulators. A sweep runs a simulator for
+# every combination of the swept options and every input binary, with
+# --stats, and collects the "name = value" lines the simulators print
+# into one result per point. The points run in parallel, each in its own
+# simulator process.
+#
+#  sweep = Sweep( "pmx-sim",
+#                 [ ( "proc-impl",  [ "fl", "rtl" ] ),
+#                   ( "cache-impl", [ "null", "rtl" ] ) ],
+#                 inputs = [ "vvadd.elf", "bsearch.elf" ],
+#                 cache  = ResultCache( cache_dir ) )
+#  results = sweep.run()
+#
+# Results are kept in a cache keyed by a hash of the simulator sources,
+# the simulator, the options, and the contents of the input binary, so a
+# point is only simulated again if one of these changed. We hash all the
+# sources in the sim directory (without the tests), since we cannot know
+# which of them a simulator imports without importing it ourselves. Only
+# runs which exit successfully are cached.
+
+import csv
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pymtl3
+
+from proc.DiskCache import sim_dir, user_cache_dir, file_hash, sources_hash, \
+                       all_sources, write_entry
+
+default_cache_dir = user_cache_dir( "sweep" )
+
+# The simulators we know by name, anything else is a path to a script
+
+simulators = {
+  "pmx-sim"        : "pmx/pmx-sim",
+  "iss-sim"        : "pmx/iss-sim",
+  "interval-sim"   : "pmx/interval-sim",
+  "imul-sim"       : "lab1_imul/imul-sim",
+  "accum-xcel-sim" : "tut9_xcel/accum-xcel-sim",
+  "mem-sim"        : "cache/mem-sim",
+}
+
+def sim_path( sim ):
+  if sim in simulators:
+    return os.path.join( sim_dir, simulators[ sim ] )
+  return os.path.abspath( sim )
+
+#-------------------------------------------------------------------------
+# parse_stats
+#-------------------------------------------------------------------------
+# Collects the "name = value" lines a simulator prints with --stats.
+# Values are converted to int or float where possible.
+
+def parse_stats( output ):
+
+  stats = {}
+  for line in output.splitlines():
+    name, sep, value = line.partition( "=" )
+    name  = name.strip()
+    value = value.strip()
+    if not sep or not name.isidentifier() or not value:
+      continue
+    for conv in ( int, float ):
+      try:
+        value = conv( value )
+        break
+      except ValueError:
+        pass
+    stats[ name ] = value
+
+  return stats
+
+#=========================================================================
+# ResultCache
+#=========================================================================
+# One JSON file per result, written with write_entry (see proc/DiskCache.py).
+# We ignore any problems with the cache directory and just simulate
+# again.
+
+class ResultCache (object):
+
+  def __init__( s, cache_dir ):
+    s.cache_dir = cache_dir
+
+  def path( s, key ):
+    return os.path.join( s.cache_dir, key[:2], key + ".json" )
+
+  def get( s, key ):
+    try:
+      with open( s.path( key ) ) as fd:
+        return json.load( fd )
+    except Exception:
+      return None
+
+  def put( s, key, result ):
+    write_entry( s.path( key ), lambda f: json.dump( result, f ), mode="w" )
+
+#=========================================================================
+# Sweep
+#=========================================================================
+# params is a list of ( option, values ) in the order they should vary,
+# where an option without values (an empty list) is a flag given for all
+# points. inputs are the positional arguments (the elf binaries for
+# pmx-sim), or [ None ] for simulators which take none.
+
+class Sweep (object):
+
+  def __init__( s, sim, params, inputs=None, cache=None, jobs=None,
+                timeout=None ):
+
+    s.sim     = sim
+    s.params  = list( params )
+    s.inputs  = list( inputs ) if inputs else [ None ]
+    s.cache   = cache
+    s.jobs    = jobs or os.cpu_count() or 1
+    s.timeout = timeout
+
+    s.num_hits   = 0
+    s.num_misses = 0
+
+    s.sources_hash = None
+    if cache is not None:
+      s.sources_hash = sources_hash( all_sources() | { sim_path( sim ) } )
+
+  #-----------------------------------------------------------------------
+  # points
+  #-----------------------------------------------------------------------
+  # All the points of the sweep as ( options, input ), where options is
+  # a dict from option to value (None for flags).
+
+  def points( s ):
+
+    flags = [ name for name, values in s.params if not values ]
+    swept = [ ( name, values ) for name, values in s.params if values ]
+
+    points = []
+    for values in itertools.product( *[ v for _, v in swept ] ):
+      options = { name: None for name in flags }
+      options.update( zip( [ name for name, _ in swept ], values ) )
+      for input_ in s.inputs:
+        points.append( ( options, input_ ) )
+
+    return points
+
+  def cmd( s, options, input_ ):
+
+    cmd = [ sys.executable, sim_path( s.sim ) ]
+    for name, value in options.items():
+      cmd.append( "--" + name )
+      if value is not None:
+        cmd.append( str( value ) )
+    if input_ is not None:
+      cmd.append( input_ )
+    cmd.append( "--stats" )
+    return cmd
+
+  def key( s, options, input_ ):
+
+    h = hashlib.sha1()
+    h.update( json.dumps( [
+      s.sources_hash, pymtl3.__version__, sys.implementation.cache_tag,
+      os.path.basename( sim_path( s.sim ) ),
+      sorted( options.items() ),
+      file_hash( input_ ) if input_ is not None and os.path.isfile( input_ ) else input_,
+    ] ).encode() )
+    return h.hexdigest()
+
+  #-----------------------------------------------------------------------
+  # run_point
+  #-----------------------------------------------------------------------
+
+  def run_point( s, options, input_ ):
+
+    result = {
+      "sim"     : s.sim,
+      "options" : options,
+      "input"   : input_,
+    }
+
+    key = None
+    if s.cache is not None:
+      key    = s.key( options, input_ )
+      cached = s.cache.get( key )
+      if cached is not None:
+        result.update( cached, cached=True )
+        return result
+
+    start_time = timeit.default_timer()
+
+    try:
+      proc = subprocess.run( s.cmd( options, input_ ),
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True, timeout=s.timeout )
+      returncode = proc.returncode
+      output     = proc.stdout
+    except subprocess.TimeoutExpired as e:
+      returncode = None
+      output     = e.output or ""
+      if isinstance( output, bytes ):
+        output = output.decode( errors="replace" )
+
+    outcome = {
+      "returncode" : returncode,
+      "stats"      : parse_stats( output ),
+      "wall_time"  : timeit.default_timer() - start_time,
+    }
+    if returncode != 0:
+      outcome["output"] = output
+
+    if key is not None and returncode == 0:
+      s.cache.put( key, outcome )
+
+    result.update( outcome, cached=False )
+    return result
+
+  #-----------------------------------------------------------------------
+  # run
+  #-----------------------------------------------------------------------
+  # Runs all points and returns the results in the order of points().
+  # The simulators run in their own processes, so threads are enough to
+  # keep jobs of them busy.
+
+  def run( s ):
+
+    points = s.points()
+    with ThreadPoolExecutor( max_workers=s.jobs ) as pool:
+      results = list( pool.map( lambda p: s.run_point( *p ), points ) )
+
+    if s.cache is not None:
+      s.num_hits   = sum( result["cached"] for result in results )
+      s.num_misses = len( results ) - s.num_hits
+
+    return results
+
+#-------------------------------------------------------------------------
+# write_csv/write_json
+#-------------------------------------------------------------------------
+# The CSV file has one column per option and per stat (in the order they
+# first appear).
+
+def columns( results ):
+
+  option_names = []
+  stat_names   = []
+  for result in results:
+    for name in result["options"]:
+      if name not in option_names:
+        option_names.append( name )
+    for name in result["stats"]:
+      if name not in stat_names:
+        stat_names.append( name )
+
+  return option_names, stat_names
+
+def write_csv( fd, results ):
+
+  option_names, stat_names = columns( results )
+
+  writer = csv.writer( fd )
+  writer.writerow( [ "sim" ] + option_names + [ "input", "returncode" ]
+                   + stat_names + [ "wall_time", "cached" ] )
+
+  for result in results:
+    writer.writerow(
+      [ result["sim"] ]
+      + [ result["options"].get( name, "" ) for name in option_names ]
+      + [ result["input"] or "", result["returncode"] ]
+      + [ result["stats"].get( name, "" ) for name in stat_names ]
+      + [ "{:.3f}".format( result["wall_time"] ), result["cached"] ] )
+
+def write_json( fd, results ):
+  json.dump( results, fd, indent=2 )
+  fd.write( "\n" )
@@ -0,0 +1,81 @@
+#=========================================================================
+# TestHarness
+#=========================================================================
+# Composes a processor/accelerator (with or without caches) with a test
+# memory. This is the harness pmx-sim and interval-sim simulate. The test
+# memory is sparse, so we only pay for the memory the program uses.
+
+from pymtl3 import *
+
+from pymtl3.stdlib.ifcs import mk_mem_msg, SendIfcRTL, RecvIfcRTL
+
+from .SparseMemoryCL import SparseMemoryCL
+
+class TestHarness( Component ):
+
+  #-----------------------------------------------------------------------
+  # constructor
+  #-----------------------------------------------------------------------
+
+  def construct( s, pmx, caches ):
+
+    # Stats enable signal
+
+    s.stats_en = OutPort()
+
+    # prog2mngr interface. Note simulator only gets output, so we don't
+    # need to worry about the mngr2proc interface. The simulator will
+    # monitor this interface for handling various message types.
+
+    s.mngr2proc = RecvIfcRTL( Bits32 )
+    s.proc2mngr = SendIfcRTL( Bits32 )
+
+    # Instantiate processor, cache, accelerator
+
+    s.pmx = pmx
+
+    # If pmx does not have any caches, we need a different test memory
+
+    if caches:
+      s.mem = SparseMemoryCL( 2, [ mk_mem_msg(8,32,128) ] * 2, mem_nbytes=1<<28 )
+    else:
+      s.mem = SparseMemoryCL( 3, [ mk_mem_msg(8,32,32) ] * 3, mem_nbytes=1<<28 )
+
+    # Bring the stats enable up to the top level
+
+    s.stats_en  //= s.pmx.stats_en
+
+    # Processor <-> Proc/Mngr
+
+    s.mngr2proc //= s.pmx.mngr2proc
+    s.proc2mngr //= s.pmx.proc2mngr
+
+    # PMX Caches <-> Memory
+
+    s.pmx.imem //= s.mem.ifc[0]
+    s.pmx.dmem //= s.mem.ifc[1]
+
+    if not caches:
+      # PMX directly to memory with no caches
+      s.pmx.xmem //= s.mem.ifc[2]
+
+  #-----------------------------------------------------------------------
+  # load memory image
+  #-----------------------------------------------------------------------
+  # Clears the test memory first, so that we can load one program after
+  # the other into the same model.
+
+  def load( self, mem_image ):
+    self.mem.clear_mem()
+    sections = mem_image.get_sections()
+    for section in sections:
+      self.mem.write_mem( section.addr, section.data )
+
+  #-----------------------------------------------------------------------
+  # line trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    return ("-" if s.stats_en else " ") + \
+           s.pmx.line_trace() + " | " + \
+           s.mem.ifc[1].line_trace()
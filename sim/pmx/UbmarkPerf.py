@@ -0,0 +1,305 @@
+#=========================================================================
+# UbmarkPerf
+#=========================================================================
+# Performance of the modeled designs on the assembly ubmarks. We run
+# every ubmark on a processor/accelerator composition (with or without
+# caches) in the pmx test harness, with a test source and sink for the
+# mngr2proc and proc2mngr messages of the ubmark, check the result with
+# the verify function of the ubmark, and measure inside the stats_en
+# region:
+#
+#  - num_cycles       : cycles with stats_en set
+#  - num_insts        : instructions committed with stats_en set
+#  - cpi              : num_cycles / num_insts
+#  - icache_miss_rate : refills / accesses of the instruction cache
+#  - dcache_miss_rate : refills / accesses of the data cache
+#
+# The miss rates are only there for the compositions with caches. Every
+# cache miss refills exactly one line, so we count misses as the read
+# requests from the cache to the test memory.
+#
+# Known limitation: the data cache is write-back and has no way to flush
+# it, so at the end of a ubmark its dirty lines never reach the test
+# memory. Instead we record the stores the data cache accepts and apply
+# them to the test memory before we verify the result. verify therefore
+# checks the stores of the processor and not what the cache writes back,
+# and a cache which loses a dirty line still passes here (the cache tests
+# cover write-backs).
+#
+# The models are deterministic, so the results only change when the
+# design (or the ubmark) changes. compare() checks results against a
+# baseline which is checked in next to this file.
+
+import contextlib
+import fnmatch
+import io
+import os
+import struct
+
+from pymtl3 import *
+from pymtl3.stdlib.ifcs import MemMsgType
+from pymtl3.stdlib.test import TestSrcCL, TestSinkCL
+
+from . import Baseline
+
+# Checked-in baseline
+
+default_baseline = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                                 "ubmark_perf_baseline.json" )
+
+# Version of the baseline format
+
+baseline_version = 1
+
+#-------------------------------------------------------------------------
+# configs
+#-------------------------------------------------------------------------
+# Compositions by name as ( proc, xcel, caches ). The FL processor uses
+# the int mode, which commits exactly the same instructions as the bits
+# mode and is a lot faster.
+
+configs = {
+  "fl"              : ( "fl",  "null-rtl",  False ),
+  "fl-accum"        : ( "fl",  "accum-fl",  False ),
+  "rtl"             : ( "rtl", "null-rtl",  False ),
+  "rtl-accum"       : ( "rtl", "accum-rtl", False ),
+  "rtl-cache"       : ( "rtl", "null-rtl",  True  ),
+  "rtl-cache-accum" : ( "rtl", "accum-rtl", True  ),
+}
+
+def mk_model( config ):
+
+  from proc      import ProcFL, ProcRTL, NullXcelRTL
+  from cache     import BlockingCacheRTL
+  from tut9_xcel import AccumXcelFL, AccumXcelRTL
+
+  from .ProcMemXcel import ProcMemXcel
+  from .ProcXcel    import ProcXcel
+  from .TestHarness import TestHarness
+
+  proc_impl, xcel_impl, caches = configs[ config ]
+
+  proc = { "fl"  : lambda: ProcFL( mode="int" ),
+           "rtl" : ProcRTL }[ proc_impl ]()
+
+  xcel = { "null-rtl"  : NullXcelRTL,
+           "accum-fl"  : AccumXcelFL,
+           "accum-rtl" : AccumXcelRTL }[ xcel_impl ]()
+
+  if caches:
+    pmx = ProcMemXcel( proc, BlockingCacheRTL(), BlockingCacheRTL(), xcel )
+  else:
+    pmx = ProcXcel( proc, xcel )
+
+  return TestHarness( pmx, caches=caches )
+
+#-------------------------------------------------------------------------
+# UbmarkHarness
+#-------------------------------------------------------------------------
+# The pmx test harness with a source for the mngr2proc messages and a
+# sink which checks the proc2mngr messages, like the processor test
+# harness in proc/test/harness.py.
+
+class UbmarkHarness( Component ):
+
+  def construct( s, config ):
+
+    s.stats_en = OutPort()
+
+    s.src  = TestSrcCL ( Bits32, [] )
+    s.sink = TestSinkCL( Bits32, [] )
+    s.th   = mk_model( config )
+
+    s.src.send      //= s.th.mngr2proc
+    s.th.proc2mngr  //= s.sink.recv
+    s.stats_en      //= s.th.stats_en
+
+  def load( s, mem_image ):
+    s.th.mem.clear_mem()
+    for section in mem_image.get_sections():
+      if section.name == ".mngr2proc":
+        for bits, in struct.iter_unpack( "<I", section.data ):
+          s.src.msgs.append( b32( bits ) )
+      elif section.name == ".proc2mngr":
+        for bits, in struct.iter_unpack( "<I", section.data ):
+          s.sink.msgs.append( b32( bits ) )
+      else:
+        s.th.mem.write_mem( section.addr, section.data )
+
+  def done( s ):
+    return s.src.done() and s.sink.done()
+
+  def line_trace( s ):
+    return s.src.line_trace() + " > " + s.th.line_trace() + " > " + \
+           s.sink.line_trace()
+
+#-------------------------------------------------------------------------
+# ubmarks
+#-------------------------------------------------------------------------
+
+def mk_ubmarks():
+
+  from proc.ubmark.proc_ubmark_vvadd_unopt import ubmark_vvadd_unopt
+  from proc.ubmark.proc_ubmark_vvadd_opt   import ubmark_vvadd_opt
+  from proc.ubmark.proc_ubmark_cmult       import ubmark_cmult
+  from proc.ubmark.proc_ubmark_mfilt       import ubmark_mfilt
+  from proc.ubmark.proc_ubmark_bsearch     import ubmark_bsearch
+
+  return {
+    "vvadd-unopt" : ubmark_vvadd_unopt,
+    "vvadd-opt"   : ubmark_vvadd_opt,
+    "cmult"       : ubmark_cmult,
+    "mfilt"       : ubmark_mfilt,
+    "bsearch"     : ubmark_bsearch,
+  }
+
+ubmark_names = [ "vvadd-unopt", "vvadd-opt", "cmult", "mfilt", "bsearch" ]
+
+def all_runs():
+  return [ "{}/{}".format( config, ubmark )
+           for config in configs for ubmark in ubmark_names ]
+
+def select( patterns ):
+  if not patterns:
+    return all_runs()
+  return [ name for name in all_runs()
+           if any( fnmatch.fnmatchcase( name, p ) for p in patterns ) ]
+
+#-------------------------------------------------------------------------
+# mk_sim
+#-------------------------------------------------------------------------
+# Builds the simulator of a composition the same way pmx-sim does.
+
+def mk_sim( config ):
+
+  from pymtl3.passes.backends.verilog import VerilogPlaceholderPass
+  from pymtl3.passes.mamba import Mamba2020
+
+  model = UbmarkHarness( config )
+  model.elaborate()
+  model.apply( VerilogPlaceholderPass() )
+  model.apply( TranslationImportPass() )
+  model.apply( Mamba2020() )
+
+  return model
+
+#-------------------------------------------------------------------------
+# run_ubmark
+#-------------------------------------------------------------------------
+# Runs one ubmark on one composition and returns its result. Raises an
+# AssertionError if the ubmark does not pass.
+
+def run_ubmark( config, ubmark, max_cycles=100000 ):
+
+  ubmark_cls = mk_ubmarks()[ ubmark ]
+
+  model = mk_sim( config )
+  model.load( ubmark_cls.gen_mem_image() )
+  model.sim_reset()
+
+  pmx    = model.th.pmx
+  caches = configs[ config ][2]
+
+  num_total_cycles = 0
+  num_cycles       = 0
+  num_insts        = 0
+  num_accesses     = { "icache": 0, "dcache": 0 }
+  num_refills      = { "icache": 0, "dcache": 0 }
+  in_region        = { "icache": False, "dcache": False }
+  stores           = []
+
+  while not model.done():
+
+    assert num_total_cycles < max_cycles, \
+      "{}/{}: exceeded {} cycles".format( config, ubmark, max_cycles )
+
+    # Count the events of this cycle. The caches are blocking, so every
+    # refill belongs to the last access, and we count it if that access
+    # was inside the stats region.
+
+    if model.stats_en:
+      num_cycles += 1
+      if pmx.proc.commit_inst:
+        num_insts += 1
+
+    for name in ( num_accesses if caches else [] ):
+      cache = getattr( pmx, name )
+      if cache.cache.req.en:
+        in_region[ name ] = bool( model.stats_en )
+        num_accesses[ name ] += in_region[ name ]
+      if cache.mem.req.en and cache.mem.req.msg.type_ == MemMsgType.READ:
+        num_refills[ name ] += in_region[ name ]
+
+    # Record the stores accepted by the data cache
+
+    if caches and pmx.dcache.cache.req.en \
+        and pmx.dcache.cache.req.msg.type_ == MemMsgType.WRITE:
+      req = pmx.dcache.cache.req.msg
+      stores.append( ( int( req.addr ), int( req.data ), int( req.len ) or 4 ) )
+
+    model.tick()
+    num_total_cycles += 1
+
+  # Check the results in memory, verify prints whether the ubmark passed
+
+  for addr, data, nbytes in stores:
+    model.th.mem.write_mem( addr, data.to_bytes( 4, "little" )[:nbytes] )
+
+  with contextlib.redirect_stdout( io.StringIO() ) as output:
+    passed = ubmark_cls.verify( model.th.mem.mem )
+  assert passed, "{}/{}: {}".format( config, ubmark, output.getvalue().strip() )
+
+  result = {
+    "num_cycles" : num_cycles,
+    "num_insts"  : num_insts,
+    "cpi"        : num_cycles / num_insts if num_insts else 0.0,
+  }
+
+  if caches:
+    for name in num_accesses:
+      result[ name + "_miss_rate" ] = \
+        num_refills[ name ] / num_accesses[ name ] if num_accesses[ name ] else 0.0
+
+  return result
+
+#-------------------------------------------------------------------------
+# Baselines
+#-------------------------------------------------------------------------
+
+# The baseline files have the same format as the SimBench baselines (see
+# Baseline.py), with the results of all runs in "results".
+
+def load_baseline( path=default_baseline ):
+  return Baseline.load_baseline( path, baseline_version )["results"]
+
+def save_baseline( results, path=default_baseline ):
+  Baseline.save_baseline( path, { "version": baseline_version, "results": results } )
+
+#-------------------------------------------------------------------------
+# compare
+#-------------------------------------------------------------------------
+# Compares the result of one run against its baseline. Returns a list of
+# regressions, which are more cycles (beyond the threshold, as a
+# fraction) or higher miss rates, and a list of other changes, which are
+# improvements or a different number of instructions. Both are lists of
+# ( stat, baseline value, value ).
+
+def compare( result, base, threshold=0.0 ):
+
+  regressions = []
+  changes     = []
+
+  for stat, value in sorted( result.items() ):
+    if stat not in base or stat == "cpi":
+      continue
+
+    base_value = base[ stat ]
+
+    if stat == "num_cycles" and value > base_value * ( 1.0 + threshold ):
+      regressions.append( ( stat, base_value, value ) )
+    elif stat.endswith( "_miss_rate" ) and value > base_value + 1e-9:
+      regressions.append( ( stat, base_value, value ) )
+    elif value != base_value and abs( value - base_value ) > 1e-9:
+      changes.append( ( stat, base_value, value ) )
+
+  return regressions, changes
@@ -0,0 +1,129 @@
+#=========================================================================
+# BankedCache_test.py
+#=========================================================================
+
+import pytest
+import struct
+
+from pymtl3 import *
+from pymtl3.stdlib.test import TestSrcCL, run_sim
+from pymtl3.stdlib.cl.MemoryCL import MemoryCL
+
+from cache.test.TestCacheSink       import TestCacheSink
+from cache.test.BlockingCacheFL_test import ( CacheReqType, CacheRespType,
+  MemReqType, MemRespType, req, resp, test_case_table_generic,
+  random_msgs, stream_msgs )
+
+from pmx.BankedCache import BankedCache
+
+#-------------------------------------------------------------------------
+# TestHarness
+#-------------------------------------------------------------------------
+# A source and a sink for every port of the banked cache. msgs is a list
+# with the request/response messages for every port.
+
+class TestHarness( Component ):
+
+  def construct( s, nbanks, msgs, stall_prob=0, latency=1,
+                 src_delay=0, sink_delay=0, check_test=False ):
+
+    s.srcs  = [ TestSrcCL( CacheReqType, port_msgs[::2],
+                           initial_delay=src_delay+3, interval_delay=src_delay )
+                for port_msgs in msgs ]
+    s.cache = BankedCache( nbanks, len(msgs) )
+    s.mem   = MemoryCL( 1, [ (MemReqType, MemRespType) ],
+                        stall_prob=stall_prob, latency=latency )
+    s.sinks = [ TestCacheSink( CacheRespType, port_msgs[1::2],
+                               initial_delay=sink_delay+3,
+                               interval_delay=sink_delay,
+                               check_test=check_test )
+                for port_msgs in msgs ]
+
+    for i in range( len(msgs) ):
+      s.srcs[i].send  //= s.cache.cache[i].req
+      s.sinks[i].recv //= s.cache.cache[i].resp
+
+    s.cache.mem //= s.mem.ifc[0]
+
+  def load( s, addrs, data_ints ):
+    for addr, data_int in zip( addrs, data_ints ):
+      s.mem.write_mem( addr, struct.pack( "<I", data_int ) )
+
+  def done( s ):
+    return all( src.done() for src in s.srcs ) and \
+           all( sink.done() for sink in s.sinks )
+
+  def line_trace( s ):
+    return " ".join( str(src.send) for src in s.srcs ) + " > " + \
+           s.cache.line_trace() + " > " + s.mem.line_trace()
+
+#-------------------------------------------------------------------------
+# Generic cache tests on the first port
+#-------------------------------------------------------------------------
+# Every bank is a full cache, so the banked cache has more capacity and
+# a different mapping, so we do not check hits and misses.
+
+@pytest.mark.parametrize( "nbanks", [ 2 ] )
+@pytest.mark.parametrize( **test_case_table_generic )
+def test_generic( test_params, nbanks ):
+
+  msgs = test_params.msg_func( 0 )
+
+  th = TestHarness( nbanks, [ msgs, [] ], test_params.stall,
+                    test_params.lat+1, test_params.src, test_params.sink )
+  th.elaborate()
+
+  if test_params.mem_data_func != None:
+    mem = test_params.mem_data_func( 0 )
+    th.load( mem[::2], mem[1::2] )
+
+  run_sim( th )
+
+#-------------------------------------------------------------------------
+# Both ports at the same time
+#-------------------------------------------------------------------------
+# The ports access different words of the same lines, so both ports use
+# all banks at the same time. The opaque fields have to come back.
+
+@pytest.mark.parametrize( "nbanks",     [ 2, 4 ] )
+@pytest.mark.parametrize( "stall,lat",  [ ( 0.0, 1 ), ( 0.5, 4 ) ] )
+@pytest.mark.parametrize( "src,sink",   [ ( 0, 0 ), ( 1, 3 ) ] )
+def test_two_ports( nbanks, stall, lat, src, sink ):
+
+  msgs = [ random_msgs( 0x1000 ), stream_msgs( 0x1050 ) ]
+
+  th = TestHarness( nbanks, msgs, stall, lat, src, sink )
+  run_sim( th )
+
+#-------------------------------------------------------------------------
+# Parallel hits
+#-------------------------------------------------------------------------
+# Once the lines are in the cache, two ports hitting in different banks
+# take about half the cycles of two ports hitting in the same bank.
+
+def run_cycles( addrs ):
+
+  msgs = []
+  for port, addr in enumerate( addrs ):
+    port_msgs = [ req( 'in', 0, addr, 0, port ), resp( 'in', 0, 0, 0, 0 ) ]
+    for i in range( 20 ):
+      port_msgs += [ req( 'rd', i, addr, 0, 0 ), resp( 'rd', i, 1, 0, port ) ]
+    msgs.append( port_msgs )
+
+  th = TestHarness( 2, msgs, check_test=True )
+  th.elaborate()
+  th.apply( SimulationPass() )
+  th.sim_reset()
+
+  while not th.done() and th.simulated_cycles < 1000:
+    th.tick()
+
+  assert th.done()
+  return th.simulated_cycles
+
+def test_parallel_banks():
+
+  same_bank      = run_cycles( [ 0x1000, 0x1020 ] )
+  different_bank = run_cycles( [ 0x1000, 0x1010 ] )
+
+  assert different_bank * 3 < same_bank * 2
@@ -0,0 +1,77 @@
+#=========================================================================
+# Batch_test.py
+#=========================================================================
+# Runs different programs one after the other on the same model with
+# pmx-sim --batch. All programs start at the same address, so a model
+# which keeps its cache state across programs runs the instructions of
+# the previous program, or writes back its dirty lines into the memory of
+# the next one.
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from proc                  import elf
+from proc.tinyrv2_encoding import assemble
+
+pmx_sim = os.path.join( os.path.dirname( os.path.dirname( __file__ ) ), "pmx-sim" )
+
+# Passes after storing 7 to 0x2000
+
+pass_program = """
+  addi x1, x0, 7
+  lui  x3, 2
+  sw   x1, 0(x3)
+  lui  x2, 16
+  csrw proc2mngr, x2 > 65536
+"""
+
+# Exits with status 5 plus whatever it finds at 0x2000
+
+fail5_program = """
+  lui  x3, 2
+  lw   x1, 0(x3)
+  lui  x2, 16
+  addi x2, x2, 5
+  add  x2, x2, x1
+  csrw proc2mngr, x2 > 65541
+"""
+
+def write_elf( path, program ):
+  with open( path, "wb" ) as file_obj:
+    elf.elf_writer( assemble( program ), file_obj )
+  return path
+
+#-------------------------------------------------------------------------
+# test_batch
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "opts", [
+  [ "--cache-impl", "null" ],
+  [ "--cache-impl", "rtl" ],
+  [ "--cache-impl", "nonblocking" ],
+  [ "--cache-impl", "rtl", "--dcache-banks", "2" ],
+], ids=[ "null", "rtl", "nonblocking", "banked" ] )
+def test_batch( tmpdir, opts ):
+
+  pass_elf  = write_elf( str( tmpdir.join( "pass.elf" ) ),  pass_program  )
+  fail5_elf = write_elf( str( tmpdir.join( "fail5.elf" ) ), fail5_program )
+
+  batch = tmpdir.join( "batch" )
+  batch.write( "\n".join([ pass_elf, fail5_elf, pass_elf ]) )
+
+  proc = subprocess.run( [ sys.executable, pmx_sim, "--proc-impl", "rtl",
+                           "--no-model-cache", "--no-image-cache",
+                           "--batch", str( batch ) ] + opts,
+                         stdout=subprocess.PIPE, universal_newlines=True )
+
+  results = [ json.loads( line ) for line in proc.stdout.splitlines() ]
+
+  assert [ result["status"] for result in results ] == \
+         [ "passed", "failed", "passed" ]
+  assert results[1]["exit_status"] == 5
+  assert results[0]["num_total_cycles"] == results[2]["num_total_cycles"]
+  assert proc.returncode == 1
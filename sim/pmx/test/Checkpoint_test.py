@@ -0,0 +1,146 @@
+#=========================================================================
+# Checkpoint_test.py
+#=========================================================================
+# Run a program on the instruction set simulator for a while, take a
+# checkpoint, and continue on the RTL processor from the checkpoint. The
+# RTL processor has to produce the remaining proc2mngr messages.
+
+import pytest
+
+from pymtl3 import *
+
+from proc                   import ProcRTL
+from proc.tinyrv2_encoding  import assemble
+from proc.tinyrv2_semantics import TinyRV2Semantics
+from proc.test.harness      import TestHarness, asm_test
+from proc.test              import inst_lw, inst_sw, inst_bne, inst_self_mod
+from proc.test              import inst_mul_mem, inst_jal_beq, inst_csr
+
+from pmx.Checkpoint       import Checkpoint, run_functional
+from pmx.Proc2MngrDecoder import Proc2MngrDecoder
+
+#-------------------------------------------------------------------------
+# run_test
+#-------------------------------------------------------------------------
+# Returns the value of stats_en in every cycle on the RTL processor.
+
+def run_test( gen_test, num_insts ):
+
+  # Run the first num_insts instructions on the instruction set simulator
+
+  mem_image = assemble( gen_test() )
+
+  iss = TinyRV2Semantics( mem_nbytes=1<<20 )
+  iss.load( mem_image )
+
+  while iss.num_insts < num_insts:
+    iss.run( num_insts - iss.num_insts )
+    while iss.proc2mngr_queue:
+      assert iss.proc2mngr_queue.popleft() == iss.proc2mngr_ref.popleft()
+
+  checkpoint = Checkpoint.capture( iss )
+
+  # Continue on the RTL processor with whatever messages are left
+
+  model = TestHarness( ProcRTL )
+  model.set_param( "top.proc.construct", reset_vector=checkpoint.pc )
+  model.elaborate()
+
+  model.src.msgs.extend ( [ b32(x) for x in iss.mngr2proc_queue ] )
+  model.sink.msgs.extend( [ b32(x) for x in iss.proc2mngr_ref   ] )
+
+  model.apply( SimulationPass() )
+  model.sim_reset()
+  model.tick()
+
+  checkpoint.restore( model.proc, model.mem )
+
+  stats_en = []
+  while not model.done() and model.simulated_cycles < 5000:
+    model.tick()
+    stats_en.append( int( model.proc.stats_en ) )
+
+  assert model.done()
+  return stats_en
+
+#-------------------------------------------------------------------------
+# tests
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "num_insts", [ 0, 1, 5, 17, 40 ] )
+@pytest.mark.parametrize( "name,test", [
+  asm_test( inst_lw.gen_random_test      ),
+  asm_test( inst_sw.gen_random_test      ),
+  asm_test( inst_self_mod.gen_basic_test ),
+  asm_test( inst_bne.gen_random_test     ),
+  asm_test( inst_mul_mem.gen_more_test   ),
+  asm_test( inst_jal_beq.gen_basic_test  ),
+  asm_test( inst_csr.gen_random_test     ),
+])
+def test_restore( name, test, num_insts ):
+  run_test( test, num_insts )
+
+# Checkpoint right after turning on stats, the RTL processor should pick
+# up where the instruction set simulator left off and turn stats off
+# again later.
+
+def test_restore_stats_en():
+  stats_en = run_test( inst_csr.gen_core_stats_test, 2 )
+  assert stats_en[0] == 1
+  assert stats_en[-1] == 0
+
+# Fast forward up to the entry of a function, which is how pmx-sim fast
+# forwards to --roi-start.
+
+def test_run_functional_until_pc():
+
+  mem_image = assemble("""
+    addi  x3, x0, 3
+  loop:
+    jal   x1, func
+    addi  x3, x3, -1
+    bne   x3, x0, loop
+    csrw  proc2mngr, x0 > 0
+  func:
+    addi  x4, x4, 1
+    jalr  x0, x1, 0
+  """)
+
+  iss = TinyRV2Semantics( mem_nbytes=1<<20 )
+  iss.load( mem_image )
+
+  func_pc = 0x214
+
+  # Every call reaches the entry of func again
+
+  for i in range( 3 ):
+    assert run_functional( iss, Proc2MngrDecoder(), until_pc=func_pc ) is None
+    assert iss.PC == func_pc
+    assert iss.R[4] == i
+    iss.run( 1 )
+
+  # After the last call the program finishes
+
+  assert run_functional( iss, Proc2MngrDecoder(), until_pc=func_pc ) == 0
+
+# Only the pages which are not all zero end up in the checkpoint, in the
+# first and the last span of memory as well as in between.
+
+def test_capture_pages():
+
+  iss = TinyRV2Semantics( mem_nbytes=3 << 20 )
+
+  iss.M[0x000000] = 1
+  iss.M[0x001fff] = 2
+  iss.M[0x1ff000] = 3
+  iss.M[0x2fffff] = 4
+
+  pages = Checkpoint.capture( iss ).pages
+
+  assert sorted( pages ) == [ 0x000000, 0x001000, 0x1ff000, 0x2ff000 ]
+  assert all( len( page ) == Checkpoint.page_nbytes for page in pages.values() )
+  assert pages[0x001000][-1] == 2 and pages[0x2ff000][-1] == 4
+
+  iss2 = TinyRV2Semantics( mem_nbytes=3 << 20 )
+  Checkpoint( 0, [0]*32, 0, 0, pages ).load_mem( iss2.M )
+  assert iss2.M == iss.M
@@ -0,0 +1,150 @@
+#=========================================================================
+# IntervalSim_test.py
+#=========================================================================
+# Simulate a small loop as a set of intervals on the RTL processor and
+# compare the stitched estimate against simulating the whole program.
+
+import pytest
+import random
+
+from pymtl3 import *
+
+from proc                   import ProcRTL
+from proc.tinyrv2_encoding  import assemble
+from proc.tinyrv2_semantics import TinyRV2Semantics
+from proc.test.harness      import TestHarness
+from proc.test.inst_utils   import gen_word_data
+
+from pmx.Proc2MngrDecoder import Proc2MngrDecoder
+from pmx.IntervalSim      import take_checkpoints, sim_interval, stitch
+from pmx.IntervalSim      import estimate_total
+
+# Fix the random seed so results are reproducible
+random.seed(0xdeadbeef)
+
+#-------------------------------------------------------------------------
+# gen_loop_test
+#-------------------------------------------------------------------------
+# Sum of squares over an array, with a running sum stored back to memory.
+# Only the very last instruction sends a message to the manager, which
+# tells the proc2mngr decoder that the program passed.
+
+def gen_loop_test( nelements=32 ):
+
+  data = [ random.randint(0,1000) for i in range(nelements) ]
+
+  return """
+    addi x1, x0, {}
+    lui  x2, 2
+    addi x3, x0, 0
+  loop:
+    lw   x4, 0(x2)
+    mul  x5, x4, x4
+    add  x3, x3, x5
+    sw   x3, 0(x2)
+    addi x2, x2, 4
+    addi x1, x1, -1
+    bne  x1, x0, loop
+    csrw proc2mngr, x0 > 0
+  """.format( nelements ) + gen_word_data( data )
+
+#-------------------------------------------------------------------------
+# run_intervals
+#-------------------------------------------------------------------------
+# Take checkpoints and simulate all of the intervals one after the other.
+
+def run_intervals( mem_image, interval_insts, warmup_insts, sample_period=1 ):
+
+  iss = TinyRV2Semantics( mem_nbytes=1<<20 )
+  iss.load( mem_image )
+  proc2mngr_ref = list( iss.proc2mngr_ref )
+
+  intervals, num_insts, num_stats_insts, status = take_checkpoints(
+    iss, Proc2MngrDecoder(), interval_insts, warmup_insts, sample_period )
+
+  assert status == 0
+
+  results = []
+  for index, checkpoint, warmup, ninsts in intervals:
+
+    model = TestHarness( ProcRTL )
+    model.set_param( "top.proc.construct", reset_vector=checkpoint.pc )
+    model.elaborate()
+
+    # Only the last interval sends a message to the manager
+
+    if index*interval_insts + ninsts == num_insts:
+      model.sink.msgs.extend( [ b32(x) for x in proc2mngr_ref ] )
+
+    model.apply( SimulationPass() )
+    model.sim_reset()
+
+    result = sim_interval( model, model.proc, model.mem, checkpoint,
+                           warmup, ninsts, max_cycles=5000 )
+    assert result is not None
+    results.append( result )
+
+  return stitch( results, num_insts, num_stats_insts, interval_insts )
+
+#-------------------------------------------------------------------------
+# tests
+#-------------------------------------------------------------------------
+
+def test_one_interval():
+
+  mem_image = assemble( gen_loop_test() )
+  estimate  = run_intervals( mem_image, 1000, 0 )
+
+  assert estimate["num_intervals"]  == 1
+  assert estimate["num_insts"]      == 3 + 32*7 + 1
+  assert estimate["num_cycles_err"] == 0.0
+
+@pytest.mark.parametrize( "interval_insts,warmup_insts", [
+  ( 50, 0  ),
+  ( 50, 20 ),
+  ( 31, 40 ),
+])
+def test_stitch( interval_insts, warmup_insts ):
+
+  mem_image = assemble( gen_loop_test() )
+  reference = run_intervals( mem_image, 1000, 0 )
+  estimate  = run_intervals( mem_image, interval_insts, warmup_insts )
+
+  assert estimate["num_insts"] == reference["num_insts"]
+  assert estimate["num_intervals"] == estimate["num_sim_intervals"]
+
+  # Every interval can be off by a few cycles since we do not warm up the
+  # pipeline, so we allow a few cycles per interval
+
+  num_cycles_err = abs( estimate["num_cycles"] - reference["num_cycles"] )
+  assert num_cycles_err <= 4 * estimate["num_intervals"]
+
+def test_sample():
+
+  mem_image = assemble( gen_loop_test( 64 ) )
+  reference = run_intervals( mem_image, 1000, 0 )
+  estimate  = run_intervals( mem_image, 20, 10, sample_period=3 )
+
+  assert estimate["num_sim_intervals"] < estimate["num_intervals"]
+  assert estimate["num_cycles_err"] > 0.0
+
+  num_cycles_err = abs( estimate["num_cycles"] - reference["num_cycles"] )
+  assert num_cycles_err <= max( estimate["num_cycles_err"], 0.05 * reference["num_cycles"] )
+
+def test_estimate_total():
+
+  # Exactly proportional samples have no error
+
+  total, err = estimate_total( [ 10, 10 ], [ 20, 20 ], 100, 10 )
+  assert total == 200
+  assert err   == 0.0
+
+  # Every interval simulated, no sampling error either
+
+  total, err = estimate_total( [ 10, 10 ], [ 15, 25 ], 20, 2 )
+  assert total == 40
+  assert err   == 0.0
+
+  total, err = estimate_total( [ 10, 10 ], [ 15, 25 ], 100, 10 )
+  assert total == 200
+  assert err   >  0.0
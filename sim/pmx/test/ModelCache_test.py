@@ -0,0 +1,155 @@
+#=========================================================================
+# ModelCache_test.py
+#=========================================================================
+
+import os
+import py
+
+from pymtl3 import *
+from pymtl3.passes.backends.verilog import VerilogPlaceholderPass
+from pymtl3.passes.mamba import Mamba2020
+from pymtl3.passes.sim import GenDAGPass as gen_dag_pass_module
+
+from proc                  import ProcRTL, NullXcelRTL
+from proc.tinyrv2_encoding import assemble
+
+from pmx.ProcXcel    import ProcXcel
+from pmx.TestHarness import TestHarness
+from pmx.ModelCache  import ModelCache, deindent
+
+from .programs import loop_program
+
+#-------------------------------------------------------------------------
+# build_and_run
+#-------------------------------------------------------------------------
+# Builds a simulator for the pmx test harness, with the given cache if
+# any, and returns the line trace of the first few cycles.
+
+def build():
+  model = TestHarness( ProcXcel( ProcRTL(), NullXcelRTL() ), caches=False )
+  model.elaborate()
+  model.apply( VerilogPlaceholderPass() )
+  model.apply( TranslationImportPass() )
+  model.apply( Mamba2020() )
+  return model
+
+def build_and_run( cache, num_cycles=40 ):
+
+  if cache is None:
+    model = build()
+  else:
+    with cache.setup():
+      model = build()
+
+  model.load( assemble( loop_program ) )
+  model.sim_reset()
+  model.proc2mngr.rdy = b1(1)
+
+  trace = []
+  for i in range(num_cycles):
+    trace.append( model.line_trace() )
+    model.tick()
+
+  return trace
+
+#-------------------------------------------------------------------------
+# test_deindent
+#-------------------------------------------------------------------------
+
+def test_deindent():
+
+  srcs = [
+    "def f():\n  return 1\n",
+    "\n      def f( s ):\n        def g():\n          x = s.a\n          x.b._flip()\n        return g\n      ",
+    "  a = 1\nb = 2\n    c = 3\n\n\n",
+    "",
+  ]
+
+  for src in srcs:
+    assert deindent( src ) == py.code.Source( src ).lines
+
+#-------------------------------------------------------------------------
+# test_cold_warm
+#-------------------------------------------------------------------------
+
+def test_cold_warm( tmpdir ):
+
+  cache_dir = str( tmpdir )
+
+  ref_trace = build_and_run( None )
+
+  cold = ModelCache( cache_dir, [ "rtl" ] )
+  cold_trace = build_and_run( cold )
+
+  assert not cold.loaded
+  assert cold.num_code_hits == 0
+  assert cold.num_code_misses > 0
+  assert os.path.exists( cold.path() )
+  assert cold_trace == ref_trace
+
+  # Everything was patched back
+
+  assert py.code.Source.__module__ == "py._code.source"
+  assert not hasattr( gen_dag_pass_module, "compile" )
+
+  # Some of the generated source is different every time we build the
+  # model, but a good part of it is the same
+
+  warm = ModelCache( cache_dir, [ "rtl" ] )
+  warm_trace = build_and_run( warm )
+
+  assert warm.loaded
+  assert warm.run == 2
+  assert warm.num_code_hits > 0
+  assert warm.cold_setup_time == cold.setup_time
+  assert warm_trace == ref_trace
+
+  # A different configuration has its own cache file
+
+  other = ModelCache( cache_dir, [ "rtl", "other" ] )
+  assert other.key != warm.key
+  assert not other.loaded
+
+#-------------------------------------------------------------------------
+# test_max_age
+#-------------------------------------------------------------------------
+# Entries which are not used for max_age runs are dropped
+
+def test_max_age( tmpdir ):
+
+  cache_dir = str( tmpdir )
+
+  cache = ModelCache( cache_dir, [ "rtl" ], max_age=2 )
+  with cache.setup():
+    code = py.code.Source( "def f():\n  return 42" ).compile()
+  assert cache.num_code_misses == 1
+
+  for i in range(2):
+    cache = ModelCache( cache_dir, [ "rtl" ], max_age=2 )
+    assert "src:def f():\n  return 42" in cache.entries
+    with cache.setup():
+      pass
+
+  cache = ModelCache( cache_dir, [ "rtl" ], max_age=2 )
+  assert cache.loaded
+  assert cache.entries == {}
+
+#-------------------------------------------------------------------------
+# test_corrupt
+#-------------------------------------------------------------------------
+# A corrupt cache file is just a miss
+
+def test_corrupt( tmpdir ):
+
+  cache_dir = str( tmpdir )
+
+  cold = ModelCache( cache_dir, [ "rtl" ] )
+  with open( cold.path(), "wb" ) as fd:
+    fd.write( b"garbage" )
+
+  cache = ModelCache( cache_dir, [ "rtl" ] )
+  assert not cache.loaded
+
+  build_and_run( cache, num_cycles=1 )
+  assert cache.num_code_hits == 0
+  assert ModelCache( cache_dir, [ "rtl" ] ).loaded
@@ -0,0 +1,155 @@
+#=========================================================================
+# MultiProcMemXcel_test.py
+#=========================================================================
+
+import struct
+
+import pytest
+
+from pymtl3 import *
+from pymtl3.stdlib.test import TestSrcCL, TestSinkCL, run_sim
+
+from proc                  import ProcRTL, NullXcelRTL
+from proc.tinyrv2_encoding import assemble
+from cache                 import BlockingCacheRTL
+
+from pmx.ProcMemXcel      import ProcMemXcel
+from pmx.ProcXcel         import ProcXcel
+from pmx.MultiProcMemXcel import MultiProcMemXcel
+from pmx.TestHarness      import TestHarness
+
+#-------------------------------------------------------------------------
+# MultiCoreHarness
+#-------------------------------------------------------------------------
+# The pmx test harness around an N-core composition, with a source and a
+# sink for the mngr2proc and proc2mngr messages of core 0.
+
+class MultiCoreHarness( Component ):
+
+  def construct( s, ncores, caches, coherent=False ):
+
+    def mk_core( core_id ):
+      proc = ProcRTL( num_cores=ncores )
+      if caches:
+        return ProcMemXcel( proc, BlockingCacheRTL(),
+                            BlockingCacheRTL( coherent=coherent ),
+                            NullXcelRTL(), core_id=core_id,
+                            coherent=coherent )
+      return ProcXcel( proc, NullXcelRTL(), core_id=core_id )
+
+    s.src  = TestSrcCL ( Bits32, [] )
+    s.sink = TestSinkCL( Bits32, [] )
+    s.th   = TestHarness( MultiProcMemXcel(
+                            [ mk_core(i) for i in range(ncores) ], caches,
+                            coherent ),
+                          caches=caches )
+
+    s.src.send     //= s.th.mngr2proc
+    s.th.proc2mngr //= s.sink.recv
+
+  def load( s, mem_image ):
+    s.th.load( mem_image )
+    for section in mem_image.get_sections():
+      if section.name == ".mngr2proc":
+        for bits, in struct.iter_unpack( "<I", section.data ):
+          s.src.msgs.append( b32( bits ) )
+      elif section.name == ".proc2mngr":
+        for bits, in struct.iter_unpack( "<I", section.data ):
+          s.sink.msgs.append( b32( bits ) )
+
+  def done( s ):
+    return s.src.done() and s.sink.done()
+
+  def line_trace( s ):
+    return s.src.line_trace() + " > " + s.th.line_trace() + " > " + \
+           s.sink.line_trace()
+
+#-------------------------------------------------------------------------
+# test_shared_memory
+#-------------------------------------------------------------------------
+# Every core stores coreid+1 to its own word, core 0 waits until it has
+# seen the words of all cores and sends their sum. Without caches all
+# cores see the same memory.
+
+SHARED_MEMORY = """
+    csrr  x1, coreid
+    csrr  x2, numcores
+    lui   x5, 2
+    slli  x3, x1, 2
+    add   x3, x5, x3
+    addi  x4, x1, 1
+    sw    x4, 0(x3)
+    bne   x1, x0, worker
+
+    csrr  x9, mngr2proc < 0x100
+    add   x8, x0, x9
+    addi  x6, x0, 0
+  wait:
+    lw    x7, 0(x5)
+    beq   x7, x0, wait
+    add   x8, x8, x7
+    addi  x5, x5, 4
+    addi  x6, x6, 1
+    bne   x6, x2, wait
+    csrw  proc2mngr, x8 > {}
+  end:
+    jal   x0, end
+
+  worker:
+    csrw  proc2mngr, x1
+    jal   x0, worker
+"""
+
+@pytest.mark.parametrize( "ncores", [ 1, 2, 4 ] )
+def test_shared_memory( ncores ):
+
+  model = MultiCoreHarness( ncores, caches=False )
+  model.elaborate()
+
+  model.load( assemble( SHARED_MEMORY.format( 0x100 + ncores * ( ncores + 1 ) // 2 ) ) )
+
+  run_sim( model, max_cycles=2000 )
+
+#-------------------------------------------------------------------------
+# test_coherent_caches
+#-------------------------------------------------------------------------
+# The same program with coherent data caches: core 0 sees the stores of
+# the other cores in its own cache.
+
+@pytest.mark.parametrize( "ncores", [ 2, 4 ] )
+def test_coherent_caches( ncores ):
+
+  model = MultiCoreHarness( ncores, caches=True, coherent=True )
+  model.elaborate()
+
+  model.load( assemble( SHARED_MEMORY.format( 0x100 + ncores * ( ncores + 1 ) // 2 ) ) )
+
+  run_sim( model, max_cycles=5000 )
+
+#-------------------------------------------------------------------------
+# test_private_caches
+#-------------------------------------------------------------------------
+# Every core has its own caches. Core 0 reports the number of cores and
+# its core id, and the messages of the other cores are dropped.
+
+@pytest.mark.parametrize( "ncores", [ 1, 2 ] )
+def test_private_caches( ncores ):
+
+  model = MultiCoreHarness( ncores, caches=True )
+  model.elaborate()
+
+  model.load( assemble( """
+    csrr  x1, coreid
+    csrr  x2, numcores
+    bne   x1, x0, worker
+    csrw  proc2mngr, x2 > {}
+    csrw  proc2mngr, x1 > 0
+  end:
+    jal   x0, end
+
+  worker:
+    csrw  proc2mngr, x1
+    jal   x0, worker
+  """.format( ncores ) ) )
+
+  run_sim( model, max_cycles=2000 )
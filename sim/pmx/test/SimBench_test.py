@@ -0,0 +1,80 @@
+#=========================================================================
+# SimBench_test.py
+#=========================================================================
+
+import json
+import pytest
+
+from pmx.SimBench import benchmarks, select, run_benchmark, mk_baseline, \
+                         load_baseline, save_baseline, compare
+
+#-------------------------------------------------------------------------
+# test_select
+#-------------------------------------------------------------------------
+
+def test_select():
+
+  assert select( [] ) == list( benchmarks )
+  assert select( [ "proc/rtl/*" ] ) == \
+    [ "proc/rtl/vvadd", "proc/rtl/cmult", "proc/rtl/mfilt", "proc/rtl/bsearch" ]
+  assert select( [ "accum/*/small", "imul/rtl-var/sparse" ] ) == \
+    [ "imul/rtl-var/sparse", "accum/fl/small", "accum/cl/small", "accum/rtl/small" ]
+  assert select( [ "nope" ] ) == []
+
+#-------------------------------------------------------------------------
+# test_run_benchmark
+#-------------------------------------------------------------------------
+
+def test_run_benchmark():
+
+  result = run_benchmark( "proc/fl-int/vvadd" )
+
+  assert result["passed"]
+  assert result["num_cycles"] > 100
+  assert result["cycles_per_sec"] > 0
+  assert result["elab_time"] > 0
+  assert result["peak_rss_kb"] > 0
+
+  # Stopping early fails the benchmark
+
+  result = run_benchmark( "proc/fl-int/vvadd", max_cycles=10 )
+
+  assert not result["passed"]
+  assert result["num_cycles"] == 10
+
+#-------------------------------------------------------------------------
+# test_baseline
+#-------------------------------------------------------------------------
+
+def mk_result( cycles_per_sec ):
+  return { "elab_time": 1.0, "num_cycles": 1000, "sim_time": 1.0,
+           "cycles_per_sec": cycles_per_sec, "peak_rss_kb": 1024,
+           "passed": True }
+
+def test_baseline( tmpdir ):
+
+  path = str( tmpdir.join( "baseline.json" ) )
+
+  save_baseline( path, mk_baseline( { "a": mk_result( 100.0 ),
+                                      "b": mk_result( 100.0 ),
+                                      "c": mk_result( 100.0 ) } ) )
+  baseline = load_baseline( path )
+
+  ratios, regressions = compare( { "a": mk_result( 91.0 ),
+                                   "b": mk_result( 89.0 ),
+                                   "c": { "error": "..." },
+                                   "d": mk_result( 1.0 ) }, baseline, 0.10 )
+
+  assert ratios == { "a": 0.91, "b": 0.89 }
+  assert regressions == [ "b" ]
+
+  # Baselines in a different format are rejected
+
+  with open( path ) as fd:
+    baseline = json.load( fd )
+  baseline["version"] = 0
+  with open( path, "w" ) as fd:
+    json.dump( baseline, fd )
+
+  with pytest.raises( ValueError ):
+    load_baseline( path )
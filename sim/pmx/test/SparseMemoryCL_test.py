@@ -0,0 +1,252 @@
+#=========================================================================
+# SparseMemoryCL_test.py
+#=========================================================================
+
+import pytest
+import random
+
+from pymtl3 import *
+from pymtl3.stdlib.ifcs import mk_mem_msg, MemMsgType
+from pymtl3.stdlib.test import TestSrcCL, TestSinkCL, run_sim
+
+from proc.SparseMemoryImage import SparseMemoryImage
+
+from pmx.SparseMemoryCL import PagedMemory, SparseMemoryCL
+
+#-------------------------------------------------------------------------
+# PagedMemory
+#-------------------------------------------------------------------------
+# Random accesses (many of them across page boundaries) compared against
+# a flat bytearray.
+
+def test_paged_memory():
+
+  mem_nbytes = 1 << 16
+  mem = PagedMemory( mem_nbytes )
+  ref = bytearray( mem_nbytes )
+
+  # Reading does not allocate any pages
+
+  assert mem[0x1000:0x1010] == bytes( 16 )
+  assert mem.read_int( 0x2ffe, 4 ) == 0
+  assert mem.num_resident_pages() == 0
+
+  for i in range(1000):
+    addr   = random.randint( 0, mem_nbytes - 64 )
+    nbytes = random.randint( 1, 64 )
+    data   = bytes( random.getrandbits(8) for _ in range(nbytes) )
+
+    if random.random() < 0.5:
+      mem[addr:addr+nbytes] = data
+    else:
+      mem.write_int( addr, nbytes, int.from_bytes( data, "little" ) )
+    ref[addr:addr+nbytes] = data
+
+    addr   = random.randint( 0, mem_nbytes - 64 )
+    nbytes = random.randint( 1, 64 )
+    assert mem[addr:addr+nbytes] == ref[addr:addr+nbytes]
+    assert mem.read_int( addr, nbytes ) == \
+           int.from_bytes( ref[addr:addr+nbytes], "little" )
+    assert mem[addr] == ref[addr]
+
+  assert mem[:] == ref
+  assert mem.num_resident_pages() <= mem_nbytes // PagedMemory.page_nbytes
+
+  with pytest.raises( IndexError ):
+    mem.read( mem_nbytes - 2, 4 )
+
+  with pytest.raises( IndexError ):
+    mem.write_int( mem_nbytes, 1, 0 )
+
+def test_paged_memory_resident():
+
+  mem = PagedMemory( 1 << 28 )
+
+  mem[0x0ffe:0x1002] = b"\x01\x02\x03\x04"
+  mem[0x0ffffffc] = 0xff
+  mem.write_int( 0x200, 4, 0xdeadbeef )
+
+  assert mem.num_resident_pages() == 3
+  assert mem.resident_nbytes()    == 3 * 4096
+  assert mem.read_int( 0x0ffe, 4 ) == 0x04030201
+  assert mem.read_int( 0x0200, 4 ) == 0xdeadbeef
+
+  mem.clear()
+
+  assert mem.num_resident_pages() == 0
+  assert mem.read_int( 0x0200, 4 ) == 0
+
+def test_paged_memory_zero():
+
+  mem_nbytes = 1 << 16
+  mem = PagedMemory( mem_nbytes )
+  ref = bytearray( mem_nbytes )
+
+  # Zeroing fresh memory does not allocate any pages
+
+  mem.zero( 0, mem_nbytes )
+  assert mem.num_resident_pages() == 0
+
+  # Whole pages are written straight into new pages
+
+  data = memoryview( bytes( random.getrandbits(8) for _ in range(3*4096) ) )
+  mem.write( 0x1000, data )
+  ref[0x1000:0x4000] = data
+
+  assert mem.num_resident_pages() == 3
+
+  # Zeroing drops the pages it covers completely, and zeroes the rest
+
+  for addr, nbytes in [ ( 0x2000, 0x1000 ), ( 0x0ff0, 0x20 ), ( 0x3000, 0 ) ]:
+    mem.zero( addr, nbytes )
+    ref[addr:addr+nbytes] = bytes( nbytes )
+    assert mem[:] == ref
+
+  assert mem.num_resident_pages() == 2
+
+  mem.zero( 0x1000, 0x3000 )
+
+  assert mem.num_resident_pages() == 0
+  assert mem[:] == bytes( mem_nbytes )
+
+  with pytest.raises( IndexError ):
+    mem.zero( mem_nbytes - 2, 4 )
+
+#-------------------------------------------------------------------------
+# TestHarness
+#-------------------------------------------------------------------------
+
+class TestHarness( Component ):
+
+  def construct( s, MemMsgTypes, src_msgs, sink_msgs, latency ):
+
+    s.src  = TestSrcCL ( MemMsgTypes[0], src_msgs  )
+    s.mem  = SparseMemoryCL( 1, [ MemMsgTypes ], latency=latency )
+    s.sink = TestSinkCL( MemMsgTypes[1], sink_msgs )
+
+    s.src.send  //= s.mem.ifc[0].req
+    s.sink.recv //= s.mem.ifc[0].resp
+
+  def done( s ):
+    return s.src.done() and s.sink.done()
+
+  def line_trace( s ):
+    return s.src.line_trace() + " > " + s.mem.line_trace() + " > " + \
+           s.sink.line_trace()
+
+#-------------------------------------------------------------------------
+# mk_msgs
+#-------------------------------------------------------------------------
+# Random reads, writes, and AMOs, with the expected responses from a
+# flat reference memory. The AMOs use the signed/unsigned semantics of
+# MemoryCL.
+
+amo_ref_funcs = {
+  MemMsgType.AMO_ADD  : lambda m,a : m+a,
+  MemMsgType.AMO_AND  : lambda m,a : m&a,
+  MemMsgType.AMO_OR   : lambda m,a : m|a,
+  MemMsgType.AMO_SWAP : lambda m,a : a,
+  MemMsgType.AMO_MIN  : lambda m,a : m if ( m ^ 0x80000000 ) < ( a ^ 0x80000000 ) else a,
+  MemMsgType.AMO_MINU : min,
+  MemMsgType.AMO_MAX  : lambda m,a : m if ( m ^ 0x80000000 ) > ( a ^ 0x80000000 ) else a,
+  MemMsgType.AMO_MAXU : max,
+  MemMsgType.AMO_XOR  : lambda m,a : m^a,
+}
+
+def mk_msgs( MemMsgTypes, num_msgs ):
+
+  ReqType, RespType = MemMsgTypes
+  nbytes = ReqType.data_nbits // 8
+
+  # A few words in each of a few pages, including words crossing pages
+
+  addrs = [ base + offset for base in [ 0x1000, 0x2000, 0x0ff0000 ]
+                          for offset in [ -8, -4, -2, 0, 4, 8 ] ]
+
+  ref = {}
+  def ref_read( addr, n ):
+    return sum( ref.get( addr+i, 0 ) << (8*i) for i in range(n) )
+  def ref_write( addr, n, value ):
+    for i in range(n):
+      ref[addr+i] = ( value >> (8*i) ) & 0xff
+
+  reqs  = []
+  resps = []
+  for i in range(num_msgs):
+
+    addr  = random.choice( addrs )
+    data  = random.getrandbits( 8*nbytes )
+    len_  = random.choice( [ 0, 1, 2, 4 ] ) if nbytes == 4 else 0
+    n     = len_ if len_ else nbytes
+    type_ = random.choice( [ MemMsgType.READ, MemMsgType.WRITE ] * 4 +
+                           ( list( amo_ref_funcs ) if nbytes == 4 else [] ) )
+
+    if type_ == MemMsgType.READ:
+      reqs .append( ReqType ( type_, i & 0xff, addr, len_, 0 ) )
+      resps.append( RespType( type_, i & 0xff, 0, len_, ref_read( addr, n ) ) )
+
+    elif type_ == MemMsgType.WRITE:
+      ref_write( addr, n, data )
+      reqs .append( ReqType ( type_, i & 0xff, addr, len_, data ) )
+      resps.append( RespType( type_, i & 0xff, 0, 0, 0 ) )
+
+    else:
+      old = ref_read( addr, 4 )
+      ref_write( addr, 4, amo_ref_funcs[ type_ ]( old, data ) )
+      reqs .append( ReqType ( type_, i & 0xff, addr, 0, data ) )
+      resps.append( RespType( type_, i & 0xff, 0, 0, old ) )
+
+  return reqs, resps
+
+#-------------------------------------------------------------------------
+# test_sparse_memory_cl
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "data_nbits,latency", [
+  ( 32,  1 ),
+  ( 32,  3 ),
+  ( 128, 1 ),
+])
+def test_sparse_memory_cl( data_nbits, latency ):
+
+  MemMsgTypes = mk_mem_msg( 8, 32, data_nbits )
+  src_msgs, sink_msgs = mk_msgs( MemMsgTypes, 200 )
+
+  model = TestHarness( MemMsgTypes, src_msgs, sink_msgs, latency )
+  run_sim( model, max_cycles=2000 )
+
+  assert model.mem.mem.num_resident_pages() <= 5
+
+def test_sparse_memory_cl_write_mem():
+
+  MemMsgTypes = mk_mem_msg( 8, 32, 32 )
+  ReqType, RespType = MemMsgTypes
+
+  src_msgs  = [ ReqType ( MemMsgType.READ, 0, 0x3ffe, 0, 0 ) ]
+  sink_msgs = [ RespType( MemMsgType.READ, 0, 0, 0, 0x44332211 ) ]
+
+  model = TestHarness( MemMsgTypes, src_msgs, sink_msgs, 1 )
+  model.elaborate()
+
+  model.mem.write_mem( 0x3ffe, bytearray( b"\x11\x22\x33\x44" ) )
+  assert model.mem.read_mem( 0x3ffc, 8 ) == \
+         bytearray( b"\0\0\x11\x22\x33\x44\0\0" )
+  assert model.mem.mem.num_resident_pages() == 2
+
+  run_sim( model, max_cycles=100 )
+
+# Sections of an ELF file are memoryviews, and ZeroData for .bss
+
+def test_sparse_memory_cl_write_mem_sections():
+
+  model = TestHarness( mk_mem_msg( 8, 32, 32 ), [], [], 1 )
+  model.elaborate()
+
+  mem = model.mem
+
+  mem.write_mem( 0x1000, memoryview( b"\xff" * 0x3000 ) )
+  mem.write_mem( 0x1ffc, SparseMemoryImage.ZeroData( 0x1008 ) )
+
+  assert mem.read_mem( 0x1ff8, 8 ) == bytearray( b"\xff" * 4 + b"\0" * 4 )
+  assert mem.read_mem( 0x3000, 8 ) == bytearray( b"\0" * 4 + b"\xff" * 4 )
+  assert mem.mem.num_resident_pages() == 2
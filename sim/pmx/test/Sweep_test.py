@@ -0,0 +1,204 @@
+#=========================================================================
+# Sweep_test.py
+#=========================================================================
+
+import io
+import csv
+import os
+import sys
+
+from pmx.Sweep import Sweep, ResultCache, parse_stats, write_csv
+
+# Stand-in for a simulator: prints stats from its options and input, and
+# appends a line to a log file every time it runs
+
+fake_sim = """
+import argparse, sys
+p = argparse.ArgumentParser()
+p.add_argument( "--impl" )
+p.add_argument( "--nstages", type=int, default=1 )
+p.add_argument( "--fast", action="store_true" )
+p.add_argument( "--stats", action="store_true" )
+p.add_argument( "input", nargs="?" )
+opts = p.parse_args()
+with open( {log!r}, "a" ) as fd:
+  fd.write( "run\\n" )
+data = open( opts.input ).read() if opts.input else ""
+if "fail" in data:
+  print( "ERROR: failed" )
+  sys.exit( 2 )
+if opts.stats:
+  print( "num_cycles = ", 10 * opts.nstages + len( data ) )
+  print( "miss_rate  = 0.25" )
+  print( "impl       = " + opts.impl )
+  print( "fast       = " + str( opts.fast ) )
+"""
+
+def mk_sim( tmpdir ):
+  log = str( tmpdir.join( "log" ) )
+  sim = tmpdir.join( "fake-sim" )
+  sim.write( fake_sim.format( log=log ) )
+  return str( sim ), log
+
+def num_runs( log ):
+  if not os.path.exists( log ):
+    return 0
+  with open( log ) as fd:
+    return len( fd.readlines() )
+
+#-------------------------------------------------------------------------
+# test_parse_stats
+#-------------------------------------------------------------------------
+
+def test_parse_stats():
+
+  output = "\n".join([
+    "",
+    "  [ passed ]",
+    "num_cycles =  1234",
+    "miss_rate    = 0.125",
+    "model_cache_hits = 3/4",
+    "cache_impl =  rtl",
+    " a = b = c",
+    "x + y = 3",
+  ])
+
+  assert parse_stats( output ) == {
+    "num_cycles"       : 1234,
+    "miss_rate"        : 0.125,
+    "model_cache_hits" : "3/4",
+    "cache_impl"       : "rtl",
+    "a"                : "b = c",
+  }
+
+#-------------------------------------------------------------------------
+# test_points
+#-------------------------------------------------------------------------
+
+def test_points( tmpdir ):
+
+  sim, log = mk_sim( tmpdir )
+
+  sweep = Sweep( sim, [ ( "impl", [ "a", "b" ] ), ( "fast", [] ),
+                        ( "nstages", [ "1", "2", "3" ] ) ],
+                 inputs=[ "x", "y" ] )
+
+  points = sweep.points()
+  assert len( points ) == 12
+  assert points[0] == ( { "fast": None, "impl": "a", "nstages": "1" }, "x" )
+  assert points[1] == ( { "fast": None, "impl": "a", "nstages": "1" }, "y" )
+  assert points[2] == ( { "fast": None, "impl": "a", "nstages": "2" }, "x" )
+  assert points[-1][0]["impl"] == "b"
+
+  assert sweep.cmd( *points[0] ) == \
+    [ sys.executable, sim, "--fast", "--impl", "a", "--nstages", "1", "x", "--stats" ]
+
+#-------------------------------------------------------------------------
+# test_sweep
+#-------------------------------------------------------------------------
+
+def test_sweep( tmpdir ):
+
+  sim, log = mk_sim( tmpdir )
+
+  inputs = [ str( tmpdir.join( name ) ) for name in [ "in0", "in1", "in2" ] ]
+  for path, data in zip( inputs, [ "", "abc", "fail" ] ):
+    with open( path, "w" ) as fd:
+      fd.write( data )
+
+  params = [ ( "impl", [ "a", "b" ] ), ( "nstages", [ "1", "4" ] ) ]
+  cache  = ResultCache( str( tmpdir.join( "cache" ) ) )
+
+  # Cold sweep simulates every point
+
+  sweep = Sweep( sim, params, inputs, cache=cache, jobs=4 )
+  results = sweep.run()
+
+  assert num_runs( log ) == 12
+  assert sweep.num_hits == 0
+
+  assert [ r["options"]["impl"] for r in results[:3] ] == [ "a", "a", "a" ]
+  assert [ r["input"] for r in results[:3] ] == inputs
+  assert results[0]["stats"] == { "num_cycles": 10, "miss_rate": 0.25,
+                                  "impl": "a", "fast": "False" }
+  assert results[4]["stats"]["num_cycles"] == 43
+  assert results[2]["returncode"] == 2
+  assert "ERROR: failed" in results[2]["output"]
+
+  # Warm sweep only runs the failed points again
+
+  sweep = Sweep( sim, params, inputs, cache=cache, jobs=4 )
+  warm_results = sweep.run()
+
+  assert num_runs( log ) == 16
+  assert sweep.num_hits == 8
+  for result, warm_result in zip( results, warm_results ):
+    assert warm_result["stats"] == result["stats"]
+    assert warm_result["cached"] == ( result["returncode"] == 0 )
+
+  # Changing an input only runs the points with that input again
+
+  with open( inputs[1], "w" ) as fd:
+    fd.write( "abcd" )
+
+  sweep = Sweep( sim, params, inputs[:2], cache=cache )
+  results = sweep.run()
+
+  assert num_runs( log ) == 20
+  assert sweep.num_hits == 4
+  assert results[1]["stats"]["num_cycles"] == 14
+
+  # Without a cache we always simulate
+
+  sweep = Sweep( sim, params[:1], inputs[:1] )
+  sweep.run()
+  sweep.run()
+
+  assert num_runs( log ) == 24
+
+#-------------------------------------------------------------------------
+# test_timeout
+#-------------------------------------------------------------------------
+
+def test_timeout( tmpdir ):
+
+  sim = tmpdir.join( "slow-sim" )
+  sim.write( "import time\ntime.sleep(10)\n" )
+
+  result, = Sweep( str( sim ), [], timeout=0.5 ).run()
+  assert result["returncode"] is None
+
+  # We keep what the simulator printed before it timed out
+
+  sim.write( "import time\nprint( 'num_cycles = 5', flush=True )\ntime.sleep(10)\n" )
+
+  result, = Sweep( str( sim ), [], timeout=0.5 ).run()
+  assert result["returncode"] is None
+  assert result["stats"] == { "num_cycles" : 5 }
+  assert "num_cycles = 5" in result["output"]
+
+#-------------------------------------------------------------------------
+# test_write_csv
+#-------------------------------------------------------------------------
+
+def test_write_csv():
+
+  results = [
+    { "sim": "mem-sim", "options": { "pattern": "loop-1d" }, "input": None,
+      "returncode": 0, "stats": { "miss_rate": 0.5 }, "wall_time": 1.0,
+      "cached": False },
+    { "sim": "mem-sim", "options": { "pattern": "loop-2d", "mem-lat": "5" },
+      "input": None, "returncode": 0, "stats": { "miss_rate": 0.25, "amal": 3 },
+      "wall_time": 2.0, "cached": True },
+  ]
+
+  fd = io.StringIO()
+  write_csv( fd, results )
+  rows = list( csv.reader( io.StringIO( fd.getvalue() ) ) )
+
+  assert rows == [
+    [ "sim", "pattern", "mem-lat", "input", "returncode", "miss_rate", "amal",
+      "wall_time", "cached" ],
+    [ "mem-sim", "loop-1d", "", "", "0", "0.5", "", "1.000", "False" ],
+    [ "mem-sim", "loop-2d", "5", "", "0", "0.25", "3", "2.000", "True" ],
+  ]
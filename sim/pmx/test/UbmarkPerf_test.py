@@ -0,0 +1,78 @@
+#=========================================================================
+# UbmarkPerf_test.py
+#=========================================================================
+
+import pytest
+
+from pmx.UbmarkPerf import all_runs, select, run_ubmark, load_baseline, \
+                           save_baseline, compare, configs, ubmark_names
+
+#-------------------------------------------------------------------------
+# test_select
+#-------------------------------------------------------------------------
+
+def test_select():
+
+  assert select( [] ) == all_runs()
+  assert select( [ "rtl/*" ] ) == [ "rtl/" + x for x in ubmark_names ]
+  assert select( [ "*/bsearch", "fl/cmult" ] ) == \
+    [ "fl/cmult", "fl/bsearch", "fl-accum/bsearch", "rtl/bsearch",
+      "rtl-accum/bsearch", "rtl-cache/bsearch", "rtl-cache-accum/bsearch" ]
+  assert select( [ "nope" ] ) == []
+
+#-------------------------------------------------------------------------
+# test_baseline
+#-------------------------------------------------------------------------
+# All ubmarks on the RTL processor and one ubmark on every other
+# composition against the checked-in baseline, so that a change to their
+# performance fails here.
+
+@pytest.mark.parametrize( "name", select( [ "rtl/*" ] ) +
+  [ config + "/vvadd-opt" for config in configs if config != "rtl" ] )
+def test_baseline( name ):
+
+  config, ubmark = name.split("/")
+
+  baseline = load_baseline()
+  assert name in baseline, \
+    "no baseline for {}, record it with ubmark-perf --save".format( name )
+
+  result = run_ubmark( config, ubmark )
+  base   = baseline[ name ]
+
+  assert compare( result, base ) == ( [], [] )
+  assert result["num_cycles"] >= result["num_insts"] > 0
+
+#-------------------------------------------------------------------------
+# test_compare
+#-------------------------------------------------------------------------
+
+def test_compare( tmpdir ):
+
+  path = str( tmpdir.join( "baseline.json" ) )
+
+  base = { "num_cycles": 1000, "num_insts": 800, "cpi": 1.25,
+           "icache_miss_rate": 0.01, "dcache_miss_rate": 0.25 }
+
+  save_baseline( { "rtl/cmult": base }, path )
+  base = load_baseline( path )[ "rtl/cmult" ]
+
+  assert compare( dict( base ), base ) == ( [], [] )
+
+  # More cycles are a regression, unless within the threshold
+
+  result = dict( base, num_cycles=1050, cpi=1.3125 )
+
+  assert compare( result, base ) == \
+    ( [ ( "num_cycles", 1000, 1050 ) ], [] )
+  assert compare( result, base, threshold=0.10 ) == \
+    ( [], [ ( "num_cycles", 1000, 1050 ) ] )
+
+  # Higher miss rates are regressions, fewer cycles and different
+  # instruction counts are changes
+
+  result = dict( base, num_cycles=900, num_insts=700, dcache_miss_rate=0.5 )
+
+  assert compare( result, base ) == \
+    ( [ ( "dcache_miss_rate", 0.25, 0.5 ) ],
+      [ ( "num_cycles", 1000, 900 ), ( "num_insts", 800, 700 ) ] )
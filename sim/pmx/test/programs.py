@@ -0,0 +1,17 @@
+#=========================================================================
+# programs.py
+#=========================================================================
+# Small test programs shared by the tests of the simulator builds.
+
+# Sums up 3 five times (the count comes from the manager) and sends the
+# result to the manager
+
+loop_program = """
+  csrr x1, mngr2proc < 5
+  addi x2, x0, 0
+loop:
+  addi x2, x2, 3
+  addi x1, x1, -1
+  bne  x1, x0, loop
+  csrw proc2mngr, x2 > 15
+"""
@@ -0,0 +1,114 @@
+#=========================================================================
+# DiskCache
+#=========================================================================
+# Helpers shared by our persistent caches: the cache of generated
+# simulator code (pmx/ModelCache), of sweep results (pmx/Sweep), of
+# parsed ELF binaries (ImageCache), and of assembled test programs
+# (tinyrv2_encoding). They all live under one cache directory, are keyed
+# by a hash of the sources which produce their entries, and write their
+# entries so that simulators and test processes running in parallel
+# never see a partially written entry.
+#
+# This module is in proc since pmx already builds on proc, so both can
+# use it without making proc depend on pmx. It only uses the standard
+# library.
+
+import hashlib
+import os
+import sys
+import tempfile
+
+# The sim directory (marked by .pymtl_sim_root)
+
+sim_dir = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+#-------------------------------------------------------------------------
+# user_cache_dir
+#-------------------------------------------------------------------------
+# Returns the directory for the given cache under the user's cache
+# directory (~/.cache/pmx-sim unless XDG_CACHE_HOME is set).
+
+def user_cache_dir( *subdirs ):
+  return os.path.join(
+    os.environ.get( "XDG_CACHE_HOME", os.path.expanduser( "~/.cache" ) ),
+    "pmx-sim", *subdirs )
+
+#-------------------------------------------------------------------------
+# sources_hash
+#-------------------------------------------------------------------------
+# Hash of the given source files, covering their paths (relative to the
+# sim directory) and their contents. imported_sources and all_sources
+# return the sources of the sim directory which have been imported so
+# far, and all of them outside of test directories.
+
+def file_hash( path ):
+  h = hashlib.sha1()
+  with open( path, "rb" ) as fd:
+    for chunk in iter( lambda: fd.read( 1 << 20 ), b"" ):
+      h.update( chunk )
+  return h.hexdigest()
+
+def sources_hash( paths ):
+
+  h = hashlib.sha1()
+  for path in sorted( set( os.path.abspath( path ) for path in paths ) ):
+    h.update( os.path.relpath( path, sim_dir ).encode() )
+    h.update( file_hash( path ).encode() )
+
+  return h.hexdigest()
+
+def imported_sources():
+
+  paths = set()
+  for module in list( sys.modules.values() ):
+    path = getattr( module, "__file__", None )
+    if path and path.endswith( ".py" ) \
+        and os.path.abspath( path ).startswith( sim_dir + os.sep ):
+      paths.add( os.path.abspath( path ) )
+
+  return paths
+
+def all_sources():
+
+  paths = set()
+  for dirpath, dirnames, filenames in os.walk( sim_dir ):
+    dirnames[:] = sorted( d for d in dirnames
+                          if d != "test" and not d.startswith(".")
+                                         and d != "__pycache__" )
+    for filename in filenames:
+      if filename.endswith( ( ".py", ".v" ) ):
+        paths.add( os.path.join( dirpath, filename ) )
+
+  return paths
+
+#-------------------------------------------------------------------------
+# write_entry
+#-------------------------------------------------------------------------
+# Writes a cache entry with write_func( file ) to a temporary file in
+# the same directory and then renames it to path. We ignore any problems
+# with the cache directory, since the caller can always compute the
+# entry again, and we never leave the temporary file behind. Returns
+# True if the entry was written.
+
+def write_entry( path, write_func, mode="wb" ):
+
+  try:
+    os.makedirs( os.path.dirname( path ), exist_ok=True )
+    fd, tmp_path = tempfile.mkstemp( dir=os.path.dirname( path ) )
+  except OSError:
+    return False
+
+  try:
+    with os.fdopen( fd, mode ) as f:
+      write_func( f )
+    os.replace( tmp_path, path )
+    return True
+
+  except BaseException as e:
+    try:
+      os.remove( tmp_path )
+    except OSError:
+      pass
+    if not isinstance( e, OSError ):
+      raise
+    return False
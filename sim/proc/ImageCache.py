@@ -0,0 +1,105 @@
+#=========================================================================
+# ImageCache
+#=========================================================================
+# Cache of ELF binaries as memory images. Our regression loops run the
+# same binaries on many designs, and every run parses the ELF file again
+# and rebuilds its sparse memory image. We keep every ELF binary we load
+# as a file in the image format (see SparseMemoryImage.write_image),
+# keyed by a hash of the contents of the ELF file, so that a warm load
+# just maps the image file and uses its sections in place. The key also
+# covers the sources of the ELF reader and of the image format, so
+# changing either invalidates the cache.
+#
+#  image_cache = ImageCache( cache_dir )
+#  mem_image   = image_cache.load_elf( "vvadd.elf" )
+#
+# Without a directory load_elf just reads the ELF file. Just like the
+# AssembleCache we ignore any problems with the cache directory (and
+# with the entries in it) and read the ELF file instead.
+
+import hashlib
+import os
+import sys
+
+from .DiskCache import user_cache_dir, sources_hash, write_entry
+
+from .SparseMemoryImage import SparseMemoryImage, map_file
+from .elf               import elf_reader
+
+default_cache_dir = user_cache_dir( "images" )
+
+reader_hash = sources_hash( sys.modules[ module ].__file__
+                            for module in [ SparseMemoryImage.__module__,
+                                            elf_reader.__module__ ] )
+
+class ImageCache (object):
+
+  def __init__( self, cache_dir=None ):
+
+    self.num_hits   = 0
+    self.num_misses = 0
+
+    self.set_dir( cache_dir )
+
+  def set_dir( self, cache_dir ):
+    if cache_dir is not None:
+      try:
+        os.makedirs( cache_dir, exist_ok=True )
+      except OSError:
+        cache_dir = None
+    self.cache_dir = cache_dir
+
+  #-----------------------------------------------------------------------
+  # key
+  #-----------------------------------------------------------------------
+
+  def key( self, elf_data ):
+    h = hashlib.sha1( reader_hash.encode() )
+    h.update( elf_data )
+    return h.hexdigest()
+
+  #-----------------------------------------------------------------------
+  # Disk cache
+  #-----------------------------------------------------------------------
+  # New entries are written with write_entry (see DiskCache.py), so
+  # simulators running in parallel never see a partially written entry.
+
+  def load( self, key ):
+
+    try:
+      with open( os.path.join( self.cache_dir, key + ".img" ), "rb" ) as fd:
+        return SparseMemoryImage.read_image( fd )
+    except ( OSError, ValueError ):
+      return None
+
+  def store( self, key, mem_image ):
+
+    write_entry( os.path.join( self.cache_dir, key + ".img" ),
+                 mem_image.write_image )
+
+  #-----------------------------------------------------------------------
+  # load_elf
+  #-----------------------------------------------------------------------
+  # Returns the sparse memory image of the ELF file with the given path.
+  # Errors in the ELF file itself are raised just like by elf_reader.
+
+  def load_elf( self, elf_path ):
+
+    with open( elf_path, "rb" ) as file_obj:
+
+      if self.cache_dir is None:
+        return elf_reader( file_obj )
+
+      key = self.key( map_file( file_obj ) )
+
+      mem_image = self.load( key )
+      if mem_image is not None:
+        self.num_hits += 1
+        return mem_image
+
+      mem_image = elf_reader( file_obj )
+
+    self.store( key, mem_image )
+    self.num_misses += 1
+
+    return mem_image
@@ -26,7 +26,10 @@ c_reset_inst   = 0
 
 class ProcDpathPRTL( Component ):
 
-  def construct( s, num_cores = 1 ):
+  # The reset vector is only a parameter so that we can start simulating
+  # somewhere in the middle of a program (see pmx/Checkpoint.py).
+
+  def construct( s, num_cores = 1, reset_vector = c_reset_vector ):
 
     dtype = mk_bits(32)
     MemReqType, MemRespType = mk_mem_msg(8,32,32)
@@ -135,7 +138,7 @@ class ProcDpathPRTL( Component ):
 
     # PC register
 
-    s.pc_reg_F = RegEnRst( dtype, reset_value=c_reset_vector-4 )(
+    s.pc_reg_F = RegEnRst( dtype, reset_value=reset_vector-4 )(
       en  = s.reg_en_F,
       in_ = s.pc_sel_mux_F.out,
       out = s.pc_F
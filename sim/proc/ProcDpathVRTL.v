@@ -19,7 +19,8 @@
 
 module proc_ProcDpathVRTL
 #(
-  parameter p_num_cores = 1
+  parameter p_num_cores    = 1,
+  parameter p_reset_vector = 32'h200
 )
 (
   input  logic        clk,
@@ -92,7 +93,7 @@ module proc_ProcDpathVRTL
 
 );
 
-  localparam c_reset_vector = 32'h200;
+  localparam c_reset_vector = p_reset_vector;
   localparam c_reset_inst   = 32'h00000000;
 
   // Fetch address
@@ -8,6 +8,8 @@ Author : Shunning Jiang
   Date : June 14, 2019
 """
 
+from array import array
+
 from pymtl3 import *
 from pymtl3.stdlib.ifcs.GetGiveIfc import GetIfcFL
 from pymtl3.stdlib.ifcs.mem_ifcs import MemMasterIfcFL
@@ -15,7 +17,10 @@ from pymtl3.stdlib.ifcs.SendRecvIfc import SendIfcFL
 from pymtl3.stdlib.ifcs.xcel_ifcs import XcelMasterIfcFL
 from pymtl3.stdlib.ifcs.XcelMsg import mk_xcel_msg
 
-from .tinyrv2_encoding import TinyRV2Inst, disassemble_inst
+from .tinyrv2_encoding import TinyRV2PredecodedInst, TinyRV2PredecodedIntInst
+from .tinyrv2_encoding import disassemble_inst
+from .tinyrv2_semantics import TinyRV2Semantics, mk_execute_handlers
+from .tinyrv2_translate import block_terminators, mk_block_src
 
 class RegisterFile(object):
 
@@ -29,9 +34,73 @@ class RegisterFile(object):
     if idx != 0:
       self.regs[idx] = Bits32( value )
 
+#-------------------------------------------------------------------------
+# IntRegisterFile
+#-------------------------------------------------------------------------
+# Register file for the integer-native mode. The registers live in an
+# array of unsigned 32-bit ints, so writing a value outside of [0,2^32)
+# raises an OverflowError instead of silently turning into garbage. The
+# instruction handlers index regs directly and skip writes to x0
+# themselves, so the accessors are only here for everybody else.
+
+class IntRegisterFile(object):
+
+  def __init__( self, nregs ):
+    self.regs = array( 'I', [0] * nregs )
+
+  def __getitem__( self, idx ):
+    return self.regs[idx]
+
+  def __setitem__( self, idx, value ):
+    if idx != 0:
+      self.regs[idx] = int(value) & 0xFFFFFFFF
+
+#-------------------------------------------------------------------------
+# block_mem_tmpls
+#-------------------------------------------------------------------------
+# How translated blocks access memory in the block mode, everything goes
+# through the dmem interface (see mk_block_src).
+
+block_mem_tmpls = {
+  "lw"  : "read( {addr}, 4 ).uint()",
+  "lh"  : "read( {addr}, 2 ).int() & 0xFFFFFFFF",
+  "lhu" : "read( {addr}, 2 ).uint()",
+  "lb"  : "read( {addr}, 1 ).int() & 0xFFFFFFFF",
+  "lbu" : "read( {addr}, 1 ).uint()",
+  "sw"  : "write( {addr}, 4, {data} )",
+  "sh"  : "write( {addr}, 2, {data} )",
+  "sb"  : "write( {addr}, 1, {data} )",
+}
+
+#-------------------------------------------------------------------------
+# ProcFL
+#-------------------------------------------------------------------------
+# The processor supports three execution modes:
+#
+#  - bits : the original model, all architectural state is Bits and
+#           every instruction goes through Bits arithmetic
+#  - int  : integer-native model, the PC and registers are plain ints,
+#           every instruction is dispatched to a handler function
+#           through a table, and results are only masked to 32 bits
+#           when they can actually overflow
+#  - block : basic-block translation on top of the int mode, straight
+#           line code up to the next branch, jump, or CSR instruction is
+#           compiled into a Python function the first time we execute
+#           it, and cached by the PC of its first instruction
+#
+# The bits and int modes commit exactly the same results and produce the
+# same commit_inst and line trace. The bits mode is the default since it
+# is easier to read, but the int mode is many times faster. The block
+# mode commits a whole block at once, so it computes the same results
+# but commit_inst and the line trace are per block instead of per
+# instruction. It also counts instructions and block cache hits/misses.
+
 class ProcFL( Component ):
 
-  def construct( s, num_cores=1 ):
+  def construct( s, num_cores=1, mode="bits" ):
+
+    assert mode in ( "bits", "int", "block" ), \
+      "Unknown ProcFL mode ({})".format( mode )
 
     # Interface, Buffers to hold request/response messages
 
@@ -53,19 +122,43 @@ class ProcFL( Component ):
     s.R = RegisterFile(32)
     s.raw_inst = None
 
+    # Predecoded instruction cache. Maps the PC to the instruction we
+    # fetched and decoded the first time we executed that PC. Stores
+    # through dmem invalidate any overlapping entries so self-modifying
+    # code still works. Note that we do not see stores from the
+    # accelerator, so accelerators should not write to the text section.
+
+    s.inst_cache = {}
+
+    def invalidate_inst_cache( addr, nbytes ):
+      if s.inst_cache:
+        addr = int(addr)
+        for pc in range( addr & ~3, addr + nbytes, 4 ):
+          s.inst_cache.pop( pc, None )
+
+    if mode in ( "int", "block" ):
+      s.construct_int( num_cores, mode, invalidate_inst_cache )
+      return
+
     @s.update
     def up_ProcFL():
       if s.reset:
         s.PC = b32( 0x200 )
+        s.inst_cache.clear()
         return
 
       s.commit_inst = Bits1( 0 )
 
       try:
-        s.raw_inst = s.imem.read( s.PC, 4 ) # line trace
+        pc   = int(s.PC)
+        inst = s.inst_cache.get( pc )
 
-        inst = TinyRV2Inst( s.raw_inst )
-        inst_name = inst.name
+        if inst is None:
+          inst = TinyRV2PredecodedInst( s.imem.read( s.PC, 4 ) )
+          s.inst_cache[ pc ] = inst
+
+        s.raw_inst = inst.bits # line trace
+        inst_name  = inst.name
 
         if   inst_name == "nop":
           s.PC += 4
@@ -104,22 +197,22 @@ class ProcFL( Component ):
           s.PC += 4
 
         elif inst_name == "addi":
-          s.R[inst.rd] = s.R[inst.rs1] + sext( inst.i_imm, 32 )
+          s.R[inst.rd] = s.R[inst.rs1] + inst.i_imm
           s.PC += 4
         elif inst_name == "slti":
           s.R[inst.rd] = s.R[inst.rs1].int() < inst.i_imm.int()
           s.PC += 4
         elif inst_name == "sltiu":
-          s.R[inst.rd] = s.R[inst.rs1] < sext( inst.i_imm, 32 )
+          s.R[inst.rd] = s.R[inst.rs1] < inst.i_imm
           s.PC += 4
         elif inst_name == "xori":
-          s.R[inst.rd] = s.R[inst.rs1] ^ sext( inst.i_imm, 32 )
+          s.R[inst.rd] = s.R[inst.rs1] ^ inst.i_imm
           s.PC += 4
         elif inst_name == "ori":
-          s.R[inst.rd] = s.R[inst.rs1] | sext( inst.i_imm, 32 )
+          s.R[inst.rd] = s.R[inst.rs1] | inst.i_imm
           s.PC += 4
         elif inst_name == "andi":
-          s.R[inst.rd] = s.R[inst.rs1] & sext( inst.i_imm, 32 )
+          s.R[inst.rd] = s.R[inst.rs1] & inst.i_imm
           s.PC += 4
         elif inst_name == "slli":
           s.R[inst.rd] = s.R[inst.rs1] << inst.shamt
@@ -139,74 +232,77 @@ class ProcFL( Component ):
           s.PC += 4
 
         elif inst_name == "sw":
-          addr = s.R[inst.rs1] + sext( inst.s_imm, 32 )
+          addr = s.R[inst.rs1] + inst.s_imm
           s.dmem.write( addr, 4, s.R[inst.rs2] )
+          invalidate_inst_cache( addr, 4 )
           s.PC += 4
         elif inst_name == "sb":
-          addr = s.R[inst.rs1] + sext( inst.s_imm, 32 )
+          addr = s.R[inst.rs1] + inst.s_imm
           s.dmem.write( addr, 1, s.R[inst.rs2][0:8] )
+          invalidate_inst_cache( addr, 1 )
           s.PC += 4
         elif inst_name == "sh":
-          addr = s.R[inst.rs1] + sext( inst.s_imm, 32 )
+          addr = s.R[inst.rs1] + inst.s_imm
           s.dmem.write( addr, 2, s.R[inst.rs2][0:16] )
+          invalidate_inst_cache( addr, 2 )
           s.PC += 4
         elif inst_name == "lw":
-          addr = s.R[inst.rs1] + sext( inst.i_imm, 32 )
+          addr = s.R[inst.rs1] + inst.i_imm
           s.R[inst.rd] = s.dmem.read( addr, 4 )
           s.PC += 4
         elif inst_name == "lb":
-          addr = s.R[inst.rs1] + sext( inst.i_imm, 32 )
+          addr = s.R[inst.rs1] + inst.i_imm
           s.R[inst.rd] = sext( s.dmem.read( addr, 1 ), 32 )
           s.PC += 4
         elif inst_name == "lh":
-          addr = s.R[inst.rs1] + sext( inst.i_imm, 32 )
+          addr = s.R[inst.rs1] + inst.i_imm
           s.R[inst.rd] = sext( s.dmem.read( addr, 2 ), 32 )
           s.PC += 4
         elif inst_name == "lbu":
-          addr = s.R[inst.rs1] + sext( inst.i_imm, 32 )
+          addr = s.R[inst.rs1] + inst.i_imm
           s.R[inst.rd] = zext( s.dmem.read( addr, 1 ), 32 )
           s.PC += 4
         elif inst_name == "lhu":
-          addr = s.R[inst.rs1] + sext( inst.i_imm, 32 )
+          addr = s.R[inst.rs1] + inst.i_imm
           s.R[inst.rd] = zext( s.dmem.read( addr, 2 ), 32 )
           s.PC += 4
         elif inst_name == "bne":
           if s.R[inst.rs1] != s.R[inst.rs2]:
-            s.PC = s.PC + sext( inst.b_imm, 32 )
+            s.PC = s.PC + inst.b_imm
           else:
             s.PC += 4
         elif inst_name == "beq":
           if s.R[inst.rs1] == s.R[inst.rs2]:
-            s.PC = s.PC + sext( inst.b_imm, 32 )
+            s.PC = s.PC + inst.b_imm
           else:
             s.PC += 4
         elif inst_name == "blt":
           if s.R[inst.rs1].int() < s.R[inst.rs2].int():
-            s.PC = s.PC + sext( inst.b_imm, 32 )
+            s.PC = s.PC + inst.b_imm
           else:
             s.PC += 4
         elif inst_name == "bge":
           if s.R[inst.rs1].int() >= s.R[inst.rs2].int():
-            s.PC = s.PC + sext( inst.b_imm, 32 )
+            s.PC = s.PC + inst.b_imm
           else:
             s.PC += 4
         elif inst_name == "bltu":
           if s.R[inst.rs1] < s.R[inst.rs2]:
-            s.PC = s.PC + sext( inst.b_imm, 32 )
+            s.PC = s.PC + inst.b_imm
           else:
             s.PC += 4
         elif inst_name == "bgeu":
           if s.R[inst.rs1] >= s.R[inst.rs2]:
-            s.PC = s.PC + sext( inst.b_imm, 32 )
+            s.PC = s.PC + inst.b_imm
           else:
             s.PC += 4
 
         elif inst_name == "jal":
           s.R[inst.rd] = s.PC + 4
-          s.PC = s.PC + sext( inst.j_imm, 32 )
+          s.PC = s.PC + inst.j_imm
 
         elif inst_name == "jalr":
-          temp = s.R[inst.rs1] + sext( inst.i_imm, 32 )
+          temp = s.R[inst.rs1] + inst.i_imm
           s.R[inst.rd] = s.PC + 4
           s.PC = temp & 0xFFFFFFFE
 
@@ -245,11 +341,249 @@ class ProcFL( Component ):
 
       s.commit_inst = b1( 1 )
 
+  #-----------------------------------------------------------------------
+  # construct_int
+  #-----------------------------------------------------------------------
+  # Elaborate the integer-native mode. Each instruction has a handler
+  # which takes the predecoded instruction and its PC and returns the
+  # next PC. We look up the handler once when we first decode an
+  # instruction and keep it next to the instruction in the cache, so
+  # executing a cached instruction is a dictionary lookup plus a call.
+  # Except for the CSR instructions, the handlers are the ones of the ISS
+  # (see mk_execute_handlers in tinyrv2_semantics), so that both always
+  # implement the same semantics.
+
+  def construct_int( s, num_cores, mode, invalidate_inst_cache ):
+
+    MASK = 0xFFFFFFFF
+
+    s.PC = 0x200
+    s.R  = IntRegisterFile(32)
+
+    R = s.R.regs
+
+    # Memory access for the handlers shared with the ISS. A store also
+    # drops the translated blocks and instructions it overwrites.
+
+    def load( addr, nbytes ):
+      return s.dmem.read( addr, nbytes ).uint()
+
+    def store( addr, nbytes, value ):
+      s.dmem.write( addr, nbytes, value )
+      invalidate_inst_cache( addr, nbytes )
+
+    handlers = mk_execute_handlers( R, load, store )
+
+    # System instructions
+
+    def execute_csrw( inst, pc ):
+      if   inst.csrnum == 0x7C0:
+        s.proc2mngr( Bits32( R[inst.rs1] ) )
+      elif inst.csrnum == 0x7C1:
+        s.stats_en = Bits1( R[inst.rs1] & 1 )
+
+      elif 0x7E0 <= inst.csrnum <= 0x7FF:
+        s.xcel.write( Bits5( inst.csrnum & 0x1F ), Bits32( R[inst.rs1] ) )
+      else:
+        raise TinyRV2Semantics.IllegalInstruction(
+          "Unrecognized CSR register ({}) for csrw at PC={:0>8x}" \
+            .format(inst.csrnum,pc) )
+      return ( pc + 4 ) & MASK
+
+    def execute_csrr( inst, pc ):
+      if   inst.csrnum == 0xFC0:
+        value = s.mngr2proc().uint()
+      elif inst.csrnum == 0xFC1:
+        value = num_cores
+      elif inst.csrnum == 0xF14:
+        value = int(s.core_id)
+      elif 0x7E0 <= inst.csrnum <= 0x7FF:
+        value = s.xcel.read( Bits5( inst.csrnum & 0x1F ) ).uint()
+      else:
+        raise TinyRV2Semantics.IllegalInstruction(
+          "Unrecognized CSR register ({}) for csrr at PC={:0>8x}" \
+            .format(inst.csrnum,pc) )
+      if inst.rd:
+        R[inst.rd] = value & MASK
+      return ( pc + 4 ) & MASK
+
+    # Dispatch table from instruction name to handler
+
+    s.execute_dispatch = handlers
+    s.execute_dispatch["csrr"] = execute_csrr
+    s.execute_dispatch["csrw"] = execute_csrw
+
+    # An all-zero word decodes to " ", which the bits mode quietly treats
+    # as doing nothing (not even incrementing the PC), so we do the same.
+
+    s.execute_dispatch[" "] = lambda inst, pc : pc
+
+    if mode == "block":
+      s.construct_block()
+      return
+
+    @s.update
+    def up_ProcFL_int():
+      if s.reset:
+        s.PC = 0x200
+        s.inst_cache.clear()
+        return
+
+      s.commit_inst = Bits1( 0 )
+
+      try:
+        pc    = s.PC
+        entry = s.inst_cache.get( pc )
+
+        if entry is None:
+          inst  = TinyRV2PredecodedIntInst( s.imem.read( pc, 4 ) )
+          entry = ( inst, s.execute_dispatch[ inst.name ] )
+          s.inst_cache[ pc ] = entry
+
+        inst, execute = entry
+
+        s.raw_inst = inst.bits # line trace
+        s.PC = execute( inst, pc )
+
+      except:
+        print( "Unexpected error at PC={:0>8x}!".format( s.PC ) )
+        raise
+
+      s.commit_inst = b1( 1 )
+
+  #-----------------------------------------------------------------------
+  # construct_block
+  #-----------------------------------------------------------------------
+  # Elaborate the block mode. When we miss in the block cache we fetch
+  # instructions starting at the PC until we reach a terminator (or the
+  # maximum block size), generate the source for the block with
+  # mk_block_src, and compile it. The fetch loop has to stay in the
+  # update block itself, since that is how PyMTL figures out that the
+  # update block calls blocking methods. We also remember which words belong to
+  # which blocks so that stores can invalidate them. Note that fetching
+  # a block takes one imem access per instruction, while executing a
+  # cached block takes no imem accesses at all.
+
+  def construct_block( s, max_block_size=64 ):
+
+    s.block_cache = {}  # entry PC -> compiled block
+    s.block_words = {}  # word address -> entry PCs of overlapping blocks
+
+    s.num_insts             = 0
+    s.num_block_hits        = 0
+    s.num_block_misses      = 0
+    s.num_blocks_translated = 0
+
+    def invalidate( addr, nbytes ):
+      hit = False
+      for word in range( addr & ~3, addr + nbytes, 4 ):
+        entry_pcs = s.block_words.pop( word, None )
+        if entry_pcs:
+          for entry_pc in entry_pcs:
+            s.block_cache.pop( entry_pc, None )
+          hit = True
+      return hit
+
+    def translate_block( entry_pc, insts ):
+
+      # An empty word on its own is a block that just spins
+
+      if not insts:
+        s.block_words.setdefault( entry_pc, [] ).append( entry_pc )
+        return ( lambda : ( entry_pc, 1 ) )
+
+      # Compile the block
+
+      func_name = "block_{:0>8x}".format( entry_pc )
+      namespace = {
+        "R"            : s.R.regs,
+        "read"         : s.dmem.read,
+        "write"        : s.dmem.write,
+        "invalidate"   : invalidate,
+        "execute_csrr" : s.execute_dispatch["csrr"],
+        "execute_csrw" : s.execute_dispatch["csrw"],
+      }
+      for n, inst in enumerate( insts ):
+        namespace[ "inst_{}".format(n) ] = inst
+
+      src = mk_block_src( func_name, insts, entry_pc, block_mem_tmpls )
+      exec( compile( src, "<{}>".format( func_name ), "exec" ), namespace )
+
+      for n in range( len(insts) ):
+        s.block_words.setdefault( ( entry_pc + 4*n ) & 0xFFFFFFFF, [] ) \
+                     .append( entry_pc )
+
+      s.num_blocks_translated += 1
+      return namespace[ func_name ]
+
+    @s.update
+    def up_ProcFL_block():
+      if s.reset:
+        s.PC = 0x200
+        s.block_cache.clear()
+        s.block_words.clear()
+        return
+
+      s.commit_inst = Bits1( 0 )
+
+      try:
+        pc    = s.PC
+        entry = s.block_cache.get( pc )
+
+        if entry is None:
+          s.num_block_misses += 1
+
+          # Fetch and decode until the first terminator. An illegal or
+          # empty word ends the block right before it, unless it is the
+          # first word, so that we only complain once we actually get
+          # there.
+
+          insts     = []
+          fetch_pc  = pc
+          inst_bits = None
+
+          while len(insts) < max_block_size:
+            inst_bits = s.imem.read( fetch_pc, 4 )
+            try:
+              inst = TinyRV2PredecodedIntInst( inst_bits )
+            except AssertionError:
+              if not insts:
+                raise
+              break
+
+            if inst.name == " ":
+              break
+
+            insts.append( inst )
+            fetch_pc = ( fetch_pc + 4 ) & 0xFFFFFFFF
+
+            if inst.name in block_terminators:
+              break
+
+          raw_inst = insts[-1].bits if insts else inst_bits
+          entry    = ( translate_block( pc, insts ), raw_inst )
+          s.block_cache[ pc ] = entry
+
+        else:
+          s.num_block_hits += 1
+
+        block, raw_inst = entry
+
+        s.raw_inst = raw_inst # line trace
+        s.PC, ninsts = block()
+        s.num_insts += ninsts
+
+      except:
+        print( "Unexpected error at PC={:0>8x}!".format( s.PC ) )
+        raise
+
+      s.commit_inst = b1( 1 )
+
   #-----------------------------------------------------------------------
   # line_trace
   #-----------------------------------------------------------------------
 
   def line_trace( s ):
     if s.commit_inst:
-      return "{:0>8s} {: <24}".format( str(s.PC), disassemble_inst( s.raw_inst ) )
+      return "{:0>8x} {: <24}".format( int(s.PC), disassemble_inst( s.raw_inst ) )
     return "{}".format( "#".ljust(33) )
@@ -20,7 +20,7 @@ from .XcelMsg import XcelReqMsg, XcelRespMsg
 
 class ProcPRTL( Component ):
 
-  def construct( s, num_cores=1 ):
+  def construct( s, num_cores=1, reset_vector=0x200 ):
 
     MemReqMsg, MemRespMsg = mk_mem_msg( 8, 32, 32 )
 
@@ -121,7 +121,7 @@ class ProcPRTL( Component ):
 
     # data path
 
-    s.dpath = ProcDpathPRTL( num_cores )(
+    s.dpath = ProcDpathPRTL( num_cores, reset_vector )(
       core_id  = s.core_id,
       stats_en = s.stats_en,
 
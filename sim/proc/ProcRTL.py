@@ -29,7 +29,7 @@ class ProcVRTL( Placeholder, Component ):
 
   # Constructor
 
-  def construct( s, num_cores=1 ):
+  def construct( s, num_cores=1, reset_vector=0x200 ):
 
     # Configurations
 
@@ -76,7 +76,8 @@ class ProcVRTL( Placeholder, Component ):
       # Name of the Verilog top level module
       top_module = 'proc_ProcVRTL',
       # Parameters of the Verilog module
-      params = { 'p_num_cores' : num_cores },
+      params = { 'p_num_cores'    : num_cores,
+                 'p_reset_vector' : reset_vector },
       # Port name map
       port_map = {
         'core_id'     : 'core_id',
@@ -140,8 +141,8 @@ else:
   raise Exception("Invalid RTL language!")
 
 class ProcRTL( _cls ):
-  def construct( s, num_cores=1 ):
-    super().construct( num_cores )
+  def construct( s, num_cores=1, reset_vector=0x200 ):
+    super().construct( num_cores, reset_vector )
     # The translated Verilog must be xRTL.v instead of xPRTL.v
     s.config_verilog_translate = TranslationConfigs(
       translate=False,
@@ -17,7 +17,8 @@
 
 module proc_ProcVRTL
 #(
-  parameter p_num_cores = 1
+  parameter p_num_cores    = 1,
+  parameter p_reset_vector = 32'h200
 )
 (
   input  logic         clk,
@@ -396,7 +397,8 @@ module proc_ProcVRTL
 
   proc_ProcDpathVRTL
   #(
-    .p_num_cores             (p_num_cores)
+    .p_num_cores             (p_num_cores),
+    .p_reset_vector          (p_reset_vector)
   )
   dpath
   (
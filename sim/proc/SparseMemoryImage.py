@@ -6,12 +6,62 @@
 # the addr specifies where the data lives in a flat memory space. Symbols
 # are simply name to address mappings.
 #
+# The data of a section is any bytes-like object. The ELF reader gives us
+# memoryviews into the mapped ELF file, and ZeroData for sections which
+# are all zeros (e.g., .bss), so that we never materialize them.
+#
+# Memory images can also be written to and read from a compact binary
+# image format (see write_image/read_image), which we use to cache
+# parsed programs. Reading an image maps the file and uses the section
+# data in place, just like the ELF reader.
+#
 # Author : Christopher Batten
 # Date   : May 20, 2014
 
 from __future__ import print_function
 
 import binascii
+import io
+import mmap
+import struct
+
+#-------------------------------------------------------------------------
+# map_file
+#-------------------------------------------------------------------------
+# Returns a read-only memoryview of the whole file. We map the file if we
+# can and fall back to reading it (e.g., for an io.BytesIO).
+
+def map_file( file_obj ):
+
+  try:
+    return memoryview( mmap.mmap( file_obj.fileno(), 0, access=mmap.ACCESS_READ ) )
+  except ( AttributeError, io.UnsupportedOperation, OSError, ValueError ):
+    file_obj.seek( 0 )
+    return memoryview( file_obj.read() )
+
+#-------------------------------------------------------------------------
+# Image format
+#-------------------------------------------------------------------------
+# All fields are little-endian unsigned 32-bit integers:
+#
+#  header   : magic (8 bytes), version, number of sections and symbols
+#  sections : name offset, name length, addr, data offset, size, flags
+#  symbols  : name offset, name length, addr
+#  strings  : the names of the sections and symbols (UTF-8), offsets are
+#             relative to the start of the strings
+#  payloads : the data of the sections, each aligned to image_align bytes
+#
+# Sections of ZeroData have the IMAGE_ZERO flag and no payload.
+
+image_magic   = b"TRV2IMG\0"
+image_version = 1
+image_align   = 8
+
+image_header  = struct.Struct( "<8sIII" )
+image_section = struct.Struct( "<IIIIII" )
+image_symbol  = struct.Struct( "<III" )
+
+IMAGE_ZERO = 0x1
 
 class SparseMemoryImage (object):
 
@@ -28,13 +78,49 @@ class SparseMemoryImage (object):
 
     def __str__( self ):
       return "{}: addr={} data={}" \
-        .format( self.name, hex(self.addr), binascii.hexlify(self.data) )
+        .format( self.name, hex(self.addr), binascii.hexlify(bytes(self.data)) )
 
     def __eq__( self, other ):
       return     self.name == other.name \
              and self.addr == other.addr \
              and self.data == other.data
 
+  #-----------------------------------------------------------------------
+  # Nested Class: ZeroData
+  #-----------------------------------------------------------------------
+  # Data of a section which is nbytes zeros. Memories which know about
+  # ZeroData just zero the range instead of copying the data. Everything
+  # else can use bytes(data) or slices, which are materialized on demand.
+
+  class ZeroData (object):
+
+    def __init__( self, nbytes ):
+      self.nbytes = nbytes
+
+    def __len__( self ):
+      return self.nbytes
+
+    def __bytes__( self ):
+      return bytes( self.nbytes )
+
+    def __getitem__( self, key ):
+      if isinstance( key, slice ):
+        return bytes( len( range( *key.indices( self.nbytes ) ) ) )
+      if not -self.nbytes <= key < self.nbytes:
+        raise IndexError( "ZeroData index out of range" )
+      return 0
+
+    def __eq__( self, other ):
+      if isinstance( other, SparseMemoryImage.ZeroData ):
+        return self.nbytes == other.nbytes
+      try:
+        return len(other) == self.nbytes and bytes(other) == bytes(self)
+      except TypeError:
+        return NotImplemented
+
+    def __repr__( self ):
+      return "ZeroData({})".format( self.nbytes )
+
   #-----------------------------------------------------------------------
   # Constructor
   #-----------------------------------------------------------------------
@@ -93,11 +179,134 @@ class SparseMemoryImage (object):
     return     self.sections == other.sections \
            and self.symbols  == other.symbols
 
+  #-----------------------------------------------------------------------
+  # write_image
+  #-----------------------------------------------------------------------
+  # Writes the memory image to the file in the image format.
+
+  def write_image( self, file_obj ):
+
+    strings = bytearray()
+
+    def add_string( name ):
+      encoded = name.encode()
+      strings.extend( encoded )
+      return len(strings) - len(encoded), len(encoded)
+
+    sections = [ add_string( section.name ) + ( section, )
+                 for section in self.sections ]
+    symbols  = [ add_string( name ) + ( addr, )
+                 for name, addr in self.symbols.items() ]
+
+    def align( offset ):
+      return ( offset + image_align - 1 ) & ~( image_align - 1 )
+
+    strings_offset = image_header.size \
+                   + image_section.size * len(sections) \
+                   + image_symbol.size  * len(symbols)
+
+    # Place the payloads after the strings
+
+    offset  = align( strings_offset + len(strings) )
+    entries = []
+
+    for name_offset, name_len, section in sections:
+      if isinstance( section.data, SparseMemoryImage.ZeroData ):
+        entries.append( ( name_offset, name_len, section.addr, 0,
+                          len(section.data), IMAGE_ZERO ) )
+      else:
+        entries.append( ( name_offset, name_len, section.addr, offset,
+                          len(section.data), 0 ) )
+        offset = align( offset + len(section.data) )
+
+    # Write everything in order
+
+    file_obj.write( image_header.pack( image_magic, image_version,
+                                       len(sections), len(symbols) ) )
+
+    for entry in entries:
+      file_obj.write( image_section.pack( *entry ) )
+
+    for symbol in symbols:
+      file_obj.write( image_symbol.pack( *symbol ) )
+
+    file_obj.write( strings )
+
+    offset = strings_offset + len(strings)
+    for entry, ( _, _, section ) in zip( entries, sections ):
+      if not entry[5] & IMAGE_ZERO:
+        file_obj.write( bytes( entry[3] - offset ) )
+        file_obj.write( section.data )
+        offset = entry[3] + len(section.data)
+
+  #-----------------------------------------------------------------------
+  # read_image
+  #-----------------------------------------------------------------------
+  # Reads a memory image in the image format. The data of every section
+  # is a memoryview into the mapped file, or ZeroData. Raises ValueError
+  # if the file is not a valid image.
+
+  @staticmethod
+  def read_image( file_obj ):
+
+    data = map_file( file_obj )
+
+    if len(data) < image_header.size:
+      raise ValueError( "Not a valid memory image" )
+
+    magic, version, nsections, nsymbols = image_header.unpack_from( data, 0 )
+
+    if magic != image_magic:
+      raise ValueError( "Not a valid memory image" )
+
+    if version != image_version:
+      raise ValueError( "Unsupported memory image version {} (expected {})"
+                        .format( version, image_version ) )
+
+    strings_offset = image_header.size \
+                   + image_section.size * nsections \
+                   + image_symbol.size  * nsymbols
+
+    if len(data) < strings_offset:
+      raise ValueError( "Truncated memory image" )
+
+    def get_slice( offset, nbytes ):
+      if offset + nbytes > len(data):
+        raise ValueError( "Truncated memory image" )
+      return data[offset:offset+nbytes]
+
+    def get_string( offset, nbytes ):
+      return bytes( get_slice( strings_offset + offset, nbytes ) ).decode()
+
+    mem_image = SparseMemoryImage()
+
+    offset = image_header.size
+    for i in range( nsections ):
+      name_offset, name_len, addr, data_offset, nbytes, flags = \
+        image_section.unpack_from( data, offset )
+      offset += image_section.size
+
+      if flags & IMAGE_ZERO:
+        section_data = SparseMemoryImage.ZeroData( nbytes )
+      else:
+        section_data = get_slice( data_offset, nbytes )
+
+      mem_image.add_section( get_string( name_offset, name_len ), addr,
+                             section_data )
+
+    for i in range( nsymbols ):
+      name_offset, name_len, addr = image_symbol.unpack_from( data, offset )
+      offset += image_symbol.size
+
+      mem_image.add_symbol( get_string( name_offset, name_len ), addr )
+
+    return mem_image
+
   #-----------------------------------------------------------------------
   # print_symbol_table
   #-----------------------------------------------------------------------
 
   def print_symbol_table( self ):
-    for key,value in self.symbols.iteritems():
+    for key,value in self.symbols.items():
       print( " {:0>8x} {}".format( value, key ) )
 
@@ -36,7 +36,7 @@
 
 import struct
 
-from .SparseMemoryImage import SparseMemoryImage
+from .SparseMemoryImage import SparseMemoryImage, map_file
 
 #-------------------------------------------------------------------------
 # ELF File Format Types
@@ -350,6 +350,17 @@ class ElfSymTabEntry (object):
   TYPE_LOPROC  = 13
   TYPE_HIPROC  = 15
 
+  # Symbol bindings (upper four bits of info)
+
+  BIND_LOCAL   = 0
+  BIND_GLOBAL  = 1
+  BIND_WEAK    = 2
+
+  # Special section indices
+
+  SHNDX_UNDEF  = 0
+  SHNDX_ABS    = 0xfff1
+
   #-----------------------------------------------------------------------
   # Constructor
   #-----------------------------------------------------------------------
@@ -411,78 +422,74 @@ class ElfSymTabEntry (object):
 #-------------------------------------------------------------------------
 # elf_reader
 #-------------------------------------------------------------------------
-# Opens and parses an ELF file into a sparse memory image object.
+# Opens and parses an ELF file into a sparse memory image object. The
+# data of every section is a memoryview into the mapped ELF file, and
+# .bss/.sbss (and any other section without data in the file) are
+# SparseMemoryImage.ZeroData, so loading an ELF does not copy anything.
 
 def elf_reader( file_obj ):
 
-  # Read the data for the ELF header
+  elf_data = map_file( file_obj )
 
-  ehdr_data = file_obj.read( ElfHeader.NBYTES )
+  # Construct an ELF header object from the data for the ELF header
 
-  # Construct an ELF header object
+  if len(elf_data) < ElfHeader.NBYTES:
+    raise ValueError( "Not a valid ELF file" )
 
-  ehdr = ElfHeader( ehdr_data )
+  ehdr = ElfHeader( elf_data[0:ElfHeader.NBYTES] )
 
   # Verify if its a known format and really an ELF file
 
   if ehdr.ident[0:4] != '\x7fELF':
     raise ValueError( "Not a valid ELF file" )
 
-  # We need to find the section string table so we can figure out the
-  # name of each section. We know that the section header for the section
-  # string table is entry shstrndx, so we first get the data for this
-  # section header.
+  # Returns the section header with the given index. We pad the data in
+  # case the section header is not long enough (otherwise the unpack
+  # function would not work).
 
-  file_obj.seek( ehdr.shoff + ehdr.shstrndx * ehdr.shentsize )
-  shdr_data = file_obj.read(ehdr.shentsize)
+  def section_header( section_idx ):
+    start = ehdr.shoff + section_idx * ehdr.shentsize
+    shdr_data = bytes( elf_data[start:start+ehdr.shentsize] )
+    return ElfSectionHeader( shdr_data.ljust( ElfSectionHeader.NBYTES, b'\0' ) )
 
-  # Construct a section header object for the section string table
+  # We need to find the section string table so we can figure out the
+  # name of each section. We know that the section header for the section
+  # string table is entry shstrndx.
 
-  shdr = ElfSectionHeader( shdr_data )
+  shdr = section_header( ehdr.shstrndx )
 
   # Read the data for the section header table
 
-  file_obj.seek( shdr.offset )
-  shstrtab_data = file_obj.read( shdr.size ).decode() # this is used as string!
+  shstrtab_data = bytes( elf_data[shdr.offset:shdr.offset+shdr.size] ).decode() # this is used as string!
 
   # Load sections
 
-  symtab_data = None
-  strtab_data = None
+  symtab_shdr = None
 
   mem_image = SparseMemoryImage()
 
   for section_idx in range(ehdr.shnum):
 
-    # Read the data for the section header
-
-    file_obj.seek( ehdr.shoff + section_idx * ehdr.shentsize )
-    shdr_data = file_obj.read(ehdr.shentsize)
-
-    # Pad the returned string in case the section header is not long
-    # enough (otherwise the unpack function would not work)
-
-    shdr_data = shdr_data.ljust( ElfSectionHeader.NBYTES, b'\0' )
-
     # Construct a section header object
 
-    shdr = ElfSectionHeader( shdr_data )
+    shdr = section_header( section_idx )
 
     # Find the section name
 
     start = shstrtab_data[shdr.name:]
     section_name = start.partition('\0')[0]
 
-    # Only sections marked as alloc should be written to memory
+    # The symbol table is not marked as alloc, so we remember its
+    # section header here and load the symbols after the sections
 
-    if not ( shdr.flags & ElfSectionHeader.FLAGS_ALLOC ):
+    if shdr.type == ElfSectionHeader.TYPE_SYMTAB:
+      symtab_shdr = shdr
       continue
 
-    # Read the section data if it exists
+    # Only sections marked as alloc should be written to memory
 
-    if section_name not in ['.sbss', '.bss']:
-      file_obj.seek( shdr.offset )
-      data = file_obj.read( shdr.size )
+    if not ( shdr.flags & ElfSectionHeader.FLAGS_ALLOC ):
+      continue
 
     # NOTE: the .bss and .sbss sections don't actually contain any
     # data in the ELF.  These sections should be initialized to zero.
@@ -490,69 +497,81 @@ def elf_reader( file_obj ):
     #
     # - http://stackoverflow.com/questions/610682/bss-section-in-elf-file
 
+    if section_name in ['.sbss', '.bss'] \
+        or shdr.type == ElfSectionHeader.TYPE_NOBITS:
+      data = SparseMemoryImage.ZeroData( shdr.size )
+
+    # Otherwise the data is a view into the mapped ELF file
+
     else:
-      data = b'\0' * shdr.size
+      data = elf_data[shdr.offset:shdr.offset+shdr.size]
+      if len(data) != shdr.size:
+        raise ValueError( "Section {} is past the end of the ELF file".format( section_name ) )
 
-    # Save the data holding the symbol string table
+    # Create section and append it to our list of sections
 
-    if shdr.type == ElfSectionHeader.TYPE_STRTAB:
-      strtab_data = data
+    section = SparseMemoryImage.Section( section_name, shdr.addr, data )
+    mem_image.add_section( section )
 
-    # Save the data holding the symbol table
+  if symtab_shdr is not None:
+    elf_read_symbols( elf_data, symtab_shdr, section_header( symtab_shdr.link ),
+                      mem_image )
 
-    elif shdr.type == ElfSectionHeader.TYPE_SYMTAB:
-      symtab_data = data
+  return mem_image
 
-    # Otherwise create section and append it to our list of sections
+#-------------------------------------------------------------------------
+# elf_read_symbols
+#-------------------------------------------------------------------------
+# Loads the symbols of the given symbol table into the sparse memory
+# image. The link field of the symbol table is the index of the string
+# table with the symbol names, strtab_shdr is its section header. We skip
+# the first symbol since it both "designates the first entry in the table
+# and serves as the undefined symbol index", undefined symbols, and
+# symbols which are not functions, objects, or labels (e.g., section and
+# file symbols). A local symbol never replaces a symbol of the same name
+# we already loaded, so functions like main are found even if some object
+# file has a static symbol with the same name.
 
-    else:
-      section = SparseMemoryImage.Section( section_name, shdr.addr, data )
-      mem_image.add_section( section )
-
-  # Load symbols. We skip the first symbol since it both "designates the
-  # first entry in the table and serves as the undefined symbol index".
-  # For now, I have commented this out, since we are not really using it.
-
-  # num_symbols = len(symtab_data) / ElfSymTabEntry.NBYTES
-  # for sym_idx in xrange(1,num_symbols):
-  #
-  #   # Read the data for a symbol table entry
-  #
-  #   start = sym_idx * ElfSymTabEntry.NBYTES
-  #   sym_data = symtab_data[start:start+ElfSymTabEntry.NBYTES]
-  #
-  #   # Construct a symbol table entry
-  #
-  #   sym = ElfSymTabEntry( sym_data )
-  #
-  #   # Get the symbol type
-  #
-  #   sym_type  = sym.info & 0xf
-  #
-  #   # Check to see if symbol is one of the three types we want to load
-  #
-  #   valid_sym_types = \
-  #   [
-  #     ElfSymTabEntry.TYPE_NOTYPE,
-  #     ElfSymTabEntry.TYPE_OBJECT,
-  #     ElfSymTabEntry.TYPE_FUNC,
-  #   ]
-  #
-  #   # Check to see if symbol is one of the three types we want to load
-  #
-  #   if sym_type not in valid_sym_types:
-  #     continue
-  #
-  #   # Get the symbol name from the string table
-  #
-  #   start = strtab_data[sym.name:]
-  #   name = start.partition('\0')[0]
-  #
-  #   # Add symbol to the sparse memory image
-  #
-  #   mem_image.add_symbol( name, sym.value )
+def elf_read_symbols( elf_data, symtab_shdr, strtab_shdr, mem_image ):
 
-  return mem_image
+  symtab_data = elf_data[symtab_shdr.offset:symtab_shdr.offset+symtab_shdr.size]
+  strtab_data = bytes( elf_data[strtab_shdr.offset:strtab_shdr.offset+strtab_shdr.size] )
+
+  valid_sym_types = \
+  [
+    ElfSymTabEntry.TYPE_NOTYPE,
+    ElfSymTabEntry.TYPE_OBJECT,
+    ElfSymTabEntry.TYPE_FUNC,
+  ]
+
+  num_symbols = len(symtab_data) // ElfSymTabEntry.NBYTES
+  for sym_idx in range(1,num_symbols):
+
+    # Read the data for a symbol table entry
+
+    start = sym_idx * ElfSymTabEntry.NBYTES
+    sym = ElfSymTabEntry( symtab_data[start:start+ElfSymTabEntry.NBYTES] )
+
+    # Check to see if symbol is one of the types we want to load
+
+    if sym.info & 0xf not in valid_sym_types:
+      continue
+
+    if sym.shndx == ElfSymTabEntry.SHNDX_UNDEF:
+      continue
+
+    # Get the symbol name from the string table
+
+    name = strtab_data[sym.name:].partition(b'\0')[0].decode()
+    if not name:
+      continue
+
+    if name in mem_image.symbols and sym.info >> 4 == ElfSymTabEntry.BIND_LOCAL:
+      continue
+
+    # Add symbol to the sparse memory image
+
+    mem_image.add_symbol( name, sym.value )
 
 #-------------------------------------------------------------------------
 # elf_writer
@@ -563,8 +582,12 @@ def elf_reader( file_obj ):
 #  - ElfHeader
 #  - ElfSectionHeader for "null" section
 #  - ElfSectionHeader for all "normal" sections
+#  - ElfSectionHeader for ".symtab" and ".strtab" sections (if the sparse
+#    memory image has symbols)
 #  - ElfSectionHeader for ".shstrtab" section
-#  - data for all "normal" sections
+#  - data for all "normal" sections (except ZeroData sections, which are
+#    written as NOBITS sections without data, like .bss)
+#  - data for ".symtab" and ".strtab" sections (if any)
 #  - data for ".shstrtab" section
 #
 
@@ -574,11 +597,49 @@ def elf_writer( mem_image, file_obj ):
 
   sections = mem_image.get_sections()
 
+  # Build the symbol table and its string table. Every symbol refers to
+  # the (first) section which contains its address, or is absolute.
+
+  symtab_data = bytearray()
+  strtab_data = b"\0"
+
+  if mem_image.symbols:
+
+    sym = ElfSymTabEntry()
+    sym.name  = 0
+    sym.value = 0
+    sym.size  = 0
+    sym.info  = 0
+    sym.other = 0
+    sym.shndx = ElfSymTabEntry.SHNDX_UNDEF
+    symtab_data += sym.to_bytes()
+
+    for name, addr in sorted( mem_image.symbols.items() ):
+
+      sym = ElfSymTabEntry()
+      sym.name  = len(strtab_data)
+      sym.value = addr
+      sym.size  = 0
+      sym.info  = ( ElfSymTabEntry.BIND_GLOBAL << 4 ) | ElfSymTabEntry.TYPE_NOTYPE
+      sym.other = 0
+      sym.shndx = ElfSymTabEntry.SHNDX_ABS
+
+      for section_idx, section in enumerate( sections ):
+        if section.addr <= addr < section.addr + len(section.data):
+          sym.shndx = section_idx + 1
+          break
+
+      symtab_data += sym.to_bytes()
+      strtab_data += name.encode() + b"\0"
+
+  num_sym_sections = 2 if symtab_data else 0
+
   ehdr = ElfHeader()
 
   # Many of these fields are just copied from what binutils generates.
-  # Note that we have two extra sections beyond the normal sections. The
-  # first "null" section and the final ".shstrtab" section.
+  # Note that we have two extra sections beyond the normal sections (and
+  # the symbol table sections). The first "null" section and the final
+  # ".shstrtab" section.
 
   ehdr.ident     = "\x7fELF\x01\x01\x01".ljust( ElfHeader.IDENT_NBYTES, '0' )
   ehdr.type      = ElfHeader.TYPE_EXEC
@@ -592,8 +653,8 @@ def elf_writer( mem_image, file_obj ):
   ehdr.phentsize = 0
   ehdr.phnum     = 0
   ehdr.shentsize = ElfSectionHeader.NBYTES  # shdrs are fixed size
-  ehdr.shnum     = len(sections) + 2        # add 2 for extra sections
-  ehdr.shstrndx  = len(sections) + 1        # location of shstrtab
+  ehdr.shnum     = len(sections) + num_sym_sections + 2 # add 2 for extra sections
+  ehdr.shstrndx  = len(sections) + num_sym_sections + 1 # location of shstrtab
 
   # Write the ELF header to the file
 
@@ -620,6 +681,7 @@ def elf_writer( mem_image, file_obj ):
   section_offset =  ElfHeader.NBYTES                        # ELF header
   section_offset += ElfSectionHeader.NBYTES                 # null shdr
   section_offset += len(sections) * ElfSectionHeader.NBYTES # normal shdrs
+  section_offset += num_sym_sections * ElfSectionHeader.NBYTES # symbol shdrs
   section_offset += 1 * ElfSectionHeader.NBYTES             # shstrtab shdr
 
   # Collect section names in a string for writing to ".shstrtab"
@@ -630,9 +692,11 @@ def elf_writer( mem_image, file_obj ):
 
   for section in sections:
 
+    zero = isinstance( section.data, SparseMemoryImage.ZeroData )
+
     shdr = ElfSectionHeader()
     shdr.name      = len(section_names)
-    shdr.type      = ElfSectionHeader.TYPE_PROGBITS
+    shdr.type      = ElfSectionHeader.TYPE_NOBITS if zero else ElfSectionHeader.TYPE_PROGBITS
     shdr.flags     = ElfSectionHeader.FLAGS_ALLOC
     shdr.addr      = section.addr
     shdr.offset    = section_offset
@@ -645,7 +709,45 @@ def elf_writer( mem_image, file_obj ):
     file_obj.write( shdr.to_bytes() )
 
     section_names  += section.name + "\0"
-    section_offset += len(section.data)
+    section_offset += 0 if zero else len(section.data)
+
+  # Write the ".symtab" and ".strtab" section headers to the file
+
+  if symtab_data:
+
+    shdr = ElfSectionHeader()
+    shdr.name      = len(section_names)
+    shdr.type      = ElfSectionHeader.TYPE_SYMTAB
+    shdr.flags     = 0
+    shdr.addr      = 0
+    shdr.offset    = section_offset
+    shdr.size      = len(symtab_data)
+    shdr.link      = len(sections) + 2      # location of strtab
+    shdr.info      = 1                      # first non-local symbol
+    shdr.addralign = 4
+    shdr.entsize   = ElfSymTabEntry.NBYTES
+
+    file_obj.write( shdr.to_bytes() )
+
+    section_names  += ".symtab\0"
+    section_offset += len(symtab_data)
+
+    shdr = ElfSectionHeader()
+    shdr.name      = len(section_names)
+    shdr.type      = ElfSectionHeader.TYPE_STRTAB
+    shdr.flags     = 0
+    shdr.addr      = 0
+    shdr.offset    = section_offset
+    shdr.size      = len(strtab_data)
+    shdr.link      = 0
+    shdr.info      = 0
+    shdr.addralign = 0
+    shdr.entsize   = 0
+
+    file_obj.write( shdr.to_bytes() )
+
+    section_names  += ".strtab\0"
+    section_offset += len(strtab_data)
 
   # Write the ".shstrtab" section header to the file
 
@@ -669,7 +771,14 @@ def elf_writer( mem_image, file_obj ):
   # Write the section data for "normal" sections
 
   for section in sections:
-    file_obj.write( section.data )
+    if not isinstance( section.data, SparseMemoryImage.ZeroData ):
+      file_obj.write( section.data )
+
+  # Write the data for the ".symtab" and ".strtab" sections
+
+  if symtab_data:
+    file_obj.write( symtab_data )
+    file_obj.write( strtab_data )
 
   # Write the data for the ".shstrtab" section
 
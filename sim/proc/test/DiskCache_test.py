@@ -0,0 +1,72 @@
+#=========================================================================
+# DiskCache_test.py
+#=========================================================================
+
+import os
+import pytest
+
+from proc.DiskCache import user_cache_dir, sources_hash, write_entry
+
+#-------------------------------------------------------------------------
+# test_user_cache_dir
+#-------------------------------------------------------------------------
+
+def test_user_cache_dir( monkeypatch, tmpdir ):
+
+  monkeypatch.setenv( "XDG_CACHE_HOME", str( tmpdir ) )
+  assert user_cache_dir() == str( tmpdir.join( "pmx-sim" ) )
+  assert user_cache_dir( "images" ) == str( tmpdir.join( "pmx-sim", "images" ) )
+
+#-------------------------------------------------------------------------
+# test_sources_hash
+#-------------------------------------------------------------------------
+
+def test_sources_hash( tmpdir ):
+
+  a = tmpdir.join( "a.py" )
+  b = tmpdir.join( "b.py" )
+  a.write( "x = 1\n" )
+  b.write( "y = 2\n" )
+
+  h = sources_hash( [ str(a), str(b) ] )
+  assert sources_hash( [ str(b), str(a), str(a) ] ) == h
+
+  b.write( "y = 3\n" )
+  assert sources_hash( [ str(a), str(b) ] ) != h
+  assert sources_hash( [ str(a) ] ) != h
+
+#-------------------------------------------------------------------------
+# test_write_entry
+#-------------------------------------------------------------------------
+
+def test_write_entry( tmpdir ):
+
+  path = str( tmpdir.join( "sub", "entry" ) )
+
+  assert write_entry( path, lambda f: f.write( b"data" ) )
+  with open( path, "rb" ) as fd:
+    assert fd.read() == b"data"
+
+  # A failing write leaves the old entry and no temporary file behind
+
+  def fail( f ):
+    f.write( b"partial" )
+    raise ValueError( "cannot write" )
+
+  with pytest.raises( ValueError ):
+    write_entry( path, fail )
+
+  def fail_os( f ):
+    raise OSError( "disk full" )
+
+  assert not write_entry( path, fail_os )
+
+  assert os.listdir( str( tmpdir.join( "sub" ) ) ) == [ "entry" ]
+  with open( path, "rb" ) as fd:
+    assert fd.read() == b"data"
+
+  # Problems with the cache directory are ignored
+
+  tmpdir.join( "file" ).write( "" )
+  assert not write_entry( str( tmpdir.join( "file", "entry" ) ),
+                          lambda f: f.write( b"data" ) )
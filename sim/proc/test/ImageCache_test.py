@@ -0,0 +1,96 @@
+#=========================================================================
+# ImageCache_test.py
+#=========================================================================
+
+import os
+
+from proc import elf
+from proc.ImageCache        import ImageCache
+from proc.SparseMemoryImage import SparseMemoryImage
+
+#-------------------------------------------------------------------------
+# Helpers
+#-------------------------------------------------------------------------
+
+def mk_mem_image( value ):
+
+  mem_image = SparseMemoryImage()
+
+  mem_image.add_section( ".text", 0x0200, bytes( [ value ] * 64 ) )
+  mem_image.add_section( ".bss",  0x2000, SparseMemoryImage.ZeroData( 4096 ) )
+  mem_image.add_symbol( "_start", 0x0200 )
+
+  return mem_image
+
+def write_elf( path, mem_image ):
+  with open( path, "wb" ) as file_obj:
+    elf.elf_writer( mem_image, file_obj )
+
+#-------------------------------------------------------------------------
+# test_image_cache
+#-------------------------------------------------------------------------
+
+def test_image_cache( tmpdir ):
+
+  elf_path  = str( tmpdir.join( "test.elf" ) )
+  cache_dir = str( tmpdir.join( "cache" ) )
+
+  write_elf( elf_path, mk_mem_image( 1 ) )
+
+  cache = ImageCache( cache_dir )
+
+  # The first load parses the elf binary, the second one only maps the
+  # cached image
+
+  assert cache.load_elf( elf_path ) == mk_mem_image( 1 )
+  assert ( cache.num_hits, cache.num_misses ) == ( 0, 1 )
+  assert len( os.listdir( cache_dir ) ) == 1
+
+  mem_image = cache.load_elf( elf_path )
+  assert mem_image == mk_mem_image( 1 )
+  assert ( cache.num_hits, cache.num_misses ) == ( 1, 1 )
+  assert isinstance( mem_image.get_section( ".bss" ).data,
+                     SparseMemoryImage.ZeroData )
+
+  # Entries are keyed by the contents of the elf binary, so another
+  # process (with a new cache) hits as well, and changing the binary
+  # misses
+
+  cache = ImageCache( cache_dir )
+
+  assert cache.load_elf( elf_path ) == mk_mem_image( 1 )
+  assert ( cache.num_hits, cache.num_misses ) == ( 1, 0 )
+
+  write_elf( elf_path, mk_mem_image( 2 ) )
+
+  assert cache.load_elf( elf_path ) == mk_mem_image( 2 )
+  assert ( cache.num_hits, cache.num_misses ) == ( 1, 1 )
+
+#-------------------------------------------------------------------------
+# test_image_cache_invalid
+#-------------------------------------------------------------------------
+# Broken entries are replaced, and without a directory we just read the
+# elf binary.
+
+def test_image_cache_invalid( tmpdir ):
+
+  elf_path  = str( tmpdir.join( "test.elf" ) )
+  cache_dir = str( tmpdir.join( "cache" ) )
+
+  write_elf( elf_path, mk_mem_image( 1 ) )
+
+  cache = ImageCache( cache_dir )
+  cache.load_elf( elf_path )
+
+  entry, = os.listdir( cache_dir )
+  with open( os.path.join( cache_dir, entry ), "r+b" ) as fd:
+    fd.truncate( 16 )
+
+  assert cache.load_elf( elf_path ) == mk_mem_image( 1 )
+  assert cache.load_elf( elf_path ) == mk_mem_image( 1 )
+  assert ( cache.num_hits, cache.num_misses ) == ( 1, 2 )
+
+  cache = ImageCache()
+
+  assert cache.load_elf( elf_path ) == mk_mem_image( 1 )
+  assert ( cache.num_hits, cache.num_misses ) == ( 0, 0 )
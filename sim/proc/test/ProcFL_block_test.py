@@ -0,0 +1,98 @@
+#=========================================================================
+# ProcFL_block_test.py
+#=========================================================================
+# Runs all of the FL instruction tests on the block mode of the FL
+# processor, checks that it ends up with the same architectural state as
+# the int mode, and checks the block cache statistics.
+
+import pytest
+
+from pymtl3  import *
+from .harness import *
+from proc.ProcFL import ProcFL
+from proc.tinyrv2_encoding import assemble
+
+from .ProcFL_int_test import mk_asm_tests
+
+from . import inst_sra, inst_lh, inst_sb, inst_bge, inst_csr
+from . import inst_jal_beq, inst_mul_mem, inst_self_mod
+
+#-------------------------------------------------------------------------
+# all instruction tests
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "name,test", mk_asm_tests() )
+def test_block( pytestconfig, name, test ):
+  run_test( pytestconfig, ProcFL, test, proc_params={ "mode" : "block" } )
+
+@pytest.mark.parametrize( "name,test", [
+  asm_test( inst_lh.gen_random_test  ),
+  asm_test( inst_sb.gen_random_test  ),
+  asm_test( inst_bge.gen_random_test ),
+  asm_test( inst_csr.gen_random_test ),
+])
+def test_block_rand_delays( pytestconfig, name, test ):
+  run_test( pytestconfig, ProcFL, test, proc_params={ "mode" : "block" },
+            src_delay=3, sink_delay=5, mem_stall_prob=0.5, mem_latency=3 )
+
+#-------------------------------------------------------------------------
+# state equivalence
+#-------------------------------------------------------------------------
+# The block mode commits whole blocks, so we cannot compare commits with
+# the int mode, but we can compare the register file at the end.
+
+def run_mode( mode, mem_image ):
+
+  model = TestHarness( ProcFL )
+  model.set_param( "top.proc.construct", mode=mode )
+  model.elaborate()
+  model.load( mem_image )
+
+  model.apply( SimulationPass() )
+  model.sim_reset()
+
+  while not model.done() and model.simulated_cycles < 10000:
+    model.tick()
+
+  assert model.done()
+  return model.proc
+
+@pytest.mark.parametrize( "name,test", [
+  asm_test( inst_sra.gen_random_test     ),
+  asm_test( inst_lh.gen_random_test      ),
+  asm_test( inst_jal_beq.gen_basic_test  ),
+  asm_test( inst_mul_mem.gen_more_test   ),
+  asm_test( inst_self_mod.gen_basic_test ),
+])
+def test_block_regs( name, test ):
+  mem_image = assemble( test() )
+  block_regs = run_mode( "block", mem_image ).R.regs
+  int_regs   = run_mode( "int",   mem_image ).R.regs
+  assert block_regs == int_regs
+
+#-------------------------------------------------------------------------
+# block cache statistics
+#-------------------------------------------------------------------------
+# A loop with three blocks: the code before the loop (which ends with the
+# csrr), the loop body (which ends with the bne), and the code after the
+# loop (which ends with the csrw). We also miss once on the empty word
+# after the program, but there is nothing to translate there.
+
+def gen_loop_test():
+  return """
+    addi x1, x0, 100
+    addi x2, x0, 0
+    csrr x3, mngr2proc < 1
+  loop:
+    add  x2, x2, x3
+    addi x1, x1, -1
+    bne  x1, x0, loop
+    csrw proc2mngr, x2 > 100
+  """
+
+def test_block_stats():
+  proc = run_mode( "block", assemble( gen_loop_test() ) )
+  assert proc.num_blocks_translated == 3
+  assert proc.num_block_misses      == 4
+  assert proc.num_block_hits        >= 99
+  assert proc.num_insts             >= 3 + 3*100 + 1
@@ -0,0 +1,118 @@
+#=========================================================================
+# ProcFL_int_test.py
+#=========================================================================
+# Runs all of the FL instruction tests on the integer-native mode of the
+# FL processor, and checks that both modes produce exactly the same line
+# trace for the same program.
+
+import pytest
+
+from pymtl3  import *
+from .harness import *
+from proc.ProcFL import ProcFL
+from proc.tinyrv2_encoding import assemble
+
+from . import inst_add, inst_sub, inst_mul, inst_and, inst_or, inst_xor
+from . import inst_slt, inst_sltu, inst_sll, inst_srl, inst_sra
+from . import inst_addi, inst_andi, inst_ori, inst_xori, inst_slti, inst_sltiu
+from . import inst_slli, inst_srli, inst_srai, inst_lui, inst_auipc
+from . import inst_lw, inst_lh, inst_lhu, inst_lb, inst_lbu
+from . import inst_sw, inst_sh, inst_sb
+from . import inst_beq, inst_bne, inst_blt, inst_bge, inst_bltu, inst_bgeu
+from . import inst_jal, inst_jalr, inst_csr, inst_xcel
+from . import inst_jal_beq, inst_mul_mem, inst_self_mod
+
+inst_modules = [
+  inst_add, inst_sub, inst_mul, inst_and, inst_or, inst_xor,
+  inst_slt, inst_sltu, inst_sll, inst_srl, inst_sra,
+  inst_addi, inst_andi, inst_ori, inst_xori, inst_slti, inst_sltiu,
+  inst_slli, inst_srli, inst_srai, inst_lui, inst_auipc,
+  inst_lw, inst_lh, inst_lhu, inst_lb, inst_lbu,
+  inst_sw, inst_sh, inst_sb,
+  inst_beq, inst_bne, inst_blt, inst_bge, inst_bltu, inst_bgeu,
+  inst_jal, inst_jalr, inst_csr, inst_xcel,
+  inst_jal_beq, inst_mul_mem, inst_self_mod,
+]
+
+#-------------------------------------------------------------------------
+# all instruction tests
+#-------------------------------------------------------------------------
+# Collect every test generator defined in the instruction test modules
+# (skipping the templates they import from inst_utils). A few generators
+# are not used by the bits mode tests either since they are broken.
+
+broken_tests = [
+  inst_bne.gen_very_basic_test,
+  inst_bne.gen_back_to_back_test,
+  inst_blt.gen_back_to_back_test,
+  inst_bltu.gen_back_to_back_test,
+]
+
+def mk_asm_tests():
+  tests = []
+  for module in inst_modules:
+    inst = module.__name__.split(".")[-1][len("inst_"):]
+    for func_name in dir( module ):
+      func = getattr( module, func_name )
+      if     func_name.startswith("gen_") and "_test" in func_name \
+         and func.__module__ == module.__name__ \
+         and func not in broken_tests:
+        name, func = asm_test( func )
+        tests.append( ( inst + "_" + name, func ) )
+  return tests
+
+@pytest.mark.parametrize( "name,test", mk_asm_tests() )
+def test_int( pytestconfig, name, test ):
+  run_test( pytestconfig, ProcFL, test, proc_params={ "mode" : "int" } )
+
+@pytest.mark.parametrize( "name,test", [
+  asm_test( inst_lw.gen_random_test  ),
+  asm_test( inst_sb.gen_random_test  ),
+  asm_test( inst_bge.gen_random_test ),
+  asm_test( inst_csr.gen_random_test ),
+])
+def test_int_rand_delays( pytestconfig, name, test ):
+  run_test( pytestconfig, ProcFL, test, proc_params={ "mode" : "int" },
+            src_delay=3, sink_delay=5, mem_stall_prob=0.5, mem_latency=3 )
+
+#-------------------------------------------------------------------------
+# commit equivalence
+#-------------------------------------------------------------------------
+# Simulate the same program with both modes and compare the processor
+# line trace for every committed instruction, as well as the register
+# file at the end. We do not compare the cycle-by-cycle trace of the
+# whole harness, since the relative order of the CL components within a
+# cycle (and hence the exact timing) can differ between two elaborations
+# of the same model.
+
+def get_commits( mode, mem_image ):
+
+  model = TestHarness( ProcFL )
+  model.set_param( "top.proc.construct", mode=mode )
+  model.set_param( "top.mem.construct", latency=3 )
+  model.elaborate()
+  model.load( mem_image )
+
+  model.apply( SimulationPass() )
+  model.sim_reset()
+
+  commits = []
+  while not model.done() and model.simulated_cycles < 10000:
+    model.tick()
+    if model.proc.commit_inst:
+      commits.append( model.proc.line_trace() )
+
+  assert model.done()
+  return commits, [ int(model.proc.R[i]) for i in range(32) ]
+
+@pytest.mark.parametrize( "name,test", [
+  asm_test( inst_sra.gen_random_test      ),
+  asm_test( inst_slti.gen_random_test     ),
+  asm_test( inst_lh.gen_random_test       ),
+  asm_test( inst_jalr.gen_value_test_3    ),
+  asm_test( inst_mul_mem.gen_more_test    ),
+  asm_test( inst_self_mod.gen_basic_test  ),
+])
+def test_int_commits( name, test ):
+  mem_image = assemble( test() )
+  assert get_commits( "int", mem_image ) == get_commits( "bits", mem_image )
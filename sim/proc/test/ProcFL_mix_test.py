@@ -32,3 +32,15 @@ from . import inst_mul_mem
 ])
 def test_mul_mem( pytestconfig, name, test ):
   run_test( pytestconfig, ProcFL, test )
+
+#-------------------------------------------------------------------------
+# self_mod
+#-------------------------------------------------------------------------
+
+from . import inst_self_mod
+
+@pytest.mark.parametrize( "name,test", [
+  asm_test( inst_self_mod.gen_basic_test    ) ,
+])
+def test_self_mod( pytestconfig, name, test ):
+  run_test( pytestconfig, ProcFL, test )
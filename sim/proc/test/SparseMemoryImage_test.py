@@ -7,6 +7,9 @@ from proc.SparseMemoryImage import SparseMemoryImage
 import random
 import struct
 import copy
+import io
+
+import pytest
 
 #-------------------------------------------------------------------------
 # test_sections
@@ -131,3 +134,81 @@ def test_symbols():
   assert mem_image.get_symbol( "var_a"  ) == 0x0011000
   assert mem_image.get_symbol( "var_b"  ) == 0x0011000
 
+
+#-------------------------------------------------------------------------
+# test_zero_data
+#-------------------------------------------------------------------------
+
+def test_zero_data():
+
+  data = SparseMemoryImage.ZeroData( 16 )
+
+  assert len( data ) == 16
+  assert bytes( data ) == bytes( 16 )
+  assert data[4:8] == bytes( 4 )
+  assert data[-1] == 0
+
+  assert data == SparseMemoryImage.ZeroData( 16 )
+  assert data == bytes( 16 )
+  assert bytearray( 16 ) == data
+  assert data != SparseMemoryImage.ZeroData( 8 )
+  assert data != b"\x01" + bytes( 15 )
+
+  section = SparseMemoryImage.Section( ".bss", 0x1000, data )
+  assert section == SparseMemoryImage.Section( ".bss", 0x1000, bytes( 16 ) )
+
+#-------------------------------------------------------------------------
+# test_image
+#-------------------------------------------------------------------------
+
+def test_image( tmpdir ):
+
+  mem_image = SparseMemoryImage()
+
+  mem_image.add_section( ".text",  0x0200, bytes( random.getrandbits(8) for _ in range(61) ) )
+  mem_image.add_section( ".data",  0x2000, bytearray( b"\x01\x02\x03" ) )
+  mem_image.add_section( ".empty", 0x3000, b"" )
+  mem_image.add_section( ".bss",   0x4000, SparseMemoryImage.ZeroData( 1 << 20 ) )
+
+  mem_image.add_symbol( "_start", 0x0200 )
+  mem_image.add_symbol( "main",   0x0234 )
+
+  with tmpdir.join("image").open('wb') as file_obj:
+    mem_image.write_image( file_obj )
+
+  with tmpdir.join("image").open('rb') as file_obj:
+    mem_image_test = SparseMemoryImage.read_image( file_obj )
+
+  assert mem_image_test == mem_image
+
+  # Sections are views into the mapped file, and ZeroData is not stored
+
+  text, data, empty, bss = mem_image_test.get_sections()
+
+  assert isinstance( text.data, memoryview )
+  assert isinstance( bss.data,  SparseMemoryImage.ZeroData )
+  assert tmpdir.join("image").size() < 1024
+
+  # Files we cannot map are read instead
+
+  file_obj = io.BytesIO()
+  mem_image.write_image( file_obj )
+  assert SparseMemoryImage.read_image( file_obj ) == mem_image
+
+#-------------------------------------------------------------------------
+# test_image_invalid
+#-------------------------------------------------------------------------
+
+def test_image_invalid():
+
+  mem_image = SparseMemoryImage()
+  mem_image.add_section( ".text", 0x0200, bytes( 64 ) )
+
+  file_obj = io.BytesIO()
+  mem_image.write_image( file_obj )
+  image = file_obj.getvalue()
+
+  for bad_image in [ b"", b"\x7fELF" + image[4:], image[:-1],
+                     image[:8] + struct.pack( "<I", 2 ) + image[12:] ]:
+    with pytest.raises( ValueError ):
+      SparseMemoryImage.read_image( io.BytesIO( bad_image ) )
@@ -3,6 +3,7 @@
 #=========================================================================
 
 from proc import elf
+import io
 import os
 import random
 import struct
@@ -51,3 +52,78 @@ def test_basic( tmpdir ):
 
   assert mem_image == mem_image_test
 
+
+#-------------------------------------------------------------------------
+# test_symbols
+#-------------------------------------------------------------------------
+
+def test_symbols( tmpdir ):
+
+  # Create a sparse memory image with symbols in both sections and one
+  # absolute symbol
+
+  mem_image = SparseMemoryImage()
+
+  mem_image.add_section( SparseMemoryImage.Section( ".text", 0x0200, bytearray(64) ) )
+  mem_image.add_section( SparseMemoryImage.Section( ".data", 0x2000, bytearray(16) ) )
+
+  mem_image.add_symbol( "_start", 0x0200 )
+  mem_image.add_symbol( "main",   0x0220 )
+  mem_image.add_symbol( "src",    0x2000 )
+  mem_image.add_symbol( "_end",   0x8000 )
+
+  # Write the sparse memory image to an ELF file and read it back
+
+  with tmpdir.join("elf-test").open('wb') as file_obj:
+    elf.elf_writer( mem_image, file_obj )
+
+  with tmpdir.join("elf-test").open('rb') as file_obj:
+    mem_image_test = elf.elf_reader( file_obj )
+
+  # The symbol table is not loaded into memory
+
+  assert [ x.name for x in mem_image_test.get_sections() ] == [ ".text", ".data" ]
+
+  assert mem_image_test.symbols == { "_start": 0x0200, "main": 0x0220,
+                                     "src": 0x2000, "_end": 0x8000 }
+  assert mem_image == mem_image_test
+
+#-------------------------------------------------------------------------
+# test_zero_copy
+#-------------------------------------------------------------------------
+# Sections are views into the mapped ELF file, and .bss is not
+# materialized (it is written as a NOBITS section).
+
+def test_zero_copy( tmpdir ):
+
+  mem_image = SparseMemoryImage()
+
+  mem_image.add_section( ".text", 0x0200, bytes( range(64) ) )
+  mem_image.add_section( ".data", 0x2000, bytes( range(16) ) )
+  mem_image.add_section( ".bss",  0x3000, SparseMemoryImage.ZeroData( 1 << 24 ) )
+
+  with tmpdir.join("elf-test").open('wb') as file_obj:
+    elf.elf_writer( mem_image, file_obj )
+
+  # The ELF file does not contain the .bss
+
+  assert os.path.getsize( str( tmpdir.join("elf-test") ) ) < 1024
+
+  with tmpdir.join("elf-test").open('rb') as file_obj:
+    mem_image_test = elf.elf_reader( file_obj )
+
+  text, data, bss = mem_image_test.get_sections()
+
+  assert isinstance( text.data, memoryview )
+  assert isinstance( data.data, memoryview )
+  assert isinstance( bss.data,  SparseMemoryImage.ZeroData )
+  assert len( bss.data ) == 1 << 24
+
+  assert mem_image == mem_image_test
+
+  # Files we cannot map are read instead
+
+  with tmpdir.join("elf-test").open('rb') as file_obj:
+    mem_image_test = elf.elf_reader( io.BytesIO( file_obj.read() ) )
+
+  assert mem_image == mem_image_test
@@ -12,8 +12,9 @@ from pymtl3.stdlib.ifcs import mk_mem_msg
 from pymtl3.stdlib.test import TestSrcCL, TestSinkCL, config_model, run_sim
 from pymtl3.stdlib.cl.MemoryCL   import MemoryCL
 
-from proc.NullXcelRTL      import NullXcelRTL
-from proc.tinyrv2_encoding import assemble
+from proc.NullXcelRTL       import NullXcelRTL
+from proc.SparseMemoryImage import SparseMemoryImage
+from proc.tinyrv2_encoding  import assemble
 
 #=========================================================================
 # TestHarness
@@ -98,12 +99,18 @@ class TestHarness(Component):
         for bits in struct.iter_unpack("<I", section.data):
           self.sink.msgs.append( b32(bits[0]) )
 
-      # For all other sections, simply copy them into the memory
+      # For all other sections, simply copy them into the memory. Memory
+      # images read from ELF binaries or from the image cache keep .bss
+      # as ZeroData, which we zero-fill.
 
       else:
+        data = section.data
+        if isinstance( data, SparseMemoryImage.ZeroData ):
+          data = bytes( data )
+
         start_addr = section.addr
-        stop_addr  = section.addr + len(section.data)
-        self.mem.mem.mem[start_addr:stop_addr] = section.data
+        stop_addr  = section.addr + len(data)
+        self.mem.mem.mem[start_addr:stop_addr] = data
 
   #-----------------------------------------------------------------------
   # cleanup
@@ -138,12 +145,15 @@ class TestHarness(Component):
 def run_test( pytestconfig, ProcModel, gen_test,
               dump_vcd=None, test_verilog=False,
               src_delay=0, sink_delay=0, mem_stall_prob=0, mem_latency=0,
-              max_cycles=10000 ):
+              max_cycles=10000, proc_params=None ):
 
   # Instantiate and elaborate the model
 
   model = TestHarness( ProcModel )
 
+  if proc_params:
+    model.set_param( "top.proc.construct", **proc_params )
+
   model.set_param( "top.src.construct",
     initial_delay=src_delay+3, interval_delay=src_delay )
 
@@ -0,0 +1,45 @@
+#=========================================================================
+# self_mod
+#=========================================================================
+# Self-modifying code: a store overwrites an instruction which we have
+# already executed and then we execute it again.
+
+from pymtl3 import *
+from .inst_utils import *
+
+#-------------------------------------------------------------------------
+# gen_basic_test
+#-------------------------------------------------------------------------
+
+def gen_basic_test():
+  return """
+
+    csrr x4, mngr2proc < 0x00a18193 # x4 = addi x3, x3, 10
+    addi x3, x0, 0
+    lui  x1,     %hi[label_a]
+    addi x1, x1, %lo[label_a]
+    jal  x6, label_a            # x3 = x3 + 1
+    csrw proc2mngr, x3 > 1
+    sw   x4, 0(x1)              # store new instruction to label_a
+    nop
+    nop
+    nop
+    nop
+    nop
+    nop
+    jal  x6, label_a            # x3 = x3 + 10
+    csrw proc2mngr, x3 > 11
+    jal  x0, label_b
+
+  label_a:
+    addi x3, x3, 1              # overwritten with addi x3, x3, 10
+    jalr x0, x6, 0
+
+  label_b:
+    nop
+    nop
+    nop
+    nop
+    nop
+    nop
+  """
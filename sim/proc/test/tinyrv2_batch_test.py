@@ -0,0 +1,117 @@
+#=========================================================================
+# tinyrv2_batch_test.py
+#=========================================================================
+# Runs all of the FL instruction tests in a single batch on the batched
+# instruction set simulator, and checks every lane against the standalone
+# instruction set simulator.
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pymtl3 import *
+from proc.tinyrv2_encoding import assemble
+from proc.tinyrv2_batch    import TinyRV2Batch
+
+from pmx.Proc2MngrDecoder import Proc2MngrDecoder
+
+from .ProcFL_int_test           import mk_asm_tests
+from .tinyrv2_semantics_test    import run_iss
+from . import inst_add, inst_lw, inst_sw
+
+#-------------------------------------------------------------------------
+# run_batch
+#-------------------------------------------------------------------------
+
+def run_batch( mem_images, max_insts=10000, decoders=None ):
+
+  batch = TinyRV2Batch( len(mem_images) )
+  for lane, mem_image in enumerate( mem_images ):
+    batch.load( lane, mem_image, decoders[lane] if decoders else None )
+
+  batch.run( max_insts )
+  return batch
+
+#-------------------------------------------------------------------------
+# all instruction tests in one batch
+#-------------------------------------------------------------------------
+
+def test_batch_all():
+
+  tests      = mk_asm_tests()
+  mem_images = [ assemble( test() ) for name, test in tests ]
+
+  batch = run_batch( mem_images )
+
+  for lane, ( name, test ) in enumerate( tests ):
+    assert batch.passed()[lane], ( name, batch.errors[lane] )
+
+    iss = run_iss( mem_images[lane] )
+    assert batch.R[lane].tolist()  == iss.R, name
+    assert batch.num_insts[lane]   == iss.num_insts, name
+    assert not batch.proc2mngr_refs[lane], name
+
+#-------------------------------------------------------------------------
+# failing lanes
+#-------------------------------------------------------------------------
+# A lane failing must not affect the other lanes.
+
+def test_batch_fail():
+
+  mem_images = [ assemble( inst_add.gen_random_test() ),
+                 assemble( inst_lw.gen_random_test()  ),
+                 assemble( inst_sw.gen_random_test()  ),
+                 assemble( "csrw proc2mngr, x0 > 0" ) ]
+
+  batch = TinyRV2Batch( len(mem_images) + 1 )
+  for lane, mem_image in enumerate( mem_images ):
+    batch.load( lane, mem_image )
+
+  # Corrupt the third reference message of the second lane
+
+  batch.proc2mngr_refs[1][2] ^= 1
+
+  # Lane 4 runs an infinite loop
+
+  batch.load( 4, assemble( "loop:\n jal x0, loop\n csrw proc2mngr, x0 > 0" ) )
+
+  batch.run( 1000 )
+
+  assert batch.passed().tolist() == [ True, False, True, True, False ]
+  assert "!= reference" in batch.errors[1]
+  assert len( batch.proc2mngr_queues[1] ) == 3
+  assert "Exceeded 1000 instructions" in batch.errors[4]
+  assert batch.num_insts[4] == 1000
+
+#-------------------------------------------------------------------------
+# proc2mngr decoder
+#-------------------------------------------------------------------------
+
+def test_batch_decoder():
+
+  passing = assemble( """
+    addi x1, x0, 5
+  loop:
+    addi x1, x1, -1
+    bne  x1, x0, loop
+    csrw proc2mngr, x0 > 0
+  """ )
+
+  failing = assemble( """
+    addi x1, x0, 3
+    csrw proc2mngr, x1 > 0
+  """ )
+
+  # Runs into the all-zero word right after the program
+
+  illegal = assemble( """
+    addi x1, x0, 3
+  """ )
+
+  batch = run_batch( [ passing, failing, illegal ],
+                     decoders=[ Proc2MngrDecoder() for _ in range(3) ] )
+
+  assert batch.passed().tolist() == [ True, False, False ]
+  assert batch.num_insts.tolist() == [ 1 + 2*5 + 1, 1, 1 ]
+  assert "status 1" in batch.errors[1]
+  assert "Illegal instruction at PC=00000204" in batch.errors[2]
@@ -5,9 +5,14 @@
 # the reference instruction bits.
 
 import pytest
+import random
+import re
 import struct
 
-from proc.tinyrv2_encoding  import assemble_inst, disassemble_inst
+from pymtl3                 import *
+from proc.tinyrv2_encoding  import assemble_inst, disassemble_inst, decode_inst_name
+from proc.tinyrv2_encoding  import tinyrv2_encoding_table, tinyrv2_isa_impl
+from proc.tinyrv2_encoding  import assemble, AssembleCache, disassemble
 from proc.SparseMemoryImage import SparseMemoryImage
 
 #-------------------------------------------------------------------------
@@ -34,6 +39,7 @@ def check( inst_str, inst_bits_ref, inst_str_ref ):
 
   inst_bits = assemble_inst( {}, 0, inst_str )
   assert inst_bits == inst_bits_ref
+  assert tinyrv2_isa_impl.encode_inst( {}, 0, inst_str ) == inst_bits_ref
 
   inst_str  = disassemble_inst( inst_bits )
   assert compare_str( inst_str, inst_str_ref )
@@ -48,6 +54,7 @@ def check_sym( sym, pc, inst_str, inst_bits_ref, inst_str_ref ):
 
   inst_bits = assemble_inst( sym, pc, inst_str )
   assert inst_bits == inst_bits_ref
+  assert tinyrv2_isa_impl.encode_inst( sym, pc, inst_str ) == inst_bits_ref
 
   inst_str  = disassemble_inst( inst_bits )
   assert compare_str( inst_str, inst_str_ref )
@@ -169,6 +176,64 @@ def test_tinyrv2_inst_csrr():
 def test_tinyrv2_inst_csrw():
   check( "csrw  proc2mngr, x2",     0b01111100000000010001000001110011, "csrw  0x7c0, x02"       )
 
+#-------------------------------------------------------------------------
+# Decode tree
+#-------------------------------------------------------------------------
+# The decode tree should always agree with the linear scan over the
+# encoding table, both for legal instructions (we randomize all of the
+# bits not covered by the opcode mask) and for random garbage.
+
+def test_tinyrv2_decode_tree():
+
+  for row in tinyrv2_encoding_table:
+    for i in range(100):
+      inst_bits = ( random.getrandbits(32) & ~row[1] ) | row[2]
+      assert tinyrv2_isa_impl.decode_tmpl( inst_bits ) \
+          == tinyrv2_isa_impl.decode_tmpl_linear( inst_bits )
+
+  for i in range(10000):
+    inst_bits = random.getrandbits(32)
+    try:
+      inst_tmpl_ref = tinyrv2_isa_impl.decode_tmpl_linear( inst_bits )
+    except AssertionError:
+      with pytest.raises( AssertionError ):
+        tinyrv2_isa_impl.decode_tmpl( inst_bits )
+    else:
+      assert tinyrv2_isa_impl.decode_tmpl( inst_bits ) == inst_tmpl_ref
+
+def test_tinyrv2_decode_inst_name():
+  assert decode_inst_name( 0b00000000000000000000000000010011 ) == "nop"
+  assert decode_inst_name( 0b00000000001100010000000010010011 ) == "addi"
+  assert decode_inst_name( 0b01000000001100010101000010010011 ) == "srai"
+  assert decode_inst_name( 0b11111100000000000010000111110011 ) == "csrr"
+  assert decode_inst_name( 0b01111100000000010001000001110011 ) == "csrw"
+  assert decode_inst_name( Bits32(0b00000000001100010000000010110011) ) == "add"
+  assert decode_inst_name( 0 ) == " "
+
+  with pytest.raises( AssertionError ):
+    decode_inst_name( 0b11111111111111111111111111111111 )
+
+#-------------------------------------------------------------------------
+# Disassembly format strings
+#-------------------------------------------------------------------------
+# The precompiled format strings should always agree with replacing one
+# field tag at a time.
+
+def test_tinyrv2_disassemble_fmts():
+
+  for row in tinyrv2_encoding_table:
+    for i in range(100):
+      inst_bits = ( random.getrandbits(32) & ~row[1] ) | row[2]
+      assert disassemble_inst( inst_bits ) \
+          == tinyrv2_isa_impl.disassemble_inst_replace( Bits32( inst_bits ) )
+      assert disassemble_inst( Bits32( inst_bits ) ) \
+          == disassemble_inst( inst_bits )
+
+  assert disassemble_inst( 0 ) == ""
+
+  with pytest.raises( AssertionError ):
+    disassemble_inst( 0b11111111111111111111111111111111 )
+
 #-------------------------------------------------------------------------
 # mk_section
 #-------------------------------------------------------------------------
@@ -180,3 +245,148 @@ def mk_section( name, addr, words ):
     data.extend(struct.pack("<I",word))
 
   return SparseMemoryImage.Section( name, addr, data )
+
+#-------------------------------------------------------------------------
+# Field encoders
+#-------------------------------------------------------------------------
+# The precompiled encoders should always agree with assembling into Bits.
+# We fill in every template in the encoding table with random fields,
+# including labels and immediates which do not fit into the field.
+
+gen_field_strs = {
+  "rs1"    : lambda: "x{}".format( random.randint(0,31) ),
+  "rs2"    : lambda: "x{}".format( random.randint(0,31) ),
+  "rd"     : lambda: "x{}".format( random.randint(0,31) ),
+  "shamt"  : lambda: str( random.randint(0,31) ),
+  "funct7" : lambda: str( random.randint(0,127) ),
+  "i_imm"  : lambda: random.choice([ str( random.randint(-4096,4095) ),
+                                     hex( random.randint(0,4095) ),
+                                     "%hi[label_a]", "%md[label_a]", "%lo[label_b]" ]),
+  "csrnum" : lambda: random.choice([ "mngr2proc", "proc2mngr", "numcores",
+                                     "coreid", "stats_en", "0x7e3" ]),
+  "s_imm"  : lambda: str( random.randint(-4096,4095) ),
+  "b_imm"  : lambda: random.choice([ str( random.randint(-4096,4095) & ~1 ),
+                                     "label_a", "label_b" ]),
+  "u_imm"  : lambda: random.choice([ hex( random.randint(0,(1<<20)-1) ),
+                                     "%hi[label_a]", "%lo[label_b]" ]),
+  "j_imm"  : lambda: random.choice([ str( random.randint(-(1<<20),(1<<20)-1) & ~1 ),
+                                     "label_a", "label_b" ]),
+}
+
+def test_tinyrv2_encode_inst():
+
+  sym = { "label_a": 0xdeadbeef, "label_b": 0x00000400 }
+  field_tags = re.compile( r"\b({})\b".format( "|".join( gen_field_strs ) ) )
+
+  for row in tinyrv2_encoding_table:
+    for i in range(100):
+      inst_str = field_tags.sub( lambda m: gen_field_strs[ m.group(1) ](), row[0] )
+      pc       = random.randint(0,0xffff) & ~3
+      assert tinyrv2_isa_impl.encode_inst( sym, pc, inst_str ) \
+          == assemble_inst( sym, pc, inst_str ).uint(), inst_str
+
+#-------------------------------------------------------------------------
+# Assemble cache
+#-------------------------------------------------------------------------
+
+asm_code = """
+    csrr x1, mngr2proc < 5
+    lui  x2, 2
+  loop:
+    lw   x3, 0(x2)
+    add  x1, x1, x3
+    addi x2, x2, 4
+    bne  x3, x0, loop
+    csrw proc2mngr, x1 > 0x106
+  .data
+    .word 0x100
+    .hword 1
+    .byte 0
+    .byte 0
+    .word 0
+"""
+
+def test_tinyrv2_assemble_cache( tmpdir ):
+
+  ref = AssembleCache().assemble( [ asm_code ] )
+
+  assert ref.get_section(".text").data[:4] == struct.pack( "<I",
+    tinyrv2_isa_impl.encode_inst( {}, 0x200, "csrr x1, mngr2proc" ) )
+  assert ref.get_section(".data").data == mk_section( ".data", 0x2000,
+    [ 0x100, 0x00000001, 0 ] ).data
+  assert ref.get_section(".mngr2proc").data == struct.pack( "<I", 5 )
+  assert ref.get_section(".proc2mngr").data == struct.pack( "<I", 0x106 )
+
+  # In memory
+
+  cache = AssembleCache( str(tmpdir) )
+  assert cache.assemble( [ asm_code ] ) == ref
+  assert cache.num_misses == 1
+
+  mem_image = cache.assemble( [ asm_code ] )
+  assert mem_image == ref
+  assert cache.num_hits == 1
+
+  # Every call gets its own copy of the sections
+
+  mem_image.get_section(".text").data[0] ^= 1
+  assert cache.assemble( [ asm_code ] ) == ref
+
+  # On disk
+
+  cache = AssembleCache( str(tmpdir) )
+  assert cache.assemble( [ asm_code ] ) == ref
+  assert cache.num_disk_hits == 1
+  assert cache.num_misses    == 0
+
+  # Splitting the code differently is a different program as far as the
+  # cache is concerned, but assembles to the same thing
+
+  assert cache.assemble( asm_code.partition(".data") ) == ref
+  assert cache.num_misses == 1
+
+  # Broken cache entries are ignored
+
+  for path in tmpdir.listdir():
+    path.write( "garbage" )
+
+  cache = AssembleCache( str(tmpdir) )
+  assert cache.assemble( [ asm_code ] ) == ref
+  assert cache.num_misses == 1
+
+  # The LRU only keeps the most recent programs
+
+  cache = AssembleCache( max_entries=2 )
+  for i in range(3):
+    cache.assemble( [ asm_code, "addi x1, x1, {}".format(i) ] )
+  cache.assemble( [ asm_code, "addi x1, x1, 0" ] )
+  assert cache.num_misses == 4
+  assert assemble( asm_code ) == ref
+
+#-------------------------------------------------------------------------
+# disassemble
+#-------------------------------------------------------------------------
+
+def test_tinyrv2_disassemble():
+
+  mem_image = assemble( """
+    addi x1, x0, 1
+    bne  x1, x0, 0x8
+    csrw proc2mngr, x1
+  """ )
+
+  # Append an illegal instruction and add some symbols
+
+  mem_image.get_section(".text").data.extend( struct.pack( "<I", 0xffffffff ) )
+  mem_image.add_symbol( "_start", 0x200 )
+  mem_image.add_symbol( "loop",   0x204 )
+  mem_image.add_symbol( "data",   0x2000 )
+
+  assert list( disassemble( mem_image ) ) == [
+    "00000200 <_start>:",
+    " 00000200  00100093  addi   x01, x00, 0x001",
+    "00000204 <loop>:",
+    " 00000204  00009463  bne    x01, x00, 0x0008",
+    " 00000208  7c009073  csrw   0x7c0, x01",
+    " 0000020c  ffffffff  .word 0xffffffff",
+  ]
@@ -0,0 +1,281 @@
+#=========================================================================
+# tinyrv2_multicore_test.py
+#=========================================================================
+# Runs multicore programs on the functional multicore simulator with
+# different quanta, with and without skipping spin-waits, and runs the
+# FL instruction tests on a single core of it.
+
+import pytest
+
+from pymtl3 import *
+from proc.tinyrv2_encoding  import assemble
+from proc.tinyrv2_multicore import TinyRV2Multicore
+
+from .ProcFL_int_test import mk_asm_tests
+
+#-------------------------------------------------------------------------
+# run_multicore
+#-------------------------------------------------------------------------
+# Run the program until core 0 has sent all reference messages, checking
+# every message against the reference as we go.
+
+def run_multicore( mem_image, num_cores, max_insts=100000, **kwargs ):
+
+  mc = TinyRV2Multicore( num_cores, mem_nbytes=1<<20, **kwargs )
+  mc.load( mem_image )
+
+  while mc.proc2mngr_ref and mc.num_insts < max_insts and not mc.deadlock:
+    mc.run( max_insts - mc.num_insts )
+    while mc.proc2mngr_queue:
+      assert mc.proc2mngr_queue.popleft() == mc.proc2mngr_ref.popleft()
+
+  assert not mc.proc2mngr_ref
+  assert not mc.proc2mngr_queue
+  return mc
+
+#-------------------------------------------------------------------------
+# Programs
+#-------------------------------------------------------------------------
+# Every core stores coreid+1 to its own word, core 0 waits until it has
+# seen the words of all cores and sends their sum.
+
+shared_memory = """
+    csrr  x1, coreid
+    csrr  x2, numcores
+    lui   x5, 2
+    slli  x3, x1, 2
+    add   x3, x5, x3
+    addi  x4, x1, 1
+    sw    x4, 0(x3)
+    bne   x1, x0, worker
+
+    addi  x8, x0, 0
+    addi  x6, x0, 0
+  wait:
+    lw    x7, 0(x5)
+    beq   x7, x0, wait
+    add   x8, x8, x7
+    addi  x5, x5, 4
+    addi  x6, x6, 1
+    bne   x6, x2, wait
+    csrw  proc2mngr, x8 > {}
+  end:
+    jal   x0, end
+
+  worker:
+    csrw  proc2mngr, x1
+    jal   x0, worker
+"""
+
+# The bthread spawn/join protocol: core 0 sets the flag of every worker,
+# the workers wait for their flag, add their core id to a shared sum
+# with a lock-free handoff (worker i waits until the sum has seen worker
+# i-1), and clear their flag. Meanwhile core 0 does its own share of the
+# work (counting to 16384), then it waits until all flags are cleared.
+# We do this twice. Flags are at 0x2000, the sum at 0x2100.
+
+spawn_join = """
+    csrr  x1, coreid
+    csrr  x2, numcores
+    lui   x5, 2
+    slli  x3, x1, 2
+    add   x3, x5, x3
+    bne   x1, x0, worker
+
+    addi  x10, x0, 2
+  round:
+    addi  x6, x0, 1
+    addi  x4, x0, 1
+  spawn:
+    slli  x3, x6, 2
+    add   x3, x5, x3
+    sw    x4, 0(x3)
+    addi  x6, x6, 1
+    bne   x6, x2, spawn
+
+    addi  x12, x0, 0
+    lui   x13, 4
+  work:
+    addi  x12, x12, 1
+    bne   x12, x13, work
+
+    addi  x6, x0, 1
+  join:
+    slli  x3, x6, 2
+    add   x3, x5, x3
+  join_wait:
+    lw    x7, 0(x3)
+    bne   x7, x0, join_wait
+    addi  x6, x6, 1
+    bne   x6, x2, join
+
+    addi  x10, x10, -1
+    bne   x10, x0, round
+    lw    x8, 0x100(x5)
+    csrw  proc2mngr, x8 > {}
+  end:
+    jal   x0, end
+
+  worker:
+    lw    x7, 0(x3)
+    nop
+    nop
+    nop
+    beq   x7, x0, worker
+  handoff:
+    lw    x8, 0x104(x5)
+    addi  x9, x1, -1
+    bne   x8, x9, handoff_next
+    lw    x8, 0x100(x5)
+    add   x8, x8, x1
+    sw    x8, 0x100(x5)
+    sw    x1, 0x104(x5)
+    sw    x0, 0(x3)
+    jal   x0, worker
+  handoff_next:
+    lw    x8, 0x104(x5)
+    addi  x11, x2, -1
+    bne   x8, x11, handoff
+    sw    x0, 0x104(x5)
+    jal   x0, handoff
+"""
+
+def mk_spawn_join( num_cores ):
+  return spawn_join.format( 2 * sum( range( num_cores ) ) )
+
+#-------------------------------------------------------------------------
+# shared memory
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "num_cores", [ 1, 2, 4 ] )
+@pytest.mark.parametrize( "quantum",   [ 1, 7, 1000 ] )
+def test_shared_memory( num_cores, quantum ):
+  run_multicore( assemble( shared_memory.format(
+                   num_cores * ( num_cores + 1 ) // 2 ) ),
+                 num_cores, quantum=quantum )
+
+#-------------------------------------------------------------------------
+# spin-waits
+#-------------------------------------------------------------------------
+# Skipping spin-waits must not change the result, and has to save most
+# of the instructions of the waiting cores.
+
+@pytest.mark.parametrize( "num_cores", [ 2, 4 ] )
+@pytest.mark.parametrize( "quantum",   [ 3, 100, 1000 ] )
+def test_spawn_join( num_cores, quantum ):
+
+  mem_image = assemble( mk_spawn_join( num_cores ) )
+
+  mc_spin = run_multicore( mem_image, num_cores, max_insts=1000000,
+                           quantum=quantum, skip_spins=False )
+  assert mc_spin.num_spins == 0
+
+  mc = run_multicore( mem_image, num_cores, max_insts=1000000,
+                      quantum=quantum )
+  assert mc.num_spins > 0
+  assert mc.cores[0].num_insts == mc_spin.cores[0].num_insts
+
+  worker_insts      = sum( core.num_insts for core in mc.cores[1:] )
+  worker_spin_insts = sum( core.num_insts for core in mc_spin.cores[1:] )
+  assert worker_insts * 4 < worker_spin_insts
+
+# A core waiting on a word nobody writes is parked for good, and once
+# all cores are parked run returns.
+
+def test_deadlock():
+
+  mc = TinyRV2Multicore( 2, mem_nbytes=1<<20 )
+  mc.load( assemble( """
+    lui   x5, 2
+  wait:
+    lw    x7, 0(x5)
+    beq   x7, x0, wait
+    csrw  proc2mngr, x7 > 1
+  """ ) )
+
+  mc.run( 100000 )
+  assert mc.deadlock
+  assert not mc.proc2mngr_queue
+  assert mc.num_insts < 10000
+
+# Loops which do not get back to the same registers are not spinning
+
+def test_counting_loop():
+
+  mc = run_multicore( assemble( """
+    csrr  x1, coreid
+    bne   x1, x0, end
+    addi  x2, x0, 0
+    lui   x3, 1
+  loop:
+    addi  x2, x2, 1
+    bne   x2, x3, loop
+    csrw  proc2mngr, x2 > 0x1000
+  end:
+    jal   x0, end
+  """ ), 2, quantum=50 )
+
+  assert mc.cores[0].num_insts == 4 + 2*0x1000 + 1
+
+#-------------------------------------------------------------------------
+# code written by another core
+#-------------------------------------------------------------------------
+# Core 0 calls a function which returns 1, core 1 overwrites it to
+# return 2 and sets a flag, and core 0 calls it again. The store has to
+# invalidate the translated block of core 0. The program starts at 0x200,
+# so func is at 0x230.
+
+@pytest.mark.parametrize( "quantum", [ 5, 1000 ] )
+def test_cross_core_code( quantum ):
+
+  new_inst = assemble( "addi x10, x0, 2" ).get_section( ".text" ).data[:4]
+
+  run_multicore( assemble( """
+    csrr  x1, coreid
+    lui   x5, 2
+    bne   x1, x0, worker
+
+    jal   x1, func
+    csrw  proc2mngr, x10 > 1
+    addi  x4, x0, 1
+    sw    x4, 0(x5)
+  wait:
+    lw    x7, 4(x5)
+    beq   x7, x0, wait
+    jal   x1, func
+    csrw  proc2mngr, x10 > 2
+  end:
+    jal   x0, end
+
+  func:
+    addi  x10, x0, 1
+    jalr  x0, x1, 0
+
+  worker:
+    lw    x7, 0(x5)
+    beq   x7, x0, worker
+    lui   x6, {upper}
+    addi  x6, x6, {lower}
+    sw    x6, 0x230(x0)
+    sw    x7, 4(x5)
+  done:
+    jal   x0, done
+  """.format( **split_imm( int.from_bytes( new_inst, "little" ) ) ) ), 2,
+  quantum=quantum )
+
+# Split a 32-bit value into the lui and addi immediates
+
+def split_imm( value ):
+  lower = value & 0xFFF
+  if lower >= 0x800:
+    lower -= 0x1000
+  return { "upper": ( ( value - lower ) >> 12 ) & 0xFFFFF, "lower": lower }
+
+#-------------------------------------------------------------------------
+# all instruction tests on one core
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "name,test", [ ( name, test )
+  for name, test in mk_asm_tests() if not name.startswith("xcel") ] )
+def test_single_core( name, test ):
+  run_multicore( assemble( test() ), 1, quantum=13 )
@@ -0,0 +1,113 @@
+#=========================================================================
+# tinyrv2_semantics_test.py
+#=========================================================================
+# Runs all of the FL instruction tests on the standalone instruction set
+# simulator, both with translated blocks and one instruction at a time,
+# and checks the final register file against the FL processor.
+
+import pytest
+
+from pymtl3 import *
+from proc.tinyrv2_encoding  import assemble
+from proc.tinyrv2_semantics import TinyRV2Semantics
+
+from .harness         import asm_test
+from .ProcFL_int_test import mk_asm_tests, get_commits
+from . import inst_lw, inst_sh, inst_bge, inst_jalr
+from . import inst_mul_mem, inst_self_mod
+
+#-------------------------------------------------------------------------
+# NullXcel
+#-------------------------------------------------------------------------
+# Accelerator registers without an accelerator behind them, just like
+# the null accelerator.
+
+class NullXcel:
+
+  def __init__( s ):
+    s.xr = [0]*32
+
+  def read( s, addr ):
+    return s.xr[addr]
+
+  def write( s, addr, value ):
+    s.xr[addr] = value
+
+#-------------------------------------------------------------------------
+# run_iss
+#-------------------------------------------------------------------------
+# Run the program to completion, checking every proc2mngr message against
+# the reference as we go. With step=True we call run with a single
+# instruction at a time, so we never execute a translated block. We use
+# the same memory size as the test harness.
+
+def run_iss( mem_image, step=False, max_insts=10000 ):
+
+  iss = TinyRV2Semantics( mem_nbytes=1<<20, xcel=NullXcel() )
+  iss.load( mem_image )
+
+  while iss.proc2mngr_ref and iss.num_insts < max_insts:
+    iss.run( 1 if step else max_insts - iss.num_insts )
+    while iss.proc2mngr_queue:
+      assert iss.proc2mngr_queue.popleft() == iss.proc2mngr_ref.popleft()
+
+  assert not iss.proc2mngr_ref
+  assert not iss.proc2mngr_queue
+  return iss
+
+#-------------------------------------------------------------------------
+# all instruction tests
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "name,test", mk_asm_tests() )
+def test_iss( name, test ):
+  run_iss( assemble( test() ) )
+
+@pytest.mark.parametrize( "name,test", mk_asm_tests() )
+def test_iss_step( name, test ):
+  run_iss( assemble( test() ), step=True )
+
+#-------------------------------------------------------------------------
+# register file
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "name,test", [
+  asm_test( inst_lw.gen_random_test       ),
+  asm_test( inst_sh.gen_random_test       ),
+  asm_test( inst_bge.gen_random_test      ),
+  asm_test( inst_jalr.gen_value_test_3    ),
+  asm_test( inst_mul_mem.gen_more_test    ),
+  asm_test( inst_self_mod.gen_basic_test  ),
+])
+def test_iss_regs( name, test ):
+  mem_image = assemble( test() )
+  _, regs   = get_commits( "int", mem_image )
+  assert run_iss( mem_image ).R == regs
+
+#-------------------------------------------------------------------------
+# instruction counts
+#-------------------------------------------------------------------------
+# run should stop after exactly max_insts instructions (or right after a
+# csrw), no matter how the program was split into blocks.
+
+def test_iss_max_insts():
+
+  mem_image = assemble( inst_mul_mem.gen_more_test() )
+
+  ref = run_iss( mem_image, step=True )
+
+  iss = TinyRV2Semantics( mem_nbytes=1<<20 )
+  iss.load( mem_image )
+
+  for max_insts in [ 1, 3, 100, 7, 64, 65, 1000 ]:
+    num_insts = iss.num_insts
+    n = iss.run( max_insts )
+    assert n == iss.num_insts - num_insts
+    assert n == max_insts or iss.proc2mngr_queue
+
+  while iss.num_insts < ref.num_insts:
+    iss.run( ref.num_insts - iss.num_insts )
+
+  assert iss.num_insts == ref.num_insts
+  assert iss.PC == ref.PC
+  assert iss.R  == ref.R
@@ -0,0 +1,504 @@
+#=========================================================================
+# tinyrv2_batch
+#=========================================================================
+# Batched functional simulator which runs many TinyRV2 programs in
+# lockstep. Every lane has its own PC, register file, memory, accelerator
+# registers, and mngr2proc/proc2mngr streams, all kept in NumPy arrays
+# with one row per lane. Each step fetches and decodes one instruction
+# for every running lane, groups the lanes by the instruction they
+# execute, and executes every group with a handful of vectorized
+# operations, so the cost of a step grows with the number of different
+# instructions and not with the number of lanes.
+#
+# Just like the test harness, the .proc2mngr section of a program is the
+# list of reference messages, and every message a lane sends is checked
+# against it as soon as it is sent: a lane passes once it has sent all of
+# its reference messages, and fails on the first mismatch. Programs
+# without reference messages (e.g., benchmarks) can instead use a
+# Proc2MngrDecoder to decide when they are done. Every lane is an
+# independent single-core processor with the null accelerator.
+#
+# NumPy is optional for the rest of the simulators, so we only import it
+# here and complain when the batched simulator is constructed without it.
+
+import struct
+
+from collections import deque
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+from .SparseMemoryImage import SparseMemoryImage
+from .tinyrv2_encoding  import TinyRV2PredecodedIntInst
+
+#-------------------------------------------------------------------------
+# Vectorized instruction semantics
+#-------------------------------------------------------------------------
+# Register values, immediates, and PCs are all uint32 arrays, so
+# arithmetic wraps around just like in hardware. Immediates are kept in
+# two's complement, and we reinterpret them as int32 where the
+# instruction needs a signed value.
+
+def _s( x ):
+  return x.view( np.int32 )
+
+def _u( x ):
+  return x.astype( np.uint32 )
+
+rr_ops = {
+  "add"  : lambda a, b: a + b,
+  "sub"  : lambda a, b: a - b,
+  "sll"  : lambda a, b: a << ( b & 0x1F ),
+  "slt"  : lambda a, b: _u( _s(a) < _s(b) ),
+  "sltu" : lambda a, b: _u( a < b ),
+  "xor"  : lambda a, b: a ^ b,
+  "srl"  : lambda a, b: a >> ( b & 0x1F ),
+  "sra"  : lambda a, b: ( _s(a) >> _s( b & 0x1F ) ).view( np.uint32 ),
+  "or"   : lambda a, b: a | b,
+  "and"  : lambda a, b: a & b,
+  "mul"  : lambda a, b: a * b,
+}
+
+ri_ops = {
+  "addi"  : lambda a, imm: a + imm,
+  "slti"  : lambda a, imm: _u( _s(a) < _s(imm) ),
+  "sltiu" : lambda a, imm: _u( a < imm ),
+  "xori"  : lambda a, imm: a ^ imm,
+  "ori"   : lambda a, imm: a | imm,
+  "andi"  : lambda a, imm: a & imm,
+  "slli"  : lambda a, imm: a << imm,
+  "srli"  : lambda a, imm: a >> imm,
+  "srai"  : lambda a, imm: ( _s(a) >> _s(imm) ).view( np.uint32 ),
+}
+
+branch_ops = {
+  "beq"  : lambda a, b: a == b,
+  "bne"  : lambda a, b: a != b,
+  "blt"  : lambda a, b: _s(a) <  _s(b),
+  "bge"  : lambda a, b: _s(a) >= _s(b),
+  "bltu" : lambda a, b: a <  b,
+  "bgeu" : lambda a, b: a >= b,
+}
+
+# Number of bytes and NumPy type of the loaded value
+
+load_ops = {
+  "lw"  : ( 4, "<u4" ),
+  "lh"  : ( 2, "<i2" ),
+  "lhu" : ( 2, "<u2" ),
+  "lb"  : ( 1, "i1"  ),
+  "lbu" : ( 1, "u1"  ),
+}
+
+store_ops = {
+  "sw" : 4,
+  "sh" : 2,
+  "sb" : 1,
+}
+
+# Which immediate each instruction uses
+
+imm_fields = dict(
+  [ ( name, "i_imm" ) for name in ri_ops   ] +
+  [ ( name, "i_imm" ) for name in load_ops ] +
+  [ ( name, "s_imm" ) for name in store_ops ] +
+  [ ( name, "b_imm" ) for name in branch_ops ] +
+  [ ( name, "shamt" ) for name in ( "slli", "srli", "srai" ) ] +
+  [ ( "lui", "u_imm" ), ( "auipc", "u_imm" ),
+    ( "jal", "j_imm" ), ( "jalr",  "i_imm" ) ]
+)
+
+op_names = [ "illegal", "nop", "lui", "auipc", "jal", "jalr", "csrr", "csrw" ] \
+         + list( rr_ops ) + list( ri_ops ) + list( branch_ops ) \
+         + list( load_ops ) + list( store_ops )
+
+class TinyRV2Batch (object):
+
+  # Lane status
+
+  RUNNING = 0
+  PASSED  = 1
+  FAILED  = 2
+
+  #-----------------------------------------------------------------------
+  # Constructor
+  #-----------------------------------------------------------------------
+  # We use the same memory size per lane as the test harness by default.
+  # The memory of all lanes is allocated with np.zeros, so pages a lane
+  # never touches do not take up any physical memory.
+
+  def __init__( s, num_lanes, mem_nbytes=1<<20 ):
+
+    if np is None:
+      raise ImportError( "TinyRV2Batch needs NumPy" )
+
+    s.num_lanes  = num_lanes
+    s.mem_nbytes = mem_nbytes
+
+    s.PC = np.full ( num_lanes, 0x00000200, np.uint32 )
+    s.R  = np.zeros( ( num_lanes, 32 ), np.uint32 )
+    s.XR = np.zeros( ( num_lanes, 32 ), np.uint32 )
+    s.M  = np.zeros( ( num_lanes, mem_nbytes ), np.uint8 )
+
+    s.stats_en        = np.zeros( num_lanes, np.bool_ )
+    s.num_insts       = np.zeros( num_lanes, np.int64 )
+    s.num_stats_insts = np.zeros( num_lanes, np.int64 )
+
+    s.status = np.full( num_lanes, s.RUNNING, np.int8 )
+    s.errors = [ None ] * num_lanes
+
+    s.mngr2proc_queues   = [ deque() for _ in range( num_lanes ) ]
+    s.proc2mngr_queues   = [ []      for _ in range( num_lanes ) ]
+    s.proc2mngr_refs     = [ deque() for _ in range( num_lanes ) ]
+    s.proc2mngr_decoders = [ None    for _ in range( num_lanes ) ]
+
+    # Decoded instructions, shared by all lanes. We map every instruction
+    # word we have seen to a slot in the decode table, which has one
+    # array per field (op_names index, rd, rs1, rs2, immediate, and CSR
+    # number).
+
+    s.decode_slots  = {}
+    s.decode_fields = [ [] for _ in range(6) ]
+    s.decode_table  = None
+
+    s.op_ids = { name : i for i, name in enumerate( op_names ) }
+
+  #-----------------------------------------------------------------------
+  # load
+  #-----------------------------------------------------------------------
+  # Load a SparseMemoryImage into the given lane. If a Proc2MngrDecoder
+  # is given, the lane is done when the decoder says so instead of when
+  # it has sent all of its reference messages.
+
+  def load( s, lane, mem_image, proc2mngr_decoder=None ):
+
+    for section in mem_image.get_sections():
+
+      if section.name == ".mngr2proc":
+        for bits in struct.iter_unpack("<I", section.data):
+          s.mngr2proc_queues[lane].append( bits[0] )
+
+      elif section.name == ".proc2mngr":
+        for bits in struct.iter_unpack("<I", section.data):
+          s.proc2mngr_refs[lane].append( bits[0] )
+
+      elif isinstance( section.data, SparseMemoryImage.ZeroData ):
+        s.M[ lane, section.addr:section.addr+len(section.data) ] = 0
+
+      else:
+        start_addr = section.addr
+        stop_addr  = section.addr + len(section.data)
+        s.M[ lane, start_addr:stop_addr ] = \
+          np.frombuffer( section.data, np.uint8 )
+
+    s.proc2mngr_decoders[lane] = proc2mngr_decoder
+
+    if proc2mngr_decoder is None and not s.proc2mngr_refs[lane]:
+      s.status[lane] = s.PASSED
+
+  #-----------------------------------------------------------------------
+  # Lane status
+  #-----------------------------------------------------------------------
+
+  def passed( s ):
+    return s.status == s.PASSED
+
+  def fail( s, lanes, msg ):
+    for lane in lanes:
+      lane = int(lane)
+      if s.status[lane] == s.RUNNING:
+        s.status[lane] = s.FAILED
+        s.errors[lane] = msg.format( pc=int( s.PC[lane] ) )
+
+  #-----------------------------------------------------------------------
+  # decode
+  #-----------------------------------------------------------------------
+  # Return the decode table slots for the given instruction words. We
+  # only decode every distinct word once, and words which are not legal
+  # TinyRV2 instructions (including all-zero words) decode to "illegal".
+
+  def decode_slot( s, word ):
+
+    slot = s.decode_slots.get( word )
+    if slot is not None:
+      return slot
+
+    try:
+      inst = TinyRV2PredecodedIntInst( word )
+      name = inst.name
+    except AssertionError:
+      inst = None
+      name = "illegal"
+
+    if name not in s.op_ids:
+      name = "illegal"
+
+    imm = getattr( inst, imm_fields[name] ) if name in imm_fields else 0
+
+    fields = ( s.op_ids[name],
+               inst.rd  if inst else 0,
+               inst.rs1 if inst else 0,
+               inst.rs2 if inst else 0,
+               imm & 0xFFFFFFFF,
+               inst.csrnum if inst else 0 )
+
+    for column, value in zip( s.decode_fields, fields ):
+      column.append( value )
+
+    slot = len( s.decode_slots )
+    s.decode_slots[ word ] = slot
+    s.decode_table = None
+    return slot
+
+  def decode( s, words ):
+
+    uniq, inverse = np.unique( words, return_inverse=True )
+    slots = np.array( [ s.decode_slot( int(word) ) for word in uniq ],
+                      np.intp )
+
+    if s.decode_table is None:
+      s.decode_table = [ np.array( column, np.uint32 )
+                         for column in s.decode_fields ]
+
+    return slots[ inverse ]
+
+  #-----------------------------------------------------------------------
+  # Memory helpers
+  #-----------------------------------------------------------------------
+  # Both return the mask of lanes whose access is in bounds, and the
+  # out-of-bounds lanes fail.
+
+  def mem_check( s, lanes, addr, nbytes ):
+    ok = addr <= s.mem_nbytes - nbytes
+    if not ok.all():
+      s.fail( lanes[~ok], "Memory access out of bounds at PC={pc:0>8x}" )
+    return ok
+
+  def mem_read( s, lanes, addr, nbytes, dtype ):
+    offsets = addr.astype( np.intp )[:,None] + np.arange( nbytes )
+    data = np.ascontiguousarray( s.M[ lanes[:,None], offsets ] )
+    return data.view( dtype )[:,0].astype( np.int32 ).view( np.uint32 )
+
+  def mem_write( s, lanes, addr, nbytes, data ):
+    offsets = addr.astype( np.intp )[:,None] + np.arange( nbytes )
+    data = data.astype( "<u4" ).view( np.uint8 ).reshape( -1, 4 )
+    s.M[ lanes[:,None], offsets ] = data[:,:nbytes]
+
+  #-----------------------------------------------------------------------
+  # CSR instructions
+  #-----------------------------------------------------------------------
+  # These are rare enough that we just loop over the lanes. Returns the
+  # mask of lanes which executed the instruction without failing.
+
+  def execute_csrr( s, lanes, rd, csrnum ):
+
+    ok = np.ones( len(lanes), np.bool_ )
+    for i, ( lane, csr ) in enumerate( zip( lanes.tolist(), csrnum.tolist() ) ):
+
+      if csr == 0xFC0:
+        if not s.mngr2proc_queues[lane]:
+          s.fail( [lane], "Read from empty mngr2proc at PC={pc:0>8x}" )
+          ok[i] = False
+          continue
+        value = s.mngr2proc_queues[lane].popleft()
+
+      elif csr == 0xFC1:
+        value = 1
+
+      elif csr == 0xF14:
+        value = 0
+
+      elif 0x7E0 <= csr <= 0x7FF:
+        value = int( s.XR[ lane, csr & 0x1F ] )
+
+      else:
+        s.fail( [lane], "Unrecognized CSR register ({}) for csrr at "
+                        "PC={{pc:0>8x}}".format( csr ) )
+        ok[i] = False
+        continue
+
+      s.R[ lane, rd[i] ] = value
+
+    return ok
+
+  def execute_csrw( s, lanes, rs1, csrnum ):
+
+    ok = np.ones( len(lanes), np.bool_ )
+    for i, ( lane, csr ) in enumerate( zip( lanes.tolist(), csrnum.tolist() ) ):
+
+      value = int( s.R[ lane, rs1[i] ] )
+
+      if csr == 0x7C0:
+        s.proc2mngr_queues[lane].append( value )
+        ok[i] = s.check_proc2mngr( lane, value )
+
+      elif csr == 0x7C1:
+        s.stats_en[lane] = bool( value )
+
+      elif 0x7E0 <= csr <= 0x7FF:
+        s.XR[ lane, csr & 0x1F ] = value
+
+      else:
+        s.fail( [lane], "Unrecognized CSR register ({}) for csrw at "
+                        "PC={{pc:0>8x}}".format( csr ) )
+        ok[i] = False
+
+    return ok
+
+  # Check a message the lane just sent, and mark the lane as passed or
+  # failed if it is done. Returns False if the lane failed.
+
+  def check_proc2mngr( s, lane, value ):
+
+    decoder = s.proc2mngr_decoders[lane]
+    if decoder is not None:
+      status = decoder( value )
+      if status is None:
+        return True
+      if status == 0:
+        s.status[lane] = s.PASSED
+        return True
+      s.fail( [lane], "Program failed with status {} at PC={{pc:0>8x}}" \
+                        .format( status ) )
+      return False
+
+    ref = s.proc2mngr_refs[lane]
+    if not ref:
+      s.fail( [lane], "Unexpected proc2mngr message {:#010x} at "
+                      "PC={{pc:0>8x}}".format( value ) )
+      return False
+
+    ref_value = ref.popleft()
+    if value != ref_value:
+      s.fail( [lane], "proc2mngr message {:#010x} != reference {:#010x} at "
+                      "PC={{pc:0>8x}}".format( value, ref_value ) )
+      return False
+
+    if not ref:
+      s.status[lane] = s.PASSED
+
+    return True
+
+  #-----------------------------------------------------------------------
+  # step
+  #-----------------------------------------------------------------------
+  # Execute one instruction in each of the given (running) lanes.
+
+  def step( s, lanes ):
+
+    pc = s.PC[ lanes ]
+    R  = s.R
+
+    # Fetch and decode
+
+    ok = s.mem_check( lanes, pc, 4 )
+    if not ok.all():
+      lanes, pc = lanes[ok], pc[ok]
+
+    words = s.mem_read( lanes, pc, 4, "<u4" )
+    slots = s.decode( words )
+
+    op, rd_all, rs1_all, rs2_all, imm_all, csr_all = \
+      [ column[ slots ] for column in s.decode_table ]
+
+    next_pc = pc + np.uint32(4)
+    done    = np.ones( len(lanes), np.bool_ )
+
+    # Execute each group of lanes running the same instruction
+
+    for op_id in np.unique( op ).tolist():
+
+      name = op_names[ op_id ]
+      sel  = np.flatnonzero( op == op_id )
+      ls   = lanes[ sel ]
+      rd   = rd_all[ sel ]
+      a    = R[ ls, rs1_all[ sel ] ]
+      b    = R[ ls, rs2_all[ sel ] ]
+      imm  = imm_all[ sel ]
+
+      if name in rr_ops:
+        R[ ls, rd ] = rr_ops[ name ]( a, b )
+
+      elif name in ri_ops:
+        R[ ls, rd ] = ri_ops[ name ]( a, imm )
+
+      elif name in branch_ops:
+        taken = branch_ops[ name ]( a, b )
+        next_pc[ sel ] = np.where( taken, pc[ sel ] + imm, next_pc[ sel ] )
+
+      elif name in load_ops:
+        nbytes, dtype = load_ops[ name ]
+        addr = a + imm
+        ok   = s.mem_check( ls, addr, nbytes )
+        done[ sel[~ok] ] = False
+        R[ ls[ok], rd[ok] ] = s.mem_read( ls[ok], addr[ok], nbytes, dtype )
+
+      elif name in store_ops:
+        nbytes = store_ops[ name ]
+        addr = a + imm
+        ok   = s.mem_check( ls, addr, nbytes )
+        done[ sel[~ok] ] = False
+        s.mem_write( ls[ok], addr[ok], nbytes, b[ok] )
+
+      elif name == "lui":
+        R[ ls, rd ] = imm
+
+      elif name == "auipc":
+        R[ ls, rd ] = pc[ sel ] + imm
+
+      elif name == "jal":
+        R[ ls, rd ] = next_pc[ sel ]
+        next_pc[ sel ] = pc[ sel ] + imm
+
+      elif name == "jalr":
+        R[ ls, rd ] = next_pc[ sel ]
+        next_pc[ sel ] = ( a + imm ) & np.uint32( 0xFFFFFFFE )
+
+      elif name == "csrr":
+        done[ sel ] = s.execute_csrr( ls, rd, csr_all[ sel ] )
+
+      elif name == "csrw":
+        done[ sel ] = s.execute_csrw( ls, rs1_all[ sel ], csr_all[ sel ] )
+
+      elif name == "illegal":
+        s.fail( ls, "Illegal instruction at PC={pc:0>8x}" )
+        done[ sel ] = False
+
+    R[ :, 0 ] = 0
+
+    # Only lanes which executed their instruction move on (a lane which
+    # passed with its last csrw still counts the csrw)
+
+    lanes = lanes[ done ]
+    s.PC[ lanes ] = next_pc[ done ]
+    s.num_insts[ lanes ] += 1
+    s.num_stats_insts[ lanes[ s.stats_en[ lanes ] ] ] += 1
+
+  #-----------------------------------------------------------------------
+  # run
+  #-----------------------------------------------------------------------
+  # Step all running lanes until every lane has passed or failed. Lanes
+  # which execute more than max_insts instructions fail. Returns the mask
+  # of lanes which passed.
+
+  def run( s, max_insts=10000 ):
+
+    while True:
+
+      lanes = np.flatnonzero( s.status == s.RUNNING )
+      if not lanes.size:
+        break
+
+      timeout = s.num_insts[ lanes ] >= max_insts
+      if timeout.any():
+        s.fail( lanes[ timeout ],
+                "Exceeded {} instructions at PC={{pc:0>8x}}".format( max_insts ) )
+        lanes = lanes[ ~timeout ]
+        if not lanes.size:
+          break
+
+      s.step( lanes )
+
+    return s.passed()
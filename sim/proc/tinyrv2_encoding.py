@@ -12,9 +12,17 @@
 # Author : Christopher Batten, Shunning Jiang
 # Date   : Aug 27, 2016
 
+import functools
+import hashlib
+import os
+import re
 import struct
+import sys
+
+from collections import OrderedDict
 
 from pymtl3            import *
+from .DiskCache         import sources_hash, write_entry
 from .SparseMemoryImage import SparseMemoryImage
 
 #=========================================================================
@@ -179,6 +187,31 @@ tinyrv2_field_slice_j_imm1 = slice( 20, 21 )
 tinyrv2_field_slice_j_imm2 = slice( 12, 20 )
 tinyrv2_field_slice_j_imm3 = slice( 31, 32 )
 
+#-------------------------------------------------------------------------
+# Field encoders
+#-------------------------------------------------------------------------
+# Each assemble_field function below has an encode_field counterpart
+# which takes the same arguments but returns the field as an int already
+# shifted into place instead of setting a slice of a Bits object. The
+# assembler ORs these together, which is much faster than building Bits
+# for every field. Just like slicing into Bits, values are truncated to
+# the width of the field.
+
+def encode_slice( value, field_slice ):
+  nbits = field_slice.stop - field_slice.start
+  return ( value & ( ( 1 << nbits ) - 1 ) ) << field_slice.start
+
+def encode_reg( field_str ):
+
+  # Register specifiers must begin with an "x"
+  assert field_str[0] == "x"
+
+  # Register specifier must be between 0 and 31
+  reg_specifier = int(field_str.lstrip("x"))
+  assert 0 <= reg_specifier <= 31
+
+  return reg_specifier
+
 #-------------------------------------------------------------------------
 # rs1 assembly/disassembly functions
 #-------------------------------------------------------------------------
@@ -198,6 +231,9 @@ def assemble_field_rs1( bits, sym, pc, field_str ):
 
   bits[ tinyrv2_field_slice_rs1 ] = reg_specifier
 
+def encode_field_rs1( sym, pc, field_str ):
+  return encode_reg( field_str ) << tinyrv2_field_slice_rs1.start
+
 def disassemble_field_rs1( bits ):
   return "x{:0>2}".format( bits[ tinyrv2_field_slice_rs1 ].uint() )
 
@@ -216,6 +252,9 @@ def assemble_field_rs2( bits, sym, pc, field_str ):
 
   bits[ tinyrv2_field_slice_rs2 ] = reg_specifier
 
+def encode_field_rs2( sym, pc, field_str ):
+  return encode_reg( field_str ) << tinyrv2_field_slice_rs2.start
+
 def disassemble_field_rs2( bits ):
   return "x{:0>2}".format( bits[ tinyrv2_field_slice_rs2 ].uint() )
 
@@ -230,6 +269,13 @@ def assemble_field_shamt( bits, sym, pc, field_str ):
 
   bits[ tinyrv2_field_slice_shamt ] = shamt
 
+def encode_field_shamt( sym, pc, field_str ):
+
+  shamt = int(field_str,0)
+  assert 0 <= shamt <= 31
+
+  return shamt << tinyrv2_field_slice_shamt.start
+
 def disassemble_field_shamt( bits ):
   return "{:0>2x}".format( bits[ tinyrv2_field_slice_shamt ].uint() )
 
@@ -248,6 +294,9 @@ def assemble_field_rd( bits, sym, pc, field_str ):
 
   bits[ tinyrv2_field_slice_rd ] = reg_specifier
 
+def encode_field_rd( sym, pc, field_str ):
+  return encode_reg( field_str ) << tinyrv2_field_slice_rd.start
+
 def disassemble_field_rd( bits ):
   return "x{:0>2}".format( bits[ tinyrv2_field_slice_rd ].uint() )
 
@@ -261,6 +310,9 @@ def assemble_field_funct7( bits, sym, pc, field_str ):
 
   bits[ tinyrv2_field_slice_funct7 ] = funct7
 
+def encode_field_funct7( sym, pc, field_str ):
+  return encode_slice( int(field_str), tinyrv2_field_slice_funct7 )
+
 def disassemble_field_funct7( bits ):
   return "{:0>2}".format( bits[ tinyrv2_field_slice_funct7 ].uint() )
 
@@ -286,9 +338,40 @@ def assemble_field_i_imm( bits, sym, pc, field_str ):
 
   bits[ tinyrv2_field_slice_i_imm ] = imm
 
+def encode_field_i_imm( sym, pc, field_str ):
+
+  # Check to see if the immediate field derives from a label
+  if field_str[0] == "%":
+    label_addr = sym[ field_str[4:-1] ]
+    if field_str.startswith( "%hi[" ):
+      imm = label_addr >> 20
+    elif field_str.startswith( "%md[" ):
+      imm = label_addr >> 13
+    elif field_str.startswith( "%lo[" ):
+      imm = label_addr
+    else:
+      assert False
+    imm &= 0xFFF
+  else:
+    imm = int(field_str,0)
+
+  assert imm < (1 << 12)
+
+  return encode_slice( imm, tinyrv2_field_slice_i_imm )
+
 def disassemble_field_i_imm( bits ):
   return "0x{:0>3x}".format( bits[ tinyrv2_field_slice_i_imm ].uint() )
 
+# CSR names we accept in assembly
+
+csr_numbers = {
+  "mngr2proc" : 0xFC0,
+  "proc2mngr" : 0x7C0,
+  "numcores"  : 0xFC1,
+  "coreid"    : 0xF14,
+  "stats_en"  : 0x7C1,
+}
+
 def assemble_field_csrnum( bits, sym, pc, field_str ):
 
   # assert (field_str == "proc2mngr") or (field_str == "mngr2proc") \
@@ -310,6 +393,14 @@ def assemble_field_csrnum( bits, sym, pc, field_str ):
 
   bits[ tinyrv2_field_slice_csrnum ] = imm
 
+def encode_field_csrnum( sym, pc, field_str ):
+
+  imm = csr_numbers.get( field_str )
+  if imm is None:
+    imm = int(field_str,0)
+
+  return encode_slice( imm, tinyrv2_field_slice_csrnum )
+
 def disassemble_field_csrnum( bits ):
   return "0x{:0>3x}".format( bits[ tinyrv2_field_slice_csrnum ].uint() )
 
@@ -324,6 +415,13 @@ def assemble_field_s_imm( bits, sym, pc, field_str ):
   bits[ tinyrv2_field_slice_s_imm0 ] = imm[0:5 ]
   bits[ tinyrv2_field_slice_s_imm1 ] = imm[5:12]
 
+def encode_field_s_imm( sym, pc, field_str ):
+
+  imm = int(field_str,0)
+
+  return encode_slice( imm,      tinyrv2_field_slice_s_imm0 ) \
+       | encode_slice( imm >> 5, tinyrv2_field_slice_s_imm1 )
+
 def disassemble_field_s_imm( bits ):
   imm = Bits( 12, 0 )
   imm[0:5]  = bits[ tinyrv2_field_slice_s_imm0 ]
@@ -351,6 +449,18 @@ def assemble_field_b_imm( bits, sym, pc, field_str ):
   bits[ tinyrv2_field_slice_b_imm2 ] = imm[11:12]
   bits[ tinyrv2_field_slice_b_imm3 ] = imm[12:13]
 
+def encode_field_b_imm( sym, pc, field_str ):
+
+  if field_str in sym:
+    btarg_byte_addr = sym[field_str] - pc
+  else:
+    btarg_byte_addr = int(field_str,0)
+
+  return encode_slice( btarg_byte_addr >> 1,  tinyrv2_field_slice_b_imm0 ) \
+       | encode_slice( btarg_byte_addr >> 5,  tinyrv2_field_slice_b_imm1 ) \
+       | encode_slice( btarg_byte_addr >> 11, tinyrv2_field_slice_b_imm2 ) \
+       | encode_slice( btarg_byte_addr >> 12, tinyrv2_field_slice_b_imm3 )
+
 def disassemble_field_b_imm( bits ):
 
   imm = Bits( 13, 0 )
@@ -382,6 +492,23 @@ def assemble_field_u_imm( bits, sym, pc, field_str ):
   assert int(imm) < (1 << 20)
   bits[ tinyrv2_field_slice_u_imm ] = imm
 
+def encode_field_u_imm( sym, pc, field_str ):
+
+  # Check to see if the immediate field derives from a label
+  if field_str[0] == "%":
+    label_addr = sym[ field_str[4:-1] ]
+    if field_str.startswith( "%hi[" ):
+      imm = ( label_addr >> 12 ) & 0xFFFFF
+    elif field_str.startswith( "%lo[" ):
+      imm = label_addr & 0xFFF
+    else:
+      assert False
+  else:
+    imm = int(field_str,0)
+
+  assert imm < (1 << 20)
+  return encode_slice( imm, tinyrv2_field_slice_u_imm )
+
 def disassemble_field_u_imm( bits ):
   return "0x{:0>5x}".format( bits[ tinyrv2_field_slice_u_imm ].uint() )
 
@@ -405,6 +532,18 @@ def assemble_field_j_imm( bits, sym, pc, field_str ):
   bits[ tinyrv2_field_slice_j_imm2 ] = imm[12:20]
   bits[ tinyrv2_field_slice_j_imm3 ] = imm[20:21]
 
+def encode_field_j_imm( sym, pc, field_str ):
+
+  if field_str in sym:
+    jtarg_byte_addr = sym[field_str] - pc
+  else:
+    jtarg_byte_addr = int(field_str,0)
+
+  return encode_slice( jtarg_byte_addr >> 1,  tinyrv2_field_slice_j_imm0 ) \
+       | encode_slice( jtarg_byte_addr >> 11, tinyrv2_field_slice_j_imm1 ) \
+       | encode_slice( jtarg_byte_addr >> 12, tinyrv2_field_slice_j_imm2 ) \
+       | encode_slice( jtarg_byte_addr >> 20, tinyrv2_field_slice_j_imm3 )
+
 def disassemble_field_j_imm( bits ):
   imm = Bits( 21, 0 )
   imm[1:11]  = bits[ tinyrv2_field_slice_j_imm0 ]
@@ -416,23 +555,24 @@ def disassemble_field_j_imm( bits ):
 #-------------------------------------------------------------------------
 # Field Dictionary
 #-------------------------------------------------------------------------
-# Create a dictionary so we can lookup an assemble field function
-# based on the field tag. I imagine we can eventually use some kind of
-# Python magic to eliminate this boiler plate code.
+# Create a dictionary so we can lookup the assemble, disassemble, and
+# encode field functions based on the field tag. I imagine we can
+# eventually use some kind of Python magic to eliminate this boiler plate
+# code.
 
 tinyrv2_fields = \
 {
-  "rs1"    : [ assemble_field_rs1,    disassemble_field_rs1    ],
-  "rs2"    : [ assemble_field_rs2,    disassemble_field_rs2    ],
-  "shamt"  : [ assemble_field_shamt,  disassemble_field_shamt  ],
-  "rd"     : [ assemble_field_rd,     disassemble_field_rd     ],
-  "funct7" : [ assemble_field_funct7, disassemble_field_funct7 ],
-  "i_imm"  : [ assemble_field_i_imm,  disassemble_field_i_imm  ],
-  "csrnum" : [ assemble_field_csrnum, disassemble_field_csrnum ],
-  "s_imm"  : [ assemble_field_s_imm,  disassemble_field_s_imm  ],
-  "b_imm"  : [ assemble_field_b_imm,  disassemble_field_b_imm  ],
-  "u_imm"  : [ assemble_field_u_imm,  disassemble_field_u_imm  ],
-  "j_imm"  : [ assemble_field_j_imm,  disassemble_field_j_imm  ],
+  "rs1"    : [ assemble_field_rs1,    disassemble_field_rs1,    encode_field_rs1    ],
+  "rs2"    : [ assemble_field_rs2,    disassemble_field_rs2,    encode_field_rs2    ],
+  "shamt"  : [ assemble_field_shamt,  disassemble_field_shamt,  encode_field_shamt  ],
+  "rd"     : [ assemble_field_rd,     disassemble_field_rd,     encode_field_rd     ],
+  "funct7" : [ assemble_field_funct7, disassemble_field_funct7, encode_field_funct7 ],
+  "i_imm"  : [ assemble_field_i_imm,  disassemble_field_i_imm,  encode_field_i_imm  ],
+  "csrnum" : [ assemble_field_csrnum, disassemble_field_csrnum, encode_field_csrnum ],
+  "s_imm"  : [ assemble_field_s_imm,  disassemble_field_s_imm,  encode_field_s_imm  ],
+  "b_imm"  : [ assemble_field_b_imm,  disassemble_field_b_imm,  encode_field_b_imm  ],
+  "u_imm"  : [ assemble_field_u_imm,  disassemble_field_u_imm,  encode_field_u_imm  ],
+  "j_imm"  : [ assemble_field_j_imm,  disassemble_field_j_imm,  encode_field_j_imm  ],
 }
 
 #=========================================================================
@@ -443,6 +583,11 @@ tinyrv2_fields = \
 # assembly/disassembly functions. I am not sure if we still want to
 # refactor this here, but it is good enough for now.
 
+# Translation table which turns the non-whitespace delimiters in
+# instruction templates and assembly into whitespace so we can use split
+
+asm_field_delims = str.maketrans(",()","   ")
+
 class IsaImpl (object):
 
   #-----------------------------------------------------------------------
@@ -456,8 +601,13 @@ class IsaImpl (object):
     self.asm_field_funcs_dict    = {}
     self.disasm_field_funcs_dict = {}
     self.opcode_match_dict       = {}
+    self.encoders_dict           = {}
+    self.disasm_fmts_dict        = {}
 
     self.disasm_field_funcs_dict[''] = {} # this is for all-zero case
+    self.disasm_fmts_dict['']        = ( "", () )
+
+    field_tags = re.compile( r"\b({})\b".format( "|".join( inst_fields ) ) )
 
     for row in inst_encoding_table:
 
@@ -480,8 +630,7 @@ class IsaImpl (object):
       # translate non-whitespace deliminters into whitespace so that we
       # can use split.
 
-      translation_table = str.maketrans(",()","   ")
-      inst_field_tags = str.translate(inst_tmpl,translation_table).split()
+      inst_field_tags = str.translate(inst_tmpl,asm_field_delims).split()
 
       # Create the list of asm field functions
 
@@ -503,15 +652,150 @@ class IsaImpl (object):
 
       self.disasm_field_funcs_dict[ inst_name ] = disasm_field_funcs
 
+      # Precompile the encoder for this instruction: the opcode match
+      # and the encode field functions for each field in order
+
+      self.encoders_dict[ inst_name ] = ( opcode_match,
+        tuple( inst_fields[asm_field_tag][2]
+               for asm_field_tag in inst_field_tags ) )
+
+      # Precompile the disassembly format string for this instruction,
+      # which is the template with a {} in place of each field tag, and
+      # the disasm field functions for each field in order
+
+      self.disasm_fmts_dict[ inst_name ] = (
+        field_tags.sub( "{}", row[0] ),
+        tuple( inst_fields[asm_field_tag][1]
+               for asm_field_tag in inst_field_tags ) )
+
+    # Build the decode tree from the opcode mask/match columns
+
+    self.decode_tree = self.mk_decode_tree( inst_encoding_table )
+
+    # Memoize disassembly by instruction word, since line traces
+    # disassemble the same few instructions over and over again
+
+    self.disassemble_word = \
+      functools.lru_cache( maxsize=4096 )( self.disassemble_word_uncached )
+
+  #-----------------------------------------------------------------------
+  # mk_decode_tree
+  #-----------------------------------------------------------------------
+  # Turn the encoding table into a two-level decode tree. The first level
+  # is indexed by the opcode field. For each opcode we figure out which of
+  # the funct3/funct7 bits any row with that opcode actually cares about,
+  # and the second level is indexed by the instruction bits under this
+  # key mask. Each leaf is a short list of candidate rows in table order.
+  # A row only ends up in a leaf if its mask/match agrees with the key,
+  # so for most instructions there is exactly one candidate. We still
+  # check the full mask/match for each candidate, which is what handles
+  # special patterns like nop (a specific addi) or csrr/csrw (which also
+  # constrain the rs1/rd fields). Since candidates stay in table order
+  # the result is always identical to the linear scan.
+
+  decode_key_mask = 0b11111110000000000111000001111111 # funct7|funct3|opcode
+
+  def mk_decode_tree( self, inst_encoding_table ):
+
+    opcode_mask = 0b1111111
+
+    # Group the rows by opcode
+
+    opcode_rows = {}
+    for row in inst_encoding_table:
+      assert row[1] & opcode_mask == opcode_mask
+      opcode_rows.setdefault( row[2] & opcode_mask, [] ).append( row )
+
+    decode_tree = {}
+
+    for opcode, rows in opcode_rows.items():
+
+      # Union of all the funct3/funct7 bits this opcode looks at
+
+      key_mask = opcode_mask
+      for row in rows:
+        key_mask |= row[1] & self.decode_key_mask
+
+      # Enumerate every possible value of the key bits (at most 2^10)
+
+      key_bits = [ i for i in range(self.nbits) if key_mask & (1 << i) ]
+      key_bits = [ i for i in key_bits if not opcode_mask & (1 << i) ]
+
+      leaves = {}
+      for n in range( 1 << len(key_bits) ):
+
+        key = opcode
+        for j, i in enumerate( key_bits ):
+          if n & (1 << j):
+            key |= 1 << i
+
+        candidates = []
+        for row in rows:
+          row_key_mask = row[1] & key_mask
+          if key & row_key_mask == row[2] & row_key_mask:
+            inst_tmpl = row[0]
+            inst_name = inst_tmpl.partition(' ')[0]
+            candidates.append( ( row[1], row[2], inst_tmpl, inst_name ) )
+
+        if candidates:
+          leaves[ key ] = tuple( candidates )
+
+      decode_tree[ opcode ] = ( key_mask, leaves )
+
+    return decode_tree
+
+  #-----------------------------------------------------------------------
+  # decode_row
+  #-----------------------------------------------------------------------
+  # Walk the decode tree and return the matching (mask, match, template,
+  # name) candidate, or None if this is an illegal instruction.
+
+  def decode_row( self, inst_bits ):
+
+    inst_bits = int( inst_bits )
+
+    node = self.decode_tree.get( inst_bits & 0b1111111 )
+    if node is None:
+      return None
+
+    candidates = node[1].get( inst_bits & node[0] )
+    if candidates is None:
+      return None
+
+    for candidate in candidates:
+      if inst_bits & candidate[0] == candidate[1]:
+        return candidate
+
+    return None
+
   #-----------------------------------------------------------------------
   # decode_tmpl
   #-----------------------------------------------------------------------
-  # For now this is O(n) where n is the number of instructions in the
-  # encoding table. Obviously, this is pretty slow. I am sure we can do
-  # better by creating some kind of tree-based data structure.
+  # Uses the decode tree so this is O(1) in the number of instructions in
+  # the encoding table.
 
   def decode_tmpl( self, inst_bits ):
 
+    if inst_bits == 0: # hacky
+      return ""
+
+    candidate = self.decode_row( inst_bits )
+    if candidate is not None:
+      return candidate[2]
+
+    # Illegal instruction
+
+    raise AssertionError( "Illegal instruction {}!".format( inst_bits ) )
+
+  #-----------------------------------------------------------------------
+  # decode_tmpl_linear
+  #-----------------------------------------------------------------------
+  # The original O(n) decoder where n is the number of instructions in
+  # the encoding table. We keep it around as the reference for testing
+  # the decode tree and as the baseline for decode-bench.
+
+  def decode_tmpl_linear( self, inst_bits ):
+
     if inst_bits == 0: # hacky
       return ""
 
@@ -538,13 +822,16 @@ class IsaImpl (object):
 
   def decode_inst_name( self, inst_bits ):
 
-    # Decode template
+    if inst_bits == 0: # hacky
+      return ""
 
-    inst_tmpl = self.decode_tmpl( inst_bits )
+    candidate = self.decode_row( inst_bits )
+    if candidate is not None:
+      return candidate[3]
 
-    # Extract instruction name
+    # Illegal instruction
 
-    return inst_tmpl.partition(' ')[0]
+    raise AssertionError( "Illegal instruction {}!".format( inst_bits ) )
 
   #-----------------------------------------------------------------------
   # assemble_inst
@@ -565,8 +852,7 @@ class IsaImpl (object):
     # we translate non-whitespace deliminters into whitespace so that
     # we can use split.
 
-    translation_table = str.maketrans(",()","   ")
-    asm_field_strs = str.translate(inst_str,translation_table).split()
+    asm_field_strs = str.translate(inst_str,asm_field_delims).split()
 
     # Retrieve the list of asm field functions for this instruction
 
@@ -581,11 +867,57 @@ class IsaImpl (object):
 
     return inst_bits
 
+  #-----------------------------------------------------------------------
+  # encode_inst
+  #-----------------------------------------------------------------------
+  # Same as assemble_inst, but returns the instruction as an int and uses
+  # the precompiled encoder for the instruction, so we never build Bits.
+
+  def encode_inst( self, sym, pc, inst_str ):
+
+    (inst_name,sep,inst_str) = inst_str.partition(' ')
+
+    inst_bits, encode_field_funcs = self.encoders_dict[ inst_name ]
+
+    asm_field_strs = str.translate(inst_str,asm_field_delims).split()
+
+    for asm_field_str, encode_field_func in zip( asm_field_strs, encode_field_funcs ):
+      inst_bits |= encode_field_func( sym, pc, asm_field_str )
+
+    return inst_bits
+
   #-----------------------------------------------------------------------
   # disassemble_inst
   #-----------------------------------------------------------------------
+  # Takes the instruction as Bits or an int. The work is done by
+  # disassemble_word, which is memoized (see the constructor).
 
   def disassemble_inst( self, inst_bits ):
+    return self.disassemble_word( int( inst_bits ) )
+
+  def disassemble_word_uncached( self, inst_word ):
+
+    # Decode the instruction to find the precompiled format string and
+    # the disasm field functions
+
+    inst_fmt, disasm_field_funcs = \
+      self.disasm_fmts_dict[ self.decode_inst_name( inst_word ) ]
+
+    # Apply these disasm field functions and fill in the format string
+
+    inst_bits = Bits( self.nbits, inst_word )
+
+    return inst_fmt.format( *[ disasm_field_func( inst_bits )
+                               for disasm_field_func in disasm_field_funcs ] )
+
+  #-----------------------------------------------------------------------
+  # disassemble_inst_replace
+  #-----------------------------------------------------------------------
+  # The original disassembler which replaces each field tag in the
+  # template one at a time. We keep it around as the reference for
+  # testing the precompiled format strings.
+
+  def disassemble_inst_replace( self, inst_bits ):
 
     # Decode the instruction to find instruction template
 
@@ -622,20 +954,17 @@ tinyrv2_isa_impl = IsaImpl( 32, tinyrv2_encoding_table, tinyrv2_fields )
 def assemble_inst( sym, pc, inst_str ):
   return tinyrv2_isa_impl.assemble_inst( sym, pc, inst_str )
 
-def assemble( asm_code ):
-
-  # If asm_code is a single string, then put it in a list to simplify the
-  # rest of the logic.
-
-  asm_code_list = asm_code
-  if isinstance( asm_code, str ):
-    asm_code_list = [ asm_code ]
+def assemble_sections( asm_code_list ):
 
-  # Create a single list of lines
+  # Create a single list of lines without comments and empty lines, which
+  # both passes use
 
   asm_list = []
   for asm_seq in asm_code_list:
-    asm_list.extend( asm_seq.splitlines() )
+    for line in asm_seq.splitlines():
+      line = line.partition('#')[0].strip()
+      if line != "":
+        asm_list.append( line )
 
   # First pass to create symbol table. This is obviously very simplistic.
   # We can maybe make it more robust in the future.
@@ -643,11 +972,6 @@ def assemble( asm_code ):
   addr = 0x00000200
   sym  = {}
   for line in asm_list:
-    line = line.partition('#')[0]
-    line = line.strip()
-
-    if line == "":
-      continue
 
     if line.startswith(".offset"):
       (cmd,sep,addr_str) = line.partition(' ')
@@ -665,19 +989,15 @@ def assemble( asm_code ):
 
   # Second pass to assemble text section
 
+  encode_inst     = tinyrv2_isa_impl.encode_inst
   asm_list_idx    = 0
   addr            = 0x00000200
-  text_bytes      = bytearray()
-  mngr2proc_bytes = bytearray()
-  proc2mngr_bytes = bytearray()
+  text_words      = []
+  mngr2proc_words = []
+  proc2mngr_words = []
 
   for line in asm_list:
     asm_list_idx += 1
-    line = line.partition('#')[0]
-    line = line.strip()
-
-    if line == "":
-      continue
 
     if line.startswith(".offset"):
       (cmd,sep,addr_str) = line.partition(' ')
@@ -694,29 +1014,21 @@ def assemble( asm_code ):
 
         if '<' in line:
           (temp,sep,value) = line.partition('<')
-          bits = Bits( 32, int(value,0) )
-          mngr2proc_bytes.extend(struct.pack("<I",bits))
+          mngr2proc_words.append( int(value,0) & 0xFFFFFFFF )
           inst_str = temp
 
         elif '>' in line:
           (temp,sep,value) = line.partition('>')
-          bits = Bits( 32, int(value,0) )
-          proc2mngr_bytes.extend(struct.pack("<I",bits))
+          proc2mngr_words.append( int(value,0) & 0xFFFFFFFF )
           inst_str = temp
 
-        bits = assemble_inst( sym, addr, inst_str )
-        text_bytes.extend(struct.pack("<I",bits.uint()))
+        text_words.append( encode_inst( sym, addr, inst_str ) )
         addr += 4
 
   # Assemble data section
 
   data_bytes = bytearray()
   for line in asm_list[asm_list_idx:]:
-    line = line.partition('#')[0]
-    line = line.strip()
-
-    if line == "":
-      continue
 
     if line.startswith(".offset"):
       (cmd,sep,addr_str) = line.partition(' ')
@@ -737,34 +1049,150 @@ def assemble( asm_code ):
       data_bytes.extend(struct.pack("<B",int(value,0)))
       addr += 1
 
-  # Construct the corresponding section objects
+  # Return the sections as ( name, addr, data ) tuples. Just like before,
+  # we always have a text section but only keep the other sections if
+  # they are not empty.
+
+  def pack_words( words ):
+    return struct.pack( "<{}I".format( len(words) ), *words )
+
+  sections = [ ( ".text", 0x0200, pack_words( text_words ) ) ]
+
+  if len(data_bytes) > 0:
+    sections.append( ( ".data", 0x2000, bytes( data_bytes ) ) )
+
+  if len(mngr2proc_words) > 0:
+    sections.append( ( ".mngr2proc", 0x13000, pack_words( mngr2proc_words ) ) )
+
+  if len(proc2mngr_words) > 0:
+    sections.append( ( ".proc2mngr", 0x14000, pack_words( proc2mngr_words ) ) )
+
+  return tuple( sections )
+
+#-------------------------------------------------------------------------
+# AssembleCache
+#-------------------------------------------------------------------------
+# The test generators produce exactly the same assembly code for a given
+# test every time, so we cache the assembled sections keyed by a hash of
+# the assembly code. We keep the most recently used programs in memory,
+# and, if we are given a directory (the test suite uses the pytest cache
+# directory, which conftest.py passes in sys._tinyrv2_asm_cache_dir), we
+# also keep every program on disk so that we do not have to assemble
+# anything when we rerun the tests. The key includes a hash of this file,
+# so changing the assembler invalidates the cache.
+
+class AssembleCache (object):
+
+  def __init__( self, cache_dir=None, max_entries=1024 ):
+
+    self.entries     = OrderedDict()
+    self.max_entries = max_entries
+    self.cache_dir   = None
+
+    self.num_hits      = 0
+    self.num_disk_hits = 0
+    self.num_misses    = 0
+
+    self.set_dir( cache_dir )
+
+  def set_dir( self, cache_dir ):
+    if cache_dir is not None:
+      os.makedirs( cache_dir, exist_ok=True )
+    self.cache_dir = cache_dir
+
+  #-----------------------------------------------------------------------
+  # key
+  #-----------------------------------------------------------------------
+
+  def key( self, asm_code_list ):
+    h = hashlib.sha1( assembler_hash.encode() )
+    for asm_seq in asm_code_list:
+      h.update( asm_seq.encode() )
+      h.update( b"\0" )
+    return h.hexdigest()
+
+  #-----------------------------------------------------------------------
+  # Disk cache
+  #-----------------------------------------------------------------------
+  # We ignore any problems with the cache directory and just assemble the
+  # program again. New entries are written with write_entry (see
+  # proc/DiskCache.py), so test processes running in parallel never see a
+  # partially written entry. Entries are in the same image format that we
+  # use to cache ELF binaries (see SparseMemoryImage.write_image).
+
+  def load( self, key ):
+
+    if self.cache_dir is None:
+      return None
+
+    try:
+      with open( os.path.join( self.cache_dir, key ), "rb" ) as fd:
+        mem_image = SparseMemoryImage.read_image( fd )
+      return tuple( ( section.name, section.addr, bytes( section.data ) )
+                    for section in mem_image.get_sections() )
+    except Exception:
+      return None
+
+  def store( self, key, sections ):
+
+    if self.cache_dir is None:
+      return
+
+    mem_image = SparseMemoryImage()
+    for name, addr, data in sections:
+      mem_image.add_section( name, addr, data )
+
+    write_entry( os.path.join( self.cache_dir, key ), mem_image.write_image )
+
+  #-----------------------------------------------------------------------
+  # assemble
+  #-----------------------------------------------------------------------
+
+  def assemble( self, asm_code_list ):
+
+    key = self.key( asm_code_list )
+
+    sections = self.entries.get( key )
+    if sections is not None:
+      self.entries.move_to_end( key )
+      self.num_hits += 1
 
-  text_section = \
-    SparseMemoryImage.Section( ".text", 0x0200, text_bytes )
+    else:
+      sections = self.load( key )
+      if sections is not None:
+        self.num_disk_hits += 1
+      else:
+        sections = assemble_sections( asm_code_list )
+        self.store( key, sections )
+        self.num_misses += 1
 
-  data_section = SparseMemoryImage.Section( ".data", 0x2000, data_bytes )
+      self.entries[ key ] = sections
+      if len( self.entries ) > self.max_entries:
+        self.entries.popitem( last=False )
 
-  mngr2proc_section = \
-    SparseMemoryImage.Section( ".mngr2proc", 0x13000, mngr2proc_bytes )
+    # Build a new sparse memory image every time, since callers are free
+    # to modify it
 
-  proc2mngr_section = \
-    SparseMemoryImage.Section( ".proc2mngr", 0x14000, proc2mngr_bytes )
+    mem_image = SparseMemoryImage()
+    for name, addr, data in sections:
+      mem_image.add_section( SparseMemoryImage.Section( name, addr, bytearray( data ) ) )
 
-  # Build a sparse memory image
+    return mem_image
 
-  mem_image = SparseMemoryImage()
-  mem_image.add_section( text_section )
+assembler_hash = sources_hash( [ __file__ ] )
 
-  if len(data_section.data) > 0:
-    mem_image.add_section( data_section )
+assemble_cache = AssembleCache( getattr( sys, "_tinyrv2_asm_cache_dir", None ) )
+
+def assemble( asm_code ):
 
-  if len(mngr2proc_section.data) > 0:
-    mem_image.add_section( mngr2proc_section )
+  # If asm_code is a single string, then put it in a list to simplify the
+  # rest of the logic.
 
-  if len(proc2mngr_section.data) > 0:
-    mem_image.add_section( proc2mngr_section )
+  asm_code_list = asm_code
+  if isinstance( asm_code, str ):
+    asm_code_list = [ asm_code ]
 
-  return mem_image
+  return assemble_cache.assemble( asm_code_list )
 
 #=========================================================================
 # Disassemble
@@ -775,116 +1203,49 @@ def disassemble_inst( inst_bits ):
 
 def decode_inst_name( inst ):
 
-  # Originally I was just using this:
-  #
-  #  return parc_isa_impl.decode_inst_name( inst_bits )
-  #
-  # which basically just does a linear search in the encoding table to
-  # find a match. Eventually, I think we should figure out a way to
-  # automatically turn the encoding table into some kind of fast
-  # tree-bsaed search, but for now we just explicitly create a big case
-  # statement to do the instruction name decode.
-
-  # Short names
-
-  opcode = tinyrv2_field_slice_opcode
-  funct3 = tinyrv2_field_slice_funct3
-  funct7 = tinyrv2_field_slice_funct7
-
-  inst_name = ""
-
-  if inst == 0b00000000000000000000000000010011: inst_name = "nop"
-
-  elif inst[opcode] == 0b0110011:
-    if   inst[funct7] == 0b0000000:
-      if   inst[funct3] == 0b000:     inst_name = "add"
-      elif inst[funct3] == 0b001:     inst_name = "sll"
-      elif inst[funct3] == 0b010:     inst_name = "slt"
-      elif inst[funct3] == 0b011:     inst_name = "sltu"
-      elif inst[funct3] == 0b100:     inst_name = "xor"
-      elif inst[funct3] == 0b101:     inst_name = "srl"
-      elif inst[funct3] == 0b110:     inst_name = "or"
-      elif inst[funct3] == 0b111:     inst_name = "and"
-    elif inst[funct7] == 0b0100000:
-      if   inst[funct3] == 0b000:     inst_name = "sub"
-      elif inst[funct3] == 0b101:     inst_name = "sra"
-    elif inst[funct7] == 0b0000001:
-      if   inst[funct3] == 0b000:     inst_name = "mul"
-
-  elif inst[opcode] == 0b0010011:
-    if   inst[funct3] == 0b000:       inst_name = "addi"
-    elif inst[funct3] == 0b010:       inst_name = "slti"
-    elif inst[funct3] == 0b011:       inst_name = "sltiu"
-    elif inst[funct3] == 0b100:       inst_name = "xori"
-    elif inst[funct3] == 0b110:       inst_name = "ori"
-    elif inst[funct3] == 0b111:       inst_name = "andi"
-    elif inst[funct3] == 0b001:       inst_name = "slli"
-    elif inst[funct3] == 0b101:
-      if   inst[funct7] == 0b0000000: inst_name = "srli"
-      elif inst[funct7] == 0b0100000: inst_name = "srai"
-
-  elif inst[opcode] == 0b0000011:
-    if   inst[funct3] == 0b000:       inst_name = "lb"
-    elif inst[funct3] == 0b001:       inst_name = "lh"
-    elif inst[funct3] == 0b010:       inst_name = "lw"
-    elif inst[funct3] == 0b100:       inst_name = "lbu"
-    elif inst[funct3] == 0b101:       inst_name = "lhu"
-
-  elif inst[opcode] == 0b0100011:
-    if   inst[funct3] == 0b000:       inst_name = "sb"
-    elif inst[funct3] == 0b001:       inst_name = "sh"
-    elif inst[funct3] == 0b010:       inst_name = "sw"
-
-  elif inst[opcode] == 0b1100011:
-    if   inst[funct3] == 0b000:       inst_name = "beq"
-    elif inst[funct3] == 0b001:       inst_name = "bne"
-    elif inst[funct3] == 0b100:       inst_name = "blt"
-    elif inst[funct3] == 0b101:       inst_name = "bge"
-    elif inst[funct3] == 0b110:       inst_name = "bltu"
-    elif inst[funct3] == 0b111:       inst_name = "bgeu"
-
-  elif inst[opcode] == 0b0110111:     inst_name = "lui"
-
-  elif inst[opcode] == 0b0010111:     inst_name = "auipc"
-
-  elif inst[opcode] == 0b1101111:     inst_name = "jal"
-
-  elif inst[opcode] == 0b1100111:     inst_name = "jalr"
-
-  elif inst[opcode] == 0b1110011:
-    if   inst[funct3] == 0b001:       inst_name = "csrw"
-    elif inst[funct3] == 0b010:       inst_name = "csrr"
-
-  # custom
-  elif inst[opcode]   == 0b0001011:     inst_name = "custom0"
-
-  elif inst == 0: inst_name = " "
-
-  if inst_name == "":
-    raise AssertionError( "Illegal instruction {}!".format(inst) )
-
-  return inst_name
+  # Originally this was a big hand-written case statement on the opcode,
+  # funct3, and funct7 fields. Now the IsaImpl automatically turns the
+  # encoding table into a decode tree so we can just use that. The only
+  # special case is the all-zero instruction which we decode as " " so
+  # that it does not look like a legal instruction name.
 
-def disassemble( mem_image ):
+  if inst == 0:
+    return " "
+
+  return tinyrv2_isa_impl.decode_inst_name( inst )
+
+#-------------------------------------------------------------------------
+# disassemble
+#-------------------------------------------------------------------------
+# Generator which disassembles the whole text section of the given
+# SparseMemoryImage and yields one line per instruction with the address,
+# the instruction word, and the disassembled instruction. If the memory
+# image has symbols, we also yield a line before each instruction with a
+# symbol at its address. Words which are not legal instructions are
+# shown as .word directives.
 
-  # Get the text section to disassemble
+def disassemble( mem_image ):
 
   text_section = mem_image.get_section( ".text" )
 
-  # Iterate through the text section four bytes at a time
+  symbols = {}
+  for name, addr in sorted( mem_image.symbols.items() ):
+    symbols.setdefault( addr, [] ).append( name )
 
   addr = text_section.addr
-  asm_code = ""
-  for i in xrange(0,len(text_section.data),4):
+  for ( inst_word, ) in struct.iter_unpack( "<I", text_section.data ):
+
+    for name in symbols.get( addr, () ):
+      yield "{:0>8x} <{}>:".format( addr, name )
 
-    print( hex(addr+i) )
+    try:
+      inst_str = tinyrv2_isa_impl.disassemble_word( inst_word )
+    except AssertionError:
+      inst_str = ".word 0x{:0>8x}".format( inst_word )
 
-    bits = struct.unpack_from("<I",buffer(text_section.data,i,4))[0]
-    inst_str= disassemble_inst( Bits(32,bits) )
-    disasm_line = " {:0>8x}  {:0>8x}  {}\n".format( addr+i, bits, inst_str )
-    asm_code += disasm_line
+    yield " {:0>8x}  {:0>8x}  {}".format( addr, inst_word, inst_str )
 
-  return asm_code
+    addr += 4
 
 #=========================================================================
 # TinyRV2Inst
@@ -969,3 +1330,92 @@ class TinyRV2Inst(object):
 
   def __str__( self ):
     return disassemble_inst( self.bits )
+
+#=========================================================================
+# TinyRV2PredecodedInst
+#=========================================================================
+# Same fields as TinyRV2Inst, but everything is extracted once in the
+# constructor instead of every time a field is accessed. The register
+# specifiers are plain ints and the i/s/b/j immediates are already sign
+# extended to 32 bits. This is what the FL processor keeps in its
+# predecoded instruction cache.
+
+class TinyRV2PredecodedInst(object):
+
+  __slots__ = ( "bits", "name", "rd", "rs1", "rs2", "shamt", "i_imm",
+                "s_imm", "b_imm", "u_imm", "j_imm", "csrnum", "funct7" )
+
+  #-----------------------------------------------------------------------
+  # Constructor
+  #-----------------------------------------------------------------------
+
+  def __init__( self, inst_bits ):
+    inst = TinyRV2Inst( inst_bits )
+
+    self.bits   = inst.bits
+    self.name   = inst.name
+
+    self.rd     = inst.rd.uint()
+    self.rs1    = inst.rs1.uint()
+    self.rs2    = inst.rs2.uint()
+    self.shamt  = inst.shamt
+
+    self.i_imm  = sext( inst.i_imm, 32 )
+    self.s_imm  = sext( inst.s_imm, 32 )
+    self.b_imm  = sext( inst.b_imm, 32 )
+    self.u_imm  = inst.u_imm
+    self.j_imm  = sext( inst.j_imm, 32 )
+
+    self.csrnum = inst.csrnum
+    self.funct7 = inst.funct7
+
+  #-----------------------------------------------------------------------
+  # to string
+  #-----------------------------------------------------------------------
+
+  def __str__( self ):
+    return disassemble_inst( self.bits )
+
+#=========================================================================
+# TinyRV2PredecodedIntInst
+#=========================================================================
+# Same idea as TinyRV2PredecodedInst, but every field is a plain Python
+# int so that the integer-native FL processor never has to touch Bits
+# while executing. The i/s/b/j immediates are signed ints, while the
+# u-type immediate is already shifted into place as an unsigned int. We
+# still keep the original Bits in bits for line tracing.
+
+class TinyRV2PredecodedIntInst(object):
+
+  __slots__ = ( "bits", "name", "rd", "rs1", "rs2", "shamt", "i_imm",
+                "s_imm", "b_imm", "u_imm", "j_imm", "csrnum" )
+
+  #-----------------------------------------------------------------------
+  # Constructor
+  #-----------------------------------------------------------------------
+
+  def __init__( self, inst_bits ):
+    inst = TinyRV2Inst( inst_bits )
+
+    self.bits   = inst.bits
+    self.name   = inst.name
+
+    self.rd     = inst.rd.uint()
+    self.rs1    = inst.rs1.uint()
+    self.rs2    = inst.rs2.uint()
+    self.shamt  = inst.shamt.uint()
+
+    self.i_imm  = inst.i_imm.int()
+    self.s_imm  = inst.s_imm.int()
+    self.b_imm  = inst.b_imm.int()
+    self.u_imm  = inst.u_imm.uint()
+    self.j_imm  = inst.j_imm.int()
+
+    self.csrnum = inst.csrnum.uint()
+
+  #-----------------------------------------------------------------------
+  # to string
+  #-----------------------------------------------------------------------
+
+  def __str__( self ):
+    return disassemble_inst( self.bits )
@@ -0,0 +1,284 @@
+#=========================================================================
+# tinyrv2_multicore
+#=========================================================================
+# Functional multicore simulator for bthread programs. Every core is a
+# standalone instruction set simulator (TinyRV2Semantics) with its own
+# PC, registers, and translated blocks, and all cores share one memory.
+# Instead of ticking all cores every cycle, we run one core at a time
+# for a quantum of instructions, round robin, so every core spends most
+# of its time in translated blocks. Just like in MultiProcMemXcel, only
+# core 0 talks to the manager: the other cores have no mngr2proc
+# messages and whatever they send to proc2mngr is dropped.
+#
+# Stores invalidate the translated blocks of all cores, so one core can
+# write code that another one runs.
+#
+# Spin-waits: bthread workers wait in a loop polling their flag, and
+# core 0 polls the flags of the workers in bthread_join, which would
+# burn most of the simulation time on doing nothing. After a quantum
+# without any store, we single-step the core until it gets back to the
+# PC it started from. If it does so with the same registers, without
+# storing anything and without any csrw or csrr with side effects, then
+# the core will keep doing exactly the same thing until one of the
+# words it loaded changes. So we park it and do not run it again until
+# another core stores to one of these words. The instructions a parked
+# core would have executed are not counted. If all cores are parked,
+# none of them can make progress anymore and run returns (see
+# deadlock).
+#
+# Memory is a bytearray like in TinyRV2Semantics. A large zeroed
+# bytearray is allocated lazily by the OS, so only the pages the
+# program touches take up memory.
+
+from collections import deque
+
+from .tinyrv2_encoding  import TinyRV2PredecodedIntInst
+from .tinyrv2_semantics import TinyRV2Semantics, _word
+
+# Number of bytes each load reads
+
+load_nbytes = { "lw": 4, "lh": 2, "lhu": 2, "lb": 1, "lbu": 1 }
+
+# CSRs which we can read without side effects: numcores and coreid
+
+pure_csrs = { 0xFC1, 0xF14 }
+
+#-------------------------------------------------------------------------
+# TinyRV2MulticoreCore
+#-------------------------------------------------------------------------
+# A core which lets the multicore simulator handle its stores, so that
+# we can invalidate the blocks of all cores and wake up parked cores.
+
+class TinyRV2MulticoreCore (TinyRV2Semantics):
+
+  def __init__( s, multicore, **kwargs ):
+    s.multicore = multicore
+    super().__init__( **kwargs )
+
+  def invalidate( s, addr, nbytes ):
+    return s.multicore.invalidate( addr, nbytes )
+
+class TinyRV2Multicore (object):
+
+  #-----------------------------------------------------------------------
+  # Constructor
+  #-----------------------------------------------------------------------
+  # We check for spin-waits over at most max_spin_insts instructions, so
+  # longer polling loops are just simulated.
+
+  def __init__( s, num_cores, mem_nbytes=1<<28, quantum=1000,
+                skip_spins=True, max_spin_insts=64, max_block_size=64 ):
+
+    s.M = bytearray( mem_nbytes )
+
+    s.mngr2proc_queue = deque()
+    s.proc2mngr_queue = deque()
+
+    s.cores = [
+      TinyRV2MulticoreCore( s,
+        mem             = s.M,
+        mngr2proc_queue = s.mngr2proc_queue if i == 0 else deque(),
+        proc2mngr_queue = s.proc2mngr_queue if i == 0 else deque( maxlen=0 ),
+        num_cores       = num_cores,
+        core_id         = i,
+        max_block_size  = max_block_size,
+      ) for i in range( num_cores ) ]
+
+    s.num_cores      = num_cores
+    s.quantum        = quantum
+    s.skip_spins     = skip_spins
+    s.max_spin_insts = max_spin_insts
+
+    s.reset()
+
+  #-----------------------------------------------------------------------
+  # reset
+  #-----------------------------------------------------------------------
+
+  def reset( s ):
+
+    for core in s.cores:
+      core.reset()
+
+    # Next core to run, the words each parked core waits on (None if the
+    # core is not parked), and the parked cores waiting on each word
+
+    s.next     = 0
+    s.parked   = [ None ] * s.num_cores
+    s.watchers = {}
+
+    s.num_insts       = 0
+    s.num_stats_insts = 0
+    s.num_stores      = 0
+    s.num_spins       = 0
+    s.num_skipped     = 0
+
+  #-----------------------------------------------------------------------
+  # load
+  #-----------------------------------------------------------------------
+  # Core 0 loads the program into the shared memory and gets the
+  # mngr2proc messages and the reference proc2mngr messages.
+
+  def load( s, mem_image ):
+
+    s.cores[0].load( mem_image )
+    s.proc2mngr_ref = s.cores[0].proc2mngr_ref
+
+    for core in s.cores[1:]:
+      core.inst_cache.clear()
+      core.block_cache.clear()
+      core.block_words.clear()
+
+  @property
+  def stats_en( s ):
+    return s.cores[0].stats_en
+
+  # True if all cores are parked, i.e., nothing will ever change anymore
+
+  @property
+  def deadlock( s ):
+    return all( words is not None for words in s.parked )
+
+  #-----------------------------------------------------------------------
+  # invalidate
+  #-----------------------------------------------------------------------
+  # Called for every store of every core. Wakes up the cores parked on
+  # the stored words and invalidates the overlapping blocks of all cores.
+  # Returns True if we invalidated any block.
+
+  def invalidate( s, addr, nbytes ):
+
+    s.num_stores += 1
+
+    if s.watchers:
+      for word in range( addr & ~3, addr + nbytes, 4 ):
+        core_ids = s.watchers.get( word )
+        if core_ids:
+          for i in list( core_ids ):
+            s.wake( i )
+
+    hit = False
+    for core in s.cores:
+      if TinyRV2Semantics.invalidate( core, addr, nbytes ):
+        hit = True
+
+    return hit
+
+  #-----------------------------------------------------------------------
+  # Parking
+  #-----------------------------------------------------------------------
+
+  def park( s, i, words ):
+
+    s.parked[i] = words
+    for word in words:
+      s.watchers.setdefault( word, set() ).add( i )
+
+    s.num_spins += 1
+
+  def wake( s, i ):
+
+    for word in s.parked[i]:
+      core_ids = s.watchers[ word ]
+      core_ids.discard( i )
+      if not core_ids:
+        del s.watchers[ word ]
+
+    s.parked[i] = None
+
+  #-----------------------------------------------------------------------
+  # run_core
+  #-----------------------------------------------------------------------
+  # Run a core for up to max_insts instructions, counting them towards
+  # the stats region if core 0 has stats enabled.
+
+  def run_core( s, core, max_insts ):
+
+    stats_en = s.cores[0].stats_en
+    n        = core.run( max_insts )
+
+    s.num_insts += n
+    if stats_en:
+      s.num_stats_insts += n
+
+    return n
+
+  #-----------------------------------------------------------------------
+  # find_spin
+  #-----------------------------------------------------------------------
+  # Single-step the core for up to max_insts instructions until it gets
+  # back to its current PC. Returns the set of words the core loaded if
+  # it is spinning, None otherwise.
+
+  def find_spin( s, core, max_insts ):
+
+    start_pc = core.PC
+    start_R  = list( core.R )
+    words    = set()
+
+    for _ in range( max_insts ):
+
+      inst = TinyRV2PredecodedIntInst( _word.unpack_from( s.M, core.PC )[0] )
+      name = inst.name
+
+      if name in load_nbytes:
+        addr = ( core.R[inst.rs1] + inst.i_imm ) & 0xFFFFFFFF
+        words.add( addr & ~3 )
+        words.add( ( addr + load_nbytes[ name ] - 1 ) & ~3 )
+
+      elif name in ( "sw", "sh", "sb", "csrw" ):
+        return None
+
+      elif name == "csrr" and inst.csrnum not in pure_csrs:
+        return None
+
+      s.run_core( core, 1 )
+
+      if core.PC == start_pc:
+        return words if core.R == start_R else None
+
+    return None
+
+  #-----------------------------------------------------------------------
+  # run
+  #-----------------------------------------------------------------------
+  # Execute up to max_insts instructions over all cores. We return as
+  # soon as core 0 sends a proc2mngr message, or if all cores are parked.
+  # Returns the number of instructions we executed.
+
+  def run( s, max_insts ):
+
+    n = 0
+
+    while n < max_insts and not s.proc2mngr_queue and not s.deadlock:
+
+      i = s.next
+      s.next = ( i + 1 ) % s.num_cores
+
+      if s.parked[i] is not None:
+        s.num_skipped += 1
+        continue
+
+      # Run the core for one quantum, or until it sends a message
+
+      core       = s.cores[i]
+      num_insts  = s.num_insts
+      num_stores = s.num_stores
+      quantum    = min( s.quantum, max_insts - n )
+
+      while s.num_insts - num_insts < quantum and not s.proc2mngr_queue:
+        s.run_core( core, quantum - ( s.num_insts - num_insts ) )
+
+      # Park the core if it is spinning
+
+      n += s.num_insts - num_insts
+
+      if s.skip_spins and s.num_stores == num_stores \
+                      and not s.proc2mngr_queue:
+        num_insts = s.num_insts
+        words     = s.find_spin( core, min( s.max_spin_insts, max_insts - n ) )
+        if words is not None:
+          s.park( i, words )
+        n += s.num_insts - num_insts
+
+    return n
@@ -2,102 +2,353 @@
 # tinyrv2_semantics
 #=========================================================================
 # This class defines the semantics for each instruction in the RISC-V
-# teaching grade instruction set.
+# teaching grade instruction set. It doubles as a standalone instruction
+# set simulator: the architectural state is kept in plain Python ints
+# and a flat bytearray, so we can run a program to completion without
+# elaborating or ticking a PyMTL model. Just like the block mode of the
+# FL processor, run translates basic blocks into Python functions (see
+# tinyrv2_translate) and caches them by their entry PC, while step
+# executes a single instruction with the handlers from
+# mk_execute_handlers, which the int mode of the FL processor shares.
 #
 # Author : Christopher Batten, Moyang Wang, Shunning Jiang
 # Date   : Aug 29, 2016
 
-from pymtl            import Bits,concat
-from pymtl.datatypes  import helpers
-from tinyrv2_encoding import TinyRV2Inst
+import struct
 
-from XcelMsg import XcelReqMsg, XcelRespMsg
+from collections import deque
+
+from .SparseMemoryImage import SparseMemoryImage
+from .tinyrv2_encoding  import TinyRV2PredecodedIntInst
+from .tinyrv2_translate import block_terminators, mk_block_src
 
 #-------------------------------------------------------------------------
-# Syntax Helpers
+# Memory access helpers
 #-------------------------------------------------------------------------
 
-def sext( bits ):
-  return helpers.sext( bits, 32 )
+_word  = struct.Struct("<I")
+_half  = struct.Struct("<H")
+_shalf = struct.Struct("<h")
+_sbyte = struct.Struct("<b")
 
-def zext( bits ):
-  return helpers.zext( bits, 32 )
+# How translated blocks access memory (see mk_block_src)
 
-class TinyRV2Semantics (object):
+block_mem_tmpls = {
+  "lw"  : "unpack_w( M, {addr} )[0]",
+  "lh"  : "unpack_sh( M, {addr} )[0] & 0xFFFFFFFF",
+  "lhu" : "unpack_h( M, {addr} )[0]",
+  "lb"  : "unpack_sb( M, {addr} )[0] & 0xFFFFFFFF",
+  "lbu" : "M[{addr}]",
+  "sw"  : "pack_w( M, {addr}, {data} )",
+  "sh"  : "pack_h( M, {addr}, {data} )",
+  "sb"  : "M[{addr}] = {data}",
+}
 
-  #-----------------------------------------------------------------------
-  # IllegalInstruction
-  #-----------------------------------------------------------------------
+#-------------------------------------------------------------------------
+# mk_execute_handlers
+#-------------------------------------------------------------------------
+# Handlers for all instructions except the CSR instructions, shared by
+# the instruction set simulator below and the int mode of the FL
+# processor. Each handler takes the predecoded instruction and its PC and
+# returns the next PC. The two simulators only differ in the register
+# file R, a list or array of ints in [0,2^32) which the handlers never
+# write at x0, and in how they access memory: load( addr, nbytes )
+# returns the unsigned value at addr, and store( addr, nbytes, value )
+# writes value, which is already truncated to nbytes. Note that we always
+# do the memory access, even if the destination is x0.
+#
+# A few tricks to stay in plain ints: (a ^ SIGN) < (b ^ SIGN) is a
+# signed comparison of two unsigned 32-bit values, and (a ^ SIGN) - SIGN
+# turns an unsigned value into a signed one. Results are only masked to
+# 32 bits when they can actually overflow.
+
+MASK = 0xFFFFFFFF
+SIGN = 0x80000000
+
+def mk_execute_handlers( R, load, store ):
+
+  def execute_nop( inst, pc ):
+    return ( pc + 4 ) & MASK
+
+  # Register-register arithmetic, logical, and comparison
+
+  def execute_add( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( R[inst.rs1] + R[inst.rs2] ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_sub( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( R[inst.rs1] - R[inst.rs2] ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_sll( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( R[inst.rs1] << ( R[inst.rs2] & 0x1F ) ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_slt( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = int( ( R[inst.rs1] ^ SIGN ) < ( R[inst.rs2] ^ SIGN ) )
+    return ( pc + 4 ) & MASK
+
+  def execute_sltu( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = int( R[inst.rs1] < R[inst.rs2] )
+    return ( pc + 4 ) & MASK
+
+  def execute_xor( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] ^ R[inst.rs2]
+    return ( pc + 4 ) & MASK
+
+  def execute_srl( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] >> ( R[inst.rs2] & 0x1F )
+    return ( pc + 4 ) & MASK
+
+  def execute_sra( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( ( ( R[inst.rs1] ^ SIGN ) - SIGN )
+                     >> ( R[inst.rs2] & 0x1F ) ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_or( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] | R[inst.rs2]
+    return ( pc + 4 ) & MASK
+
+  def execute_and( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] & R[inst.rs2]
+    return ( pc + 4 ) & MASK
+
+  def execute_mul( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( R[inst.rs1] * R[inst.rs2] ) & MASK
+    return ( pc + 4 ) & MASK
+
+  # Register-immediate arithmetic, logical, and comparison
+
+  def execute_addi( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( R[inst.rs1] + inst.i_imm ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_slti( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = int( ( ( R[inst.rs1] ^ SIGN ) - SIGN ) < inst.i_imm )
+    return ( pc + 4 ) & MASK
+
+  def execute_sltiu( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = int( R[inst.rs1] < ( inst.i_imm & MASK ) )
+    return ( pc + 4 ) & MASK
+
+  def execute_xori( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] ^ ( inst.i_imm & MASK )
+    return ( pc + 4 ) & MASK
+
+  def execute_ori( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] | ( inst.i_imm & MASK )
+    return ( pc + 4 ) & MASK
+
+  def execute_andi( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] & ( inst.i_imm & MASK )
+    return ( pc + 4 ) & MASK
+
+  def execute_slli( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( R[inst.rs1] << inst.shamt ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_srli( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = R[inst.rs1] >> inst.shamt
+    return ( pc + 4 ) & MASK
+
+  def execute_srai( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( ( ( R[inst.rs1] ^ SIGN ) - SIGN ) >> inst.shamt ) & MASK
+    return ( pc + 4 ) & MASK
 
-  class IllegalInstruction (Exception):
-    pass
+  # Other instructions
 
-  #-----------------------------------------------------------------------
-  # RegisterFile
-  #-----------------------------------------------------------------------
+  def execute_lui( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = inst.u_imm
+    return ( pc + 4 ) & MASK
 
-  class RegisterFile (object):
+  def execute_auipc( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( inst.u_imm + pc ) & MASK
+    return ( pc + 4 ) & MASK
 
-    def __init__( self ):
+  # Load/store instructions
 
-      self.regs = [ Bits(32,0) for i in xrange(32) ]
+  def execute_lw( inst, pc ):
+    data = load( ( R[inst.rs1] + inst.i_imm ) & MASK, 4 )
+    if inst.rd:
+      R[inst.rd] = data
+    return ( pc + 4 ) & MASK
+
+  def execute_lh( inst, pc ):
+    data = load( ( R[inst.rs1] + inst.i_imm ) & MASK, 2 )
+    if inst.rd:
+      R[inst.rd] = ( ( data ^ 0x8000 ) - 0x8000 ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_lb( inst, pc ):
+    data = load( ( R[inst.rs1] + inst.i_imm ) & MASK, 1 )
+    if inst.rd:
+      R[inst.rd] = ( ( data ^ 0x80 ) - 0x80 ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_lhu( inst, pc ):
+    data = load( ( R[inst.rs1] + inst.i_imm ) & MASK, 2 )
+    if inst.rd:
+      R[inst.rd] = data
+    return ( pc + 4 ) & MASK
+
+  def execute_lbu( inst, pc ):
+    data = load( ( R[inst.rs1] + inst.i_imm ) & MASK, 1 )
+    if inst.rd:
+      R[inst.rd] = data
+    return ( pc + 4 ) & MASK
+
+  def execute_sw( inst, pc ):
+    store( ( R[inst.rs1] + inst.s_imm ) & MASK, 4, R[inst.rs2] )
+    return ( pc + 4 ) & MASK
+
+  def execute_sh( inst, pc ):
+    store( ( R[inst.rs1] + inst.s_imm ) & MASK, 2, R[inst.rs2] & 0xFFFF )
+    return ( pc + 4 ) & MASK
+
+  def execute_sb( inst, pc ):
+    store( ( R[inst.rs1] + inst.s_imm ) & MASK, 1, R[inst.rs2] & 0xFF )
+    return ( pc + 4 ) & MASK
 
-      self.trace_str  = ""
-      self.trace_regs = False
-      self.src0 = ""
-      self.src1 = ""
-      self.dest = ""
+  # Unconditional jump instructions
 
-    def __getitem__( self, idx ):
-      if self.trace_regs:
-        if self.src0 == "":
-          self.src0 = "X[{:2d}]={:0>8}".format( int(idx), self.regs[idx] )
-        else:
-          self.src1 = "X[{:2d}]={:0>8}".format( int(idx), self.regs[idx] )
+  def execute_jal( inst, pc ):
+    if inst.rd:
+      R[inst.rd] = ( pc + 4 ) & MASK
+    return ( pc + inst.j_imm ) & MASK
 
-      return self.regs[idx]
+  def execute_jalr( inst, pc ):
+    temp = ( R[inst.rs1] + inst.i_imm ) & 0xFFFFFFFE
+    if inst.rd:
+      R[inst.rd] = ( pc + 4 ) & MASK
+    return temp
 
-    def __setitem__( self, idx, value ):
+  # Conditional branch instructions
 
-      trunc_value = Bits( 32, value, trunc=True )
+  def execute_beq( inst, pc ):
+    if R[inst.rs1] == R[inst.rs2]:
+      return ( pc + inst.b_imm ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_bne( inst, pc ):
+    if R[inst.rs1] != R[inst.rs2]:
+      return ( pc + inst.b_imm ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_blt( inst, pc ):
+    if ( R[inst.rs1] ^ SIGN ) < ( R[inst.rs2] ^ SIGN ):
+      return ( pc + inst.b_imm ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_bge( inst, pc ):
+    if ( R[inst.rs1] ^ SIGN ) >= ( R[inst.rs2] ^ SIGN ):
+      return ( pc + inst.b_imm ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_bltu( inst, pc ):
+    if R[inst.rs1] < R[inst.rs2]:
+      return ( pc + inst.b_imm ) & MASK
+    return ( pc + 4 ) & MASK
+
+  def execute_bgeu( inst, pc ):
+    if R[inst.rs1] >= R[inst.rs2]:
+      return ( pc + inst.b_imm ) & MASK
+    return ( pc + 4 ) & MASK
+
+  # Dispatch table from instruction name to handler
+
+  return {
+    name[len("execute_"):] : func
+    for name, func in locals().items() if name.startswith("execute_")
+  }
 
-      if self.trace_regs:
-        self.dest = "X[{:2d}]={:0>8}".format( int(idx), trunc_value )
+class TinyRV2Semantics (object):
 
-      if idx != 0:
-        self.regs[idx] = trunc_value
+  #-----------------------------------------------------------------------
+  # IllegalInstruction
+  #-----------------------------------------------------------------------
 
-    def trace_regs_str( self ):
-      self.trace_str = "{:14} {:14} {:14}".format( self.dest, self.src0, self.src1 )
-      self.src0 = ""
-      self.src1 = ""
-      self.dest = ""
-      return self.trace_str
+  class IllegalInstruction (Exception):
+    pass
 
   #-----------------------------------------------------------------------
   # Constructor
   #-----------------------------------------------------------------------
-
-  def __init__( self, memory,
-                mngr2proc_queue, proc2mngr_queue,
-                xcelreq_queue, xcelresp_queue,
-                num_cores=1 ):
-
-    self.R = TinyRV2Semantics.RegisterFile()
-    self.M = memory
-
-    self.mngr2proc_queue = mngr2proc_queue
-    self.proc2mngr_queue = proc2mngr_queue
-    self.xcelreq_queue   = xcelreq_queue
-    self.xcelresp_queue  = xcelresp_queue
-
-    self.numcores = num_cores
-    self.coreid   = -1
-
-    # Only support RISC-V 32-bit ISA
-    self.xlen = 32
-
-    self.reset()
+  # The accelerator is optional. If given, it needs read( raddr ) and
+  # write( raddr, data ) methods which take and return plain ints, and
+  # accessing an accelerator register without one is illegal. Several
+  # simulators can share their memory by passing the same bytearray as
+  # mem, in which case mem_nbytes is ignored.
+
+  def __init__( s, mem_nbytes=1<<28,
+                mngr2proc_queue=None, proc2mngr_queue=None,
+                xcel=None, num_cores=1, core_id=0, max_block_size=64,
+                mem=None ):
+
+    s.R = [ 0 ] * 32
+    s.M = bytearray( mem_nbytes ) if mem is None else mem
+
+    s.mngr2proc_queue = deque() if mngr2proc_queue is None else mngr2proc_queue
+    s.proc2mngr_queue = deque() if proc2mngr_queue is None else proc2mngr_queue
+
+    s.xcel     = xcel
+    s.numcores = num_cores
+    s.coreid   = core_id
+
+    # Predecoded instruction cache, maps the PC to the predecoded
+    # instruction and its handler. The block cache maps the entry PC to
+    # the translated block and, if the block ends with a csrw, the number
+    # of instructions in the block (zero otherwise). Stores invalidate
+    # overlapping entries in both caches.
+
+    s.inst_cache  = {}
+    s.block_cache = {}
+    s.block_words = {}  # word address -> entry PCs of overlapping blocks
+
+    s.max_block_size = max_block_size
+
+    s.block_globals = {
+      "R"          : s.R,
+      "M"          : s.M,
+      "unpack_w"   : _word.unpack_from,
+      "unpack_h"   : _half.unpack_from,
+      "unpack_sh"  : _shalf.unpack_from,
+      "unpack_sb"  : _sbyte.unpack_from,
+      "pack_w"     : _word.pack_into,
+      "pack_h"     : _half.pack_into,
+      "invalidate" : s.invalidate,
+    }
+
+    s.execute_dispatch = mk_execute_handlers( s.R, s.load_data, s.store )
+    s.execute_dispatch["csrr"] = s.execute_csrr
+    s.execute_dispatch["csrw"] = s.execute_csrw
+    s.execute_dispatch[" "]    = s.execute_dumb # this is for all-zero
+
+    s.block_globals["execute_csrr"] = s.execute_dispatch["csrr"]
+    s.block_globals["execute_csrw"] = s.execute_dispatch["csrw"]
+
+    s.reset()
 
   #-----------------------------------------------------------------------
   # reset
@@ -105,356 +356,269 @@ class TinyRV2Semantics (object):
 
   def reset( s ):
 
-    s.PC = Bits( 32, 0x00000200 )
+    s.PC = 0x00000200
     s.stats_en = False
-    s.coreid   = -1
 
-  #-----------------------------------------------------------------------
-  # Basic Instructions
-  #-----------------------------------------------------------------------
+    s.num_insts       = 0
+    s.num_stats_insts = 0
 
-  def execute_nop( s, inst ):
-    s.PC += 4
+    s.inst_cache.clear()
+    s.block_cache.clear()
+    s.block_words.clear()
 
   #-----------------------------------------------------------------------
-  # Register-register arithmetic, logical, and comparison instructions
+  # load
   #-----------------------------------------------------------------------
+  # Load a SparseMemoryImage. Just like the test harness, the .mngr2proc
+  # section goes into the mngr2proc queue and the .proc2mngr section is
+  # kept as the list of reference messages in proc2mngr_ref.
 
-  def execute_add( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] + s.R[inst.rs2]
-    s.PC += 4
-
-  def execute_sub( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] - s.R[inst.rs2]
-    s.PC += 4
+  def load( s, mem_image ):
 
-  def execute_sll( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] << (s.R[inst.rs2].uint() & 0x1F)
-    s.PC += 4
+    s.proc2mngr_ref = deque()
 
-  def execute_slt( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1].int() < s.R[inst.rs2].int()
-    s.PC += 4
+    for section in mem_image.get_sections():
 
-  def execute_sltu( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] < s.R[inst.rs2]
-    s.PC += 4
+      if section.name == ".mngr2proc":
+        for bits in struct.iter_unpack("<I", section.data):
+          s.mngr2proc_queue.append( bits[0] )
 
-  def execute_xor( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] ^ s.R[inst.rs2]
-    s.PC += 4
+      elif section.name == ".proc2mngr":
+        for bits in struct.iter_unpack("<I", section.data):
+          s.proc2mngr_ref.append( bits[0] )
 
-  def execute_srl( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] >> (s.R[inst.rs2].uint() & 0x1F)
-    s.PC += 4
+      elif isinstance( section.data, SparseMemoryImage.ZeroData ):
+        s.M[section.addr:section.addr+len(section.data)] = bytes( len(section.data) )
 
-  def execute_sra( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1].int() >> (s.R[inst.rs2].uint() & 0x1F)
-    s.PC += 4
+      else:
+        start_addr = section.addr
+        stop_addr  = section.addr + len(section.data)
+        s.M[start_addr:stop_addr] = section.data
 
-  def execute_or( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] | s.R[inst.rs2]
-    s.PC += 4
-
-  def execute_and( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] & s.R[inst.rs2]
-    s.PC += 4
+    s.inst_cache.clear()
+    s.block_cache.clear()
+    s.block_words.clear()
 
   #-----------------------------------------------------------------------
-  # Register-immediate arithmetic, logical, and comparison instructions
+  # Memory helpers
   #-----------------------------------------------------------------------
 
-  def execute_addi( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] + sext(inst.i_imm)
-    s.PC += 4
-
-  def execute_slti( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1].int() < inst.i_imm.int()
-    s.PC += 4
-
-  def execute_sltiu( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] < sext(inst.i_imm)
-    s.PC += 4
+  def load_data( s, addr, nbytes ):
 
-  def execute_xori( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] ^ sext(inst.i_imm)
-    s.PC += 4
+    if   nbytes == 4: return _word.unpack_from( s.M, addr )[0]
+    elif nbytes == 2: return _half.unpack_from( s.M, addr )[0]
+    else:             return s.M[addr]
 
-  def execute_ori( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] | sext(inst.i_imm)
-    s.PC += 4
+  def store( s, addr, nbytes, value ):
 
-  def execute_andi( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] & sext(inst.i_imm)
-    s.PC += 4
+    if   nbytes == 4: _word.pack_into( s.M, addr, value )
+    elif nbytes == 2: _half.pack_into( s.M, addr, value & 0xFFFF )
+    else:             s.M[addr] = value & 0xFF
 
-  def execute_slli( s, inst ):
-    # does not have exception, just assert here
-    s.R[inst.rd] = s.R[inst.rs1] << inst.shamt
-    s.PC += 4
+    s.invalidate( addr, nbytes )
 
-  def execute_srli( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1] >> inst.shamt
-    s.PC += 4
+  # Invalidate cached instructions and blocks overlapping the given
+  # bytes. Returns True if we invalidated any block.
 
-  def execute_srai( s, inst ):
-    s.R[inst.rd] = s.R[inst.rs1].int() >> inst.shamt.uint()
-    s.PC += 4
-
-  #-----------------------------------------------------------------------
-  # Other instructions
-  #-----------------------------------------------------------------------
-
-  def execute_lui( s, inst ):
-    s.R[inst.rd] = inst.u_imm
-    s.PC += 4
-
-  def execute_auipc( s, inst ):
-    s.R[inst.rd] = inst.u_imm + s.PC
-    s.PC += 4
-
-  #-----------------------------------------------------------------------
-  # Load/store instructions
-  #-----------------------------------------------------------------------
-
-  def execute_lb( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.i_imm)
-    s.R[inst.rd] = sext( s.M[addr] )
-    s.PC += 4
-
-  def execute_lh( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.i_imm)
-    s.R[inst.rd] = sext( s.M[addr:addr+2] )
-    s.PC += 4
-
-  def execute_lw( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.i_imm)
-    s.R[inst.rd] = s.M[addr:addr+4]
-    s.PC += 4
-
-  def execute_lbu( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.i_imm)
-    s.R[inst.rd] = zext( s.M[addr] )
-    s.PC += 4
-
-  def execute_lhu( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.i_imm)
-    s.R[inst.rd] = zext( s.M[addr:addr+2] )
-    s.PC += 4
-
-  def execute_sb( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.s_imm)
-    s.M[addr] = s.R[inst.rs2][0:8]
-    s.PC += 4
-
-  def execute_sh( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.s_imm)
-    s.M[addr:addr+2] = s.R[inst.rs2][0:16]
-    s.PC += 4
-
-  def execute_sw( s, inst ):
-    addr = s.R[inst.rs1] + sext(inst.s_imm)
-    s.M[addr:addr+4] = s.R[inst.rs2]
-    s.PC += 4
-
-  #-----------------------------------------------------------------------
-  # Unconditional jump instructions
-  #-----------------------------------------------------------------------
+  def invalidate( s, addr, nbytes ):
 
-  def execute_jal( s, inst ):
-    s.R[inst.rd] = s.PC + 4
-    s.PC = s.PC + sext(inst.j_imm)
+    hit = False
+    for word in range( addr & ~3, addr + nbytes, 4 ):
+      s.inst_cache.pop( word, None )
+      entry_pcs = s.block_words.pop( word, None )
+      if entry_pcs:
+        for entry_pc in entry_pcs:
+          s.block_cache.pop( entry_pc, None )
+        hit = True
 
-  def execute_jalr( s, inst ):
-    temp = s.R[inst.rs1] + sext(inst.i_imm)
-    s.R[inst.rd] = s.PC + 4
-    s.PC = temp & 0xFFFFFFFE
-
-  #-----------------------------------------------------------------------
-  # Conditional branch instructions
-  #-----------------------------------------------------------------------
-
-  def execute_beq( s, inst ):
-    if s.R[inst.rs1] == s.R[inst.rs2]:
-      s.PC = s.PC + sext(inst.b_imm)
-    else:
-      s.PC += 4
-
-  def execute_bne( s, inst ):
-    if s.R[inst.rs1] != s.R[inst.rs2]:
-      s.PC = s.PC + sext(inst.b_imm)
-    else:
-      s.PC += 4
-
-  def execute_blt( s, inst ):
-    if s.R[inst.rs1].int() < s.R[inst.rs2].int():
-      s.PC = s.PC + sext(inst.b_imm)
-    else:
-      s.PC += 4
-
-  def execute_bge( s, inst ):
-    if s.R[inst.rs1].int() >= s.R[inst.rs2].int():
-      s.PC = s.PC + sext(inst.b_imm)
-    else:
-      s.PC += 4
-
-  def execute_bltu( s, inst ):
-    if s.R[inst.rs1] < s.R[inst.rs2]:
-      s.PC = s.PC + sext(inst.b_imm)
-    else:
-      s.PC += 4
-
-  def execute_bgeu( s, inst ):
-    if s.R[inst.rs1] >= s.R[inst.rs2]:
-      s.PC = s.PC + sext(inst.b_imm)
-    else:
-      s.PC += 4
-
-  #-----------------------------------------------------------------------
-  # Mul/Div instructions
-  #-----------------------------------------------------------------------
-
-  def execute_mul( s, inst ):
-    s.R[ inst.rd ] = s.R[inst.rs1] * s.R[inst.rs2]
-    s.PC += 4
+    return hit
 
   #-----------------------------------------------------------------------
   # CSR instructions
   #-----------------------------------------------------------------------
+  # All other instructions are handled by mk_execute_handlers. Like those
+  # handlers, the CSR handlers take the predecoded instruction and its PC
+  # and return the next PC.
 
-  def execute_csrr( s, inst ):
+  def execute_csrr( s, inst, pc ):
 
     # CSR: mngr2proc
     # for mngr2proc just ignore the rs1 and do _not_ write to CSR at all.
     # this is the same as setting rs1 = x0.
 
     if   inst.csrnum == 0xFC0:
-      bits = s.mngr2proc_queue.popleft()
-      s.mngr2proc_str = str(bits)
-      s.R[inst.rd] = bits
+      value = s.mngr2proc_queue.popleft()
 
     # CSR: numcores
     elif inst.csrnum == 0xFC1:
-      s.R[inst.rd] = s.numcores
+      value = s.numcores
 
     # CSR: coreid
     elif inst.csrnum == 0xF14:
-      s.R[inst.rd] = s.coreid
+      value = s.coreid
 
     # CSR: xcel regs
-    elif inst.csrnum >= 0x7E0 and inst.csrnum <= 0x7FF:
-      reqmsg = XcelReqMsg()
-      reqmsg.type_ = XcelReqMsg.TYPE_READ
-      reqmsg.raddr = inst.csrnum[0:5]
-      reqmsg.data  = 0
-      s.xcelreq_queue.append( reqmsg )
-
-      respmsg = s.xcelresp_queue.popleft()
-      s.R[inst.rd] = respmsg.data
+    elif 0x7E0 <= inst.csrnum <= 0x7FF and s.xcel is not None:
+      value = s.xcel.read( inst.csrnum & 0x1F )
 
     else:
       raise TinyRV2Semantics.IllegalInstruction(
-        "Unrecognized CSR register ({}) for csrr at PC={}" \
-          .format(inst.csrnum.uint(),s.PC) )
+        "Unrecognized CSR register ({}) for csrr at PC={:0>8x}" \
+          .format(inst.csrnum,pc) )
 
-    s.PC += 4
+    if inst.rd:
+      s.R[inst.rd] = value & 0xFFFFFFFF
+    return ( pc + 4 ) & 0xFFFFFFFF
 
-  def execute_csrw( s, inst ):
+  def execute_csrw( s, inst, pc ):
 
     # CSR: proc2mngr
     # for proc2mngr we ignore the rd and do _not_ write old value to rd.
     # this is the same as setting rd = x0.
 
     if   inst.csrnum == 0x7C0:
-      bits = s.R[inst.rs1]
-      s.proc2mngr_str = str(bits)
-      s.proc2mngr_queue.append( bits )
+      s.proc2mngr_queue.append( s.R[inst.rs1] )
 
     # CSR: stats_en
 
     elif inst.csrnum == 0x7C1:
       s.stats_en = bool( s.R[inst.rs1] )
 
-    elif inst.csrnum >= 0x7E0 and inst.csrnum <= 0x7FF:
-      reqmsg = XcelReqMsg()
-      reqmsg.type_ = XcelReqMsg.TYPE_WRITE
-      reqmsg.raddr = inst.csrnum[0:5]
-      reqmsg.data  = s.R[inst.rs1]
-      s.xcelreq_queue.append( reqmsg )
-
-      respmsg = s.xcelresp_queue.popleft()
-      # discard resp msg
+    elif 0x7E0 <= inst.csrnum <= 0x7FF and s.xcel is not None:
+      s.xcel.write( inst.csrnum & 0x1F, s.R[inst.rs1] )
 
     else:
       raise TinyRV2Semantics.IllegalInstruction(
-        "Unrecognized CSR register ({}) for csrw at PC={}" \
-          .format(inst.csrnum.uint(),s.PC) )
+        "Unrecognized CSR register ({}) for csrw at PC={:0>8x}" \
+          .format(inst.csrnum,pc) )
 
-    s.PC += 4
+    return ( pc + 4 ) & 0xFFFFFFFF
 
-  def execute_dumb( s, inst ):
-    pass
+  def execute_dumb( s, inst, pc ):
+    return pc
 
   #-----------------------------------------------------------------------
-  # exec
+  # step
   #-----------------------------------------------------------------------
+  # Execute a single instruction. Returns True if it was a csrw.
 
-  execute_dispatch = {
-
-  # Listed in the order of the lecture handout
-  # 1.3 Tiny Risc-V Instruction Set Architecture
-
-    'nop'   : execute_nop,
-
-    'add'   : execute_add,
-    'addi'  : execute_addi,
-    'sub'   : execute_sub,
-    'mul'   : execute_mul,
-    'and'   : execute_and,
-    'andi'  : execute_andi,
-    'or'    : execute_or,
-    'ori'   : execute_ori,
-    'xor'   : execute_xor,
-    'xori'  : execute_xori,
-
-    'slt'   : execute_slt,
-    'slti'  : execute_slti,
-    'sltu'  : execute_sltu,
-    'sltiu' : execute_sltiu,
-
-    'sra'   : execute_sra,
-    'srai'  : execute_srai,
-    'srl'   : execute_srl,
-    'srli'  : execute_srli,
-    'sll'   : execute_sll,
-    'slli'  : execute_slli,
-
-    'lui'   : execute_lui,
-    'auipc' : execute_auipc,
-    'lb'    : execute_lb,
-    'lh'    : execute_lh,
-    'lw'    : execute_lw,
-    'lbu'   : execute_lbu,
-    'lhu'   : execute_lhu,
-    'sb'    : execute_sb,
-    'sh'    : execute_sh,
-    'sw'    : execute_sw,
-
-    'jal'   : execute_jal,
-    'jalr'  : execute_jalr,
-    'beq'   : execute_beq,
-    'bne'   : execute_bne,
-    'blt'   : execute_blt,
-    'bge'   : execute_bge,
-    'bltu'  : execute_bltu,
-    'bgeu'  : execute_bgeu,
-
-    'csrr' : execute_csrr,
-    'csrw' : execute_csrw,
-
-    ' '    : execute_dumb # this is for all-zero
+  def step( s ):
 
-  }
+    pc    = s.PC
+    entry = s.inst_cache.get( pc )
+
+    if entry is None:
+      inst  = TinyRV2PredecodedIntInst( _word.unpack_from( s.M, pc )[0] )
+      entry = ( inst, s.execute_dispatch[ inst.name ] )
+      s.inst_cache[ pc ] = entry
+
+    inst, execute = entry
+    s.PC = execute( inst, pc )
+
+    return inst.name == "csrw"
+
+  #-----------------------------------------------------------------------
+  # translate
+  #-----------------------------------------------------------------------
+  # Translate the basic block starting at the given PC and return its
+  # block cache entry. An illegal or empty word ends the block right
+  # before it. If there is not a single instruction to translate, we
+  # return False, which tells run to use step for this PC.
+
+  def translate( s, entry_pc ):
+
+    insts = []
+    pc    = entry_pc
+
+    while len(insts) < s.max_block_size:
+      try:
+        inst = TinyRV2PredecodedIntInst( _word.unpack_from( s.M, pc )[0] )
+      except AssertionError:
+        break
+
+      if inst.name == " ":
+        break
+
+      insts.append( inst )
+      pc = ( pc + 4 ) & 0xFFFFFFFF
+
+      if inst.name in block_terminators:
+        break
+
+    for n in range( max( len(insts), 1 ) ):
+      s.block_words.setdefault( ( entry_pc + 4*n ) & 0xFFFFFFFF, [] ) \
+                   .append( entry_pc )
+
+    if not insts:
+      return False
+
+    func_name = "block_{:0>8x}".format( entry_pc )
+    namespace = dict( s.block_globals )
+    for n, inst in enumerate( insts ):
+      namespace[ "inst_{}".format(n) ] = inst
+
+    src = mk_block_src( func_name, insts, entry_pc, block_mem_tmpls )
+    exec( compile( src, "<{}>".format( func_name ), "exec" ), namespace )
+
+    ncsrw = len(insts) if insts[-1].name == "csrw" else 0
+    return ( namespace[ func_name ], ncsrw )
+
+  #-----------------------------------------------------------------------
+  # run
+  #-----------------------------------------------------------------------
+  # Execute up to max_insts instructions. We always return right after a
+  # csrw, since that is when the outside world can observe something (a
+  # proc2mngr message, stats_en changing, or an accelerator write). All
+  # instructions executed in one call are counted towards the stats
+  # region if stats_en was set when we started. Returns the number of
+  # instructions we executed.
+  #
+  # We execute whole translated blocks as long as a block cannot take us
+  # past max_insts, and single instructions after that, so we always stop
+  # after exactly max_insts instructions (or at a csrw).
+  #
+  # If stop_pc is given we also return as soon as the PC reaches it. We
+  # only check the PC between blocks, which end at jumps and branches, so
+  # this finds the entry of a function which is called (or jumped to),
+  # but not necessarily an address in the middle of a block.
+
+  def run( s, max_insts, stop_pc=None ):
+
+    block_cache    = s.block_cache
+    max_block_size = s.max_block_size
+    stats_en       = s.stats_en
+    n              = 0
+
+    try:
+      while n < max_insts:
+
+        if max_insts - n >= max_block_size:
+          entry = block_cache.get( s.PC )
+          if entry is None:
+            entry = s.translate( s.PC )
+            block_cache[ s.PC ] = entry
+        else:
+          entry = False
+
+        if entry:
+          block, ncsrw = entry
+          s.PC, ninsts = block()
+          n += ninsts
+          if ninsts == ncsrw or s.PC == stop_pc:
+            break
+
+        else:
+          n += 1
+          if s.step() or s.PC == stop_pc:
+            break
+
+    except:
+      print( "Unexpected error at PC={:0>8x}!".format( s.PC ) )
+      raise
+
+    finally:
+      s.num_insts += n
+      if stats_en:
+        s.num_stats_insts += n
 
-  def execute( self, inst ):
-    self.execute_dispatch[inst.name]( self, inst )
+    return n
@@ -0,0 +1,165 @@
+#=========================================================================
+# tinyrv2_translate
+#=========================================================================
+# Basic-block translation for TinyRV2. We turn straight-line code up to
+# the next branch, jump, or CSR instruction into the source of a Python
+# function with all register specifiers, immediates, and PCs folded into
+# the code. Both the block mode of the FL processor and the standalone
+# instruction set simulator in tinyrv2_semantics use this.
+
+#-------------------------------------------------------------------------
+# mk_block_src
+#-------------------------------------------------------------------------
+# Generate the Python source for a basic block of predecoded integer
+# instructions (TinyRV2PredecodedIntInst). The generated function
+# executes every instruction in the block and returns the next PC along
+# with the number of instructions it executed. Reads from x0 are
+# replaced with a literal zero and writes to x0 are dropped, so quite a
+# few instructions turn into constant expressions.
+#
+# How to access memory is up to the caller: mem_tmpls maps each load and
+# store to a format string for an expression (loads) or a statement
+# (stores) with {addr} and {data} fields. Loads have to evaluate to an
+# unsigned 32-bit value, and store data is already truncated to the
+# width of the store. Besides whatever the templates use, the generated
+# code uses the following names, which the caller provides when it
+# compiles the source:
+#
+#  - R          : register array
+#  - invalidate : invalidate blocks overlapping a store, returns True if
+#                 any block was invalidated
+#  - execute_*  : csrr/csrw handlers taking the instruction and the PC
+#                 and returning the next PC
+#  - inst_<n>   : n-th predecoded instruction in the block
+#
+# A store that invalidates a block (possibly the one we are executing)
+# ends the block right after the store, so self-modifying code still
+# works.
+
+block_terminators = { "beq", "bne", "blt", "bge", "bltu", "bgeu",
+                      "jal", "jalr", "csrr", "csrw" }
+
+def mk_block_src( func_name, insts, entry_pc, mem_tmpls ):
+
+  def reg( idx ):
+    return "R[{}]".format( idx ) if idx else "0"
+
+  def sreg( idx ):
+    return "( R[{}] ^ 0x80000000 )".format( idx ) if idx else "0x80000000"
+
+  src = [ "def {}():".format( func_name ) ]
+
+  for n, inst in enumerate( insts ):
+
+    name    = inst.name
+    pc      = ( entry_pc + 4*n ) & 0xFFFFFFFF
+    pc_next = ( pc + 4 ) & 0xFFFFFFFF
+    ninsts  = n + 1
+
+    rd, rs1, rs2 = inst.rd, inst.rs1, inst.rs2
+    r1,  r2      = reg( rs1 ),  reg( rs2 )
+    sr1, sr2     = sreg( rs1 ), sreg( rs2 )
+
+    # Register-register and register-immediate instructions. All of
+    # these are dead if they write x0.
+
+    expr = None
+
+    if   name == "add"  : expr = "( {} + {} ) & 0xFFFFFFFF".format( r1, r2 )
+    elif name == "sub"  : expr = "( {} - {} ) & 0xFFFFFFFF".format( r1, r2 )
+    elif name == "sll"  : expr = "( {} << ( {} & 0x1F ) ) & 0xFFFFFFFF".format( r1, r2 )
+    elif name == "slt"  : expr = "{} < {}".format( sr1, sr2 )
+    elif name == "sltu" : expr = "{} < {}".format( r1, r2 )
+    elif name == "xor"  : expr = "{} ^ {}".format( r1, r2 )
+    elif name == "srl"  : expr = "{} >> ( {} & 0x1F )".format( r1, r2 )
+    elif name == "sra"  : expr = "( ( {} - 0x80000000 ) >> ( {} & 0x1F ) ) & 0xFFFFFFFF".format( sr1, r2 )
+    elif name == "or"   : expr = "{} | {}".format( r1, r2 )
+    elif name == "and"  : expr = "{} & {}".format( r1, r2 )
+    elif name == "mul"  : expr = "( {} * {} ) & 0xFFFFFFFF".format( r1, r2 )
+
+    elif name == "addi" : expr = "( {} + {} ) & 0xFFFFFFFF".format( r1, inst.i_imm )
+    elif name == "slti" : expr = "{} - 0x80000000 < {}".format( sr1, inst.i_imm )
+    elif name == "sltiu": expr = "{} < {}".format( r1, inst.i_imm & 0xFFFFFFFF )
+    elif name == "xori" : expr = "{} ^ {}".format( r1, inst.i_imm & 0xFFFFFFFF )
+    elif name == "ori"  : expr = "{} | {}".format( r1, inst.i_imm & 0xFFFFFFFF )
+    elif name == "andi" : expr = "{} & {}".format( r1, inst.i_imm & 0xFFFFFFFF )
+    elif name == "slli" : expr = "( {} << {} ) & 0xFFFFFFFF".format( r1, inst.shamt )
+    elif name == "srli" : expr = "{} >> {}".format( r1, inst.shamt )
+    elif name == "srai" : expr = "( ( {} - 0x80000000 ) >> {} ) & 0xFFFFFFFF".format( sr1, inst.shamt )
+
+    elif name == "lui"  : expr = "{}".format( inst.u_imm )
+    elif name == "auipc": expr = "{}".format( ( inst.u_imm + pc ) & 0xFFFFFFFF )
+
+    elif name == "nop"  : continue
+
+    if expr is not None:
+      if rd:
+        src.append( "  R[{}] = {}".format( rd, expr ) )
+      continue
+
+    # Loads always access memory, even if they write x0
+
+    if name in ( "lw", "lh", "lhu", "lb", "lbu" ):
+      addr = "( {} + {} ) & 0xFFFFFFFF".format( r1, inst.i_imm )
+      expr = mem_tmpls[ name ].format( addr=addr )
+      src.append( "  {} = {}".format( "R[{}]".format( rd ) if rd else "_", expr ) )
+      continue
+
+    # Stores
+
+    addr = "( {} + {} ) & 0xFFFFFFFF".format( r1, inst.s_imm )
+
+    if   name == "sw" : nbytes, data = 4, r2
+    elif name == "sh" : nbytes, data = 2, "{} & 0xFFFF".format( r2 )
+    elif name == "sb" : nbytes, data = 1, "{} & 0xFF".format( r2 )
+
+    if name in ( "sw", "sh", "sb" ):
+      src.append( "  addr = {}".format( addr ) )
+      src.append( "  " + mem_tmpls[ name ].format( addr="addr", data=data ) )
+      src.append( "  if invalidate( addr, {} ):".format( nbytes ) )
+      src.append( "    return {}, {}".format( pc_next, ninsts ) )
+      continue
+
+    # Terminators, these have to be the last instruction in the block
+
+    assert n == len(insts) - 1
+
+    target = ( pc + inst.b_imm ) & 0xFFFFFFFF
+
+    if   name == "beq"  : cond = "{} == {}".format( r1, r2 )
+    elif name == "bne"  : cond = "{} != {}".format( r1, r2 )
+    elif name == "blt"  : cond = "{} < {}".format( sr1, sr2 )
+    elif name == "bge"  : cond = "{} >= {}".format( sr1, sr2 )
+    elif name == "bltu" : cond = "{} < {}".format( r1, r2 )
+    elif name == "bgeu" : cond = "{} >= {}".format( r1, r2 )
+
+    if name in ( "beq", "bne", "blt", "bge", "bltu", "bgeu" ):
+      src.append( "  if {}:".format( cond ) )
+      src.append( "    return {}, {}".format( target, ninsts ) )
+      src.append( "  return {}, {}".format( pc_next, ninsts ) )
+
+    elif name == "jal":
+      if rd:
+        src.append( "  R[{}] = {}".format( rd, pc_next ) )
+      src.append( "  return {}, {}".format( ( pc + inst.j_imm ) & 0xFFFFFFFF, ninsts ) )
+
+    elif name == "jalr":
+      src.append( "  temp = ( {} + {} ) & 0xFFFFFFFE".format( r1, inst.i_imm ) )
+      if rd:
+        src.append( "  R[{}] = {}".format( rd, pc_next ) )
+      src.append( "  return temp, {}".format( ninsts ) )
+
+    elif name in ( "csrr", "csrw" ):
+      src.append( "  return execute_{}( inst_{}, {} ), {}".format( name, n, pc, ninsts ) )
+
+    else:
+      assert False, "Cannot translate {}".format( name )
+
+    return "\n".join( src ) + "\n"
+
+  # The block did not end with a terminator, so fall through
+
+  src.append( "  return {}, {}".format( ( entry_pc + 4*len(insts) ) & 0xFFFFFFFF,
+                                         len(insts) ) )
+  return "\n".join( src ) + "\n"
+
@@ -44,13 +44,12 @@
 
 import struct
 
-from pymtl                                import *
-from lab2_proc.test.tinyrv2_encoding_test import mk_section
-from string                               import translate, maketrans
-from lab2_proc.tinyrv2_encoding           import assemble
-from lab2_proc.SparseMemoryImage          import SparseMemoryImage
+from pymtl3                          import *
+from proc.test.tinyrv2_encoding_test import mk_section
+from proc.tinyrv2_encoding           import assemble
+from proc.SparseMemoryImage          import SparseMemoryImage
 
-from proc_ubmark_bsearch_data    import d_keys, d_values, s_keys, ref
+from .proc_ubmark_bsearch_data import d_keys, d_values, s_keys, ref
 
 c_bin_search_s_keys_ptr    = 0x2000;
 c_bin_search_s_values_ptr  = 0x3000;
@@ -95,6 +94,10 @@ class ubmark_bsearch:
     csrr  x5, mngr2proc < 0x5000
     csrr  x6, mngr2proc < 50
 
+    # start of the stats region
+    addi  x31, x0, 1
+    csrw  stats_en, x31
+
     addi  x7, x0, 0      # loop counter i is in x7
 
   zero:
@@ -157,6 +160,9 @@ class ubmark_bsearch:
     addi  x7, x7, 1     # i++
     bne   x7, x3, zero   # if (i < srch_sz) goto 0:
 
+    # end of the stats region
+    csrw  stats_en, x0
+
     # end of the program
     csrw  proc2mngr, x0 > 0
     nop
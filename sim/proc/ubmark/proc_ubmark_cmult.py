@@ -20,13 +20,12 @@
 
 import struct
 
-from pymtl                                import *
-from lab2_proc.test.tinyrv2_encoding_test import mk_section
-from string                               import translate, maketrans
-from lab2_proc.tinyrv2_encoding           import assemble
-from lab2_proc.SparseMemoryImage          import SparseMemoryImage
+from pymtl3                          import *
+from proc.test.tinyrv2_encoding_test import mk_section
+from proc.tinyrv2_encoding           import assemble
+from proc.SparseMemoryImage          import SparseMemoryImage
 
-from proc_ubmark_cmult_data      import src0, src1, ref
+from .proc_ubmark_cmult_data import src0, src1, ref
 
 # pointers for the input and output arrays
 c_cmplx_mult_src0_ptr = 0x2000
@@ -67,6 +66,11 @@ class ubmark_cmult:
     csrr  x2, mngr2proc < 0x2000
     csrr  x3, mngr2proc < 0x3000
     csrr  x4, mngr2proc < 0x4000
+
+    # start of the stats region
+    addi  x31, x0, 1
+    csrw  stats_en, x31
+
     addi  x5, x0, 0
 
   loop:
@@ -88,6 +92,9 @@ class ubmark_cmult:
     addi  x4, x4, 8
     bne   x5, x1, loop
 
+    # end of the stats region
+    csrw  stats_en, x0
+
     # end of the program
     csrw  proc2mngr, x0 > 0
     nop
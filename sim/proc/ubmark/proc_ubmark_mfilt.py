@@ -30,13 +30,12 @@
 
 import struct
 
-from pymtl                                import *
-from lab2_proc.test.tinyrv2_encoding_test import mk_section
-from string                               import translate, maketrans
-from lab2_proc.tinyrv2_encoding           import assemble
-from lab2_proc.SparseMemoryImage          import SparseMemoryImage
+from pymtl3                          import *
+from proc.test.tinyrv2_encoding_test import mk_section
+from proc.tinyrv2_encoding           import assemble
+from proc.SparseMemoryImage          import SparseMemoryImage
 
-from proc_ubmark_mfilt_data         import src, mask, ref
+from .proc_ubmark_mfilt_data import src, mask, ref
 
 # pointers for the input and output arrays
 c_masked_filter_dest_ptr = 0x2000
@@ -80,6 +79,10 @@ class ubmark_mfilt:
     csrr  x7, mngr2proc < 10
     csrr  x8, mngr2proc < 10
 
+    # start of the stats region
+    addi  x31, x0, 1
+    csrw  stats_en, x31
+
     addi  x24, x0, 64   # coeff0
     addi  x25, x0, 48   # coeff1
 
@@ -153,6 +156,9 @@ class ubmark_mfilt:
     addi  x9, x9, 1     # ridx++
     bne   x9, x2, zero  # if ( ridx != nrows - 1 ) goto zero:
 
+    # end of the stats region
+    csrw  stats_en, x0
+
     csrw  proc2mngr, x0 > 0
     nop
     nop
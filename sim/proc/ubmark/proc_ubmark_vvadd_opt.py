@@ -12,13 +12,12 @@
 
 import struct
 
-from pymtl                                import *
-from lab2_proc.test.tinyrv2_encoding_test import mk_section
-from string                               import translate, maketrans
-from lab2_proc.tinyrv2_encoding           import assemble
-from lab2_proc.SparseMemoryImage          import SparseMemoryImage
+from pymtl3                          import *
+from proc.test.tinyrv2_encoding_test import mk_section
+from proc.tinyrv2_encoding           import assemble
+from proc.SparseMemoryImage          import SparseMemoryImage
 
-from proc_ubmark_vvadd_data      import src0, src1, ref
+from .proc_ubmark_vvadd_data import src0, src1, ref
 
 c_vvadd_src0_ptr = 0x2000;
 c_vvadd_src1_ptr = 0x3000;
@@ -58,6 +57,11 @@ class ubmark_vvadd_opt:
     csrr  x2, mngr2proc < 0x2000
     csrr  x3, mngr2proc < 0x3000
     csrr  x4, mngr2proc < 0x4000
+
+    # start of the stats region
+    addi  x31, x0, 1
+    csrw  stats_en, x31
+
     add   x5, x0, x1
 
     # main loop
@@ -84,6 +88,9 @@ class ubmark_vvadd_opt:
     addi  x4, x4, 16
     bne   x5, x0, loop
 
+    # end of the stats region
+    csrw  stats_en, x0
+
     # end of the program
     csrw  proc2mngr, x0 > 0
     nop